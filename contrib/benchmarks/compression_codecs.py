@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Compare the compression codecs available for tool data and result tar
+balls: wall time, CPU time and compressed size of each.
+
+The input is a synthetic tool data directory made of `pidstat`- and
+`iostat`-like text files, which is what the Tool Meisters send at the end
+of every iteration.
+
+    compression_codecs.py [--size-mb N] [--threads N] [--codecs zstd,lz4,xz]
+"""
+
+import argparse
+from pathlib import Path
+import random
+import resource
+import subprocess
+import tempfile
+import time
+
+from pbench.common.compression import available_codecs, CODECS
+
+
+def make_tool_data(root: Path, size_mb: int):
+    """Fill a directory with roughly size_mb MiB of tool-like text output."""
+    rng = random.Random(42)
+    pidstat = root / "pidstat" / "pidstat-stdout.txt"
+    iostat = root / "iostat" / "iostat-stdout.txt"
+    for d in (pidstat.parent, iostat.parent):
+        d.mkdir(parents=True)
+    target = size_mb * 2**20 // 2
+    with pidstat.open("w") as f:
+        t = 0
+        while f.tell() < target:
+            t += 1
+            for pid in range(1000, 1200):
+                f.write(
+                    f"{t:010d}      0  {pid:6d}  {rng.random() * 5:6.2f}"
+                    f"  {rng.random() * 2:6.2f}    0.00    0.00"
+                    f"  {rng.random() * 7:6.2f}    {rng.randrange(48):3d}  cmd-{pid}\n"
+                )
+    with iostat.open("w") as f:
+        t = 0
+        while f.tell() < target:
+            t += 1
+            f.write(f"\n{t:010d}\nDevice  r/s  w/s  rkB/s  wkB/s  %util\n")
+            for dev in ("sda", "sdb", "nvme0n1", "nvme1n1", "dm-0", "dm-1"):
+                f.write(
+                    f"{dev:8s} {rng.random() * 100:8.2f} {rng.random() * 400:8.2f}"
+                    f" {rng.random() * 9e3:10.2f} {rng.random() * 3e4:10.2f}"
+                    f" {rng.random() * 100:6.2f}\n"
+                )
+
+
+def run(src: Path, out: Path, name: str, threads: int):
+    """Create a compressed tar ball of src, as the Tool Meister does, and
+    return the elapsed time, the CPU seconds of the pipeline, and the size
+    of the tar ball.
+    """
+    codec = CODECS[name]
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    subprocess.run(
+        [
+            "tar",
+            "--create",
+            f"--file={out}",
+            codec.tar_option(threads=threads),
+            f"--directory={src.parent}",
+            src.name,
+        ],
+        check=True,
+    )
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return elapsed, cpu, out.stat().st_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--codecs", default=",".join(available_codecs()))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        src = tmp / "tools-default"
+        make_tool_data(src, args.size_mb)
+        raw = sum(p.stat().st_size for p in src.rglob("*") if p.is_file())
+        print(f"{raw / 2**20:.1f} MiB of tool data, {args.threads} thread(s)")
+        for name in args.codecs.split(","):
+            out = tmp / f"tools{CODECS[name].tar_suffix()}"
+            elapsed, cpu, size = run(src, out, name, args.threads)
+            print(
+                f"{name:>5s}: {elapsed:7.2f}s wall {cpu:7.2f}s CPU"
+                f" {size / 2**20:8.2f} MiB (ratio {raw / size:5.1f})"
+            )
+
+
+if __name__ == "__main__":
+    main()
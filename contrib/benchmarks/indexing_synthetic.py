@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""Measure the indexing throughput of the server on synthetic pbench result
+tar balls of a configurable shape.
+
+A result tar ball is generated with the given number of iterations, samples,
+hosts, tools, CSV rows and sosreports, then run through `PbenchTarBall`,
+`mk_tool_data_actions()` and `mk_result_data_actions()`, with the actions
+either serialized and dropped ("null" sink) or written to local NDJSON bulk
+files ("ndjson" sink, see `BulkFileSink`).  For each stage, the number of
+documents per second, the serialized (null) or written (ndjson) bytes per
+second, and the peak RSS of the process are reported.
+
+    indexing_synthetic.py [--iterations N] [--samples N] [--hosts N]
+                          [--tools iostat,mpstat,pidstat] [--rows N]
+                          [--columns N] [--sosreports] [--sink null|ndjson]
+"""
+
+import argparse
+from argparse import Namespace
+from datetime import datetime, timedelta
+import hashlib
+import io
+import json
+import logging
+from pathlib import Path
+import resource
+import tarfile
+import tempfile
+import time
+
+from pbench.server import PbenchServerConfig
+from pbench.server.database import init_db
+from pbench.server.indexer import es_index, IdxContext, PbenchTarBall
+
+# The repository's server installation, providing the default configuration
+# file, and the index mappings and settings.
+SERVER_DIR = Path(__file__).resolve().parents[2] / "server"
+
+START_RUN = datetime(2022, 3, 1, 12, 0, 0)
+
+CONTROLLER = "controller.example.com"
+
+
+class Logger:
+    """Adapt the "{}" formatting of the server logger to a standard logger."""
+
+    def __init__(self):
+        self.logger = logging.getLogger("indexing-benchmark")
+
+    def __getattr__(self, level):
+        return lambda msg, *args, **kwargs: getattr(self.logger, level)(
+            msg.format(*args)
+        )
+
+
+def csv_files(tool: str, columns: int) -> dict:
+    """Return the CSV file names and column names generated for a tool."""
+    if tool == "iostat":
+        devs = [f"sd{chr(ord('a') + i % 26)}{i // 26 or ''}" for i in range(columns)]
+        rw = [f"{d}-{op}" for d in devs for op in ("read", "write")]
+        return {
+            "disk_IOPS.csv": rw,
+            "disk_Throughput_MB_per_sec.csv": rw,
+            "disk_Utilization_percent.csv": devs,
+        }
+    if tool == "mpstat":
+        return {
+            f"cpu{i}_cpu{i}.csv": ["usr", "sys", "iowait", "idle"]
+            for i in range(columns)
+        }
+    if tool == "pidstat":
+        procs = [f"{1000 + i}-worker{i}" for i in range(columns)]
+        return {
+            "cpu_usage_percent_cpu.csv": procs,
+            "memory_faults_major_faults_sec.csv": procs,
+        }
+    raise ValueError(f"unsupported tool {tool!r}")
+
+
+def write_csv(path: Path, names: list, rows: int):
+    start_ms = int(START_RUN.timestamp() * 1000)
+    with path.open("w") as fp:
+        fp.write(",".join(["timestamp_ms"] + names) + "\n")
+        for r in range(rows):
+            values = [f"{(r * 7 + c) % 100 + 0.25:.2f}" for c in range(len(names))]
+            fp.write(",".join([str(start_ms + r * 1000)] + values) + "\n")
+
+
+def result_json(iterations: list, samples: int, hosts: list, rows: int) -> list:
+    """Return a top-level result.json of throughput results, one per host
+    plus an aggregate, with a time series of `rows` values per sample.
+    """
+    start_ms = int(START_RUN.timestamp() * 1000)
+    results = []
+    for number, name in enumerate(iterations, start=1):
+        gbps = []
+        for host in hosts + ["all"]:
+            gbps.append(
+                {
+                    "client_hostname": host,
+                    "closest_sample": "1",
+                    "description": "Gigabits per second",
+                    "mean": 9.5,
+                    "role": "aggregate" if host == "all" else "client",
+                    "samples": [
+                        {
+                            "value": 9.5,
+                            "timeseries": [
+                                {"date": start_ms + r * 1000, "value": 9.0 + r % 10}
+                                for r in range(rows)
+                            ],
+                        }
+                        for _ in range(samples)
+                    ],
+                    "stddev": 0.1,
+                    "stddevpct": 1,
+                    "uid": "client_hostname:%client_hostname%",
+                }
+            )
+        results.append(
+            {
+                "iteration_data": {
+                    "parameters": {
+                        "benchmark": [
+                            {
+                                "benchmark_name": "uperf",
+                                "primary_metric": "Gb_sec",
+                                "uid": "benchmark_name:%benchmark_name%",
+                            }
+                        ]
+                    },
+                    "throughput": {"Gb_sec": gbps},
+                },
+                "iteration_name": name.split("-", 1)[1],
+                "iteration_name_format": "%d-%s",
+                "iteration_number": number,
+            }
+        )
+    return results
+
+
+def sosreport(path: Path, host: str):
+    """Write a minimal sosreport tar ball naming the host, and its .md5."""
+    top = f"sosreport-{host.split('.')[0]}-2022-03-01"
+    files = {
+        "sos_commands/general/hostname": f"{host.split('.')[0]}\n",
+        "sos_commands/general/hostname_-f": f"{host}\n",
+        "sos_commands/networking/ip_-o_addr": (
+            "1: lo    inet 127.0.0.1/8 scope host lo\n"
+            "2: eth0    inet 192.0.2.1/24 brd 192.0.2.255 scope global eth0\n"
+        ),
+    }
+    with tarfile.open(path, "w:xz") as tar:
+        for name, content in files.items():
+            data = content.encode()
+            info = tarfile.TarInfo(f"{top}/{name}")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    path.with_name(f"{path.name}.md5").write_text(
+        f"{hashlib.md5(path.read_bytes()).hexdigest()}\n"
+    )
+
+
+def make_tarball(tmp: Path, args) -> Path:
+    """Generate the result directory in the "incoming" tree and its tar ball
+    in the "archive" tree, returning the tar ball path.
+    """
+    name = f"uperf_synthetic_{START_RUN:%Y.%m.%dT%H.%M.%S}"
+    run_dir = tmp / "incoming" / name
+    hosts = [f"host{i:02d}.example.com" for i in range(args.hosts)]
+    tools = args.tools.split(",")
+    iterations = [f"{i}-test{i}" for i in range(1, args.iterations + 1)]
+
+    for iteration in iterations:
+        for s in range(1, args.samples + 1):
+            sample_dir = run_dir / iteration / f"sample{s}"
+            for host in hosts:
+                for tool in tools:
+                    csv_dir = sample_dir / "tools-default" / host / tool / "csv"
+                    csv_dir.mkdir(parents=True)
+                    for fname, cols in csv_files(tool, args.columns).items():
+                        write_csv(csv_dir / fname, cols, args.rows)
+    (run_dir / "result.json").write_text(
+        json.dumps(result_json(iterations, args.samples, hosts, args.rows))
+    )
+    if args.sosreports:
+        for host in hosts:
+            sos_dir = run_dir / "sysinfo" / "end" / host
+            sos_dir.mkdir(parents=True)
+            sosreport(sos_dir / f"sosreport-{host.split('.')[0]}.tar.xz", host)
+
+    end_run = START_RUN + timedelta(seconds=args.rows + 60)
+    tool_sections = "".join(
+        f"\n[tools/{host}]\n" + "".join(f"{tool} = --interval=1\n" for tool in tools)
+        for host in hosts
+    )
+    (run_dir / "metadata.log").write_text(
+        f"[pbench]\nname = {name}\nscript = uperf\n"
+        f"date = {START_RUN:%Y-%m-%dT%H:%M:%S}\nrpm-version = 0.71.0-1\n"
+        f"iterations = {', '.join(iterations)}\n\n"
+        f"[run]\ncontroller = {CONTROLLER}\n"
+        f"start_run = {START_RUN:%Y-%m-%dT%H:%M:%S.%f}\n"
+        f"end_run = {end_run:%Y-%m-%dT%H:%M:%S.%f}\n\n"
+        f"[tools]\nhosts = {' '.join(hosts)}\ngroup = default\n{tool_sections}"
+    )
+
+    controller_dir = tmp / "archive" / CONTROLLER
+    controller_dir.mkdir(parents=True)
+    tarball = controller_dir / f"{name}.tar.xz"
+    with tarfile.open(tarball, "w:xz", preset=1) as tar:
+        tar.add(run_dir, arcname=name)
+    tarball.with_name(f"{tarball.name}.md5").write_text(
+        f"{hashlib.md5(tarball.read_bytes()).hexdigest()}  {tarball.name}\n"
+    )
+    return tarball
+
+
+def server_config(tmp: Path) -> PbenchServerConfig:
+    top = tmp / "srv"
+    for d in ("tmp", "logs", "archive/fs-version-001"):
+        (top / d).mkdir(parents=True)
+    cfg = tmp / "pbench-server.cfg"
+    cfg.write_text(
+        f"[DEFAULT]\ninstall-dir = {SERVER_DIR}\n\n"
+        f"[pbench-server]\npbench-top-dir = {top}\n\n"
+        "[Indexing]\nindex_prefix = benchmark\n\n"
+        "[Postgres]\ndb_uri = sqlite:///:memory:\n\n"
+        "[config]\npath = %(install-dir)s/lib/config\n"
+        "files = pbench-server-default.cfg\n"
+    )
+    return PbenchServerConfig(str(cfg))
+
+
+def null_sink(actions) -> tuple:
+    """Serialize the actions the way the bulk API client does, and drop them,
+    returning the number of documents and of bytes.
+    """
+    count = size = 0
+    for action in actions:
+        meta = {"_index": action["_index"], "_id": action["_id"]}
+        size += len(json.dumps({action["_op_type"]: meta}))
+        size += len(json.dumps(action["_source"])) + 2
+        count += 1
+    return count, size
+
+
+def ndjson_sink(idxctx, actions) -> tuple:
+    """Write the actions to a bulk file, returning the number of documents
+    and the size of the file.
+    """
+    _, _, count, _, _, _ = es_index(idxctx.es, actions, None, idxctx.logger)
+    return count, idxctx.es.path.stat().st_size
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--iterations", type=int, default=4)
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--hosts", type=int, default=4)
+    parser.add_argument("--tools", default="iostat,mpstat,pidstat")
+    parser.add_argument("--rows", type=int, default=120, help="rows per CSV file")
+    parser.add_argument(
+        "--columns", type=int, default=8, help="devices, CPUs or processes per tool"
+    )
+    parser.add_argument("--sosreports", action="store_true")
+    parser.add_argument("--sink", choices=("null", "ndjson"), default="null")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        begin = time.perf_counter()
+        tarball = make_tarball(tmp, args)
+        print(
+            f"tar ball: {tarball.stat().st_size / 2**20:.2f} MiB,"
+            f" generated in {time.perf_counter() - begin:.1f}s"
+        )
+
+        config = server_config(tmp)
+        # The index templates are kept in the database.
+        init_db(config, Logger())
+        options = Namespace(
+            bulk_dir=str(tmp / "bulk") if args.sink == "ndjson" else None
+        )
+        idxctx = IdxContext(options, "index", config, Logger())
+
+        begin = time.perf_counter()
+        ptb = PbenchTarBall(
+            idxctx, "benchmark", str(tarball), str(tmp), str(tmp / "incoming")
+        )
+        elapsed = time.perf_counter() - begin
+        print(
+            f"{'open':>12}: {len(ptb.members):8d} members {elapsed:7.2f}s"
+            f"  peak RSS {peak_rss_mb():7.1f} MiB"
+        )
+
+        stages = (
+            ("tool data", ptb.mk_tool_data_actions),
+            ("result data", ptb.mk_result_data_actions),
+        )
+        for stage, mk_actions in stages:
+            begin = time.perf_counter()
+            if args.sink == "null":
+                docs, size = null_sink(mk_actions())
+            else:
+                docs, size = ndjson_sink(idxctx, mk_actions())
+            elapsed = time.perf_counter() - begin
+            print(
+                f"{stage:>12}: {docs:8d} docs {elapsed:7.2f}s"
+                f" {docs / elapsed:9.0f} docs/s"
+                f" {size / 2**20 / elapsed:7.2f} MiB/s"
+                f"  peak RSS {peak_rss_mb():7.1f} MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Measure how the S3 multipart backup of a large tar ball scales with the
+number of concurrent part uploads.
+
+The upload goes to the mock S3 connector (a local directory), with a fixed
+delay added to every part upload to stand in for the network round trip of
+a real S3 service.
+
+    s3_backup_concurrency.py [--size-mb N] [--part-mb N] [--latency S]
+                             [--workers 1,2,4,8]
+"""
+
+import argparse
+from configparser import ConfigParser
+import hashlib
+import logging
+from pathlib import Path
+import tempfile
+import time
+
+from pbench.server.s3backup import MockS3Connector, S3Config, Status
+
+
+class SlowMockS3Connector(MockS3Connector):
+    latency = 0.0
+
+    def upload_part(self, **kwargs):
+        time.sleep(self.latency)
+        return super().upload_part(**kwargs)
+
+
+class Logger:
+    """Adapt the "{}" formatting of the server logger to a standard logger."""
+
+    def __init__(self):
+        self.logger = logging.getLogger("s3-backup-benchmark")
+
+    def __getattr__(self, level):
+        return lambda msg, *args: getattr(self.logger, level)(msg.format(*args))
+
+
+def run(tmp: Path, tar: Path, md5: str, part_size: int, workers: int, latency: float):
+    config = ConfigParser()
+    config.read_dict(
+        {
+            "pbench-server": {
+                "debug_unittest": "1",
+                "pbench-s3-upload-dir": str(tmp / "state"),
+            },
+            "pbench-server-backup": {
+                "endpoint_url": str(tmp),
+                "bucket_name": "bucket",
+                "part_workers": str(workers),
+            },
+        }
+    )
+    s3_obj = S3Config(config, Logger())
+    s3_obj.chunk_size = part_size
+    s3_obj.connector.__class__ = SlowMockS3Connector
+    SlowMockS3Connector.latency = latency
+    start = time.perf_counter()
+    sts = s3_obj.put_tarball(
+        Name=tar,
+        Size=s3_obj.multipart_threshold,
+        ContentMD5=md5,
+        Bucket="bucket",
+        Key=f"controller/{workers}-{tar.name}",
+    )
+    elapsed = time.perf_counter() - start
+    assert sts == Status.SUCCESS, f"upload with {workers} workers failed"
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--part-mb", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--workers", default="1,2,4,8")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        (tmp / "bucket").mkdir()
+        tar = tmp / "benchmark.tar.xz"
+        md5 = hashlib.md5()
+        with tar.open("wb") as f:
+            block = bytes(range(256)) * 4096
+            for _ in range(args.size_mb):
+                f.write(block)
+                md5.update(block)
+
+        part_size = args.part_mb * 2**20
+        baseline = None
+        for workers in (int(w) for w in args.workers.split(",")):
+            elapsed = run(tmp, tar, md5.hexdigest(), part_size, workers, args.latency)
+            baseline = baseline or elapsed
+            print(
+                f"{workers:3d} part workers: {elapsed:7.2f}s"
+                f" {args.size_mb / elapsed:8.1f} MiB/s"
+                f" (x{baseline / elapsed:.1f})"
+            )
+
+
+if __name__ == "__main__":
+    main()
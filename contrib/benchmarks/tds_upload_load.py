@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""Measure the aggregate throughput and the tail latency of tool data uploads
+to a Tool Data Sink, for a number of simulated Tool Meisters sending their
+tool data at the same time, under different upload slot limits.
+
+Each simulated Tool Meister reserves an upload slot, honoring the Tool Data
+Sink's "Retry-After" replies, then PUTs its tar ball, which the Tool Data Sink
+verifies and extracts.  The latency reported is the time from the first slot
+request to the end of the PUT.
+
+    tds_upload_load.py [--hosts N] [--size-kb N] [--max-uploads 1,4,16,64]
+                       [--max-extracts N]
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+from pathlib import Path
+import shutil
+import statistics
+import subprocess
+import tempfile
+from threading import Barrier, Thread
+import time
+
+import requests
+
+from pbench.agent.tool_data_sink import (
+    DataSinkWsgiServer,
+    ExternalEnvironment,
+    ToolDataSink,
+    ToolDataSinkParams,
+)
+from pbench.agent.tool_meister import reserve_upload_slot
+
+
+def make_tar_balls(tmp: Path, hosts: int, size: int) -> dict:
+    """Create an (uncompressed) tar ball of random data per host, returning
+    the tar ball path and its MD5 by host name.
+    """
+    tar_balls = {}
+    for i in range(hosts):
+        hostname = f"tm{i:03d}.example.com"
+        data_dir = tmp / "data" / hostname / "iostat"
+        data_dir.mkdir(parents=True)
+        (data_dir / "iostat-stdout.txt").write_bytes(os.urandom(size))
+        tar = tmp / f"{hostname}.tar"
+        subprocess.run(["tar", "-cf", str(tar), hostname], cwd=tmp / "data", check=True)
+        tar_balls[hostname] = (tar, hashlib.md5(tar.read_bytes()).hexdigest())
+    return tar_balls
+
+
+def upload(url: str, tar: Path, md5: str, logger, latencies: list, start: Barrier):
+    start.wait()
+    begin = time.perf_counter()
+    reserve_upload_slot(url, logger)
+    with tar.open("rb") as fp:
+        response = requests.put(url, headers={"md5sum": md5}, data=fp)
+    assert response.status_code == 200, f"PUT {url}: {response.text}"
+    latencies.append(time.perf_counter() - begin)
+
+
+def run(tmp: Path, tar_balls: dict, max_uploads: int, max_extracts: int):
+    logger = logging.getLogger("tds-upload-benchmark")
+    pbench_run = tmp / f"run-{max_uploads}"
+    run_dir = pbench_run / "benchmark"
+    (run_dir / "tools-default").mkdir(parents=True)
+    ext_env = ExternalEnvironment(
+        cp_path="cp",
+        hostname="tds.example.com",
+        logger_name="tds",
+        pbench_bin=Path("/opt/pbench-agent"),
+        pbench_run=str(pbench_run),
+        prog_name="tds_upload_load",
+        tar_path=shutil.which("tar"),
+    )
+    params = ToolDataSinkParams(
+        benchmark_run_dir=str(run_dir),
+        bind_hostname="127.0.0.1",
+        channel_prefix="benchmark",
+        optional_md={},
+        port="0",
+        tool_group="default",
+        tool_metadata={"persistent": {}, "transient": {}},
+        tool_trigger=None,
+        tools={},
+        instance_uuid="benchmark",
+        max_uploads=max_uploads,
+        max_extracts=max_extracts,
+    )
+    tds = ToolDataSink(ext_env, None, "localhost", 0, params, logger)
+    tds.add_routes()
+    server = DataSinkWsgiServer(host="127.0.0.1", port=0, logger=logger)
+    server_thread = Thread(target=tds.run, kwargs={"server": server, "quiet": True})
+    server_thread.start()
+    try:
+        _, err_code = server.wait()
+        assert err_code == 0, "failed to start the WSGI server"
+
+        directory = run_dir / "tools-default"
+        # Bottle refuses to re-assign an application's attributes.
+        vars(tds).update(
+            action="send",
+            directory=directory,
+            data_ctx=hashlib.md5(str(directory).encode("utf-8")).hexdigest(),
+            _tm_tracking={
+                hostname: {"posted": "waiting", "transient_tools": ["iostat"]}
+                for hostname in tar_balls
+            },
+        )
+
+        port = server._server.server_port
+        latencies = []
+        start = Barrier(len(tar_balls) + 1)
+        threads = [
+            Thread(
+                target=upload,
+                args=(
+                    f"http://127.0.0.1:{port}/tool-data/{tds.data_ctx}/{hostname}",
+                    tar,
+                    md5,
+                    logger,
+                    latencies,
+                    start,
+                ),
+            )
+            for hostname, (tar, md5) in tar_balls.items()
+        ]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        begin = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - begin
+    finally:
+        server.stop()
+        server_thread.join()
+    assert len(latencies) == len(tar_balls), "some uploads failed"
+    return elapsed, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--hosts", type=int, default=64)
+    parser.add_argument("--size-kb", type=int, default=4096)
+    parser.add_argument("--max-uploads", default="1,4,16,64")
+    parser.add_argument("--max-extracts", type=int, default=4)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        tar_balls = make_tar_balls(tmp, args.hosts, args.size_kb * 1024)
+        total_mb = sum(tar.stat().st_size for tar, _ in tar_balls.values()) / 2**20
+        for max_uploads in (int(m) for m in args.max_uploads.split(",")):
+            elapsed, lat = run(tmp, tar_balls, max_uploads, args.max_extracts)
+            print(
+                f"{max_uploads:3d} upload slots: {elapsed:7.2f}s"
+                f" {total_mb / elapsed:8.1f} MiB/s"
+                f"  latency p50 {statistics.median(lat):6.2f}s"
+                f" p95 {lat[int(0.95 * (len(lat) - 1))]:6.2f}s"
+                f" p99 {lat[int(0.99 * (len(lat) - 1))]:6.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
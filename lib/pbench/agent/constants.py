@@ -21,9 +21,21 @@ tm_channel_suffix_to_tms = "to-tms"
 tm_channel_suffix_from_tms = "from-tms"
 # Channel suffix for the Tool Meister logging channel
 tm_channel_suffix_to_logging = "to-logging"
+# Transports carrying the "to-tms" and "from-tms" messages: Redis pub/sub
+# channels, or Redis Streams read through consumer groups (Redis 5.0+).
+tm_transport_pubsub = "pubsub"
+tm_transport_streams = "streams"
+tm_transports = (tm_transport_pubsub, tm_transport_streams)
 # Tool-Meisters info key
 tm_data_key = "tool-meister-data-key"
 
+# Prefix name of the channels on which pooled Tool Meisters wait, between
+# runs, to be re-bound to a new run ("<prefix>-<tool group>-<hostname>").
+tm_pool_channel_prefix = "pbench-tm-pool"
+# Name of the directory, in the ${pbench_run} directory, holding the Redis
+# server shared by the runs of pooled Tool Meisters.
+tm_pool_dir_name = "tm-pool"
+
 # List of allowed actions from the Pbench Agent CLI commands.
 cli_tm_allowed_actions = frozenset(("start", "stop", "send"))
 
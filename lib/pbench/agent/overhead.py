@@ -0,0 +1,277 @@
+"""Accounting of the resources used by the tool processes.
+
+A Tool Meister samples the `/proc/<pid>` statistics of the process trees of
+its tools while they are running, at a low frequency, to report how much
+CPU, memory, I/O and context switching the tools took from the system under
+test.  The per-tool summaries are written, as a list of JSON documents, to
+the "tool-overhead/json/tool-overhead.json" file of the tool data directory
+of the host, where the indexer handles them like the data of a tool named
+"tool-overhead".
+"""
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+# Default interval, in seconds, between two samples of the tool processes.
+SAMPLE_INTERVAL = 10
+
+# The name under which the tool overhead data is stored and indexed.
+OVERHEAD_TOOL = "tool-overhead"
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class ProcStats(NamedTuple):
+    """The resource usage of a process since it started."""
+
+    ppid: int
+    utime: float
+    stime: float
+    rss: int
+    read_bytes: int = 0
+    write_bytes: int = 0
+    voluntary: int = 0
+    involuntary: int = 0
+
+
+def _read_ppid_and_times(pid: int, proc: Path) -> Optional[List[str]]:
+    """Return the fields of /proc/<pid>/stat following the command name."""
+    try:
+        stat = (proc / str(pid) / "stat").read_text()
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return None
+    # The command name is in parentheses, and may contain spaces.
+    return stat[stat.rfind(")") + 2 :].split()
+
+
+def read_proc_stats(pid: int, proc: Path = Path("/proc")) -> Optional[ProcStats]:
+    """Return the resource usage of the given process, or None if it is gone."""
+    fields = _read_ppid_and_times(pid, proc)
+    if fields is None:
+        return None
+    counters = {}
+    for name in ("io", "status"):
+        try:
+            with (proc / str(pid) / name).open() as fp:
+                for line in fp:
+                    key, _, value = line.partition(":")
+                    counters[key] = value
+        except OSError:
+            # The I/O counters of processes of other users are not readable.
+            pass
+
+    def counter(key: str) -> int:
+        try:
+            return int(counters[key].split()[0])
+        except (KeyError, IndexError, ValueError):
+            return 0
+
+    # Fields 4 (ppid), 14 (utime), 15 (stime) and 24 (rss) of proc(5), with
+    # the first field here being field 3.
+    return ProcStats(
+        ppid=int(fields[1]),
+        utime=int(fields[11]) / _CLK_TCK,
+        stime=int(fields[12]) / _CLK_TCK,
+        rss=int(fields[21]) * _PAGE_SIZE,
+        read_bytes=counter("read_bytes"),
+        write_bytes=counter("write_bytes"),
+        voluntary=counter("voluntary_ctxt_switches"),
+        involuntary=counter("nonvoluntary_ctxt_switches"),
+    )
+
+
+def process_trees(roots: Set[int], proc: Path = Path("/proc")) -> Set[int]:
+    """Return the given processes and all of their descendants."""
+    children: Dict[int, List[int]] = {}
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        fields = _read_ppid_and_times(int(entry.name), proc)
+        if fields is not None:
+            children.setdefault(int(fields[1]), []).append(int(entry.name))
+    tree = set()
+    todo = [pid for pid in roots if (proc / str(pid)).exists()]
+    while todo:
+        pid = todo.pop()
+        if pid not in tree:
+            tree.add(pid)
+            todo.extend(children.get(pid, ()))
+    return tree
+
+
+class _Account:
+    """The resource usage of the process trees of one tool."""
+
+    def __init__(self, pids: Callable[[], List[int]], baseline: bool):
+        self.pids = pids
+        self.baseline = baseline
+        # The last statistics seen of each process, and of the processes
+        # running at the first sample when using a baseline.
+        self.last: Dict[int, ProcStats] = {}
+        self.first: Dict[int, ProcStats] = {}
+        self.rss_max = 0
+        self.samples = 0
+
+    def total(self, field: str):
+        return sum(
+            getattr(st, field) - getattr(self.first.get(pid), field, 0)
+            for pid, st in self.last.items()
+        )
+
+
+class OverheadMonitor:
+    """Periodically sample the process trees of a set of tools, in a thread
+    of its own.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        interval: float = SAMPLE_INTERVAL,
+        proc: Path = Path("/proc"),
+    ):
+        self.logger = logger
+        self.interval = interval
+        self.proc = proc
+        self._accounts: Dict[str, _Account] = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._start_time = None
+
+    def add(self, name: str, pids: Callable[[], List[int]], baseline: bool = False):
+        """Account for the process trees of a tool.
+
+        Args:
+            name        The name of the tool
+            pids        Returns the root processes of the tool
+            baseline    Whether the tool was already running, in which case
+                        only the usage from the first sample on is counted
+        """
+        self._accounts[name] = _Account(pids, baseline)
+
+    def sample(self):
+        """Sample the statistics of the process trees of all the tools."""
+        with self._lock:
+            for name, acct in self._accounts.items():
+                try:
+                    roots = set(acct.pids())
+                    tree = process_trees(roots, self.proc) if roots else set()
+                except Exception:
+                    self.logger.exception("Failed to find the %s processes", name)
+                    continue
+                rss = 0
+                for pid in tree:
+                    st = read_proc_stats(pid, self.proc)
+                    if st is None:
+                        continue
+                    if acct.baseline and acct.samples == 0:
+                        acct.first[pid] = st
+                    acct.last[pid] = st
+                    rss += st.rss
+                acct.rss_max = max(acct.rss_max, rss)
+                acct.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._start_time = time.time()
+        self.sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> List[Dict]:
+        """Take a final sample, and return the summary document of each tool."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sample()
+        end = time.time()
+        duration = end - (self._start_time or end)
+        docs = []
+        for name, acct in sorted(self._accounts.items()):
+            cpu = acct.total("utime") + acct.total("stime")
+            docs.append(
+                {
+                    "@timestamp": end,
+                    "tool": name,
+                    "duration": round(duration, 3),
+                    "samples": acct.samples,
+                    "processes": len(acct.last),
+                    "cpu": {
+                        "user": round(acct.total("utime"), 2),
+                        "system": round(acct.total("stime"), 2),
+                        "percent": round(100 * cpu / duration, 3) if duration else 0,
+                    },
+                    "memory": {"rss_max": acct.rss_max},
+                    "io": {
+                        "read_bytes": acct.total("read_bytes"),
+                        "write_bytes": acct.total("write_bytes"),
+                    },
+                    "ctxt_switches": {
+                        "voluntary": acct.total("voluntary"),
+                        "involuntary": acct.total("involuntary"),
+                    },
+                }
+            )
+        return docs
+
+
+def write_overhead(host_dir: Path, docs: List[Dict]) -> Path:
+    """Write the tool overhead documents into the tool data directory of a
+    host, returning the path of the file written.
+    """
+    json_dir = host_dir / OVERHEAD_TOOL / "json"
+    json_dir.mkdir(parents=True, exist_ok=True)
+    path = json_dir / f"{OVERHEAD_TOOL}.json"
+    path.write_text(json.dumps(docs, sort_keys=True, indent=2))
+    return path
+
+
+def summarize_overhead(paths: List[Path]) -> Dict[str, Dict]:
+    """Combine the tool overhead documents of several files (e.g., of all
+    the iterations of a run), returning a summary document per tool.
+    """
+    summary = {}
+    for path in paths:
+        try:
+            docs = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for doc in docs:
+            s = summary.setdefault(
+                doc["tool"],
+                {
+                    "intervals": 0,
+                    "duration": 0.0,
+                    "cpu_user": 0.0,
+                    "cpu_system": 0.0,
+                    "rss_max": 0,
+                    "read_bytes": 0,
+                    "write_bytes": 0,
+                    "ctxt_voluntary": 0,
+                    "ctxt_involuntary": 0,
+                },
+            )
+            s["intervals"] += 1
+            s["duration"] += doc["duration"]
+            s["cpu_user"] += doc["cpu"]["user"]
+            s["cpu_system"] += doc["cpu"]["system"]
+            s["rss_max"] = max(s["rss_max"], doc["memory"]["rss_max"])
+            s["read_bytes"] += doc["io"]["read_bytes"]
+            s["write_bytes"] += doc["io"]["write_bytes"]
+            s["ctxt_voluntary"] += doc["ctxt_switches"]["voluntary"]
+            s["ctxt_involuntary"] += doc["ctxt_switches"]["involuntary"]
+    for s in summary.values():
+        cpu = s["cpu_user"] + s["cpu_system"]
+        s["cpu_percent"] = round(100 * cpu / s["duration"], 3) if s["duration"] else 0
+        for key in ("duration", "cpu_user", "cpu_system"):
+            s[key] = round(s[key], 2)
+    return summary
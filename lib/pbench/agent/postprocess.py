@@ -0,0 +1,220 @@
+"""Post-processing of the data collected by transient tools.
+
+Each registered tool script has a "--postprocess" mode, run once per host
+on the data it collected for that host.  The invocations are independent of
+each other, so they are run concurrently, in a pool sized by the number of
+CPUs and the available memory.  The output of each invocation, followed by
+its exit status and duration, is appended to the "postprocess.log" file of
+the host's tool data directory.
+
+A Tool Meister can post-process its own tool data before sending it (see
+`ToolMeister.send_tools()`); the tools it post-processed successfully are
+listed in the "postprocess.done" file of the host directory, and skipped
+by `pbench-postprocess-tools`.
+
+    python3 -m pbench.agent.postprocess <group> <tool output dir> <tool-scripts dir>
+"""
+from argparse import ArgumentParser
+from concurrent.futures import as_completed, ThreadPoolExecutor
+import os
+from pathlib import Path
+import subprocess
+import sys
+import time
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+from pbench.agent.tool_group import BadToolGroup, ToolGroup
+from pbench.agent.utils import error_log, warn_log
+
+# The tools whose data is handled by the Tool Meister itself, which have no
+# post-processing step.
+_SKIPPED_TOOLS = frozenset(("dcgm", "node-exporter", "pcp", "pcp-transient"))
+
+# Memory set aside for one post-processing invocation, bounding the number of
+# concurrent invocations on hosts short of memory.
+_JOB_MEMORY = 512 * 2**20
+
+LOG_FILE = "postprocess.log"
+DONE_FILE = "postprocess.done"
+
+
+class Job(NamedTuple):
+    """One post-processing invocation: a tool's script on a host's data."""
+
+    host_dir: Path
+    tool: str
+    args: List[str]
+
+
+class Result(NamedTuple):
+    job: Job
+    returncode: int
+    output: str
+    elapsed: float
+
+
+def default_workers() -> int:
+    """Return the number of concurrent post-processing invocations to use:
+    one per CPU available to us, bounded by the available memory.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    cpus = min(cpus, available // _JOB_MEMORY)
+                    break
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def host_jobs(host_dir: Path, tools: Iterable[str], tool_scripts: Path) -> List[Job]:
+    """Return the post-processing jobs of the given tools for the data of one
+    host, skipping the unknown tools, the tools without a post-processing
+    step, and the tools already post-processed.
+    """
+    try:
+        done = set((host_dir / DONE_FILE).read_text().split())
+    except FileNotFoundError:
+        done = set()
+    jobs = []
+    for tool in sorted(tools):
+        if tool in _SKIPPED_TOOLS or tool in done:
+            continue
+        script = tool_scripts / tool
+        if not os.access(script, os.X_OK):
+            # Ignore unrecognized tools
+            continue
+        jobs.append(
+            Job(host_dir, tool, [str(script), "--postprocess", f"--dir={host_dir}"])
+        )
+    return jobs
+
+
+def find_jobs(
+    tool_group: ToolGroup, tool_output_dir: Path, tool_scripts: Path
+) -> Tuple[List[Job], int]:
+    """Return the post-processing jobs for all the hosts of the tool group,
+    and the number of hosts missing their tool data directory.
+    """
+    jobs = []
+    missing = 0
+    for host in sorted(tool_group.hostnames):
+        # FIXME: add support for label applied to the hostname directory.
+        host_dir = tool_output_dir / host
+        if not host_dir.is_dir():
+            warn_log(
+                f"[pbench-postprocess-tools] Missing tool output directory,"
+                f" '{host_dir}'"
+            )
+            missing += 1
+            continue
+        jobs.extend(host_jobs(host_dir, tool_group.get_tools(host), tool_scripts))
+    return jobs, missing
+
+
+def _run(job: Job) -> Result:
+    start = time.perf_counter()
+    try:
+        cp = subprocess.run(
+            job.args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+    except OSError as exc:
+        returncode, output = 127, f"{exc}\n"
+    else:
+        returncode, output = cp.returncode, cp.stdout.decode("utf-8", "replace")
+    return Result(job, returncode, output, time.perf_counter() - start)
+
+
+def run_jobs(
+    jobs: List[Job],
+    workers: Optional[int] = None,
+    record_done: bool = False,
+    report_failure: Optional[Callable[[Result], None]] = None,
+) -> int:
+    """Run the post-processing jobs, at most `workers` at a time, logging the
+    output and timing of each into its host's "postprocess.log" file.
+
+    Args:
+        jobs        The jobs to run
+        workers     The number of concurrent jobs, default_workers() if None
+        record_done Whether to record the successful jobs in the host's
+                    "postprocess.done" file, so they are not run again
+        report_failure  Called with the Result of each failed job, if given
+
+    Returns the number of failed jobs.
+    """
+    if not jobs:
+        return 0
+    failures = 0
+    with ThreadPoolExecutor(max_workers=workers or default_workers()) as executor:
+        for future in as_completed([executor.submit(_run, job) for job in jobs]):
+            res = future.result()
+            job = res.job
+            with (job.host_dir / LOG_FILE).open("a") as log:
+                log.write(f"+++ {job.tool} {' '.join(job.args[1:])}\n")
+                log.write(res.output)
+                if res.output and not res.output.endswith("\n"):
+                    log.write("\n")
+                log.write(
+                    f"--- {job.tool}: exit status {res.returncode},"
+                    f" {res.elapsed:.2f} seconds\n"
+                )
+                if res.returncode == 0 and record_done:
+                    with (job.host_dir / DONE_FILE).open("a") as done:
+                        done.write(f"{job.tool}\n")
+            if res.returncode != 0:
+                failures += 1
+                if report_failure is not None:
+                    report_failure(res)
+    return failures
+
+
+def main() -> int:
+    parser = ArgumentParser(
+        "pbench-postprocess-tools",
+        description="Post-process the data collected by the tools of a group.",
+    )
+    parser.add_argument("group", help="The tool group")
+    parser.add_argument(
+        "tool_output_dir",
+        help="The directory holding the tool data of each host of the group",
+    )
+    parser.add_argument("tool_scripts", help="The directory of the tool scripts")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("PBENCH_POSTPROCESS_WORKERS", "0")),
+        help=(
+            "The number of concurrent post-processing invocations (also set by"
+            " PBENCH_POSTPROCESS_WORKERS); by default, one per CPU, bounded by"
+            " the available memory."
+        ),
+    )
+    args = parser.parse_args()
+    try:
+        tool_group = ToolGroup(args.group)
+    except BadToolGroup as exc:
+        error_log(f"[pbench-postprocess-tools] {exc}")
+        return 1
+    jobs, failures = find_jobs(
+        tool_group, Path(args.tool_output_dir), Path(args.tool_scripts)
+    )
+
+    def report(res: Result):
+        print(res.output, end="", file=sys.stderr)
+
+    failures += run_jobs(jobs, args.workers or None, report_failure=report)
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(main())
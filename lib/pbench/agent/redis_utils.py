@@ -2,20 +2,72 @@
 """
 import json
 import logging
+import queue
+import threading
 import time
 
 import redis
 from redis.connection import SERVER_CLOSED_CONNECTION_ERROR
 
+from pbench.agent.constants import tm_transport_pubsub, tm_transport_streams
+
 # Maximum time to wait for the Redis server to respond.
 REDIS_MAX_WAIT = 60
 
+# The first Redis server version providing Streams.
+_STREAMS_MIN_VERSION = (5, 0)
+# Approximate maximum number of entries kept in a stream.
+STREAM_MAXLEN = 10000
+# Maximum number of stream entries read (and acknowledged) at once.
+STREAM_BATCH = 100
+# Time, in milliseconds, a stream read waits for new entries, which bounds
+# how long it takes a reader to notice it was closed.
+_STREAM_BLOCK_MS = 1000
+
+# Maximum number of log records published in one message by a RedisHandler.
+LOG_BATCH = 100
+# Maximum number of log records a RedisHandler queues for publication.
+LOG_QUEUE_SIZE = 10000
+# Time, in seconds, a RedisHandler waits for more records to publish, which
+# bounds how long it takes to notice it was closed.
+_LOG_FLUSH_INTERVAL = 0.1
+# Time, in seconds, a WARNING or higher record waits for room in a full queue.
+_LOG_PUT_TIMEOUT = 0.1
+
 
 class RedisChannelSubscriberError(Exception):
     pass
 
 
-class RedisChannelSubscriber:
+class _RedisSubscriber:
+    """Behaviors common to the subscribers of channels and streams."""
+
+    def fetch_message(self, logger):
+        raise NotImplementedError()
+
+    def fetch_json(self, logger):
+        """fetch_json - a simple wrapper around fetch_message() to decode the
+        string as a JSON document.
+
+        If the message is not valid JSON a warning is logged, and the message
+        is ignored.
+
+        Yields a JSON document.
+        """
+        for json_str in self.fetch_message(logger):
+            try:
+                data = json.loads(json_str)
+            except json.JSONDecodeError:
+                logger.warning(
+                    "data payload in message not JSON on channel %s, '%s'",
+                    self.channel_name,
+                    json_str,
+                )
+            else:
+                yield data
+
+
+class RedisChannelSubscriber(_RedisSubscriber):
     """RedisChannelSubscriber - encapsulate semantic behaviors we require as a
     subscriber of a pub/sub Redis channel.
     """
@@ -142,27 +194,6 @@ class RedisChannelSubscriber:
             else:
                 raise
 
-    def fetch_json(self, logger):
-        """fetch_json - a simple wrapper around fetch_message() to decode the
-        string as a JSON document.
-
-        If the message is not valid JSON a warning is logged, and the message
-        is ignored.
-
-        Yields a JSON document.
-        """
-        for json_str in self.fetch_message(logger):
-            try:
-                data = json.loads(json_str)
-            except json.JSONDecodeError:
-                logger.warning(
-                    "data payload in message not JSON on channel %s, '%s'",
-                    self.channel_name,
-                    json_str,
-                )
-            else:
-                yield data
-
     def unsubscribe(self):
         """unsubscribe - unsubscribes from the channel, leaving the pub/sub
         object alone.
@@ -177,8 +208,235 @@ class RedisChannelSubscriber:
             self._pubsub.close()
 
 
+class RedisStreamSubscriber(_RedisSubscriber):
+    """RedisStreamSubscriber - read the messages of a Redis stream as the
+    (only) consumer of a consumer group, behaving as a RedisChannelSubscriber.
+
+    Unlike a pub/sub channel, messages added while the reader is connecting,
+    or re-connecting, are not lost: the consumer group keeps its position in
+    the stream, and the messages read but not yet acknowledged are read again
+    after a lost connection.  Messages are read, and acknowledged, in batches.
+    """
+
+    def __init__(
+        self,
+        redis_server,
+        stream_name,
+        group_name,
+        start_id="0",
+        batch=STREAM_BATCH,
+    ):
+        """RedisStreamSubscriber constructor - creates the consumer group on
+        the stream (and the stream itself), unless it already exists.
+
+        :redis_server: - The Redis() server client object
+        :stream_name:  - The name of the stream to read
+        :group_name:   - The name of the consumer group, and of its consumer;
+                         every reader of all the messages of a stream needs
+                         its own group
+        :start_id:     - The ID of the last message of the stream the group
+                         has already read when it is created, "0" to read the
+                         entire stream, "$" to only read new messages
+        :batch:        - The maximum number of messages read at once
+        """
+        self.channel_name = stream_name
+        self.group_name = group_name
+        self.batch = batch
+        self._rs = redis_server
+        self._closed = False
+
+        timeout = time.time() + REDIS_MAX_WAIT
+        while True:
+            try:
+                redis_server.xgroup_create(
+                    stream_name, group_name, id=start_id, mkstream=True
+                )
+            except redis.ConnectionError:
+                if time.time() > timeout:
+                    raise
+                time.sleep(0.1)
+            except redis.ResponseError as exc:
+                if not str(exc).startswith("BUSYGROUP"):
+                    raise RedisChannelSubscriberError(
+                        f"bad group {group_name} on stream {stream_name}: {exc}"
+                    )
+                # A group re-created by the same reader, picking up where it
+                # left off.
+                break
+            else:
+                break
+
+    def _ack(self, ids):
+        self._rs.xack(self.channel_name, self.group_name, *ids)
+
+    def fetch_message(self, logger):
+        """fetch_message - generator for pulling messages off the stream.
+
+        Behaves as RedisChannelSubscriber.fetch_message(), with the messages
+        yielded being acknowledged when the next one is requested, or when the
+        generator is closed.  The generator terminates when the subscriber is
+        closed, when the connection to the Redis server could not be
+        re-established within REDIS_MAX_WAIT seconds, or when the stream (or
+        its consumer group) is deleted, as happens when a new run starts
+        while a pooled Tool Meister is still reading it.
+
+        Yields a string representing the received message.
+        """
+        # Read the messages pending for our consumer first (ID "0"), that is,
+        # the ones which were read but not acknowledged, then new ones (">").
+        last_id = "0"
+        to_ack = []
+        lost_at = None
+        try:
+            while not self._closed:
+                try:
+                    if to_ack:
+                        self._ack(to_ack)
+                        to_ack = []
+                    resp = self._rs.xreadgroup(
+                        self.group_name,
+                        self.group_name,
+                        {self.channel_name: last_id},
+                        count=self.batch,
+                        block=None if last_id == "0" else _STREAM_BLOCK_MS,
+                    )
+                except redis.ConnectionError:
+                    now = time.time()
+                    if lost_at is None:
+                        lost_at = now
+                        logger.warning(
+                            "lost connection to redis server on stream %s,"
+                            " re-connecting",
+                            self.channel_name,
+                        )
+                    elif now > lost_at + REDIS_MAX_WAIT:
+                        logger.error(
+                            "lost connection to redis server on stream %s",
+                            self.channel_name,
+                        )
+                        break
+                    time.sleep(0.1)
+                    last_id = "0"
+                    continue
+                except redis.ResponseError as exc:
+                    # Whatever was read but not acknowledged is gone too.
+                    to_ack = []
+                    if str(exc).startswith("NOGROUP"):
+                        logger.warning(
+                            "stream %s, or its consumer group %s, was deleted,"
+                            " no longer reading it",
+                            self.channel_name,
+                            self.group_name,
+                        )
+                    else:
+                        logger.error(
+                            "error reading stream %s: %s", self.channel_name, exc
+                        )
+                    break
+                if lost_at is not None:
+                    logger.info(
+                        "re-connected to redis server on stream %s", self.channel_name
+                    )
+                    lost_at = None
+                entries = resp[0][1] if resp else []
+                if not entries:
+                    # Nothing (more) pending, or no new message yet.
+                    last_id = ">"
+                    continue
+                logger.debug("%d message(s) from %s", len(entries), self.channel_name)
+                for entry_id, fields in entries:
+                    to_ack.append(entry_id)
+                    try:
+                        message = fields[b"data"].decode("utf-8")
+                    except Exception:
+                        logger.warning(
+                            "Data payload in message not UTF-8 on stream %s, %r",
+                            self.channel_name,
+                            fields,
+                        )
+                    else:
+                        logger.debug(
+                            "stream %s payload, %r", self.channel_name, message
+                        )
+                        yield message
+        finally:
+            if to_ack:
+                try:
+                    self._ack(to_ack)
+                except redis.RedisError:
+                    # They'll be read again by the next fetch.
+                    pass
+
+    def unsubscribe(self):
+        """unsubscribe - stop reading the stream, leaving the consumer group
+        in place.
+        """
+        self._closed = True
+
+    def close(self):
+        """close - stop reading the stream."""
+        self._closed = True
+
+
+def open_subscriber(
+    redis_server,
+    name,
+    transport=tm_transport_pubsub,
+    group_name=None,
+    channel_type=RedisChannelSubscriber.ONLYONE,
+):
+    """open_subscriber - subscribe to the channel, or read the stream as a
+    member of the given consumer group, of the given name, depending on the
+    transport.
+
+    Returns a RedisChannelSubscriber or RedisStreamSubscriber object.
+    """
+    if transport == tm_transport_streams:
+        return RedisStreamSubscriber(redis_server, name, group_name)
+    return RedisChannelSubscriber(redis_server, name, channel_type)
+
+
+def redis_publish(redis_server, name, message, transport=tm_transport_pubsub):
+    """redis_publish - publish the message on the channel, or add it to the
+    stream, of the given name, depending on the transport.
+
+    Returns the number of receivers of the message: the subscribers of the
+    channel, or the consumer groups of the stream (which includes readers
+    which are momentarily disconnected).
+    """
+    if transport != tm_transport_streams:
+        return redis_server.publish(name, message)
+    pipe = redis_server.pipeline(transaction=False)
+    pipe.xadd(name, {"data": message}, maxlen=STREAM_MAXLEN, approximate=True)
+    pipe.xinfo_groups(name)
+    _, groups = pipe.execute()
+    return len(groups)
+
+
+def streams_supported(redis_server) -> bool:
+    """streams_supported - return True if the Redis server provides Streams."""
+    try:
+        version = redis_server.info("server")["redis_version"]
+        return tuple(int(v) for v in version.split(".")[:2]) >= _STREAMS_MIN_VERSION
+    except (redis.RedisError, KeyError, ValueError):
+        return False
+
+
 class RedisHandler(logging.Handler):
-    """Publish messages to a given channel on a Redis server."""
+    """Publish messages to a given channel on a Redis server.
+
+    Records are not published as they are emitted: they are formatted and
+    queued, and a thread of the handler publishes them in batches of up to
+    LOG_BATCH records, one message per batch with one record per line, so
+    that a Tool Meister logging at debug level neither waits on the Redis
+    server nor floods it.
+
+    When the queue is full, records below the WARNING level are dropped, and
+    the others wait briefly for room before being dropped; the dropped
+    records are counted in `overflow`, and reported in the next batch.  The
+    records still queued are published when the handler is flushed or
+    closed.
+    """
 
     def __init__(
         self,
@@ -186,6 +444,8 @@ class RedisHandler(logging.Handler):
         hostname=None,
         redis_client=None,
         level=logging.NOTSET,
+        batch=LOG_BATCH,
+        queue_size=LOG_QUEUE_SIZE,
         **redis_kwargs,
     ):
         """Create a new logger for the given channel and redis_client."""
@@ -193,27 +453,95 @@ class RedisHandler(logging.Handler):
         self.channel = channel
         self.hostname = hostname
         self.redis_client = redis_client or redis.Redis(**redis_kwargs)
+        self.batch = batch
         self.counter = 0
         self.errors = 0
         self.redis_errors = 0
         self.dropped = 0
+        self.overflow = 0
+        # Overflowed records not yet reported in a published batch.
+        self._unreported = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._publisher, daemon=True)
+        self._thread.start()
 
     def emit(self, record):
-        """Publish record to redis logging channel"""
+        """Queue record for publication on the redis logging channel"""
         try:
-            formatted_record = self.format(record)
-            num_present = self.redis_client.publish(
-                self.channel, f"{self.hostname} {self.counter:04d} {formatted_record}"
-            )
-        except redis.RedisError:
-            self.redis_errors += 1
+            line = f"{self.hostname} {self.counter:04d} {self.format(record)}"
         except Exception:
             self.errors += 1
-        else:
-            if num_present == 0:
-                self.dropped += 1
-        finally:
             self.counter += 1
+            return
+        self.counter += 1
+        try:
+            if record.levelno < logging.WARNING:
+                self._queue.put_nowait(line)
+            else:
+                self._queue.put(line, timeout=_LOG_PUT_TIMEOUT)
+        except queue.Full:
+            self.overflow += 1
+            self._unreported += 1
+
+    def _next_batch(self):
+        """Wait for a record, and return it with all the ones queued behind
+        it, up to a batch.  Returns an empty list once the handler is closed
+        and its queue drained.
+        """
+        lines = []
+        while not lines:
+            try:
+                lines.append(self._queue.get(timeout=_LOG_FLUSH_INTERVAL))
+            except queue.Empty:
+                if self._closed:
+                    return lines
+        while len(lines) < self.batch:
+            try:
+                lines.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return lines
+
+    def _publisher(self):
+        while True:
+            lines = self._next_batch()
+            if not lines:
+                break
+            records = len(lines)
+            self.acquire()
+            try:
+                unreported, self._unreported = self._unreported, 0
+            finally:
+                self.release()
+            if unreported:
+                lines.append(
+                    f"{self.hostname} {self.counter:04d} WARNING RedisHandler --"
+                    f" {unreported} log records dropped, the queue is full"
+                )
+            try:
+                num_present = self.redis_client.publish(self.channel, "\n".join(lines))
+            except redis.RedisError:
+                self.redis_errors += records
+            except Exception:
+                self.errors += records
+            else:
+                if num_present == 0:
+                    self.dropped += records
+            finally:
+                for _ in range(records):
+                    self._queue.task_done()
+
+    def flush(self):
+        """Wait for all the queued records to be published"""
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """Publish the queued records, and stop the publishing thread"""
+        self._closed = True
+        self._thread.join()
+        super().close()
 
 
 # The connection retry interval to use in seconds.
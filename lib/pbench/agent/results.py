@@ -1,21 +1,33 @@
 import collections
+from concurrent.futures import as_completed, ThreadPoolExecutor
 import datetime
+from functools import partial
+import hashlib
 from logging import Logger
 import os
 from pathlib import Path
 import shutil
 import subprocess
+import time
 import urllib.parse
 
 import requests
 
 from pbench.agent import PbenchAgentConfig
 from pbench.common import MetadataLog
+from pbench.common.compression import CODECS, DEFAULT_CODEC
 from pbench.common.exceptions import BadMDLogFormat
-from pbench.common.utils import md5sum, validate_hostname
+from pbench.common.utils import FileRange, validate_hostname
 
 TarballRecord = collections.namedtuple("TarballRecord", ["name", "length", "md5"])
 
+# The codecs with which result tar balls may be compressed, i.e., those the
+# Pbench Server accepts.
+RESULT_CODECS = ("xz", "zstd")
+
+# Read size used when hashing the compressed tar ball as it is written.
+_BUFFER_SIZE = 2**20
+
 
 class MakeResultTb:
     """Interfaces for creating a result tar ball."""
@@ -75,9 +87,18 @@ class MakeResultTb:
         self.tar_path = shutil.which("tar")
         if self.tar_path is None:
             raise RuntimeError("External 'tar' executable not found")
-        self.xz_path = shutil.which("xz")
-        if self.xz_path is None:
-            raise RuntimeError("External 'xz' executable not found")
+        codec_name = config.get("results", "compression", fallback=DEFAULT_CODEC.name)
+        if codec_name not in RESULT_CODECS:
+            raise ValueError(
+                f"Unsupported result tar ball compression {codec_name!r},"
+                f" must be one of {', '.join(RESULT_CODECS)}"
+            )
+        self.codec = CODECS[codec_name]
+        level = config.get("results", "compression_level", fallback="")
+        self.level = int(level) if level else None
+        self.compressor_path = shutil.which(self.codec.command)
+        if self.compressor_path is None:
+            raise RuntimeError(f"External {self.codec.command!r} executable not found")
         self.result_dir = self._check_result_target_dir(result_dir, "Result")
         self.target_dir = self._check_result_target_dir(target_dir, "Target")
         self.config = config
@@ -128,14 +149,38 @@ class MakeResultTb:
             )
         return msg
 
-    def make_result_tb(self, single_threaded: bool = False) -> TarballRecord:
+    @staticmethod
+    def _raw_size(directory: Path) -> int:
+        """Return the total size of everything below a directory.
+
+        Only the stat data of the directory entries is used, so no file is
+        read; as with `Path.rglob()`, symbolic links to directories are not
+        followed.
+        """
+        total = 0
+        pending = [directory]
+        while pending:
+            with os.scandir(pending.pop()) as it:
+                for entry in it:
+                    total += entry.stat().st_size
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+        return total
+
+    def make_result_tb(
+        self, single_threaded: bool = False, write_md5: bool = False
+    ) -> TarballRecord:
         """Make the result tar ball from result directory.
 
         The metadata.log file in the result directory is double checked to be
         sure it is valid, and then the "run.raw_size" and the
         "pbench.tar-ball-creation-timestamp" fields are added.
 
-        The tar ball is created, verified, and the MD5 sum value is generated.
+        The tar ball is created by a single `tar | <compressor>` pipeline
+        whose output we write to the tar ball ourselves, computing its length
+        and MD5 sum value as we go, so the result directory is read once and
+        the tar ball is never read back.  When `write_md5` is True, the MD5
+        sum value is also written to a ".md5" file alongside the tar ball.
 
         Returns a named tuple consisting of the Path object of the created tar
         ball, its length, and its MD5 checksum value.
@@ -184,7 +229,7 @@ class MakeResultTb:
                 mdlog.set("run", "controller_orig", md_controller)
             mdlog.set("run", "controller", self.controller)
 
-        result_size = sum(f.stat().st_size for f in self.result_dir.rglob("*"))
+        result_size = self._raw_size(self.result_dir)
         self.logger.debug(
             "Preparing to tar up %d bytes of data from %s",
             result_size,
@@ -198,49 +243,60 @@ class MakeResultTb:
         with mdlog_name.open("w") as fp:
             mdlog.write(fp)
 
-        tarball = self.target_dir / f"{pbench_run_name}.tar.xz"
+        tarball = self.target_dir / f"{pbench_run_name}{self.codec.tar_suffix()}"
         e_file = self.target_dir / f"{pbench_run_name}.tar.err"
-        args = [self.tar_path, "--create", "--force-local"]
-        if single_threaded:
-            args.append("--xz")
-        args.append(pbench_run_name)
+        args = [self.tar_path, "--create", "--force-local", pbench_run_name]
+        compress_args = self.codec.compress_args(
+            self.level, threads=1 if single_threaded else 0
+        )
+        compress_args[0] = self.compressor_path
+        md5 = hashlib.md5()
+        tar_len = 0
+        procs = []
         try:
             # Invoke tar directly for efficiency.
-            with tarball.open("w") as ofp, e_file.open("w") as efp:
-                if single_threaded:
-                    xz_proc = None
-                else:
-                    xz_proc = subprocess.Popen(
-                        [self.xz_path, "-T0"],
-                        cwd=str(self.target_dir),
-                        stdin=subprocess.PIPE,
-                        stdout=ofp,
-                        stderr=efp,
-                    )
+            with tarball.open("wb") as ofp, e_file.open("w") as efp:
+                compress_proc = subprocess.Popen(
+                    compress_args,
+                    cwd=str(self.target_dir),
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=efp,
+                )
+                procs.append(compress_proc)
                 tar_proc = subprocess.Popen(
                     args,
                     cwd=str(self.result_dir.parent),
                     stdin=None,
-                    stdout=xz_proc.stdin if xz_proc else ofp,
+                    stdout=compress_proc.stdin,
                     stderr=efp,
                 )
+                procs.append(tar_proc)
+                # The `tar` command now holds the only write end of the pipe
+                # to the compression command, which sees EOF when `tar`
+                # exits.
+                compress_proc.stdin.close()
+                for buf in iter(partial(compress_proc.stdout.read, _BUFFER_SIZE), b""):
+                    ofp.write(buf)
+                    md5.update(buf)
+                    tar_len += len(buf)
                 tar_proc.wait()
-                if xz_proc:
-                    # Now that the `tar` command has exited, we close the
-                    # `stdin` of the `xz` command to shut it down.
-                    xz_proc.stdin.close()
-                    xz_proc.wait()
+                compress_proc.wait()
         except Exception as exc:
+            for proc in procs:
+                proc.kill()
+                proc.wait()
             msg = self._unlink_tarball(
                 tarball, f"Tar ball creation failed for {self.result_dir}, {exc}"
             )
             raise RuntimeError(msg)
         else:
             if tar_proc.returncode == 0:
-                if xz_proc is not None and xz_proc.returncode != 0:
+                if compress_proc.returncode != 0:
                     msg = self._unlink_tarball(
                         tarball,
-                        f"Failed to create tar ball; 'xz' return code: {xz_proc.returncode:d}",
+                        f"Failed to create tar ball; {self.codec.command!r} return"
+                        f" code: {compress_proc.returncode:d}",
                     )
                     raise RuntimeError(msg)
                 else:
@@ -255,20 +311,22 @@ class MakeResultTb:
                             unlink_exc,
                         )
             else:
-                # We explicitly ignore the return code from the optional 'xz' process.
+                # We explicitly ignore the return code from the compression process.
                 msg = self._unlink_tarball(
                     tarball,
                     f"Failed to create tar ball; 'tar' return code: {tar_proc.returncode:d}",
                 )
                 raise RuntimeError(msg)
-        try:
-            (tar_len, tar_md5) = md5sum(tarball)
-        except Exception:
-            msg = self._unlink_tarball(
-                tarball,
-                f"Failed to verify and generate MD5 for created tar ball, '{tarball}'",
-            )
-            raise RuntimeError(msg)
+        tar_md5 = md5.hexdigest()
+        if write_md5:
+            md5_file = Path(f"{tarball}.md5")
+            try:
+                md5_file.write_text(f"{tar_md5}  {tarball.name}\n")
+            except Exception as exc:
+                msg = self._unlink_tarball(
+                    tarball, f"Failed to write MD5 file, '{md5_file}': '{exc}'"
+                )
+                raise RuntimeError(msg)
 
         return TarballRecord(name=tarball, length=tar_len, md5=tar_md5)
 
@@ -309,6 +367,14 @@ class CopyResultTb:
         server_rest_url = config.get("results", "server_rest_url")
         tbname = urllib.parse.quote(self.tarball.name)
         self.upload_url = f"{server_rest_url}/upload/{tbname}"
+        self.session_url = f"{server_rest_url}/upload/session/{tbname}"
+        self.part_url = f"{server_rest_url}/upload/part/{tbname}"
+        self.part_size = (
+            int(config.get("results", "upload_part_size_mb", fallback="0")) * 2**20
+        )
+        self.workers = max(
+            int(config.get("results", "upload_workers", fallback="1")), 1
+        )
         self.logger = logger
 
     def copy_result_tb(self, token: str) -> None:
@@ -325,6 +391,10 @@ class CopyResultTb:
             FileUploadError  if the tar ball failed to upload properly
 
         """
+        if self.part_size > 0 and self.tarball_len > self.part_size:
+            self.copy_result_tb_parts(token)
+            return
+
         headers = {
             "Content-MD5": self.tarball_md5,
             "Authorization": f"Bearer {token}",
@@ -371,3 +441,142 @@ class CopyResultTb:
         assert (
             response.ok
         ), f"Logic error!  Unexpected error response, '{response.reason}' ({response.status_code})"
+
+    # Number of additional attempts made to send a single part before giving
+    # up on it.
+    PART_RETRIES = 2
+
+    # Delay, in seconds, before the first retry of a part; it doubles on each
+    # subsequent retry.
+    PART_RETRY_DELAY = 1.0
+
+    # Seconds to wait for the server to respond to a part upload.
+    PART_TIMEOUT = 300
+
+    def copy_result_tb_parts(self, token: str) -> None:
+        """Copies the tar ball from the agent to the configured server in
+        parts, using the server's resumable upload session API.
+
+        The session is initiated (or resumed, if an earlier attempt failed
+        part way through), the parts the server does not already have are
+        sent in parallel using up to `upload_workers` connections, and the
+        session is then completed, at which point the server assembles the
+        parts and verifies the MD5 of the whole tar ball.
+
+        Args
+            token -- a token which establishes that the caller is
+                authorized to make the requests on behalf of a
+                specific user.
+
+        Raises
+            RuntimeError     if a connection to the server fails
+            FileUploadError  if the tar ball failed to upload properly
+        """
+        headers = {"Authorization": f"Bearer {token}"}
+        try:
+            response = requests.post(
+                self.session_url,
+                json={
+                    "controller": self.controller,
+                    "md5": self.tarball_md5,
+                    "size": self.tarball_len,
+                    "part_size": self.part_size,
+                },
+                headers=headers,
+            )
+            response.raise_for_status()
+            session = response.json()
+            if "parts" not in session:
+                # The server already has this tar ball.
+                self.logger.info("File uploaded successfully")
+                return
+
+            received = set(session["received"])
+            missing = [p for p in range(1, session["parts"] + 1) if p not in received]
+            self.logger.debug(
+                "Uploading %d of %d parts of %s",
+                len(missing),
+                session["parts"],
+                self.tarball.name,
+            )
+            failed = []
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {
+                    executor.submit(self._put_part, token, p): p for p in missing
+                }
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except requests.exceptions.ConnectionError:
+                        raise
+                    except Exception as exc:
+                        self.logger.warning(
+                            "Part %d of %s failed to upload: %s",
+                            futures[future],
+                            self.tarball.name,
+                            exc,
+                        )
+                        failed.append(futures[future])
+            if failed:
+                raise self.FileUploadError(
+                    f"Parts {sorted(failed)} failed to upload; a later attempt"
+                    " will resume with the missing parts"
+                )
+
+            response = requests.put(self.session_url, headers=headers)
+            response.raise_for_status()
+            self.logger.info("File uploaded successfully")
+        except requests.exceptions.ConnectionError:
+            raise RuntimeError(f"Cannot connect to '{self.session_url}'")
+        except self.FileUploadError:
+            raise
+        except Exception as exc:
+            raise self.FileUploadError(
+                "There was something wrong with file upload request: "
+                f"file: '{self.tarball}', URL: '{self.session_url}';"
+                f" error: '{exc}'"
+            )
+
+    def _put_part(self, token: str, part: int) -> None:
+        """Send one part of the tar ball, retrying a few times, with an
+        increasing delay, on an error response, a connection failure, or a
+        timeout.
+
+        The part is streamed directly from the tar ball with its own MD5 so
+        that the server can verify it independently of the other parts.
+        """
+        offset = (part - 1) * self.part_size
+        length = min(self.part_size, self.tarball_len - offset)
+        with FileRange(self.tarball, offset, length) as body:
+            headers = {
+                "Content-MD5": body.md5(),
+                "Authorization": f"Bearer {token}",
+            }
+            delay = self.PART_RETRY_DELAY
+            for attempt in range(self.PART_RETRIES + 1):
+                body.rewind()
+                try:
+                    response = requests.put(
+                        f"{self.part_url}/{part}",
+                        data=body,
+                        headers=headers,
+                        timeout=self.PART_TIMEOUT,
+                    )
+                    response.raise_for_status()
+                    return
+                except (
+                    requests.exceptions.HTTPError,
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                ) as exc:
+                    if attempt == self.PART_RETRIES:
+                        raise
+                    self.logger.debug(
+                        "Retrying part %d of %s in %.1f seconds: %s",
+                        part,
+                        self.tarball.name,
+                        delay,
+                        exc,
+                    )
+                    time.sleep(delay)
+                    delay *= 2
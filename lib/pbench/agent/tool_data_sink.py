@@ -10,23 +10,28 @@
 #   sudo pip3 install python-pidfile
 
 from configparser import DuplicateSectionError
+from contextlib import contextmanager
 from datetime import datetime
 import errno
 import hashlib
 from http import HTTPStatus
 import json
 import logging
+import math
 import os
 from pathlib import Path
+import random
 import shutil
+from socketserver import ThreadingMixIn
 import subprocess
 import sys
 import tempfile
-from threading import Condition, Lock, Thread
-from typing import Any, Dict, List, NamedTuple, Tuple
-from wsgiref.simple_server import make_server, WSGIRequestHandler
+from threading import BoundedSemaphore, Condition, Event, Lock, Thread
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from wsgiref.simple_server import make_server, WSGIRequestHandler, WSGIServer
 
-from bottle import abort, Bottle, request, ServerAdapter
+from bottle import abort, Bottle, HTTPResponse, request, ServerAdapter
 from daemon import DaemonContext
 from jinja2 import Environment, FileSystemLoader
 import pidfile
@@ -40,11 +45,19 @@ from pbench.agent.constants import (
     tm_channel_suffix_to_logging,
     tm_channel_suffix_to_tms,
     tm_data_key,
+    tm_transport_pubsub,
+)
+from pbench.agent.overhead import OVERHEAD_TOOL, summarize_overhead
+from pbench.agent.redis_utils import (
+    open_subscriber,
+    redis_publish,
+    RedisChannelSubscriber,
+    wait_for_conn_and_key,
 )
-from pbench.agent.redis_utils import RedisChannelSubscriber, wait_for_conn_and_key
 from pbench.agent.toolmetadata import ToolMetadata
 from pbench.agent.utils import collect_local_info
 from pbench.common import MetadataLog
+from pbench.common.compression import available_codecs, CODECS, DEFAULT_CODEC, negotiate
 from pbench.common.utils import canonicalize
 
 # Logging format string for unit tests
@@ -58,6 +71,26 @@ _BUFFER_SIZE = 65536
 # Maximum size of the tar ball for collected tool data.
 _MAX_TOOL_DATA_SIZE = 2**30
 
+# Buffer size of the Tool Meister log file, and the maximum time, in seconds,
+# records received from the Tool Meisters stay in that buffer.
+_TM_LOG_BUFFER_SIZE = 1024 * 1024
+_TM_LOG_FLUSH_INTERVAL = 1
+
+# Default limits on the number of tool data uploads received at once, and on
+# the number of tool data tar balls extracted at once.
+DEFAULT_MAX_UPLOADS = 16
+DEFAULT_MAX_EXTRACTS = 4
+# Time, in seconds, an upload slot granted to a Tool Meister is kept for it
+# before its PUT request arrives.
+_SLOT_TTL = 30
+# Time, in seconds, a request for an upload slot waits for one to be freed
+# before being told to try again later.
+_SLOT_WAIT = 1.0
+# Bounds, in seconds, of the "Retry-After" delay given to the Tool Meisters
+# when no upload slot is available.
+_MIN_RETRY_AFTER = 1
+_MAX_RETRY_AFTER = 30
+
 # Expected metadata from received state signals
 METADATA_KEYS = {"group", "directory", "args"}
 
@@ -77,6 +110,90 @@ def _now(when):
         return datetime.utcnow().isoformat()
 
 
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """A WSGIServer serving each request in a thread of its own, with a listen
+    backlog deep enough for all the Tool Meisters of large runs to connect at
+    once; the number of uploads handled at once is limited by UploadSlots.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class UploadSlots:
+    """UploadSlots - the bounded set of Tool Meisters allowed to upload their
+    tool data at the same time.
+
+    A Tool Meister reserves a slot before sending its PUT request (see
+    `ToolDataSink.reserve_slot()`), and is told when to try again if none is
+    available.  A reserved slot which is not used within `ttl` seconds is
+    given back.  A PUT request without a reserved slot waits for one.
+
+    The slots also keep a moving average of the time, in seconds, an upload
+    takes, in `upload_time`.
+    """
+
+    def __init__(self, limit: int, ttl: float = _SLOT_TTL):
+        self.limit = limit
+        self.ttl = ttl
+        self.upload_time = 1.0
+        self._cv = Condition(lock=Lock())
+        # Host name -> expiration time of its reservation, None while the
+        # host is uploading.
+        self._holders: Dict[str, float] = {}
+
+    def _expire(self):
+        now = time.monotonic()
+        for hostname, expires in list(self._holders.items()):
+            if expires is not None and expires < now:
+                del self._holders[hostname]
+
+    def reserve(self, hostname: str, wait: float = 0.0) -> bool:
+        """Reserve a slot for the host, waiting up to `wait` seconds for one,
+        returns False if none is available.
+        """
+        with self._cv:
+            deadline = time.monotonic() + wait
+            while True:
+                self._expire()
+                if hostname in self._holders or len(self._holders) < self.limit:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cv.wait(timeout=remaining)
+            if self._holders.get(hostname, 0) is not None:
+                self._holders[hostname] = time.monotonic() + self.ttl
+            return True
+
+    def acquire(self, hostname: str):
+        """Start using the slot reserved by the host, waiting for one if it
+        did not reserve one.
+        """
+        with self._cv:
+            while True:
+                self._expire()
+                if hostname in self._holders or len(self._holders) < self.limit:
+                    self._holders[hostname] = None
+                    return
+                self._cv.wait(timeout=1)
+
+    def release(self, hostname: str, elapsed: Optional[float] = None):
+        """Give back the slot held by the host, accounting for the time,
+        `elapsed`, its upload took, if any.
+        """
+        with self._cv:
+            self._holders.pop(hostname, None)
+            if elapsed is not None:
+                self.upload_time = 0.8 * self.upload_time + 0.2 * elapsed
+            self._cv.notify_all()
+
+    def waiting(self, hostnames) -> int:
+        """Returns how many of the given hosts do not hold a slot."""
+        with self._cv:
+            return sum(1 for h in hostnames if h not in self._holders)
+
+
 class DataSinkWsgiServer(ServerAdapter):
     """DataSinkWsgiServer - a re-implementation of Bottle's WSGIRefServer
     where we have access to the underlying WSGIServer instance in order to
@@ -125,6 +242,7 @@ class DataSinkWsgiServer(ServerAdapter):
                 )
 
         self.options["handler_class"] = DataSinkWsgiRequestHandler
+        self.options["server_class"] = _ThreadingWSGIServer
         self._server = None
         self._err_code = None
         self._err_text = None
@@ -761,6 +879,9 @@ class ToolDataSinkParams(NamedTuple):
     tool_trigger: str
     tools: Dict[str, str]
     instance_uuid: str
+    transport: str = tm_transport_pubsub
+    max_uploads: int = DEFAULT_MAX_UPLOADS
+    max_extracts: int = DEFAULT_MAX_EXTRACTS
 
     def __str__(self) -> str:
         """A string containing a deterministic representation of the params"""
@@ -789,6 +910,9 @@ class ToolDataSink(Bottle):
                 tool_trigger=params["tool_trigger"],
                 tools=params["tools"],
                 instance_uuid=params["instance_uuid"],
+                transport=params.get("transport", tm_transport_pubsub),
+                max_uploads=params.get("max_uploads", DEFAULT_MAX_UPLOADS),
+                max_extracts=params.get("max_extracts", DEFAULT_MAX_EXTRACTS),
             )
         except KeyError as exc:
             raise ToolDataSinkError(f"Invalid parameter block, missing key {exc}")
@@ -812,6 +936,8 @@ class ToolDataSink(Bottle):
         self.hostname = ext_env.hostname
         self.tar_path = ext_env.tar_path
         self.cp_path = ext_env.cp_path
+        # The codecs we can decompress tool data with, in order of preference
+        self._codecs = available_codecs()
         self.redis_server = redis_server
         self.redis_host = redis_host
         self.redis_port = redis_port
@@ -845,14 +971,27 @@ class ToolDataSink(Bottle):
 
         self._lock = Lock()
         self._cv = Condition(lock=self._lock)
+        # Bounds on the tool data uploads and extractions handled at once.
+        self._upload_slots = UploadSlots(self.params.max_uploads)
+        self._extract_slots = BoundedSemaphore(self.params.max_extracts)
         self.web_server_thread = None
         self._tm_log_capture_thread_cv = Condition(lock=self._lock)
         self._tm_log_capture_thread_state = None
         self.tm_log_capture_thread = None
         self._num_tms = 0
 
-    def __enter__(self):
-        # Setup the Bottle server route and the WSGI server instance.
+    def add_routes(self):
+        """Setup the Bottle server routes."""
+        self.route(
+            "/tool-data/<data_ctx>/<hostname>/slot",
+            method="POST",
+            callback=self.reserve_slot,
+        )
+        self.route(
+            "/sysinfo-data/<data_ctx>/<hostname>/slot",
+            method="POST",
+            callback=self.reserve_slot,
+        )
         self.route(
             "/tool-data/<data_ctx>/<hostname>",
             method="PUT",
@@ -863,6 +1002,20 @@ class ToolDataSink(Bottle):
             method="PUT",
             callback=self.put_document,
         )
+        self.route(
+            "/tool-data/<data_ctx>/<hostname>",
+            method="POST",
+            callback=self.commit_document,
+        )
+        self.route(
+            "/sysinfo-data/<data_ctx>/<hostname>",
+            method="POST",
+            callback=self.commit_document,
+        )
+
+    def __enter__(self):
+        # Setup the Bottle server routes and the WSGI server instance.
+        self.add_routes()
         self._server = DataSinkWsgiServer(
             host=self.params.bind_hostname, port=self.params.port, logger=self.logger
         )
@@ -880,8 +1033,11 @@ class ToolDataSink(Bottle):
         self.logger.debug("web server 'run' thread started, processing payloads ...")
 
         # Setup the Redis channel to which the Tool Data Sink subscribes.
-        self._from_tms_chan = RedisChannelSubscriber(
-            self.redis_server, self._from_tms_channel
+        self._from_tms_chan = open_subscriber(
+            self.redis_server,
+            self._from_tms_channel,
+            self.params.transport,
+            group_name="tds",
         )
 
         # Setup the Redis channel use for logging by the Tool Meisters.
@@ -958,19 +1114,38 @@ class ToolDataSink(Bottle):
         # logs from remote Tool Meisters.
         logger = get_logger("tm_log_capture_thread", daemon=False, level="warning")
         tm_log_file = self.benchmark_run_dir.local / "tm" / "tm.logs"
-        with tm_log_file.open("w") as fp:
+        # Each message is a batch of log records, one per line, from one Tool
+        # Meister (see RedisHandler); the file is written through a large
+        # buffer, flushed every _TM_LOG_FLUSH_INTERVAL seconds by a separate
+        # thread (so that the records are not held back while no messages
+        # arrive), and when closed.
+        with tm_log_file.open("w", buffering=_TM_LOG_BUFFER_SIZE) as fp:
+            fp_lock = Lock()
+            done = Event()
+
+            def flusher():
+                while not done.wait(_TM_LOG_FLUSH_INTERVAL):
+                    with fp_lock:
+                        fp.flush()
+
+            flusher_thread = Thread(target=flusher, name="tm-log-flusher")
+            flusher_thread.start()
             try:
                 with self._lock:
                     self._tm_log_capture_thread_state = "started"
                     self._tm_log_capture_thread_cv.notify()
                 for log_msg in self._to_logging_chan.fetch_message(logger):
-                    fp.write(f"{log_msg}\n")
-                    fp.flush()
+                    with fp_lock:
+                        fp.write(f"{log_msg}\n")
             except redis.ConnectionError:
                 # We don't bother reporting any connection errors.
                 pass
             except Exception:
                 self.logger.exception("Failed to capture logs from Redis server")
+            finally:
+                done.set()
+                flusher_thread.join()
+                fp.flush()
 
     def wait_for_initial_tms(self):
         """wait_for_initial_tms - Wait for the proper number of TMs to
@@ -1080,6 +1255,10 @@ class ToolDataSink(Bottle):
             tm["persistent_tools"] = persistent_tools
             tm["transient_tools"] = transient_tools
             tm["failed_tools"] = failed_tools
+            # Agree on the codec the Tool Meister compresses the tool data
+            # it sends with: the first codec we can decompress which it
+            # offered in its startup message.
+            tm["codec"] = negotiate(tm.get("codecs"), self._codecs).name
 
             if tm["hostname"] == self.hostname:
                 # The "localhost" Tool Meister instance does not send data
@@ -1406,8 +1585,11 @@ class ToolDataSink(Bottle):
         """
         self.logger.debug("publish %s", self._to_tms_channel)
         try:
-            num_present = self.redis_server.publish(
-                self._to_tms_channel, json.dumps(data, sort_keys=True)
+            num_present = redis_publish(
+                self.redis_server,
+                self._to_tms_channel,
+                json.dumps(data, sort_keys=True),
+                self.params.transport,
             )
         except Exception:
             self.logger.exception("Failed to publish action message to TMs")
@@ -1467,6 +1649,32 @@ class ToolDataSink(Bottle):
             ret_val = self._wait_for_tms()
         return ret_val
 
+    def _record_overhead(self, mdlog: MetadataLog):
+        """Record in the metadata log the resources used by the tools of each
+        host, summed over all the start / stop intervals of the run.
+
+        The Tool Meisters write the summary of each interval into the tool
+        data directory of their host (see `pbench.agent.overhead`), which we
+        find under the run directory once all the data has been sent.
+        """
+        paths = {}
+        pattern = (
+            f"**/tools-{self.params.tool_group}/*/{OVERHEAD_TOOL}/json/"
+            f"{OVERHEAD_TOOL}.json"
+        )
+        for path in self.benchmark_run_dir.local.glob(pattern):
+            # .../tools-<group>/<host>/tool-overhead/json/tool-overhead.json
+            paths.setdefault(path.parents[2].name, []).append(path)
+        for host, host_paths in sorted(paths.items()):
+            # tool overhead summary ==> tool-overhead/<host> / <tool>
+            section = f"{OVERHEAD_TOOL}/{host}"
+            try:
+                mdlog.add_section(section)
+            except DuplicateSectionError:
+                pass
+            for tool, summary in sorted(summarize_overhead(host_paths).items()):
+                mdlog.set(section, tool, json.dumps(summary, sort_keys=True))
+
     def execute_action(self, client: str, data: Dict[str, Any]):
         """execute_action - given a client and a data dictionary, execute the
         sequence of steps required for a given action.
@@ -1528,6 +1736,7 @@ class ToolDataSink(Bottle):
                     iterations_l = iterations_val.strip().split()
                     iterations_str = ", ".join(iterations_l)
                     mdlog.set(section, "iterations", iterations_str)
+                self._record_overhead(mdlog)
                 # Write out the final meta data contents.
                 with mdlog_name.open("w") as fp:
                     mdlog.write(fp)
@@ -1693,12 +1902,292 @@ class ToolDataSink(Bottle):
         self.sig_resp.respond(client, action, int(status == "success"), status)
         return int(status != "success")
 
+    def _check_data_request(self, data_ctx: str, hostname: str) -> Path:
+        """Verify that the Tool Data Sink is expecting tool data from the
+        given host for the given data context.
+
+        Returns the target directory for the data, calls the Bottle abort()
+        method otherwise.
+        """
+        with self._lock:
+            if self.action not in self._data_actions:
+                abort(400, f"Can't accept PUT requests in action '{self.action}'")
+            if self.data_ctx != data_ctx:
+                # Tool Data Sink and this Tool Meister are out of sync as to
+                # what data is expected.
+                abort(400, f"Unexpected data context, '{data_ctx}'")
+            if self.directory is None:
+                self.logger.error("ERROR - no directory to store documents")
+                abort(500, "INTERNAL ERROR")
+            # Fetch the Tool Meister tracking record for this host and verify
+            # it is in the expected waiting state.
+            try:
+                tm_tracker = self._tm_tracking[hostname]
+            except KeyError:
+                abort(400, f"Unknown Tool Meister '{hostname}'")
+            else:
+                if tm_tracker["posted"] != "waiting":
+                    self.logger.error(
+                        "INTERNAL ERROR: expected Tool Meister for host, '%s', in"
+                        " `waiting` state, found in `%s` state",
+                        hostname,
+                        tm_tracker["posted"],
+                    )
+                    abort(400, "No data expected from a Tool Meister")
+                elif self.action == "send":
+                    # Only Tool Meisters with at least one transient tool
+                    # will send data to the Tool Data Sink, so return an
+                    # error to those Tool Meisters that issued "send" but
+                    # do not have any transient tools.
+                    if not tm_tracker["transient_tools"]:
+                        abort(400, "Not expecting tool data from Tool Meister")
+
+        target_dir = self.directory
+        if not target_dir.is_dir():
+            self.logger.error("ERROR - directory, '%s', does not exist", target_dir)
+            abort(500, "INTERNAL ERROR")
+        return target_dir
+
+    def _data_received(self, hostname: str):
+        """Tell the waiting "watcher" thread that another PUT document has
+        arrived.
+        """
+        with self._lock:
+            tm_tracker = self._tm_tracking[hostname]
+            assert tm_tracker["posted"] == "waiting", f"tm_tracker = {tm_tracker!r}"
+            tm_tracker["posted"] = "dormant"
+            tm_tracker.pop("staged", None)
+            self._cv.notify()
+
+    @staticmethod
+    def _staging_dir(target_dir: Path, hostname: str) -> Path:
+        return target_dir / f".{hostname}.staging"
+
+    def _remove_staged(self, target_dir: Path, hostname: str):
+        """Remove any tool data staged by an earlier, uncommitted, stream
+        from the given host.
+        """
+        with self._lock:
+            self._tm_tracking[hostname].pop("staged", None)
+        staging_dir = self._staging_dir(target_dir, hostname)
+        if staging_dir.exists():
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    @staticmethod
+    def _read_chunked(iostr):
+        """Generate the data of a request body sent with the "chunked"
+        transfer encoding, which the WSGI server passes through undecoded.
+        """
+        while True:
+            line = iostr.readline(_BUFFER_SIZE)
+            try:
+                size = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                abort(400, "Invalid chunked encoding")
+            if size == 0:
+                # Skip any trailer fields up to the terminating empty line.
+                while iostr.readline(_BUFFER_SIZE).strip():
+                    pass
+                return
+            while size > 0:
+                buf = iostr.read(min(size, _BUFFER_SIZE))
+                if not buf:
+                    abort(400, "Truncated chunked encoding")
+                size -= len(buf)
+                yield buf
+            if iostr.readline(_BUFFER_SIZE).strip():
+                abort(400, "Invalid chunked encoding")
+
+    def _put_stream(self, target_dir: Path, hostname: str) -> str:
+        """Receive a tar ball streamed with the "chunked" transfer encoding,
+        and extract it into a staging directory for the host.
+
+        The stream is received into a temporary file, and only extracted
+        from it, under an extraction slot, once it has all arrived: a slow
+        sender only holds its upload slot, so that up to `max_uploads`
+        streams are received at once, while at most `max_extracts` are
+        extracted at once.
+
+        The staged tool data is only moved into place when the Tool Meister
+        commits it with the MD5 of what it sent (see `commit_document()`).
+
+        Returns the MD5 of the received tar ball, calls the Bottle abort()
+        method on errors.
+        """
+        self._remove_staged(target_dir, hostname)
+        staging_dir = self._staging_dir(target_dir, hostname)
+        staging_dir.mkdir()
+        with self._lock:
+            codec = CODECS.get(self._tm_tracking[hostname].get("codec"), DEFAULT_CODEC)
+        o_file = target_dir / f"{hostname}.tar.out"
+        e_file = target_dir / f"{hostname}.tar.err"
+        h = hashlib.md5()
+        total_bytes = 0
+        try:
+            with tempfile.NamedTemporaryFile(mode="wb", dir=target_dir) as tfp:
+                for buf in self._read_chunked(request["wsgi.input"]):
+                    total_bytes += len(buf)
+                    if total_bytes > _MAX_TOOL_DATA_SIZE:
+                        abort(400, "Content object too large")
+                    h.update(buf)
+                    tfp.write(buf)
+                if total_bytes <= 0:
+                    abort(400, "No data received")
+                tfp.flush()
+                # Invoke tar directly for efficiency.
+                with o_file.open("w") as ofp, e_file.open("w") as efp:
+                    with self._extract_slots:
+                        cp = subprocess.run(
+                            [
+                                self.tar_path,
+                                "--extract",
+                                codec.tar_option(),
+                                f"--file={tfp.name}",
+                            ],
+                            cwd=staging_dir,
+                            stdin=None,
+                            stdout=ofp,
+                            stderr=efp,
+                        )
+                returncode = cp.returncode
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+        if returncode != 0:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            self.logger.error(
+                "Failed to extract tar ball stream from '%s'; return code: %d",
+                hostname,
+                returncode,
+            )
+            abort(500, "INTERNAL ERROR")
+        o_file.unlink()
+        e_file.unlink()
+        md5 = h.hexdigest()
+        with self._lock:
+            self._tm_tracking[hostname]["staged"] = md5
+        self.logger.debug(
+            "Successfully staged %d bytes of tool data from '%s' (%s)",
+            total_bytes,
+            hostname,
+            md5,
+        )
+        return md5
+
+    def commit_document(self, data_ctx, hostname):
+        """commit_document - POST callback method for Bottle web server end
+        point
+
+        Moves the tool data streamed by an earlier PUT request from the
+        host's staging directory into place, provided the MD5 the Tool
+        Meister computed while sending it (its "md5sum" header) matches
+        the MD5 of what was received.  On a mismatch the staged data is
+        discarded.
+
+        Public method, returns None, raises no exceptions directly, calls the
+        Bottle abort() method for error handling.
+        """
+        try:
+            target_dir = self._check_data_request(data_ctx, hostname)
+            try:
+                exp_md5 = request["HTTP_MD5SUM"]
+            except Exception:
+                abort(400, "Missing required md5sum header")
+            with self._lock:
+                staged_md5 = self._tm_tracking[hostname].get("staged")
+            if staged_md5 is None:
+                abort(400, "No tool data staged")
+            if staged_md5 != exp_md5:
+                self._remove_staged(target_dir, hostname)
+                abort(
+                    400,
+                    f"Content, {staged_md5}, does not match its MD5SUM header,"
+                    f" {exp_md5}",
+                )
+
+            # Promote the staged hierarchy, one top-level entry (normally
+            # just the host's directory) at a time.
+            staging_dir = self._staging_dir(target_dir, hostname)
+            for entry in staging_dir.iterdir():
+                target = target_dir / entry.name
+                if target.exists():
+                    self._remove_staged(target_dir, hostname)
+                    abort(409, f"{target} already uploaded")
+                entry.rename(target)
+            staging_dir.rmdir()
+            self.logger.debug("Successfully committed tool data from '%s'", hostname)
+
+            self._data_received(hostname)
+        except Exception:
+            self.logger.exception("Uncaught error")
+            abort(500, "INTERNAL ERROR")
+
+    def reserve_slot(self, data_ctx, hostname):
+        """reserve_slot - POST callback method for Bottle web server end point
+
+        Grants the Tool Meister one of the limited upload slots for its next
+        PUT request.  When none is available within a second, replies with a "503 Service
+        Unavailable" status and a "Retry-After" header giving the number of
+        seconds after which to try again, picked at random within the time
+        estimated for the Tool Meisters still waiting to get a slot, given
+        how long uploads take.
+
+        Public method, returns None, raises no exceptions directly, calls the
+        Bottle abort() method for error handling.
+        """
+        self._check_data_request(data_ctx, hostname)
+        if self._upload_slots.reserve(hostname, wait=_SLOT_WAIT):
+            return
+        with self._lock:
+            expected = [
+                host
+                for host, tracker in self._tm_tracking.items()
+                if tracker["posted"] == "waiting"
+            ]
+        queued = self._upload_slots.waiting(expected)
+        # Spread the retries of the waiting Tool Meisters over the time it
+        # should take for all of them to get a slot, so that they come back
+        # at about the rate slots are freed.
+        drain_time = math.ceil(
+            self._upload_slots.upload_time * queued / self._upload_slots.limit
+        )
+        retry_after = random.randint(
+            _MIN_RETRY_AFTER, min(max(drain_time, _MIN_RETRY_AFTER), _MAX_RETRY_AFTER)
+        )
+        raise HTTPResponse(
+            "No upload slot available",
+            status=503,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    @contextmanager
+    def _uploading(self, hostname: str):
+        """Hold an upload slot for the host while receiving its tool data,
+        keeping track of how long uploads take.
+        """
+        self._upload_slots.acquire(hostname)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._upload_slots.release(hostname, time.monotonic() - start)
+
     def put_document(self, data_ctx, hostname):
         """put_document - PUT callback method for Bottle web server end point
 
         The put_document method is called by threads serving web requests.
         There can be N threads configured at one time calling this method.
 
+        A tar ball sent with a "content-length" and an "md5sum" header is
+        verified, then unpacked.  A tar ball streamed with the "chunked"
+        transfer encoding is received, then unpacked into a staging
+        directory, and the response body is its MD5; the data is moved into
+        place by a subsequent POST request (see `commit_document()`).
+
+        At most `max_uploads` requests are handled at once, a request from a
+        Tool Meister without a slot reserved (see `reserve_slot()`) waits
+        for one; at most `max_extracts` tar balls are extracted at once.
+
         Public method, returns None, raises no exceptions directly, calls the
         Bottle abort() method for error handling.
 
@@ -1707,177 +2196,144 @@ class ToolDataSink(Bottle):
             content_length = 0
             exp_md5 = ""
 
-            with self._lock:
-                if self.action not in self._data_actions:
-                    abort(400, f"Can't accept PUT requests in action '{self.action}'")
-                if self.data_ctx != data_ctx:
-                    # Tool Data Sink and this Tool Meister are out of sync as to
-                    # what data is expected.
-                    abort(400, f"Unexpected data context, '{data_ctx}'")
-                if self.directory is None:
-                    self.logger.error("ERROR - no directory to store documents")
-                    abort(500, "INTERNAL ERROR")
-                # Fetch the Tool Meister tracking record for this host and verify
-                # it is in the expected waiting state.
-                try:
-                    tm_tracker = self._tm_tracking[hostname]
-                except KeyError:
-                    abort(400, f"Unknown Tool Meister '{hostname}'")
-                else:
-                    if tm_tracker["posted"] != "waiting":
-                        self.logger.error(
-                            "INTERNAL ERROR: expected Tool Meister for host, '%s', in"
-                            " `waiting` state, found in `%s` state",
-                            hostname,
-                            tm_tracker["posted"],
-                        )
-                        abort(400, "No data expected from a Tool Meister")
-                    elif self.action == "send":
-                        # Only Tool Meisters with at least one transient tool
-                        # will send data to the Tool Data Sink, so return an
-                        # error to those Tool Meisters that issued "send" but
-                        # do not have any transient tools.
-                        if not tm_tracker["transient_tools"]:
-                            abort(400, "Not expecting tool data from Tool Meister")
-
-            try:
-                content_length = int(request["CONTENT_LENGTH"])
-            except ValueError:
-                abort(400, "Invalid content-length header, not an integer")
-            except Exception:
-                abort(400, "Missing required content-length header")
-            else:
-                if content_length > _MAX_TOOL_DATA_SIZE:
-                    abort(400, "Content object too large")
+            target_dir = self._check_data_request(data_ctx, hostname)
 
-            try:
-                exp_md5 = request["HTTP_MD5SUM"]
-            except Exception:
-                self.logger.exception(request.keys())
-                abort(400, "Missing required md5sum header")
+            with self._uploading(hostname):
+                if request.get("HTTP_TRANSFER_ENCODING", "").lower() == "chunked":
+                    return self._put_stream(target_dir, hostname)
 
-            target_dir = self.directory
-            if not target_dir.is_dir():
-                self.logger.error("ERROR - directory, '%s', does not exist", target_dir)
-                abort(500, "INTERNAL ERROR")
-            host_data_tb_name = target_dir / f"{hostname}.tar.xz"
-            if host_data_tb_name.exists():
-                abort(409, f"{host_data_tb_name} already uploaded")
-            host_data_tb_md5 = Path(f"{host_data_tb_name}.md5")
-
-            with tempfile.NamedTemporaryFile(mode="wb", dir=target_dir) as ofp:
-                total_bytes = 0
-                iostr = request["wsgi.input"]
-                h = hashlib.md5()
-                remaining_bytes = content_length
-                while remaining_bytes > 0:
-                    buf = iostr.read(
-                        _BUFFER_SIZE
-                        if remaining_bytes > _BUFFER_SIZE
-                        else remaining_bytes
-                    )
-                    bytes_read = len(buf)
-                    total_bytes += bytes_read
-                    remaining_bytes -= bytes_read
-                    h.update(buf)
-                    ofp.write(buf)
-                cur_md5 = h.hexdigest()
-                if cur_md5 != exp_md5:
-                    abort(
-                        400,
-                        f"Content, {cur_md5}, does not match its MD5SUM header,"
-                        f" {exp_md5}",
-                    )
-                if total_bytes <= 0:
-                    abort(400, "No data received")
+                # A tar ball sent whole supersedes any uncommitted stream.
+                self._remove_staged(target_dir, hostname)
 
-                # First write the .md5
                 try:
-                    with host_data_tb_md5.open("w") as md5fp:
-                        md5fp.write(f"{exp_md5} {host_data_tb_name.name}\n")
+                    content_length = int(request["CONTENT_LENGTH"])
+                except ValueError:
+                    abort(400, "Invalid content-length header, not an integer")
                 except Exception:
-                    try:
-                        os.remove(host_data_tb_md5)
-                    except Exception as exc:
-                        self.logger.warning(
-                            "Failed to remove .md5 %s when trying to clean up: %s",
-                            host_data_tb_md5,
-                            exc,
-                        )
-                    self.logger.exception(
-                        "Failed to write .md5 file, '%s'", host_data_tb_md5
-                    )
-                    raise
+                    abort(400, "Missing required content-length header")
+                else:
+                    if content_length > _MAX_TOOL_DATA_SIZE:
+                        abort(400, "Content object too large")
 
-                # Then create the final filename link to the temporary file.
                 try:
-                    os.link(ofp.name, host_data_tb_name)
+                    exp_md5 = request["HTTP_MD5SUM"]
                 except Exception:
+                    self.logger.exception(request.keys())
+                    abort(400, "Missing required md5sum header")
+
+                host_data_tb_name = target_dir / f"{hostname}.tar.xz"
+                if host_data_tb_name.exists():
+                    abort(409, f"{host_data_tb_name} already uploaded")
+                host_data_tb_md5 = Path(f"{host_data_tb_name}.md5")
+
+                with tempfile.NamedTemporaryFile(mode="wb", dir=target_dir) as ofp:
+                    total_bytes = 0
+                    iostr = request["wsgi.input"]
+                    h = hashlib.md5()
+                    remaining_bytes = content_length
+                    while remaining_bytes > 0:
+                        buf = iostr.read(
+                            _BUFFER_SIZE
+                            if remaining_bytes > _BUFFER_SIZE
+                            else remaining_bytes
+                        )
+                        bytes_read = len(buf)
+                        total_bytes += bytes_read
+                        remaining_bytes -= bytes_read
+                        h.update(buf)
+                        ofp.write(buf)
+                    cur_md5 = h.hexdigest()
+                    if cur_md5 != exp_md5:
+                        abort(
+                            400,
+                            f"Content, {cur_md5}, does not match its MD5SUM header,"
+                            f" {exp_md5}",
+                        )
+                    if total_bytes <= 0:
+                        abort(400, "No data received")
+
+                    # First write the .md5
                     try:
-                        os.remove(host_data_tb_md5)
-                    except Exception as exc:
-                        self.logger.warning(
-                            "Failed to remove .md5 %s when trying to clean up: %s",
-                            host_data_tb_md5,
-                            exc,
+                        with host_data_tb_md5.open("w") as md5fp:
+                            md5fp.write(f"{exp_md5} {host_data_tb_name.name}\n")
+                    except Exception:
+                        try:
+                            os.remove(host_data_tb_md5)
+                        except Exception as exc:
+                            self.logger.warning(
+                                "Failed to remove .md5 %s when trying to clean up: %s",
+                                host_data_tb_md5,
+                                exc,
+                            )
+                        self.logger.exception(
+                            "Failed to write .md5 file, '%s'", host_data_tb_md5
                         )
-                    self.logger.exception(
-                        "Failed to rename tar ball '%s' to '%s'",
-                        ofp.name,
-                        host_data_tb_md5,
-                    )
-                    raise
-                else:
-                    self.logger.debug(
-                        "Successfully wrote %s (%s.md5)",
-                        host_data_tb_name,
-                        host_data_tb_name,
-                    )
+                        raise
 
-            # Now unpack that tar ball
-            o_file = target_dir / f"{hostname}.tar.out"
-            e_file = target_dir / f"{hostname}.tar.err"
-            try:
-                # Invoke tar directly for efficiency.
-                with o_file.open("w") as ofp, e_file.open("w") as efp:
-                    cp = subprocess.run(
-                        [self.tar_path, "-xf", host_data_tb_name],
-                        cwd=target_dir,
-                        stdin=None,
-                        stdout=ofp,
-                        stderr=efp,
-                    )
-            except Exception:
-                self.logger.exception(
-                    "Failed to extract tar ball, '%s'", host_data_tb_name
-                )
-                abort(500, "INTERNAL ERROR")
-            else:
-                if cp.returncode != 0:
-                    self.logger.error(
-                        "Failed to create tar ball; return code: %d", cp.returncode
-                    )
-                    abort(500, "INTERNAL ERROR")
-                else:
-                    self.logger.debug("Successfully unpacked %s", host_data_tb_name)
+                    # Then create the final filename link to the temporary file.
                     try:
-                        o_file.unlink()
-                        e_file.unlink()
-                        host_data_tb_md5.unlink()
-                        host_data_tb_name.unlink()
+                        os.link(ofp.name, host_data_tb_name)
                     except Exception:
+                        try:
+                            os.remove(host_data_tb_md5)
+                        except Exception as exc:
+                            self.logger.warning(
+                                "Failed to remove .md5 %s when trying to clean up: %s",
+                                host_data_tb_md5,
+                                exc,
+                            )
                         self.logger.exception(
-                            "Error removing unpacked tar ball '%s' and it's .md5",
+                            "Failed to rename tar ball '%s' to '%s'",
+                            ofp.name,
+                            host_data_tb_md5,
+                        )
+                        raise
+                    else:
+                        self.logger.debug(
+                            "Successfully wrote %s (%s.md5)",
+                            host_data_tb_name,
                             host_data_tb_name,
                         )
 
-            # Tell the waiting "watcher" thread that another PUT document has
-            # arrived.
-            with self._lock:
-                tm_tracker = self._tm_tracking[hostname]
-                assert tm_tracker["posted"] == "waiting", f"tm_tracker = {tm_tracker!r}"
-                tm_tracker["posted"] = "dormant"
-                self._cv.notify()
+                # Now unpack that tar ball
+                o_file = target_dir / f"{hostname}.tar.out"
+                e_file = target_dir / f"{hostname}.tar.err"
+                try:
+                    # Invoke tar directly for efficiency.
+                    with o_file.open("w") as ofp, e_file.open("w") as efp:
+                        with self._extract_slots:
+                            cp = subprocess.run(
+                                [self.tar_path, "-xf", host_data_tb_name],
+                                cwd=target_dir,
+                                stdin=None,
+                                stdout=ofp,
+                                stderr=efp,
+                            )
+                except Exception:
+                    self.logger.exception(
+                        "Failed to extract tar ball, '%s'", host_data_tb_name
+                    )
+                    abort(500, "INTERNAL ERROR")
+                else:
+                    if cp.returncode != 0:
+                        self.logger.error(
+                            "Failed to create tar ball; return code: %d", cp.returncode
+                        )
+                        abort(500, "INTERNAL ERROR")
+                    else:
+                        self.logger.debug("Successfully unpacked %s", host_data_tb_name)
+                        try:
+                            o_file.unlink()
+                            e_file.unlink()
+                            host_data_tb_md5.unlink()
+                            host_data_tb_name.unlink()
+                        except Exception:
+                            self.logger.exception(
+                                "Error removing unpacked tar ball '%s' and it's .md5",
+                                host_data_tb_name,
+                            )
+
+                self._data_received(hostname)
         except Exception:
             self.logger.exception("Uncaught error")
             abort(500, "INTERNAL ERROR")
@@ -33,6 +33,7 @@ and the redis key to fetch its configuration from for its operation.
 [1] https://redis.io/
 """
 
+import copy
 import errno
 import hashlib
 import io
@@ -41,6 +42,7 @@ import logging
 import logging.handlers
 import os
 from pathlib import Path
+import random
 import shutil
 import signal
 import subprocess
@@ -48,7 +50,7 @@ import sys
 import tempfile
 import threading
 import time
-from typing import Any, Dict, List, NamedTuple, Tuple
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
 from daemon import DaemonContext
 import pidfile
@@ -62,20 +64,106 @@ from pbench.agent.constants import (
     tm_channel_suffix_from_tms,
     tm_channel_suffix_to_logging,
     tm_channel_suffix_to_tms,
+    tm_data_key,
+    tm_pool_channel_prefix,
+    tm_transport_pubsub,
+    tm_transport_streams,
 )
+from pbench.agent.overhead import OverheadMonitor, SAMPLE_INTERVAL, write_overhead
+from pbench.agent.postprocess import host_jobs, run_jobs
 from pbench.agent.redis_utils import (
+    open_subscriber,
+    redis_publish,
     RedisChannelSubscriber,
     RedisHandler,
     wait_for_conn_and_key,
 )
 from pbench.agent.toolmetadata import ToolMetadata
 from pbench.agent.utils import collect_local_info
+from pbench.common.compression import available_codecs, Codec, CODECS, DEFAULT_CODEC
 from pbench.common.utils import canonicalize, md5sum
 
 # Logging format string for unit tests
 fmtstr_ut = "%(levelname)s %(name)s %(funcName)s -- %(message)s"
 fmtstr = "%(asctime)s %(levelname)s %(process)s %(thread)s %(name)s %(funcName)s %(lineno)d -- %(message)s"
 
+# Read in 64 KB chunks from the tar command streaming tool data.
+_BUFFER_SIZE = 65536
+
+# Bounds, in seconds, of the delay between attempts to connect to the Tool
+# Data Sink, and how long we keep trying.
+_CONNECT_DELAY_MIN = 0.1
+_CONNECT_DELAY_MAX = 5
+_CONNECT_TIMEOUT = 60
+
+# How long, in seconds, we wait at most for the Tool Data Sink to give us an
+# upload slot.
+_SLOT_TIMEOUT = 1800
+
+
+class Backoff:
+    """Randomized, exponentially increasing delays between attempts to reach
+    the Tool Data Sink, so that the Tool Meisters of a large run do not all
+    retry at the same moments.
+    """
+
+    def __init__(self, timeout: float = _CONNECT_TIMEOUT):
+        self.delay = _CONNECT_DELAY_MIN
+        self.deadline = time.monotonic() + timeout
+
+    def wait(self) -> bool:
+        """Sleep before the next attempt, returning False, without sleeping,
+        once the time allowed is used up.
+        """
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(remaining, random.uniform(self.delay / 2, self.delay)))
+        self.delay = min(self.delay * 2, _CONNECT_DELAY_MAX)
+        return True
+
+
+def reserve_upload_slot(url: str, logger: logging.Logger):
+    """Wait for the Tool Data Sink to give us a slot to PUT data to the given
+    URL.
+
+    The Tool Data Sink replies with a 503 and a "Retry-After" header while all
+    its upload slots are taken; any other reply (e.g. from a Tool Data Sink
+    not limiting uploads) lets the PUT go ahead, which reports any error.
+
+    Raises the connection error if the Tool Data Sink cannot be reached, or a
+    ToolMeisterError if no slot is given in time.
+    """
+    backoff = Backoff()
+    deadline = time.monotonic() + _SLOT_TIMEOUT
+    while True:
+        try:
+            response = requests.post(f"{url}/slot")
+        except (ConnectionRefusedError, requests.exceptions.ConnectionError) as exc:
+            logger.debug("%s", exc)
+            if not backoff.wait():
+                raise
+            continue
+        if response.status_code != 503:
+            if response.status_code != 200:
+                logger.debug(
+                    "No upload slot for '%s' ('%d', '%s')",
+                    url,
+                    response.status_code,
+                    response.text,
+                )
+            return
+        try:
+            retry_after = float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            retry_after = 1.0
+        # Spread out the retries of the Tool Meisters told the same delay.
+        delay = retry_after * random.uniform(1.0, 1.25)
+        if time.monotonic() + delay > deadline:
+            raise ToolMeisterError(f"No upload slot given for '{url}'")
+        logger.debug("Upload slot for '%s' not available, retrying", url)
+        time.sleep(delay)
+
 
 def log_raw_io_output(iob: io.IOBase, logger: logging.Logger):
     """Thread start function to log raw output from a given IOBase object."""
@@ -157,6 +245,12 @@ class Tool:
             f"{self.__class__.__name__} does not implement the wait method"
         )
 
+    def pids(self) -> List[int]:
+        """Returns the process IDs of the running processes of the tool, the
+        roots of the process trees accounted for by the OverheadMonitor.
+        """
+        return []
+
     def _create_process_with_logger(
         self, args: list, cwd: Path, ctx: str = None
     ) -> subprocess.Popen:
@@ -378,6 +472,10 @@ class TransientTool(Tool):
         self._wait_for_process_with_kill(self.start_process, "start")
         self.start_process = None
 
+    def pids(self) -> List[int]:
+        # The "start" operation waits for the tool's data collection process.
+        return [self.start_process.pid] if self.start_process is not None else []
+
 
 class PcpTransientTool(Tool):
     """The transient tool alternative to the PCP persistent tool, which starts
@@ -511,6 +609,11 @@ class PcpTransientTool(Tool):
         self._wait_for_process_with_kill(self.pmlogger_process, "pmlogger")
         self.pmlogger_process = None
 
+    def pids(self) -> List[int]:
+        return [
+            p.pid for p in (self.pmcd_process, self.pmlogger_process) if p is not None
+        ]
+
 
 class PersistentTool(Tool):
     """PersistentTool - Encapsulates all the states needed to run persistent
@@ -601,6 +704,9 @@ class PersistentTool(Tool):
         self._wait_for_process_with_kill(self.process)
         self.process = None
 
+    def pids(self) -> List[int]:
+        return [self.process.pid] if self.process is not None else []
+
 
 class DcgmTool(PersistentTool):
     """DcgmTool - provide specific persistent tool behaviors for the "dcgm"
@@ -694,6 +800,10 @@ class ToolMeisterParams(NamedTuple):
     tool_metadata: ToolMetadata
     tools: Dict[str, str]
     instance_uuid: str
+    pool: bool = False
+    transport: str = tm_transport_pubsub
+    postprocess: bool = False
+    overhead_interval: int = SAMPLE_INTERVAL
 
     def __str__(self) -> str:
         """A string containing a deterministic representation of the params"""
@@ -740,7 +850,17 @@ class ToolMeister:
                 "tool-1": [ "--opt-0", "--opt-1", ..., "--opt-N" ],
                 ...,
                 "tool-N": [ "--opt-0", "--opt-1", ..., "--opt-N" ]
-            }
+            },
+            "pool":       "<(optional) true if the Tool Meister should stay"
+                          " resident after it is terminated, waiting to be"
+                          " re-bound to the next run (see `park()`)>",
+            "transport":  "<(optional) 'pubsub' (the default) or 'streams',"
+                          " how the to/from messages are carried>",
+            "postprocess": "<(optional) true if a remote Tool Meister should"
+                          " post-process its tool data before sending it>",
+            "overhead_interval": "<(optional) seconds between samples of the"
+                          " resource usage of the tool processes, 0 to not"
+                          " account for it>"
         }
 
     Each action message should contain three pieces of data: the action to
@@ -786,6 +906,10 @@ class ToolMeister:
                 tool_metadata=ToolMetadata.tool_md_from_dict(params["tool_metadata"]),
                 tools=params["tools"],
                 instance_uuid=params["instance_uuid"],
+                pool=params.get("pool", False),
+                transport=params.get("transport", tm_transport_pubsub),
+                postprocess=params.get("postprocess", False),
+                overhead_interval=params.get("overhead_interval", SAMPLE_INTERVAL),
             )
         except KeyError as exc:
             raise ToolMeisterError(f"Invalid parameter block, missing key {exc}")
@@ -813,11 +937,19 @@ class ToolMeister:
         tm_params: ToolMeisterParams,
         redis_server: redis.Redis,
         logger: logging.Logger,
+        install_cache: Dict[Tuple[str, str], Tuple[InstallationResult, Tool]] = None,
     ):
         """Constructor for the ToolMeister object - sets up the internal state
         given the constructor parameters, setting up the state transition
         table, and forming the various channel names from the channel prefix
         in the params object.
+
+        A pooled Tool Meister passes the same `install_cache` to each of the
+        ToolMeister objects it creates, so that the installation check of a
+        tool, which runs external scripts or looks for its executables, is
+        only run once for a given set of tool options: the cache holds the
+        result of the check, along with a copy of the tool object as set up
+        by it, from which the tool objects of the later runs are copied.
         """
         if not pbench_install_dir.is_dir():
             raise ToolMeisterError(
@@ -832,6 +964,10 @@ class ToolMeister:
         self._params = tm_params
         self._rs = redis_server
         self.logger = logger
+        self._install_cache = {} if install_cache is None else install_cache
+        # The codec used to compress the tool data we send, agreed with the
+        # Tool Data Sink (see `_fetch_codec()`).
+        self._codec = None
         self._usable_tools = dict()
         # No running tools at first
         self._running_tools = dict()
@@ -882,6 +1018,9 @@ class ToolMeister:
         # The "tool directory" is the current directory in use by running
         # tools for storing their collected data.
         self._tool_dir = None
+        # The OverheadMonitor accounting for the resources used by the tool
+        # processes while the transient tools are running.
+        self._overhead = None
         # The operational Redis channel the TDS will use to send actions to
         # the Tool Meisters, filled in later by the context manager.
         self._to_tms_chan = None
@@ -892,8 +1031,12 @@ class ToolMeister:
         collecting the local data and metadata about this Tool Meister
         instance, and sending our startup message to the Tool Data Sink.
         """
-        self._to_tms_chan = RedisChannelSubscriber(
-            self._rs, self._to_tms_channel, RedisChannelSubscriber.ONEOFMANY
+        self._to_tms_chan = open_subscriber(
+            self._rs,
+            self._to_tms_channel,
+            self._params.transport,
+            group_name=f"tm-{self._params.hostname}",
+            channel_type=RedisChannelSubscriber.ONEOFMANY,
         )
 
         version, seqno, sha1, hostdata = collect_local_info(self.pbench_install_dir)
@@ -902,18 +1045,30 @@ class ToolMeister:
         for name, tool_opts in sorted(self._params.tools.items()):
             tklass = self._tool_name_class_mappings.get(name, TransientTool)
             try:
-                tool = tklass(
-                    name,
-                    tool_opts,
-                    pbench_install_dir=self.pbench_install_dir,
-                    logger=self.logger,
-                )
-                res = tool.install()
+                cached = self._install_cache.get((name, tool_opts))
+                if cached is None:
+                    tool = tklass(
+                        name,
+                        tool_opts,
+                        pbench_install_dir=self.pbench_install_dir,
+                        logger=self.logger,
+                    )
+                    res = tool.install()
+                else:
+                    res, installed = cached
+                    tool = copy.copy(installed)
             except Exception:
                 self.logger.exception("Failed to run tool %s install check", name)
                 res = InstallationResult(returncode=-42, output="internal-error")
             else:
                 if res.returncode == 0:
+                    if cached is None:
+                        # Keep a copy of the tool as installed, before it
+                        # is ever started.
+                        self._install_cache[(name, tool_opts)] = (
+                            res,
+                            copy.copy(tool),
+                        )
                     # Remember the successful Tool instances
                     self._usable_tools[name] = tool_opts
                     if name in self.persistent_tool_names:
@@ -935,6 +1090,7 @@ class ToolMeister:
             sha1=sha1,
             hostdata=hostdata,
             installs=tool_installs,
+            codecs=available_codecs(),
         )
 
         # Tell the entity that started us who we are, indicating we're ready.
@@ -943,11 +1099,18 @@ class ToolMeister:
         timeout = time.time() + TDS_RETRY_PERIOD_SECS
         while num_present == 0:
             try:
-                num_present = self._rs.publish(
-                    self._from_tms_channel, json.dumps(started_msg, sort_keys=True)
+                num_present = redis_publish(
+                    self._rs,
+                    self._from_tms_channel,
+                    json.dumps(started_msg, sort_keys=True),
+                    self._params.transport,
                 )
             except redis.ConnectionError:
                 num_present = 0
+            else:
+                if self._params.transport == tm_transport_streams:
+                    # The message waits in the stream for the Tool Data Sink.
+                    break
             if num_present == 0 and time.time() >= timeout:
                 raise Exception(
                     f"Unable to publish startup ack message, {started_msg!r}"
@@ -1044,7 +1207,9 @@ class ToolMeister:
         msg = json.dumps(msg_d, sort_keys=True)
         self.logger.debug("publish %s %s", self._from_tms_channel, msg)
         try:
-            num_present = self._rs.publish(self._from_tms_channel, msg)
+            num_present = redis_publish(
+                self._rs, self._from_tms_channel, msg, self._params.transport
+            )
         except redis.ConnectionError as exc:
             self.logger.error(
                 "Failed to publish client status message, %r: %s", msg, exc
@@ -1225,6 +1390,7 @@ class ToolMeister:
 
         # Start all the transient tools running.
         self._running_tools = self._start_tools(self._transient_tools, self._tool_dir)
+        self._start_overhead()
 
         failures = len(self._transient_tools) - len(self._running_tools)
         if failures > 0:
@@ -1235,6 +1401,40 @@ class ToolMeister:
             self._send_client_status("success")
         return failures
 
+    def _start_overhead(self):
+        """Start accounting for the resources used by the running transient
+        tools, and by the persistent tools over the same period.
+        """
+        if self._params.overhead_interval <= 0:
+            return
+        self._overhead = OverheadMonitor(
+            self.logger, interval=self._params.overhead_interval
+        )
+        for name, tool in self._running_tools.items():
+            self._overhead.add(name, tool.pids)
+        for name, tool in self._persistent_tools.items():
+            # Persistent tools were started by the "init" action, only their
+            # usage from now on is accounted for.
+            self._overhead.add(name, tool.pids, baseline=True)
+        self._overhead.start()
+
+    def _record_overhead(self):
+        """Stop accounting for the resources used by the tools, writing the
+        per-tool summaries into the tool data directory.
+
+        Failures are logged, but do not fail the "stop" action.
+        """
+        if self._overhead is None:
+            return
+        overhead, self._overhead = self._overhead, None
+        try:
+            docs = overhead.stop()
+            write_overhead(self._tool_dir, docs)
+        except Exception:
+            self.logger.exception(
+                "Failed to record the overhead of the tools in %s", self._tool_dir
+            )
+
     def _wait_for_tools(self) -> int:
         """Convenience method to properly wait for all the currently running
         tools to finish before returning to the caller.
@@ -1298,6 +1498,7 @@ class ToolMeister:
             return 1
 
         tool_cnt = len(self._running_tools)
+        self._record_overhead()
         failures = self._stop_running_tools()
         failures += self._wait_for_tools()
 
@@ -1384,7 +1585,176 @@ class ToolMeister:
 
         return cp
 
+    def _fetch_codec(self) -> Codec:
+        """Fetch the codec the Tool Data Sink chose for us from the codecs we
+        offered in our startup message, which it records along with the rest
+        of its Tool Meister tracking data in Redis.
+
+        The default codec is used if there is no such record.
+        """
+        try:
+            tms = json.loads(self._rs.get(tm_data_key))
+            name = tms[self._params.hostname]["codec"]
+            return CODECS[name]
+        except Exception as exc:
+            self.logger.warning(
+                "No tool data codec agreed with the Tool Data Sink, using %s: %s",
+                DEFAULT_CODEC.name,
+                exc,
+            )
+            return DEFAULT_CODEC
+
+    def _stream_directory(self, directory: Path, url: str) -> bool:
+        """Stream a tar ball of the given directory to the Tool Data Sink as
+        it is created, without writing it to a local file first.
+
+        The tar command's output is sent via a PUT request using the
+        "chunked" transfer encoding, hashing it on the fly.  The Tool Data
+        Sink unpacks the stream it received into a staging area, replying
+        with the MD5 of what it received; the data is committed via a POST
+        request carrying the MD5 of what was sent, which the Tool Data Sink
+        checks before moving the data into place.
+
+        Returns True if the tool data was committed, False if it has to be
+        sent some other way.
+        """
+        if self._codec is None:
+            self._codec = self._fetch_codec()
+        backoff = Backoff()
+        while True:
+            reserve_upload_slot(url, self.logger)
+            h = hashlib.md5()
+            with tempfile.TemporaryFile() as efp:
+                tar_proc = subprocess.Popen(
+                    [
+                        self.tar_path,
+                        "--create",
+                        self._codec.tar_option(),
+                        "--force-local",
+                        "--file=-",
+                        directory.name,
+                    ],
+                    cwd=directory.parent,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=efp,
+                )
+
+                def body():
+                    while True:
+                        buf = tar_proc.stdout.read(_BUFFER_SIZE)
+                        if not buf:
+                            break
+                        h.update(buf)
+                        yield buf
+
+                try:
+                    response = requests.put(url, data=body())
+                except (
+                    ConnectionRefusedError,
+                    requests.exceptions.ConnectionError,
+                ) as exc:
+                    self.logger.debug("%s", exc)
+                    tar_proc.kill()
+                    tar_proc.wait()
+                    # Try until we get a connection.
+                    if not backoff.wait():
+                        raise
+                    continue
+                finally:
+                    tar_proc.stdout.close()
+                returncode = tar_proc.wait()
+                if returncode != 0:
+                    efp.seek(0)
+                    self.logger.warning(
+                        "Streaming tar of %s failed with %d: %s",
+                        directory,
+                        returncode,
+                        efp.read().decode("utf-8", errors="replace"),
+                    )
+                    return False
+            break
+
+        tar_md5 = h.hexdigest()
+        if response.status_code != 200:
+            self.logger.warning(
+                "Streaming PUT '%s' failed with '%d', '%s'",
+                url,
+                response.status_code,
+                response.text,
+            )
+            return False
+        if response.text != tar_md5:
+            self.logger.warning(
+                "Streaming PUT '%s' received MD5 %s, sent %s",
+                url,
+                response.text,
+                tar_md5,
+            )
+            # Committing with our MD5 will have the Tool Data Sink discard
+            # the data it received.
+        response = requests.post(url, headers={"md5sum": tar_md5})
+        if response.status_code != 200:
+            self.logger.warning(
+                "Commit '%s' failed with '%d', '%s'",
+                url,
+                response.status_code,
+                response.text,
+            )
+            return False
+        self.logger.debug(
+            "Streaming PUT '%s' succeeded ('%d', '%s')",
+            url,
+            response.status_code,
+            tar_md5,
+        )
+        return True
+
     def _send_directory(self, directory: Path, uri: str, ctx: str) -> int:
+        """Stream a tar ball of the given directory via PUT to the URL
+        constructed from the "uri" fragment, using the provided context.
+
+        If streaming fails, the tar ball is created locally and sent whole
+        instead (see `_send_tarball()`).
+
+        Returns 0 on success, # of failures otherwise.
+        """
+        url = (
+            f"http://{self._params.tds_hostname}:{self._params.tds_port}/{uri}"
+            f"/{ctx}/{self._params.hostname}"
+        )
+        self.logger.debug(
+            "%s: starting send_data group=%s, directory=%s",
+            self._params.hostname,
+            self._params.tool_group,
+            self._directory,
+        )
+        try:
+            streamed = self._stream_directory(directory, url)
+        except Exception:
+            self.logger.exception("Exception streaming tool data to '%s'", url)
+            streamed = False
+        if not streamed:
+            return self._send_tarball(directory, uri, ctx)
+
+        failures = 0
+        try:
+            shutil.rmtree(directory.parent)
+        except Exception:
+            self.logger.exception(
+                "Failed to remove tool data hierarchy, '%s'", directory.parent
+            )
+            failures += 1
+        self.logger.info(
+            "%s: PUT %s completed %s %s",
+            self._params.hostname,
+            uri,
+            self._params.tool_group,
+            directory,
+        )
+        return failures
+
+    def _send_tarball(self, directory: Path, uri: str, ctx: str) -> int:
         """Tar up the given directory and send via PUT to the URL constructed
         from the "uri" fragment, using the provided context.
 
@@ -1459,9 +1829,10 @@ class ToolMeister:
                     f"/{ctx}/{self._params.hostname}"
                 )
                 sent = False
-                retries = 200
+                backoff = Backoff()
                 while not sent:
                     try:
+                        reserve_upload_slot(url, self.logger)
                         with tar_file.open("rb") as tar_fp:
                             response = requests.put(url, headers=headers, data=tar_fp)
                     except (
@@ -1470,9 +1841,7 @@ class ToolMeister:
                     ) as exc:
                         self.logger.debug("%s", exc)
                         # Try until we get a connection.
-                        time.sleep(0.1)
-                        retries -= 1
-                        if retries <= 0:
+                        if not backoff.wait():
                             raise
                     else:
                         sent = True
@@ -1526,6 +1895,37 @@ class ToolMeister:
                 )
         return failures
 
+    def _postprocess(self, tool_dir: Path):
+        """Post-process the data of our transient tools, spreading the work
+        of `pbench-postprocess-tools` across the Tool Meister hosts.
+
+        Failures are only logged: the tools which failed are post-processed
+        again by `pbench-postprocess-tools` on the controller.
+        """
+        jobs = host_jobs(
+            tool_dir,
+            self._transient_tools.keys(),
+            Path(self.pbench_install_dir) / "tool-scripts",
+        )
+        start = time.perf_counter()
+        failures = run_jobs(
+            jobs,
+            record_done=True,
+            report_failure=lambda res: self.logger.warning(
+                "%s: %s post-processing failed, exit status %d",
+                self._params.hostname,
+                res.job.tool,
+                res.returncode,
+            ),
+        )
+        self.logger.info(
+            "%s: post-processed %d tool(s) in %.2f seconds, %d failure(s)",
+            self._params.hostname,
+            len(jobs),
+            time.perf_counter() - start,
+            failures,
+        )
+
     def send_tools(self, data: Dict[str, str]) -> int:
         """Send any collected tool data to the Tool Data Sink.
 
@@ -1596,6 +1996,9 @@ class ToolMeister:
                 f" '{tool_dir.name}', not our host name '{self._params.hostname}'"
             )
 
+        if self._params.postprocess:
+            self._postprocess(tool_dir)
+
         directory_bytes = data["directory"].encode("utf-8")
         tool_data_ctx = hashlib.md5(directory_bytes).hexdigest()
         failures = self._send_directory(tool_dir, "tool-data", tool_data_ctx)
@@ -1836,7 +2239,105 @@ class Arguments(NamedTuple):
     level: str
 
 
-def driver(
+# How long, in seconds, a pooled Tool Meister waits to be re-bound to a new
+# run before exiting.
+POOL_IDLE_TIMEOUT = 3600
+# How long, in seconds, a pooled Tool Meister's claim on a run is kept.
+_POOL_CLAIM_EXPIRY = 86400
+
+
+def park(
+    redis_server: redis.Redis,
+    tm_params: ToolMeisterParams,
+    logger: logging.Logger,
+    idle_timeout: float = POOL_IDLE_TIMEOUT,
+) -> Optional[Tuple[redis.Redis, ToolMeisterParams]]:
+    """Wait, between runs, for a pooled Tool Meister to be re-bound to a new
+    run.
+
+    The Tool Meister subscribes to its pool channel,
+    "<tm_pool_channel_prefix>-<tool group>-<hostname>", on the Redis server
+    of the run which just ended, and waits for one of these messages:
+
+        {"action": "rebind", "redis_host": "<host>", "redis_port": <port>,
+         "key": "<parameter key>", "instance_uuid": "<UUID>"}
+        {"action": "retire"}
+
+    On "rebind", the Tool Meister connects to the given Redis server (which
+    may well be the same one), and fetches the operational parameters of
+    the new run from the given key.  More than one parked Tool Meister might
+    receive the same message (e.g., one which missed an earlier re-bind), so
+    each must claim the run first, and only the first to do so is re-bound.
+
+    Returns a (Redis client, parameters) tuple for the new run, or None if
+    the Tool Meister is retired, stays idle for too long, or loses its
+    connection to the Redis server.
+    """
+    channel = f"{tm_pool_channel_prefix}-{tm_params.tool_group}-{tm_params.hostname}"
+    pubsub = redis_server.pubsub(ignore_subscribe_messages=True)
+    deadline = time.time() + idle_timeout
+    try:
+        pubsub.subscribe(channel)
+        logger.info("%s: parked on %s", tm_params.hostname, channel)
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                logger.info("%s: idle pool timeout, exiting", tm_params.hostname)
+                return None
+            payload = pubsub.get_message(timeout=min(remaining, 10))
+            if payload is None or payload["type"] != "message":
+                continue
+            try:
+                data = json.loads(payload["data"].decode("utf-8"))
+                action = data["action"]
+            except Exception:
+                logger.warning("ignoring invalid pool message, %r", payload["data"])
+                continue
+            if action == "retire":
+                logger.info("%s: retired from the pool", tm_params.hostname)
+                return None
+            if action != "rebind":
+                logger.warning("ignoring unexpected pool message, %r", data)
+                continue
+            try:
+                host, port = data["redis_host"], int(data["redis_port"])
+                conn = redis_server.connection_pool.connection_kwargs
+                if (host, port) == (conn.get("host"), conn.get("port")):
+                    new_rs = redis_server
+                else:
+                    new_rs = redis.Redis(host=host, port=port, db=0)
+                claim = f"{data['key']}-claim-{data['instance_uuid']}"
+                if not new_rs.set(claim, os.getpid(), nx=True, ex=_POOL_CLAIM_EXPIRY):
+                    logger.debug("%s: run already claimed", tm_params.hostname)
+                    continue
+                new_params = ToolMeister.fetch_params(
+                    json.loads(new_rs.get(data["key"]))
+                )
+            except Exception:
+                logger.exception("failed to re-bind with %r", data)
+                continue
+            if new_params.instance_uuid != data["instance_uuid"]:
+                logger.warning(
+                    "Parameter block has unexpected UUID '%s', expected '%s'",
+                    new_params.instance_uuid,
+                    data["instance_uuid"],
+                )
+                continue
+            logger.info(
+                "%s: re-bound to %s", tm_params.hostname, new_params.benchmark_run_dir
+            )
+            return new_rs, new_params
+    except redis.ConnectionError as exc:
+        logger.info("%s: lost connection to the pool, %s", tm_params.hostname, exc)
+        return None
+    finally:
+        try:
+            pubsub.close()
+        except Exception:
+            pass
+
+
+def _drive(
     tar_path: str,
     sysinfo_dump: str,
     pbench_install_dir: Path,
@@ -1844,13 +2345,10 @@ def driver(
     parsed: Arguments,
     tm_params: ToolMeisterParams,
     redis_server: redis.Redis,
-    logger_name: str,
-    logger: logging.Logger = None,
-):
-    """Create and drive a Tool Meister instance"""
-    if logger is None:
-        logger = get_logger(logger_name, level=parsed.level)
-
+    logger: logging.Logger,
+    install_cache: Dict[Tuple[str, str], Tuple[InstallationResult, Tool]],
+) -> int:
+    """Create and drive a Tool Meister instance for one run"""
     # Add a logging handler to send logs back to the Redis server, with each
     # log entry prepended with the given hostname parameter.
     channel_prefix = tm_params.channel_prefix
@@ -1880,6 +2378,7 @@ def driver(
             tm_params,
             redis_server,
             logger,
+            install_cache=install_cache,
         ) as tm:
             logger.debug("waiting ...")
             for action, data in tm.wait_for_command():
@@ -1897,16 +2396,62 @@ def driver(
         logger.exception("Unexpected error encountered")
         ret_val = 8
     finally:
-        if rh.errors > 0 or rh.redis_errors > 0 or rh.dropped > 0:
+        rh.flush()
+        if rh.errors > 0 or rh.redis_errors > 0 or rh.dropped > 0 or rh.overflow > 0:
             logger.warning(
-                "RedisHandler redis_errors: %d, errors: %d, dropped: %d",
+                "RedisHandler redis_errors: %d, errors: %d, dropped: %d,"
+                " overflow: %d",
                 rh.errors,
                 rh.redis_errors,
                 rh.dropped,
+                rh.overflow,
             )
+        logger.removeHandler(rh)
+        # Publish the remaining records before the Tool Meister exits.
+        rh.close()
     return ret_val
 
 
+def driver(
+    tar_path: str,
+    sysinfo_dump: str,
+    pbench_install_dir: Path,
+    tmp_dir: Path,
+    parsed: Arguments,
+    tm_params: ToolMeisterParams,
+    redis_server: redis.Redis,
+    logger_name: str,
+    logger: logging.Logger = None,
+):
+    """Create and drive a Tool Meister instance
+
+    A pooled Tool Meister is not done when its run is terminated: it parks,
+    and is driven again for each new run it is re-bound to.
+    """
+    if logger is None:
+        logger = get_logger(logger_name, level=parsed.level)
+
+    install_cache = {}
+    while True:
+        ret_val = _drive(
+            tar_path,
+            sysinfo_dump,
+            pbench_install_dir,
+            tmp_dir,
+            parsed,
+            tm_params,
+            redis_server,
+            logger,
+            install_cache,
+        )
+        if ret_val != 0 or not tm_params.pool:
+            return ret_val
+        rebound = park(redis_server, tm_params, logger)
+        if rebound is None:
+            return ret_val
+        redis_server, tm_params = rebound
+
+
 def daemon(
     tar_path: str,
     sysinfo_dump: str,
@@ -1927,7 +2472,9 @@ def daemon(
     sys.stderr.flush()
     sys.stdout.flush()
 
-    if tm_params.hostname != tm_params.controller:
+    if tm_params.hostname != tm_params.controller or tm_params.pool:
+        # A pooled Tool Meister outlives the run directory in which it was
+        # started.
         working_dir = tmp_dir
     else:
         working_dir = Path(".")
@@ -115,6 +115,15 @@ The environment variable _PBENCH_TOOL_MEISTER_START_LOG_LEVEL can be defined to
 specify the logging level (e.g., _PBENCH_TOOL_MEISTER_START_LOG_LEVEL=debug);
 by default only INFO, WARNING, and ERROR are included.
 
+With `--tm-pool` (or PBENCH_TM_POOL=yes), an opt-in for CI-style loops of
+many short runs, the Tool Meisters stay resident between runs instead of
+exiting when terminated: they "park", waiting on a per-host channel of a Redis
+server kept running across runs (in "${pbench_run}/tm-pool"), and the next
+pbench-tool-meister-start re-binds them to its run with a "rebind" message
+instead of starting new ones via ssh.  Tool Meisters which are not parked
+(e.g., the first time) are started as usual.  The time taken to get all the
+Tool Meisters ready is reported.
+
 The pbench-tool-meister-start command will also propagate component Log level
 environment variables when the tool data sink and remote tool meister instances
 are created with `--orchestrate=create`:
@@ -144,11 +153,20 @@ from pbench.agent.constants import (
     cli_tm_channel_prefix,
     def_redis_port,
     def_wsgi_port,
+    tm_channel_suffix_from_tms,
     tm_channel_suffix_to_client,
     tm_channel_suffix_to_logging,
+    tm_channel_suffix_to_tms,
     tm_data_key,
+    tm_pool_channel_prefix,
+    tm_pool_dir_name,
+    tm_transport_pubsub,
+    tm_transport_streams,
+    tm_transports,
 )
-from pbench.agent.redis_utils import RedisChannelSubscriber
+from pbench.agent.overhead import SAMPLE_INTERVAL
+from pbench.agent.redis_utils import RedisChannelSubscriber, streams_supported
+from pbench.agent.tool_data_sink import DEFAULT_MAX_EXTRACTS, DEFAULT_MAX_UPLOADS
 from pbench.agent.tool_data_sink import main as tds_main
 from pbench.agent.tool_group import BadToolGroup, ToolGroup
 from pbench.agent.tool_meister import main as tm_main
@@ -246,6 +264,23 @@ class CleanupTime(Exception):
         return f"Cleanup requested with status {self.status}: {self.message}"
 
 
+def env_int(name: str, default: int, logger: logging.Logger, minimum: int = 0) -> int:
+    """Returns the integer value of the given environment variable, or the
+    default if it is not set, not an integer, or less than the minimum.
+    """
+    try:
+        value = int(os.environ.get(name, default))
+    except ValueError:
+        logger.warning("Invalid %s, using %d", name, default)
+        return default
+    if value < minimum:
+        logger.warning(
+            "Invalid %s, %d, less than %d, using %d", name, value, minimum, default
+        )
+        return default
+    return value
+
+
 def _waitpid(pid: int) -> int:
     """Wrapper for os.waitpid()
 
@@ -277,6 +312,39 @@ class StartTmsErr(ReturnCode.Err):
     pass
 
 
+def rebind_tm(
+    pool_client: redis.Redis,
+    tool_group_name: str,
+    host: str,
+    redis_host: str,
+    redis_port: int,
+    tm_param_key: str,
+    instance_uuid: str,
+    logger: logging.Logger,
+) -> bool:
+    """Ask a parked Tool Meister for the given host to re-bind to this run.
+
+    Returns True if a parked Tool Meister received the request, False if
+    there is none, in which case a new one has to be started.
+    """
+    msg = dict(
+        action="rebind",
+        redis_host=redis_host,
+        redis_port=redis_port,
+        key=tm_param_key,
+        instance_uuid=instance_uuid,
+    )
+    try:
+        num_present = pool_client.publish(
+            f"{tm_pool_channel_prefix}-{tool_group_name}-{host}",
+            json.dumps(msg, sort_keys=True),
+        )
+    except redis.RedisError as exc:
+        logger.warning("failed to re-bind a pooled tool meister on %s: %s", host, exc)
+        return False
+    return num_present > 0
+
+
 def start_tms_via_ssh(
     exec_dir: Path,
     ssh_cmd: str,
@@ -285,10 +353,16 @@ def start_tms_via_ssh(
     redis_server: RedisServerCommon,
     instance_uuid: str,
     logger: logging.Logger,
-) -> None:
+    pool_client: redis.Redis = None,
+) -> int:
     """Orchestrate the creation of local and remote Tool Meister instances using
     ssh for those that are remote.
 
+    When a `pool_client` is given, parked Tool Meisters are re-bound to this
+    run first, and only the hosts without one get a new Tool Meister.
+
+    Returns the number of re-bound Tool Meisters.
+
     Raises a StartTmsErr on failure.
 
     NOTE: all local and remote Tool Meisters are started even if failures
@@ -299,6 +373,7 @@ def start_tms_via_ssh(
     lrh = LocalRemoteHost()
     failures = 0
     successes = 0
+    rebound = 0
     tool_meister_cmd = exec_dir / "tool-meister" / "pbench-tool-meister"
     debug_level = os.environ.get("_PBENCH_TOOL_MEISTER_LOG_LEVEL")
     cmd = f"{tool_meister_cmd} {redis_server.host} {redis_server.port} {{tm_param_key}} {instance_uuid} yes"
@@ -310,7 +385,20 @@ def start_tms_via_ssh(
     for host in tool_group.hostnames.keys():
         tm_count += 1
         tm_param_key = f"tm-{tool_group.name}-{host}"
-        if lrh.is_local(host):
+        is_local = lrh.is_local(host)
+        if pool_client is not None and rebind_tm(
+            pool_client,
+            tool_group.name,
+            host,
+            redis_server.local_host if is_local else redis_server.host,
+            redis_server.port,
+            tm_param_key,
+            instance_uuid,
+            logger,
+        ):
+            logger.debug("6. re-bound pooled tool meister on %s", host)
+            tms[host] = {"status": "rebound"}
+        elif is_local:
             logger.debug("6a. starting localhost tool meister")
             try:
                 pid = os.fork()
@@ -359,6 +447,9 @@ def start_tms_via_ssh(
         if tm_proc["status"] == "failed":
             failures += 1
             continue
+        elif tm_proc["status"] == "rebound":
+            successes += 1
+            rebound += 1
         elif tm_proc["status"] == "forked":
             pid = tm_proc["pid"]
             try:
@@ -406,6 +497,7 @@ def start_tms_via_ssh(
             f" match the expected number of Tool Meisters, {tm_count}",
             ReturnCode.TMMISSING,
         )
+    return rebound
 
 
 class ToolDataSink(BaseServer):
@@ -597,19 +689,13 @@ port {redis_port:d}
         super().__init__(spec, def_host_name)
         self.pid_file = None
 
-    def start(self, tm_dir: Path) -> None:
-        """start_redis - configure and start a Redis server.
+    def _resolve(self) -> str:
+        """Determine the host names the Redis server binds to, returned as
+        a space separated list, and the host name to use to talk to it
+        locally.
 
         Raises a BaseServer.Err exception if an error is encountered.
         """
-        assert (
-            self.host is not None
-            and self.port is not None
-            and self.bind_host is not None
-            and self.bind_port is not None
-            and self.pid_file is None
-        ), f"Unexpected state: {self!r}"
-
         try:
             bind_host_ip = socket.gethostbyname(self.bind_host)
         except socket.error as exc:
@@ -674,7 +760,44 @@ port {redis_port:d}
                     # "local" access.
                     pass
 
-        bind_host_names = " ".join(bind_hostnames_l)
+        return " ".join(bind_hostnames_l)
+
+    def reuse(self, tm_dir: Path) -> bool:
+        """Use the Redis server previously started in the given directory, if
+        it is still running.
+
+        Returns True if it is, False if a new one needs to be started.
+
+        Raises a BaseServer.Err exception if an error is encountered.
+        """
+        assert self.pid_file is None, f"Unexpected state: {self!r}"
+        pid_file = tm_dir / "redis.pid"
+        try:
+            os.kill(int(pid_file.read_text()), 0)
+        except (OSError, ValueError):
+            return False
+        self._resolve()
+        try:
+            redis.Redis(host=self.local_host, port=self.port, db=0).ping()
+        except redis.RedisError:
+            return False
+        self.pid_file = pid_file
+        return True
+
+    def start(self, tm_dir: Path) -> None:
+        """start_redis - configure and start a Redis server.
+
+        Raises a BaseServer.Err exception if an error is encountered.
+        """
+        assert (
+            self.host is not None
+            and self.port is not None
+            and self.bind_host is not None
+            and self.bind_port is not None
+            and self.pid_file is None
+        ), f"Unexpected state: {self!r}"
+
+        bind_host_names = self._resolve()
 
         # Create the Redis server pbench-specific configuration file
         self.pid_file = tm_dir / "redis.pid"
@@ -766,6 +889,10 @@ def start(_prog: str, cli_params: Namespace) -> int:
         * tool_data_sink - The IP/port specification of the Tool Data Sink;
                            follows the same pattern as 'redis_server'
         * tool_group     - The tool group from which to load the registered tools
+        * tm_pool        - True to keep the Tool Meisters resident between
+                           runs, re-binding those left by a previous run
+        * tm_transport   - How messages are carried between the Tool Data
+                           Sink and the Tool Meisters, "pubsub" or "streams"
 
 
     Return 0 on success, non-zero ReturnCode class value on failure.
@@ -830,6 +957,12 @@ def start(_prog: str, cli_params: Namespace) -> int:
         orchestrate = False
     else:
         orchestrate = True
+    pool = getattr(cli_params, "tm_pool", False)
+    if pool and not orchestrate:
+        logger.warning(
+            "--tm-pool ignored with --orchestrate=%s", cli_params.orchestrate
+        )
+        pool = False
 
     # Load and verify required and optional environment variables.
     try:
@@ -1037,10 +1170,36 @@ def start(_prog: str, cli_params: Namespace) -> int:
         # Step 2. - Start the Redis Server (optional)
         # -
 
-        if orchestrate:
+        reused = False
+        if pool:
+            # The pooled Tool Meisters park on the Redis server between runs,
+            # so it lives in a directory of its own, which we record for
+            # pbench-tool-meister-stop.
+            pool_dir = (
+                Path(os.environ.get("pbench_run", benchmark_run_dir.parent))
+                / tm_pool_dir_name
+            )
+            try:
+                pool_dir.mkdir(exist_ok=True)
+                (tm_dir / "pool").write_text(str(pool_dir))
+            except Exception as exc:
+                raise CleanupTime(
+                    ReturnCode.EXCCREATETMDIR,
+                    f"Failed to create the tool meister pool directory: '{exc}'",
+                )
+            try:
+                reused = redis_server.reuse(pool_dir)
+            except redis_server.Err as exc:
+                raise CleanupTime(
+                    exc.return_code, f"Failed to use the pooled Redis server: '{exc}'"
+                )
+            if reused:
+                logger.debug("2. using pooled redis server")
+
+        if orchestrate and not reused:
             logger.debug("2. starting redis server")
             try:
-                redis_server.start(tm_dir)
+                redis_server.start(pool_dir if pool else tm_dir)
             except redis_server.Err as exc:
                 raise CleanupTime(
                     exc.return_code, f"Failed to start a local Redis server: '{exc}'"
@@ -1079,6 +1238,26 @@ def start(_prog: str, cli_params: Namespace) -> int:
                 f"Unable to connect to redis server, {redis_server}: {exc}",
             )
 
+        transport = getattr(cli_params, "tm_transport", tm_transport_pubsub)
+        if transport == tm_transport_streams:
+            if not streams_supported(redis_client):
+                logger.warning(
+                    "Redis server %s does not support streams, using pub/sub",
+                    redis_server,
+                )
+                transport = tm_transport_pubsub
+            else:
+                # Streams outlive the run (e.g., in a pooled Redis server), so
+                # each run starts with new ones.
+                redis_client.delete(
+                    f"{cli_tm_channel_prefix}-{tm_channel_suffix_to_tms}",
+                    f"{cli_tm_channel_prefix}-{tm_channel_suffix_from_tms}",
+                )
+
+        overhead_interval = env_int(
+            "PBENCH_TM_OVERHEAD_INTERVAL", SAMPLE_INTERVAL, logger
+        )
+
         # +
         # Step 4. - Push the loaded tool group data and metadata into the Redis
         #           server
@@ -1110,6 +1289,10 @@ def start(_prog: str, cli_params: Namespace) -> int:
                 tool_metadata=tool_metadata.getFullData(),
                 tools=tools,
                 instance_uuid=instance_uuid,
+                pool=pool,
+                transport=transport,
+                postprocess=os.environ.get("PBENCH_TM_POSTPROCESS", "") == "yes",
+                overhead_interval=overhead_interval,
             )
             # Create a separate key for the Tool Meister that will be on that host
             tm_param_key = f"tm-{tool_group.name}-{host}"
@@ -1138,6 +1321,13 @@ def start(_prog: str, cli_params: Namespace) -> int:
             tool_trigger=tool_group.trigger,
             tools=tool_group_data,
             instance_uuid=instance_uuid,
+            transport=transport,
+            max_uploads=env_int(
+                "PBENCH_TDS_MAX_UPLOADS", DEFAULT_MAX_UPLOADS, logger, minimum=1
+            ),
+            max_extracts=env_int(
+                "PBENCH_TDS_MAX_EXTRACTS", DEFAULT_MAX_EXTRACTS, logger, minimum=1
+            ),
             # The following are optional
             optional_md=optional_md,
         )
@@ -1193,9 +1383,11 @@ def start(_prog: str, cli_params: Namespace) -> int:
         # Step 6. - Start all the local and remote Tool Meisters (optional)
         # -
 
+        tms_start = time.time()
+        rebound = 0
         if orchestrate:
             try:
-                start_tms_via_ssh(
+                rebound = start_tms_via_ssh(
                     prog.parent,
                     ssh_cmd,
                     tool_group,
@@ -1203,6 +1395,7 @@ def start(_prog: str, cli_params: Namespace) -> int:
                     redis_server,
                     instance_uuid,
                     logger,
+                    pool_client=redis_client if pool else None,
                 )
             except StartTmsErr as exc:
                 raise CleanupTime(
@@ -1232,6 +1425,14 @@ def start(_prog: str, cli_params: Namespace) -> int:
                 ReturnCode.TDSWAITFAILURE, "TDS didn't confirm init sequence completion"
             )
         to_client_chan.close()
+        if pool:
+            msg = (
+                f"{len(tool_group.hostnames)} Tool Meister(s) ready in"
+                f" {time.time() - tms_start:0.2f} seconds, {rebound} re-bound"
+                " from the pool"
+            )
+            logger.info(msg)
+            info_log(msg)
 
         # +
         # Step 8. - Verify all the Tool Meisters have reported back, and that
@@ -1387,6 +1588,30 @@ def main():
             " The binding is not used with --orchestrate=existing."
         ),
     )
+    parser.add_argument(
+        "--tm-pool",
+        dest="tm_pool",
+        action="store_true",
+        default=os.environ.get("PBENCH_TM_POOL", "") == "yes",
+        help=(
+            "Keep the Tool Meisters resident after they are stopped, and"
+            " re-bind those left by a previous run instead of starting new"
+            " ones (also enabled by PBENCH_TM_POOL=yes)."
+        ),
+    )
+    parser.add_argument(
+        "--tm-transport",
+        dest="tm_transport",
+        default=os.environ.get("PBENCH_TM_TRANSPORT", tm_transport_pubsub),
+        choices=tm_transports,
+        help=(
+            "How messages are carried between the Tool Data Sink and the Tool"
+            " Meisters: Redis pub/sub channels (the default), or Redis"
+            " Streams, which are not lost when a Tool Meister re-connects,"
+            " falling back to pub/sub when the Redis server does not support"
+            " them (also set by PBENCH_TM_TRANSPORT)."
+        ),
+    )
     parser.add_argument(
         "tool_group",
         help="The tool group name of tools to be run by the Tool Meisters.",
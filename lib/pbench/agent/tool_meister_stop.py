@@ -6,15 +6,23 @@ Responsible for ending persistent tools, collecting any requested system
 information, recording any necessary metadata about the Tool Meisters, and
 stopping all local/remote tool meisters, closing down the local data sink, and
 finally the local redis server.
+
+Pooled Tool Meisters (see `pbench-tool-meister-start --tm-pool`) are left
+parked on the pooled Redis server, which is left running, unless
+`--retire-pool` is given.
 """
 
 from argparse import ArgumentParser, Namespace
+import json
 import logging
 import os
 from pathlib import Path
 import sys
 import time
 
+import redis
+
+from pbench.agent.constants import tm_pool_channel_prefix
 from pbench.agent.tool_group import BadToolGroup, ToolGroup
 from pbench.agent.tool_meister_client import Client
 from pbench.agent.utils import (
@@ -51,15 +59,22 @@ class RedisServer(RedisServerCommon):
 
     The constructor is enhanced to find the optional local Redis server pid
     file, and the additional method, locally_managed(), keys off of its
-    presence.
+    presence.  The pid file of the Redis server of pooled Tool Meisters is
+    in the pool directory recorded by pbench-tool-meister-start.
     """
 
     def __init__(self, spec: str, benchmark_run_dir: Path, def_host_name: str):
         super().__init__(spec, def_host_name)
+        tm_dir = benchmark_run_dir / "tm"
         try:
-            self.pid_file = (benchmark_run_dir / "tm" / "redis.pid").resolve(
-                strict=True
-            )
+            pool_dir = Path((tm_dir / "pool").read_text())
+        except FileNotFoundError:
+            self.pooled = False
+        else:
+            self.pooled = True
+            tm_dir = pool_dir
+        try:
+            self.pid_file = (tm_dir / "redis.pid").resolve(strict=True)
         except FileNotFoundError:
             pass
         else:
@@ -72,6 +87,41 @@ class RedisServer(RedisServerCommon):
         return self.pid_file is not None
 
 
+def wait_for_tds(benchmark_run_dir: Path, logger: logging.Logger) -> int:
+    """Wait for the local Tool Data Sink to exit.
+
+    Returns 0 on success, 1 on failure (logging any unexpected exceptions)
+    """
+    try:
+        tds_pid_file = benchmark_run_dir / "tm" / "pbench-tool-data-sink.pid"
+        try:
+            pid_str = tds_pid_file.read_text()
+        except FileNotFoundError:
+            pass
+        else:
+            tds_pid = int(pid_str)
+            logger.debug("waiting for tool-data-sink (%d) to exit", tds_pid)
+            wait_for_pid(tds_pid)
+    except Exception:
+        logger.exception("Exception encountered waiting for tool-data-sink")
+        return 1
+    return 0
+
+
+def retire_pool(group: str, redis_server: RedisServer, logger: logging.Logger) -> None:
+    """Tell the parked Tool Meisters of the given tool group to exit."""
+    try:
+        hostnames = ToolGroup(group).hostnames.keys()
+        redis_client = redis.Redis(host=redis_server.host, port=redis_server.port)
+        for host in hostnames:
+            redis_client.publish(
+                f"{tm_pool_channel_prefix}-{group}-{host}",
+                json.dumps({"action": "retire"}),
+            )
+    except Exception:
+        logger.exception("Exception encountered retiring pooled tool meisters")
+
+
 def graceful_shutdown(
     benchmark_run_dir: Path,
     redis_server: RedisServer,
@@ -90,21 +140,7 @@ def graceful_shutdown(
 
     Returns 0 on success, 1 on failure (logging any unexpected exceptions)
     """
-    try:
-        tds_pid_file = benchmark_run_dir / "tm" / "pbench-tool-data-sink.pid"
-        try:
-            pid_str = tds_pid_file.read_text()
-        except FileNotFoundError:
-            pass
-        else:
-            tds_pid = int(pid_str)
-            logger.debug("waiting for tool-data-sink (%d) to exit", tds_pid)
-            wait_for_pid(tds_pid)
-    except Exception:
-        logger.exception("Exception encountered waiting for tool-data-sink")
-        ret_val = 1
-    else:
-        ret_val = 0
+    ret_val = wait_for_tds(benchmark_run_dir, logger)
 
     try:
         ltm_pid_file = benchmark_run_dir / "tm" / "tm.pid"
@@ -152,6 +188,8 @@ def start(_prog: str, cli_params: Namespace) -> int:
         * interrupt  - True / False value indicating if the call to stop the
                        Tool Meisters is in response to an interrupt or not
         * sysinfo    - The system information set to be collected at the start
+        * retire_pool - True to also stop pooled Tool Meisters, and their Redis
+                       server, instead of leaving them for the next run
 
     Return 0 on success, 1 on failure.
     """
@@ -202,6 +240,7 @@ def start(_prog: str, cli_params: Namespace) -> int:
         logger.error(str(exc))
         return exc.return_code
 
+    stop_start = time.time()
     # The Redis server is always running on the local host with the CLI.
     with Client(
         redis_host=redis_server.host,
@@ -255,7 +294,20 @@ def start(_prog: str, cli_params: Namespace) -> int:
     # of the terminate operation instead.
     ret_val = end_ret_val if (end_ret_val != 0 and not interrupt) else term_ret_val
 
-    if redis_server.locally_managed():
+    if redis_server.pooled and not getattr(cli_params, "retire_pool", False):
+        # The Tool Meisters are parked, waiting for the next run, on the
+        # pooled Redis server, which we leave running; only the Tool Data
+        # Sink exits.
+        shutdown_ret_val = wait_for_tds(benchmark_run_dir, logger)
+        if ret_val == 0:
+            ret_val = shutdown_ret_val
+        logger.info(
+            "Tool Meisters stopped in %0.2f seconds, left in the pool",
+            time.time() - stop_start,
+        )
+    elif redis_server.locally_managed():
+        if redis_server.pooled:
+            retire_pool(group, redis_server, logger)
         # The client operations have finished, successful or unsuccessfully,
         # and we were not given an explicit Redis server to use.  So the
         # previous pbench-tool-meister-start must have set up the local Tool
@@ -295,6 +347,16 @@ def main():
             " as well."
         ),
     )
+    parser.add_argument(
+        "--retire-pool",
+        dest="retire_pool",
+        action="store_true",
+        help=(
+            "Stop pooled Tool Meisters (see pbench-tool-meister-start"
+            " --tm-pool), and their Redis server, instead of leaving them"
+            " for the next run."
+        ),
+    )
     parser.add_argument(
         "tool_group",
         help="The tool group name of tools being run in the Tool Meisters.",
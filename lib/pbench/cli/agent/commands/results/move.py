@@ -1,7 +1,11 @@
+from concurrent.futures import ThreadPoolExecutor
 import os
+from pathlib import Path
 import shutil
 import socket
 import tempfile
+import threading
+import time
 
 import click
 
@@ -13,6 +17,19 @@ from pbench.common.exceptions import BadMDLogFormat
 from pbench.common.utils import validate_hostname
 
 
+class _Run:
+    """The state of one result directory moving through the pipeline."""
+
+    def __init__(self, result_dir: Path, mrt: MakeResultTb):
+        self.result_dir = result_dir
+        self.mrt = mrt
+        self.tarball = None
+        self.length = 0
+        self.md5 = None
+        self.make_time = 0.0
+        self.upload_time = 0.0
+
+
 class MoveResults(BaseCommand):
     """Command implementation for "pbench results move."
 
@@ -24,20 +41,199 @@ class MoveResults(BaseCommand):
     This command is responsible for finding all the existing pbench data
     directories on the local host (controller), packaging each of them up as a
     tar ball, and sending it to the remote pbench server.
+
+    The tar balls are made and uploaded by a pipeline of two thread pools, so
+    that compressing one result directory overlaps with uploading another:
+    up to `[results] move_compressors` tar balls are made at a time, and up
+    to `[results] move_uploaders` are uploaded at a time.  Each upload is
+    retried `[results] move_upload_retries` times, backing off exponentially
+    from `[results] move_retry_backoff` seconds, before the run is counted as
+    a failure, at which point no further uploads are attempted.
     """
 
     def __init__(self, context: CliContext):
         super().__init__(context)
+        self.compressors = max(
+            int(self.config.get("results", "move_compressors", fallback="1")), 1
+        )
+        self.uploaders = max(
+            int(self.config.get("results", "move_uploaders", fallback="1")), 1
+        )
+        self.retries = max(
+            int(self.config.get("results", "move_upload_retries", fallback="2")), 0
+        )
+        self.backoff = float(
+            self.config.get("results", "move_retry_backoff", fallback="5")
+        )
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.runs_copied = 0
+        self.failures = 0
+
+    def _failed(self, stop: bool = False):
+        with self.lock:
+            self.failures += 1
+        if stop:
+            self.stop.set()
+
+    def _make(self, run: _Run, single_threaded: bool) -> bool:
+        """Make the tar ball of a result directory, returning True on success."""
+        start = time.perf_counter()
+        try:
+            run.tarball, run.length, run.md5 = run.mrt.make_result_tb(
+                single_threaded=single_threaded
+            )
+        except BadMDLogFormat as exc:
+            self.logger.warning(str(exc))
+        except FileNotFoundError as exc:
+            self.logger.error(str(exc))
+        except RuntimeError as exc:
+            self.logger.warning("Error encountered making tar ball, '%s'", exc)
+        except Exception as exc:
+            self.logger.error(
+                "Unexpected error occurred making tar ball for '%s', '%s'",
+                run.result_dir,
+                exc,
+            )
+        else:
+            run.make_time = time.perf_counter() - start
+            return True
+        self._failed()
+        return False
+
+    def _upload(self, run: _Run):
+        """Upload the tar ball of a result directory, retrying with an
+        exponential back off; the final failure is raised to the caller.
+        """
+        crt = CopyResultTb(
+            self.context.controller,
+            run.tarball,
+            run.length,
+            run.md5,
+            self.config,
+            self.logger,
+        )
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                crt.copy_result_tb(self.context.token)
+            except (CopyResultTb.FileUploadError, RuntimeError) as exc:
+                if attempt == self.retries or self.stop.is_set():
+                    raise
+                delay = self.backoff * 2**attempt
+                self.logger.warning(
+                    "Error uploading file, '%s', %s; retrying in %.1f seconds",
+                    run.tarball,
+                    exc,
+                    delay,
+                )
+                self.stop.wait(delay)
+            else:
+                break
+        run.upload_time = time.perf_counter() - start
+
+    def _finish(self, run: _Run, delete: bool):
+        """Remove or mark as copied a result directory which was uploaded."""
+        result_dir = run.result_dir
+        if delete:
+            try:
+                shutil.rmtree(result_dir)
+            except OSError:
+                self.logger.error(
+                    "Failed to remove the %s directory hierarchy", result_dir
+                )
+                # If we can't hold up the contract of removing the local
+                # directory tree that was copied, we stop processing result
+                # directories.  Not being able to remove the local directory
+                # tree will usually indicate a serious problem that needs to
+                # be resolved before doing anything else.
+                self._failed(stop=True)
+                return
+        else:
+            copied = result_dir.parent / f"{result_dir.name}.copied"
+            try:
+                copied.touch()
+            except OSError as exc:
+                self.logger.error(
+                    "Failed to create '.copied' file marker for '%s', '%s'",
+                    result_dir,
+                    exc,
+                )
+                # If we can't hold up the contract of marking a directory as
+                # copied remotely, we stop processing result directories.  If
+                # we can't create an empty file on the file system where the
+                # result directory lives, it likely indicates bigger problems.
+                self._failed(stop=True)
+                return
+        with self.lock:
+            self.runs_copied += 1
+        self.logger.info(
+            "%s: %d byte tar ball made in %.2fs, uploaded in %.2fs (%.2f MiB/s)",
+            result_dir.name,
+            run.length,
+            run.make_time,
+            run.upload_time,
+            run.length / 2**20 / max(run.upload_time, 1e-6),
+        )
+
+    def _upload_stage(self, run: _Run, delete: bool, slots: threading.Semaphore):
+        try:
+            if self.stop.is_set():
+                return
+            try:
+                self._upload(run)
+            except Exception as exc:
+                if isinstance(exc, (CopyResultTb.FileUploadError, RuntimeError)):
+                    msg = "Error uploading file"
+                else:
+                    msg = "Unexpected error occurred copying tar ball remotely"
+                self.logger.error("%s, '%s', %s", msg, run.tarball, exc)
+                # We don't know why this operation failed; regardless, trying
+                # to copy another tar ball remotely does not have much chance
+                # of success.
+                self._failed(stop=True)
+                return
+            self._finish(run, delete)
+        finally:
+            try:
+                # We always remove the constructed tar ball, regardless of
+                # success or failure, since we keep the result directory on
+                # failure.
+                os.remove(run.tarball)
+            except OSError as exc:
+                self.logger.error("Failed to remove '%s', '%s'", run.tarball, exc)
+            slots.release()
+
+    def _make_stage(
+        self,
+        run: _Run,
+        single_threaded: bool,
+        delete: bool,
+        slots: threading.Semaphore,
+        uploaders: ThreadPoolExecutor,
+    ):
+        if not self.stop.is_set() and self._make(run, single_threaded):
+            uploaders.submit(self._upload_stage, run, delete, slots)
+        else:
+            slots.release()
 
     def execute(self, single_threaded: bool, delete: bool = True) -> int:
-        runs_copied = 0
-        failures = 0
         no_of_tb = 0
+        # Bound the number of tar balls made but not yet uploaded, so that
+        # fast compressors don't fill the temporary directory.
+        slots = threading.BoundedSemaphore(self.compressors + self.uploaders)
+        start = time.perf_counter()
 
         with tempfile.TemporaryDirectory(
             dir=self.config.pbench_tmp, prefix="pbench-results-move."
-        ) as temp_dir:
-            for dirent in self.config.pbench_run.iterdir():
+        ) as temp_dir, ThreadPoolExecutor(
+            max_workers=self.uploaders, thread_name_prefix="upload"
+        ) as uploaders, ThreadPoolExecutor(
+            max_workers=self.compressors, thread_name_prefix="compress"
+        ) as compressors:
+            for dirent in sorted(self.config.pbench_run.iterdir()):
+                if self.stop.is_set():
+                    break
                 if not dirent.is_dir():
                     continue
                 if dirent.name.startswith("tools-") or dirent.name == "tmp":
@@ -66,109 +262,36 @@ class MoveResults(BaseCommand):
                     continue
                 except (NotADirectoryError, FileNotFoundError) as exc:
                     self.logger.error(str(exc))
-                    failures += 1
+                    self._failed()
                     continue
 
-                try:
-                    result_tb_name, result_tb_len, result_tb_md5 = mrt.make_result_tb(
-                        single_threaded=single_threaded
-                    )
-                except BadMDLogFormat as exc:
-                    self.logger.warning(str(exc))
-                    failures += 1
-                    continue
-                except FileNotFoundError as exc:
-                    self.logger.error(str(exc))
-                    failures += 1
-                    continue
-                except RuntimeError as exc:
-                    self.logger.warning("Error encountered making tar ball, '%s'", exc)
-                    failures += 1
-                    continue
-                except Exception as exc:
-                    self.logger.error(
-                        "Unexpected error occurred making tar ball for '%s', '%s'",
-                        result_dir,
-                        exc,
-                    )
-                    failures += 1
-                    continue
-
-                try:
-                    crt = CopyResultTb(
-                        self.context.controller,
-                        result_tb_name,
-                        result_tb_len,
-                        result_tb_md5,
-                        self.config,
-                        self.logger,
-                    )
-                    crt.copy_result_tb(self.context.token)
-                except Exception as exc:
-                    if isinstance(exc, (CopyResultTb.FileUploadError, RuntimeError)):
-                        msg = "Error uploading file"
-                    else:
-                        msg = "Unexpected error occurred copying tar ball remotely"
-                    self.logger.error("%s, '%s', %s", msg, result_tb_name, exc)
-                    failures += 1
-                    # We don't know why this operation failed; regardless,
-                    # trying to copy another tar ball remotely does not have
-                    # much chance of success.
-                    break
-                else:
-                    runs_copied += 1
-                finally:
-                    try:
-                        # We always remove the constructed tar ball, regardless of success
-                        # or failure, since we keep the result directory below on failure.
-                        os.remove(result_tb_name)
-                    except OSError as exc:
-                        self.logger.error(
-                            "Failed to remove '%s', '%s'", result_tb_name, exc
-                        )
-
-                if delete:
-                    try:
-                        shutil.rmtree(result_dir)
-                    except OSError:
-                        self.logger.error(
-                            "Failed to remove the %s directory hierarchy", result_dir
-                        )
-                        failures += 1
-                        # If we can't hold up the contract of removing the
-                        # local directory tree that was copied, we exit the
-                        # loop that is processing result directories.  Not
-                        # being able to remove the local directory tree will
-                        # usually indicate a serious problem that needs to be
-                        # resolved before doing anything else.
-                        break
-                else:
-                    copied = result_dir.parent / f"{result_dir.name}.copied"
-                    try:
-                        copied.touch()
-                    except OSError as exc:
-                        self.logger.error(
-                            "Failed to create '.copied' file marker for '%s', '%s'",
-                            result_dir,
-                            exc,
-                        )
-                        failures += 1
-                        # If we can't hold up the contract of marking a
-                        # directory as copied remotely, we exit the loop that
-                        # is processing result directories.  If we can't
-                        # create an empty file on the file system where the
-                        # result directory lives, it likely indicates bigger
-                        # problems.
-                        break
+                slots.acquire()
+                compressors.submit(
+                    self._make_stage,
+                    _Run(result_dir, mrt),
+                    single_threaded,
+                    delete,
+                    slots,
+                    uploaders,
+                )
 
+        elapsed = time.perf_counter() - start
         action = "moved" if delete else "copied"
+        if self.runs_copied:
+            self.logger.info(
+                "%s %d of %d result directories in %.2fs",
+                action.capitalize(),
+                self.runs_copied,
+                no_of_tb,
+                elapsed,
+            )
         click.echo(
             f"Status: total # of result directories considered {no_of_tb:d},"
-            f" successfully {action} {runs_copied:d}, encountered"
-            f" {failures:d} failures"
+            f" successfully {action} {self.runs_copied:d}, encountered"
+            f" {self.failures:d} failures"
         )
 
-        return 0 if failures == 0 else 1
+        return 0 if self.failures == 0 else 1
 
 
 @click.command(name="pbench-results-move")
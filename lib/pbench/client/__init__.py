@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
 from enum import Enum
 from pathlib import Path
@@ -9,6 +10,7 @@ import requests
 from requests.structures import CaseInsensitiveDict
 
 from pbench.client.types import Dataset, JSONMap, JSONOBJECT
+from pbench.common.utils import FileRange
 
 
 class PbenchClientError(Exception):
@@ -56,6 +58,8 @@ class API(Enum):
     REGISTER = "register"
     SERVER_CONFIGURATION = "server_configuration"
     UPLOAD = "upload"
+    UPLOAD_PART = "upload_part"
+    UPLOAD_SESSION = "upload_session"
     USER = "user"
 
 
@@ -346,6 +350,21 @@ class PbenchServerClient:
         self.username = None
         self.auth_token = None
 
+    @staticmethod
+    def _controller(tarball: Path, **kwargs) -> Optional[str]:
+        """Return the controller for a tarball, either from a "controller"
+        keyword override or from the tarball's metadata.log file.
+        """
+        if "controller" in kwargs:
+            return kwargs["controller"]
+        with tarfile.open(tarball) as t:
+            metafile = (
+                t.extractfile(f"{Dataset.stem(tarball)}/metadata.log").read().decode()
+            )
+        metadata = ConfigParser()
+        metadata.read_string(metafile)
+        return metadata.get("run", "controller", fallback=None)
+
     def upload(self, tarball: Path, **kwargs) -> requests.Response:
         """Upload a tarball to the server.
 
@@ -367,18 +386,7 @@ class PbenchServerClient:
             The PUT response object
         """
         md5 = kwargs.get("md5", Dataset.md5(tarball))
-        if "controller" in kwargs:
-            controller = kwargs["controller"]
-        else:
-            with tarfile.open(tarball) as t:
-                metafile = (
-                    t.extractfile(f"{Dataset.stem(tarball)}/metadata.log")
-                    .read()
-                    .decode()
-                )
-            metadata = ConfigParser()
-            metadata.read_string(metafile)
-            controller = metadata.get("run", "controller", fallback=None)
+        controller = self._controller(tarball, **kwargs)
 
         headers = {"Content-MD5": md5, "controller": controller}
 
@@ -391,6 +399,71 @@ class PbenchServerClient:
                 raise_error=False,
             )
 
+    def upload_parts(
+        self, tarball: Path, part_size: int, workers: int = 4, **kwargs
+    ) -> requests.Response:
+        """Upload a tarball to the server in parts using a resumable upload
+        session.
+
+        The session is initiated (or an existing identical session resumed),
+        the parts the server has not yet received are sent in parallel, each
+        with its own MD5, and the session is completed, at which point the
+        server assembles the tarball and verifies its MD5. If an upload is
+        interrupted, calling this again sends only the missing parts.
+
+        This has the same requirements as `upload`.
+
+        Args:
+            tarball: path to a tarball file with a companion MD5 file
+            part_size: the size in bytes of each part but the last
+            workers: the maximum number of parts sent concurrently
+            kwargs: Use to override automatically generated headers
+                md5: override companion MD5 value
+                controller: override metadata.log controller
+
+        Raises:
+            FileNotFound: The file or the companion MD5 file is missing
+            HttpError: An HTTP or API error occurs
+
+        Returns:
+            The response object from the last API call: the session
+            completion, or the session initiation if the server already
+            has the dataset
+        """
+        md5 = kwargs.get("md5", Dataset.md5(tarball))
+        size = tarball.stat().st_size
+        params = {"filename": tarball.name}
+        response = self.post(
+            api=API.UPLOAD_SESSION,
+            uri_params=params,
+            json={
+                "controller": self._controller(tarball, **kwargs),
+                "md5": md5,
+                "size": size,
+                "part_size": part_size,
+            },
+        )
+        session = response.json()
+        if "parts" not in session:
+            return response
+
+        def send(part: int):
+            offset = (part - 1) * part_size
+            with FileRange(tarball, offset, min(part_size, size - offset)) as body:
+                self.put(
+                    api=API.UPLOAD_PART,
+                    uri_params={"filename": tarball.name, "part": part},
+                    headers={"Content-MD5": body.md5()},
+                    data=body,
+                )
+
+        received = set(session["received"])
+        missing = [p for p in range(1, session["parts"] + 1) if p not in received]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Consume the results so that any failure is raised here.
+            list(executor.map(send, missing))
+        return self.put(api=API.UPLOAD_SESSION, uri_params=params, raise_error=False)
+
     def get_list(self, **kwargs) -> Iterator[Dataset]:
         """Return a list of datasets matching the specific search criteria and
         with the requested metadata items.
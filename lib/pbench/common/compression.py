@@ -0,0 +1,164 @@
+"""Compression codecs for tar balls.
+
+Tar balls are compressed and decompressed by external commands, either run
+by `tar` itself (via its `--use-compress-program` option), or in a pipeline
+with it.  Python's `tarfile` package can only decompress some of them (e.g.,
+`xz`); for the others, `open_tar_stream()` pipes the data through the
+external command.
+"""
+from contextlib import contextmanager
+from pathlib import Path
+import shutil
+import subprocess
+import tarfile
+import threading
+from typing import BinaryIO, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+# Read size used when feeding an external decompression command.
+_BUFFER_SIZE = 65536
+
+
+class Codec(NamedTuple):
+    """A compression codec implemented by an external command."""
+
+    # Name of the codec, as used in configuration files and messages
+    name: str
+    # File name suffix of a compressed file, including the leading "."
+    suffix: str
+    # The external command implementing the codec
+    command: str
+    # The compression level used when none is specified
+    default_level: int
+    # Whether the command accepts a "-T<threads>" option
+    threaded: bool
+    # Whether Python's `tarfile` package can decompress it on its own
+    native: bool
+
+    def compress_args(self, level: Optional[int] = None, threads: int = 0) -> List[str]:
+        """The command line compressing standard input to standard output.
+
+        Args:
+            level   Compression level, or None for the codec's default
+            threads Number of compression threads, 0 for one per CPU
+                    (ignored by codecs which aren't multi-threaded)
+        """
+        args = [
+            self.command,
+            "-c",
+            f"-{self.default_level if level is None else level}",
+        ]
+        if self.threaded:
+            args.append(f"-T{threads}")
+        return args
+
+    def decompress_args(self) -> List[str]:
+        """The command line decompressing standard input to standard output."""
+        return [self.command, "-d", "-c"]
+
+    def tar_option(self, level: Optional[int] = None, threads: int = 0) -> str:
+        """The `tar` option compressing (or, when extracting, decompressing)
+        an archive with this codec.
+        """
+        return f"--use-compress-program={' '.join(self.compress_args(level, threads))}"
+
+    def tar_suffix(self) -> str:
+        return f".tar{self.suffix}"
+
+
+CODECS = {
+    codec.name: codec
+    for codec in (
+        Codec("xz", ".xz", "xz", 6, threaded=True, native=True),
+        Codec("zstd", ".zst", "zstd", 3, threaded=True, native=False),
+        Codec("lz4", ".lz4", "lz4", 1, threaded=False, native=False),
+    )
+}
+
+# The codec every Pbench Agent and Server supports.
+DEFAULT_CODEC = CODECS["xz"]
+
+# Codecs in order of preference when sending tool data: the faster ones
+# first, since tool data is compressed on the systems under test.
+PREFERRED_CODECS = ("zstd", "lz4", "xz")
+
+
+def available_codecs(names: Iterable[str] = PREFERRED_CODECS) -> List[str]:
+    """Return the names of the given codecs, in order, whose commands are
+    installed on this host.
+    """
+    return [n for n in names if n in CODECS and shutil.which(CODECS[n].command)]
+
+
+def negotiate(offered: Optional[Iterable[str]], accepted: Iterable[str]) -> Codec:
+    """Choose the codec with which to send data: the first of the codecs the
+    receiver accepts which the sender offers, falling back to the default
+    codec when there is none (e.g., for a sender which offers nothing).
+    """
+    offered = set(offered or ())
+    for name in accepted:
+        if name in offered:
+            return CODECS[name]
+    return DEFAULT_CODEC
+
+
+def codec_for(path: Union[Path, str]) -> Optional[Codec]:
+    """Return the codec of a compressed tar ball, based on its file name
+    suffix, or None if it isn't a compressed tar ball.
+    """
+    name = str(path)
+    for codec in CODECS.values():
+        if name.endswith(codec.tar_suffix()):
+            return codec
+    return None
+
+
+@contextmanager
+def open_tar_stream(fileobj: BinaryIO, codec: Codec) -> Iterator[tarfile.TarFile]:
+    """Open a compressed tar ball for sequential reading.
+
+    Codecs Python can't decompress are piped through their external command,
+    fed by a helper thread.
+
+    Args:
+        fileobj The compressed tar ball, open for reading
+        codec   Its compression codec
+
+    Yields a `tarfile.TarFile` object in stream mode.
+    """
+    if codec.native:
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+            yield tar
+        return
+
+    proc = subprocess.Popen(
+        codec.decompress_args(),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+
+    def feed():
+        try:
+            while True:
+                buf = fileobj.read(_BUFFER_SIZE)
+                if not buf:
+                    break
+                proc.stdin.write(buf)
+        except (BrokenPipeError, ValueError):
+            # The reader stopped early, and closed the pipe.
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        with tarfile.open(fileobj=proc.stdout, mode="r|") as tar:
+            yield tar
+    finally:
+        proc.stdout.close()
+        feeder.join()
+        proc.wait()
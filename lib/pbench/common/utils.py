@@ -16,26 +16,85 @@ class Md5Result(NamedTuple):
     md5_hash: str
 
 
-def md5sum(filename: Union[Path, str]) -> Md5Result:
+def md5sum(filename: Union[Path, str], blocksize: int = 2**20) -> Md5Result:
     """
     Return the MD5 check-sum of a given file without reading the entire file
     into memory.
 
+    The file is read unbuffered into a single reusable buffer, so large block
+    sizes cost no more memory churn than small ones.
+
     Args:
         filename    Filename to hash
+        blocksize   Size of each read
 
     Returns:
         Md5Result tuple containing the length and the hex digest of the file.
     """
-    with open(filename, mode="rb") as f:
+    buf = bytearray(blocksize)
+    view = memoryview(buf)
+    with open(filename, mode="rb", buffering=0) as f:
         d = hashlib.md5()
         length = 0
-        for buf in iter(partial(f.read, 2**20), b""):
-            length += len(buf)
-            d.update(buf)
+        for n in iter(partial(f.readinto, buf), 0):
+            length += n
+            d.update(view[:n])
     return Md5Result(length=length, md5_hash=d.hexdigest())
 
 
+class FileRange:
+    """
+    A read-only, file-like view of a contiguous byte range of a file.
+
+    This is used to send one part of a large file as an HTTP request body
+    without reading the whole part into memory: the HTTP library uses the
+    object's length as the Content-Length and then streams it via read().
+    """
+
+    def __init__(self, filename: Union[Path, str], offset: int, length: int):
+        self.filename = filename
+        self.offset = offset
+        self.length = length
+        self.remaining = length
+        self.file = open(filename, mode="rb")
+        self.file.seek(offset)
+
+    def __len__(self) -> int:
+        return self.remaining
+
+    def __enter__(self) -> "FileRange":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        buf = self.file.read(size)
+        self.remaining -= len(buf)
+        return buf
+
+    def rewind(self):
+        self.file.seek(self.offset)
+        self.remaining = self.length
+
+    def md5(self) -> str:
+        """
+        Return the MD5 hex digest of the byte range, leaving the view
+        positioned at the start of the range.
+        """
+        self.rewind()
+        d = hashlib.md5()
+        for buf in iter(partial(self.read, 2**20), b""):
+            d.update(buf)
+        self.rewind()
+        return d.hexdigest()
+
+    def close(self):
+        self.file.close()
+
+
 # Derived from https://stackoverflow.com/questions/106179/regular-expression-to-match-dns-hostname-or-ip-address
 # with a few modifications: take advantage of ignoring case; use non-capturing
 # groups to improve efficiency; take advantage of RFC 1123 modification to RFC
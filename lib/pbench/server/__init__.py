@@ -6,7 +6,7 @@ from configparser import NoOptionError, NoSectionError
 from datetime import datetime, timedelta, tzinfo
 from pathlib import Path
 from time import time as _time
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 
 from pbench import _STD_DATETIME_FMT, PbenchConfig
 from pbench.common.exceptions import BadConfig
@@ -159,6 +159,66 @@ class PbenchServerConfig(PbenchConfig):
             retention_days = self.MAXIMUM_RETENTION_DAYS
         return retention_days
 
+    @property
+    def tool_data_rollup_interval(self) -> int:
+        """
+        The width, in seconds, of the intervals into which tool data is
+        rolled up next to the raw tool data indices.
+
+        Returns
+            The rollup interval in seconds, or 0 when rollups are disabled
+        """
+        try:
+            interval = int(self._get_conf("Indexing", "tool_data_rollup_interval"))
+        except (BadConfig, ValueError):
+            return 0
+        return max(interval, 0)
+
+    @property
+    def index_catalog_refresh(self) -> int:
+        """
+        The interval, in seconds, at which the API server refreshes its view
+        of the indices which exist, used to query only those.
+
+        Returns
+            The refresh interval in seconds, or 0 when all the indices of a
+            time range are queried
+        """
+        try:
+            interval = int(self._get_conf("Indexing", "index_catalog_refresh"))
+        except (BadConfig, ValueError):
+            return 0
+        return max(interval, 0)
+
+    @property
+    def slow_request_threshold(self) -> Optional[float]:
+        """
+        The duration, in seconds, beyond which an API request is logged with
+        the SQL statements and Elasticsearch calls it made.
+
+        Returns
+            The threshold, or None when slow requests are not logged
+        """
+        try:
+            threshold = float(self._get_conf("pbench-server", "slow_request_threshold"))
+        except (BadConfig, ValueError):
+            return None
+        return max(threshold, 0.0)
+
+    @property
+    def metrics_dir(self) -> Optional[Path]:
+        """
+        The directory where the server processes write their metrics for the
+        API server to export.
+
+        Returns
+            The metrics directory, or None when it is not configured
+        """
+        try:
+            return Path(self._get_conf("pbench-server", "pbench-metrics-dir"))
+        except BadConfig:
+            return None
+
     def _get_conf(self, section, option):
         """
         _get_conf - get the option from the section, raising
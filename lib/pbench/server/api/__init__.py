@@ -13,7 +13,7 @@ from flask_restful import Api
 
 from pbench.common.exceptions import BadConfig, ConfigFileNotSpecified
 from pbench.common.logger import get_pbench_logger
-from pbench.server import PbenchServerConfig
+from pbench.server import metrics, PbenchServerConfig
 from pbench.server.api.resources.datasets_daterange import DatasetsDateRange
 from pbench.server.api.resources.datasets_inventory import DatasetsInventory
 from pbench.server.api.resources.datasets_list import DatasetsList
@@ -28,15 +28,20 @@ from pbench.server.api.resources.query_apis.datasets.datasets_detail import (
 from pbench.server.api.resources.query_apis.datasets.datasets_mappings import (
     DatasetsMappings,
 )
+from pbench.server.api.resources.query_apis.datasets.datasets_timeseries import (
+    DatasetsTimeseries,
+)
 from pbench.server.api.resources.query_apis.datasets.namespace_and_rows import (
     SampleNamespace,
     SampleValues,
 )
+from pbench.server.api.resources.query_apis.datasets_compare import DatasetsCompare
 from pbench.server.api.resources.query_apis.datasets_delete import DatasetsDelete
 from pbench.server.api.resources.query_apis.datasets_publish import DatasetsPublish
 from pbench.server.api.resources.query_apis.datasets_search import DatasetsSearch
 from pbench.server.api.resources.server_configuration import ServerConfiguration
-from pbench.server.api.resources.upload_api import Upload
+from pbench.server.api.resources.server_metrics import ServerMetrics
+from pbench.server.api.resources.upload_api import Upload, UploadPart, UploadSession
 from pbench.server.api.resources.users_api import Login, Logout, RegisterUser, UserAPI
 from pbench.server.auth.auth import Auth
 from pbench.server.database import init_db
@@ -125,12 +130,24 @@ def register_endpoints(api, app, config):
         endpoint="datasets_publish",
         resource_class_args=(config, logger),
     )
+    api.add_resource(
+        DatasetsCompare,
+        f"{base_uri}/datasets/compare",
+        endpoint="datasets_compare",
+        resource_class_args=(config, logger),
+    )
     api.add_resource(
         DatasetsSearch,
         f"{base_uri}/datasets/search",
         endpoint="datasets_search",
         resource_class_args=(config, logger),
     )
+    api.add_resource(
+        DatasetsTimeseries,
+        f"{base_uri}/datasets/timeseries/<string:dataset>",
+        endpoint="datasets_timeseries",
+        resource_class_args=(config, logger),
+    )
     api.add_resource(
         EndpointConfig,
         f"{base_uri}/endpoints",
@@ -155,6 +172,12 @@ def register_endpoints(api, app, config):
         endpoint="register",
         resource_class_args=(config, logger),
     )
+    api.add_resource(
+        ServerMetrics,
+        f"{base_uri}/metrics",
+        endpoint="server_metrics",
+        resource_class_args=(config, logger),
+    )
     api.add_resource(
         ServerConfiguration,
         f"{base_uri}/server/configuration",
@@ -175,6 +198,18 @@ def register_endpoints(api, app, config):
         endpoint="upload",
         resource_class_args=(config, logger),
     )
+    api.add_resource(
+        UploadPart,
+        f"{base_uri}/upload/part/<string:filename>/<int:part>",
+        endpoint="upload_part",
+        resource_class_args=(config, logger),
+    )
+    api.add_resource(
+        UploadSession,
+        f"{base_uri}/upload/session/<string:filename>",
+        endpoint="upload_session",
+        resource_class_args=(config, logger),
+    )
 
 
 def get_server_config() -> PbenchServerConfig:
@@ -207,6 +242,10 @@ def create_app(server_config):
 
     register_endpoints(api, app, server_config)
 
+    # Each worker shares its metrics with the others through the metrics
+    # directory.
+    metrics.init_worker(server_config.metrics_dir, app.logger)
+
     try:
         init_db(server_config=server_config, logger=app.logger)
     except Exception:
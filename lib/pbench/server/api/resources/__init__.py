@@ -11,8 +11,9 @@ from flask import request
 from flask.wrappers import Request, Response
 from flask_restful import abort, Resource
 from sqlalchemy.orm.query import Query
+from werkzeug.exceptions import HTTPException
 
-from pbench.server import JSON, JSONOBJECT, JSONVALUE, PbenchServerConfig
+from pbench.server import JSON, JSONOBJECT, JSONVALUE, metrics, PbenchServerConfig
 from pbench.server.auth.auth import Auth
 from pbench.server.database.models.datasets import (
     Dataset,
@@ -1477,7 +1478,57 @@ class ApiBase(Resource):
         uri_params: Optional[JSONOBJECT] = None,
     ) -> Response:
         """
-        This is a common front end for HTTP operations.
+        This is a common front end for HTTP operations, recording the metrics
+        of each request: its status, duration and response size, and the
+        time spent in the SQL database and in Elasticsearch.
+
+        When the server is configured with a slow_request_threshold, each
+        request is traced, and the requests taking longer than the threshold
+        are logged with the SQL statements and Elasticsearch calls they made.
+
+        Args:
+            method: The API HTTP method
+            request: The flask Request object containing payload and headers
+            uri_params: URI encoded keyword-arg supplied by the Flask
+                framework
+
+        Returns:
+            Flask Response object generally constructed implicitly from a JSON
+            payload and HTTP status.
+        """
+        status = HTTPStatus.INTERNAL_SERVER_ERROR
+        size = None
+        threshold = self.config.slow_request_threshold
+        with metrics.RequestMetrics(
+            self.__class__.__name__, method.name, trace=threshold is not None
+        ) as m:
+            try:
+                response = self._dispatch_method(method, request, uri_params)
+                if isinstance(response, Response):
+                    status = response.status_code
+                    size = response.content_length
+                elif isinstance(response, tuple):
+                    status = response[1]
+                else:
+                    status = HTTPStatus.OK
+                return response
+            except HTTPException as e:
+                status = e.code
+                raise
+            finally:
+                m.finish(status, size)
+                if threshold is not None and m.elapsed >= threshold:
+                    self.logger.warning("{}", metrics.trace_report(m, status))
+                metrics.flush_worker()
+
+    def _dispatch_method(
+        self,
+        method: API_METHOD,
+        request: Request,
+        uri_params: Optional[JSONOBJECT] = None,
+    ) -> Response:
+        """
+        Validate, authorize and perform an HTTP operation.
 
         If the class has a parameter schema, and the HTTP operation is not GET
         (which doesn't accept a request payload), we'll validate and normalize
@@ -1,11 +1,16 @@
 from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from datetime import datetime
+from fnmatch import fnmatchcase
 from http import HTTPStatus
 import json
 from logging import Logger
 import re
-from typing import Any, Callable, Dict, Iterator, List, Optional
-from urllib.parse import urljoin
+import threading
+from time import monotonic, perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urljoin, urlparse
 
 from dateutil import rrule
 from dateutil.relativedelta import relativedelta
@@ -14,7 +19,7 @@ from flask import jsonify
 from flask.wrappers import Response
 import requests
 
-from pbench.server import JSON, PbenchServerConfig
+from pbench.server import JSON, metrics, PbenchServerConfig
 from pbench.server.api.resources import (
     API_AUTHORIZATION,
     API_METHOD,
@@ -66,6 +71,119 @@ class PostprocessError(Exception):
         return f"Postprocessing error returning {self.status}: {self.message!r} [{self.data}]"
 
 
+class IndexCatalog:
+    """
+    A view of the indices which exist in Elasticsearch under a Pbench index
+    prefix, refreshed when it is older than the configured interval.
+
+    Each Pbench monthly (or daily) index holds the documents of the time range
+    in its name, so the indices generated for a time range can be pruned to
+    the ones which exist. The view is shared by the API endpoints of a server
+    process.
+    """
+
+    # The views of the server process, by Elasticsearch URL and index prefix
+    catalogs: Dict[Tuple[str, str], "IndexCatalog"] = {}
+    catalogs_lock = threading.Lock()
+
+    # The timeout, in seconds, of the Elasticsearch request listing indices
+    TIMEOUT = 10
+
+    def __init__(self, es_url: str, prefix: str):
+        self.url = f"{es_url}/_cat/indices/{prefix}.*"
+        self.lock = threading.Lock()
+        self.indices: Optional[Set[str]] = None
+        self.refreshed: Optional[float] = None
+
+    @classmethod
+    def get(cls, es_url: str, prefix: str) -> "IndexCatalog":
+        """
+        Return the view of the indices of an Elasticsearch instance and index
+        prefix, creating it on first use.
+        """
+        with cls.catalogs_lock:
+            catalog = cls.catalogs.get((es_url, prefix))
+            if not catalog:
+                catalog = cls(es_url, prefix)
+                cls.catalogs[(es_url, prefix)] = catalog
+            return catalog
+
+    def existing(self, interval: int, logger: Logger) -> Optional[Set[str]]:
+        """
+        Return the names of the existing indices, listing them again if the
+        view is older than the refresh interval.
+
+        When the indices can't be listed, we don't try again until the next
+        refresh, so that a struggling Elasticsearch isn't asked on every API
+        call.
+
+        Only one caller lists the indices, outside the lock; the others keep
+        using the previous view until the new one is swapped in.
+
+        Args:
+            interval: The refresh interval in seconds
+            logger: A logger for errors
+
+        Returns:
+            The names of the existing indices, or None if they are unknown
+        """
+        with self.lock:
+            now = monotonic()
+            if self.refreshed is not None and now - self.refreshed < interval:
+                return self.indices
+            # Claim the refresh: the view counts as fresh for other callers
+            # while it is in progress.
+            self.refreshed = now
+
+        indices = None
+        start = perf_counter()
+        try:
+            response = requests.get(
+                self.url,
+                params={"format": "json", "h": "index"},
+                timeout=self.TIMEOUT,
+            )
+            response.raise_for_status()
+            indices = {i["index"] for i in response.json()}
+        except Exception as e:
+            logger.warning("Unable to list the Elasticsearch indices: {}", e)
+        finally:
+            elapsed = perf_counter() - start
+            metrics.add_backend_time("elasticsearch", elapsed)
+            metrics.trace_call("elasticsearch", f"GET {self.url}", elapsed)
+        with self.lock:
+            self.indices = indices
+        return indices
+
+    def prune(self, names: List[str], interval: int, logger: Logger) -> List[str]:
+        """
+        Prune a list of index names to the ones which exist. A name may be a
+        wildcard pattern (e.g., a month of daily indices), which is kept when
+        any existing index matches it.
+
+        When none of the indices exist, or the existing indices are unknown,
+        the list isn't pruned: Elasticsearch ignores the missing indices, and
+        an empty list would query all of them.
+
+        Args:
+            names: The index names
+            interval: The refresh interval in seconds
+            logger: A logger for errors
+
+        Returns:
+            The index names, pruned to the existing indices
+        """
+        existing = self.existing(interval, logger)
+        if not existing:
+            return names
+        pruned = [
+            n
+            for n in names
+            if n in existing or ("*" in n and any(fnmatchcase(i, n) for i in existing))
+        ]
+        return pruned if pruned else names
+
+
 class ElasticBase(ApiBase):
     """
     A base class for Elasticsearch queries that allows subclasses to provide
@@ -84,6 +202,23 @@ class ElasticBase(ApiBase):
     and postprocess methods.
     """
 
+    # The pbench agent's default interval, in seconds, of the tool data
+    # samples
+    TOOL_DATA_SAMPLE_INTERVAL = 3
+
+    # The most points per series a tool data query should return before the
+    # rolled up tool data is used
+    TOOL_DATA_MAX_POINTS = 10000
+
+    # The most series a date histogram split by the values of a field returns
+    TIMESERIES_MAX_SERIES = 100
+
+    # The statistics computed for each date histogram bucket
+    TIMESERIES_STATS = ("min", "max", "avg", "count")
+
+    # The most Elasticsearch queries of a single API call issued concurrently
+    MAX_CONCURRENT_QUERIES = 10
+
     def __init__(
         self,
         config: PbenchServerConfig,
@@ -271,6 +406,9 @@ class ElasticBase(ApiBase):
         Construct a comma-separated list of index names qualified by year and
         month suitable for use in the Elasticsearch /_search query URI.
 
+        When the server is configured with an index_catalog_refresh interval,
+        the months without an index are left out.
+
         The month is incremented by 1 from "start" to "end"; for example,
         _gen_month_range('run', '2020-08', '2020-10') might result
         in
@@ -286,11 +424,11 @@ class ElasticBase(ApiBase):
             A comma-separated list of month-qualified index names
         """
         template = Template.find(index)
-        indices = ""
+        indices = []
         first_month = start.replace(day=1)
         last_month = end + relativedelta(day=31)
         for m in rrule.rrule(rrule.MONTHLY, dtstart=first_month, until=last_month):
-            indices += (
+            indices.append(
                 template.index_template.format(
                     prefix=self.prefix,
                     version=template.version,
@@ -299,9 +437,142 @@ class ElasticBase(ApiBase):
                     month=f"{m.month:02}",
                     day="*",
                 )
-                + ","
             )
-        return indices
+        interval = self.config.index_catalog_refresh
+        if interval:
+            catalog = IndexCatalog.get(self.es_url, self.prefix)
+            indices = catalog.prune(indices, interval, self.logger)
+        return "".join(f"{i}," for i in indices)
+
+    def _use_tool_data_rollup(
+        self,
+        start: datetime,
+        end: datetime,
+        interval: Optional[int] = None,
+        sample_interval: int = TOOL_DATA_SAMPLE_INTERVAL,
+    ) -> bool:
+        """
+        Decide whether a tool data query over a time range should read the
+        tool data rolled up by the indexer instead of the raw tool data: that
+        is when rollups are configured and the time range would return more
+        than TOOL_DATA_MAX_POINTS points per series. When the data is bucketed,
+        the bucket width must also be a multiple of the rollup interval, so
+        that each bucket is made of whole rollup intervals.
+
+        Args:
+            start: The start time
+            end: The end time
+            interval: The optional width in seconds of the buckets
+            sample_interval: The interval in seconds of the raw tool data
+
+        Returns:
+            True if the rollup indices should be used
+        """
+        rollup_interval = self.config.tool_data_rollup_interval
+        if not rollup_interval:
+            return False
+        if interval and interval % rollup_interval:
+            return False
+        points = (end - start).total_seconds() / sample_interval
+        return points > self.TOOL_DATA_MAX_POINTS
+
+    @staticmethod
+    def _date_histogram_aggs(
+        field: str,
+        interval: int,
+        rollup: bool = False,
+        group_by: Optional[str] = None,
+        bounds: Optional[Tuple[str, str]] = None,
+    ) -> JSON:
+        """
+        Construct the Elasticsearch aggregations bucketing the values of a
+        numeric field into a date histogram, computing the min, max, avg and
+        count of each bucket, and optionally splitting the histogram by the
+        values of a keyword field.
+
+        Rollup documents hold the min, max, avg and count of a field over an
+        interval: their buckets combine those, weighting the averages by the
+        counts.
+
+        Args:
+            field: The numeric field (e.g., 'iostat.util')
+            interval: The bucket width in seconds
+            rollup: The documents are rollup documents
+            group_by: Optional keyword field splitting the histogram
+            bounds: Optional first and last dates of the buckets
+
+        Returns:
+            The Elasticsearch "aggs" of a query
+        """
+        if rollup:
+            stats = {
+                "min": {"min": {"field": f"{field}.min"}},
+                "max": {"max": {"field": f"{field}.max"}},
+                "avg": {
+                    "weighted_avg": {
+                        "value": {"field": f"{field}.avg"},
+                        "weight": {"field": f"{field}.count"},
+                    }
+                },
+                "count": {"sum": {"field": f"{field}.count"}},
+            }
+        else:
+            stats = {
+                "min": {"min": {"field": field}},
+                "max": {"max": {"field": field}},
+                "avg": {"avg": {"field": field}},
+                "count": {"value_count": {"field": field}},
+            }
+        histogram = {"field": "@timestamp", "fixed_interval": f"{interval}s"}
+        if bounds:
+            histogram["extended_bounds"] = {"min": bounds[0], "max": bounds[1]}
+        aggs = {"histogram": {"date_histogram": histogram, "aggs": stats}}
+        if group_by:
+            aggs = {
+                "series": {
+                    "terms": {
+                        "field": group_by,
+                        "size": ElasticBase.TIMESERIES_MAX_SERIES,
+                    },
+                    "aggs": aggs,
+                }
+            }
+        return aggs
+
+    @staticmethod
+    def _date_histogram_series(aggregations: JSON) -> List[JSON]:
+        """
+        Convert the Elasticsearch response to the aggregations constructed by
+        _date_histogram_aggs into compact series, one per value of the
+        "group_by" field (with a None key when not split): the bucket dates,
+        in milliseconds since the epoch, and each statistic are arrays of
+        equal lengths, with None values for empty buckets.
+
+        Args:
+            aggregations: The "aggregations" of the Elasticsearch response
+
+        Raises:
+            KeyError: The response doesn't hold the expected aggregations
+
+        Returns:
+            A list of {"key", "timestamps", "min", "max", "avg", "count"}
+        """
+
+        def series(key: Any, histogram: JSON) -> JSON:
+            buckets = histogram["buckets"]
+            result = {"key": key, "timestamps": [b["key"] for b in buckets]}
+            for stat in ElasticBase.TIMESERIES_STATS:
+                result[stat] = [b[stat]["value"] for b in buckets]
+            # A sum of rollup counts is a float
+            result["count"] = [int(c or 0) for c in result["count"]]
+            return result
+
+        if "series" in aggregations:
+            return [
+                series(group["key"], group["histogram"])
+                for group in aggregations["series"]["buckets"]
+            ]
+        return [series(None, aggregations["histogram"])]
 
     def preprocess(self, params: ApiParams) -> CONTEXT:
         """
@@ -352,6 +623,9 @@ class ElasticBase(ApiBase):
                     json: The JSON query to pass to Elasticsearch
                     params: Query parameters to pass to Elasticsearch
                     headers: Request headers
+
+            or a list of such dicts, describing independent queries which are
+            issued concurrently.
         """
         raise NotImplementedError()
 
@@ -363,7 +637,8 @@ class ElasticBase(ApiBase):
         This is an abstract method that must be implemented by a subclass.
 
         Args:
-            es_json: Elasticsearch Response payload
+            es_json: Elasticsearch Response payload, or a list of them in the
+                order of the queries when assemble returns a list
             context: CONTEXT value returned by preprocess method
 
         Raises:
@@ -375,53 +650,40 @@ class ElasticBase(ApiBase):
         """
         raise NotImplementedError()
 
-    def _call(self, method: Callable, params: ApiParams):
+    def _query(self, method: Callable, url: str, es_request: JSON) -> JSON:
         """
-        Perform the requested call to Elasticsearch, and handle any exceptions.
+        Perform an Elasticsearch query, and handle any exceptions.
 
         Args:
             method: requests package callable (e.g., requests.get)
-            params: Type-normalized client parameters
+            url: The Elasticsearch URL
+            es_request: The request assembled by the subclass
 
         Returns:
-            Postprocessed JSON body to return to client
+            The JSON body of the Elasticsearch response
         """
         klasname = self.__class__.__name__
-        try:
-            context = self.preprocess(params)
-            self.logger.debug("PREPROCESS returns {}", context)
-            if context is None:
-                return "", HTTPStatus.NO_CONTENT
-        except UnauthorizedAccess as e:
-            self.logger.warning("{}", e)
-            raise APIAbort(e.http_status, str(e))
-        except KeyError as e:
-            self.logger.exception("{} problem in preprocess, missing {}", klasname, e)
-            raise APIAbort(HTTPStatus.INTERNAL_SERVER_ERROR)
-        try:
-            # prepare payload for Elasticsearch query
-            es_request = self.assemble(params, context)
-            path = es_request.get("path")
-            url = urljoin(self.es_url, path)
-            self.logger.info(
-                "ASSEMBLE returned URL {!r}, {!r}",
-                url,
-                es_request.get("kwargs").get("json"),
-            )
-        except Exception as e:
-            self.logger.exception("{} assembly failed: {}", klasname, e)
-            raise APIAbort(HTTPStatus.INTERNAL_SERVER_ERROR)
-
         try:
             # perform the Elasticsearch query
-            es_response = method(url, **es_request["kwargs"])
+            start = perf_counter()
+            try:
+                es_response = method(url, **es_request["kwargs"])
+            finally:
+                # Trace the query with its fan-out, the number of indices
+                path = urlparse(url).path.split("/")[1]
+                indices = len([i for i in path.split(",") if i])
+                metrics.trace_call(
+                    "elasticsearch",
+                    f"{method.__name__.upper()} {url} (indices: {indices})",
+                    perf_counter() - start,
+                )
             self.logger.debug(
                 "ES query response {}:{}",
                 es_response.reason,
                 es_response.status_code,
             )
             es_response.raise_for_status()
-            json_response = es_response.json()
+            return es_response.json()
         except requests.exceptions.HTTPError as e:
             self.logger.exception(
                 "{} HTTP error {} from Elasticsearch request: {}",
@@ -461,6 +723,74 @@ class ElasticBase(ApiBase):
             )
             raise APIAbort(HTTPStatus.INTERNAL_SERVER_ERROR)
 
+    def _call(self, method: Callable, params: ApiParams):
+        """
+        Perform the requested call to Elasticsearch, and handle any exceptions.
+
+        Args:
+            method: requests package callable (e.g., requests.get)
+            params: Type-normalized client parameters
+
+        Returns:
+            Postprocessed JSON body to return to client
+        """
+        klasname = self.__class__.__name__
+        try:
+            context = self.preprocess(params)
+            self.logger.debug("PREPROCESS returns {}", context)
+            if context is None:
+                return "", HTTPStatus.NO_CONTENT
+        except UnauthorizedAccess as e:
+            self.logger.warning("{}", e)
+            raise APIAbort(e.http_status, str(e))
+        except KeyError as e:
+            self.logger.exception("{} problem in preprocess, missing {}", klasname, e)
+            raise APIAbort(HTTPStatus.INTERNAL_SERVER_ERROR)
+        try:
+            # prepare payload for Elasticsearch query
+            es_request = self.assemble(params, context)
+            multiple = isinstance(es_request, list)
+            es_requests = es_request if multiple else [es_request]
+            urls = []
+            for r in es_requests:
+                url = urljoin(self.es_url, r.get("path"))
+                self.logger.info(
+                    "ASSEMBLE returned URL {!r}, {!r}",
+                    url,
+                    r.get("kwargs").get("json"),
+                )
+                urls.append(url)
+        except Exception as e:
+            self.logger.exception("{} assembly failed: {}", klasname, e)
+            raise APIAbort(HTTPStatus.INTERNAL_SERVER_ERROR)
+
+        start = perf_counter()
+        try:
+            if len(es_requests) > 1:
+                # Independent queries are issued concurrently, so that the API
+                # takes about as long as the slowest of them. Each runs in a
+                # copy of our context, so that it is traced with the request.
+                contexts = [copy_context() for _ in urls]
+                with ThreadPoolExecutor(
+                    max_workers=min(len(es_requests), self.MAX_CONCURRENT_QUERIES)
+                ) as executor:
+                    json_responses = list(
+                        executor.map(
+                            lambda c, u, r: c.run(self._query, method, u, r),
+                            contexts,
+                            urls,
+                            es_requests,
+                        )
+                    )
+            else:
+                json_responses = [
+                    self._query(method, u, r) for u, r in zip(urls, es_requests)
+                ]
+        finally:
+            metrics.add_backend_time("elasticsearch", perf_counter() - start)
+
+        json_response = json_responses if multiple else json_responses[0]
+
         try:
             # postprocess Elasticsearch response
             return self.postprocess(json_response, context)
@@ -676,6 +1006,7 @@ class ElasticBulkBase(ApiBase):
         report = defaultdict(Counter)
         count = 0
         error_count = 0
+        start = perf_counter()
 
         # NOTE: because streaming_bulk is given a generator, and also
         # returns a generator, we consume the entire sequence within the
@@ -736,6 +1067,12 @@ class ElasticBulkBase(ApiBase):
                 report,
             )
             raise APIAbort(HTTPStatus.INTERNAL_SERVER_ERROR)
+        finally:
+            elapsed = perf_counter() - start
+            metrics.add_backend_time("elasticsearch", elapsed)
+            metrics.trace_call(
+                "elasticsearch", f"bulk {self.action} (actions: {count})", elapsed
+            )
 
         summary = {"ok": count - error_count, "failure": error_count}
 
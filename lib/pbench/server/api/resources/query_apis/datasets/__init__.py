@@ -121,10 +121,16 @@ class IndexMapBase(ElasticBase):
 
         return {"dataset": dataset}
 
-    def get_index(self, dataset: Dataset, root_index_name: AnyStr) -> AnyStr:
+    def get_index(
+        self, dataset: Dataset, root_index_name: AnyStr, exact: bool = False
+    ) -> AnyStr:
         """
         Retrieve the list of ES indices from the metadata table based on a given
         root_index_name.
+
+        Unless "exact" is set, the root index name only needs to be part of
+        the index names: e.g., "result-data" also selects the
+        "result-data-sample" indices.
         """
         try:
             index_map = Metadata.getvalue(dataset=dataset, key=Metadata.INDEX_MAP)
@@ -136,7 +142,11 @@ class IndexMapBase(ElasticBase):
             self.logger.error("Index map metadata has no value")
             raise APIAbort(HTTPStatus.INTERNAL_SERVER_ERROR)
 
-        index_keys = [key for key in index_map if root_index_name in key]
+        if exact:
+            # Index names are "<prefix>.v<version>.<root>.<date>"
+            index_keys = [key for key in index_map if f".{root_index_name}." in key]
+        else:
+            index_keys = [key for key in index_map if root_index_name in key]
         indices = ",".join(index_keys)
         self.logger.debug(f"Indices from metadata , {indices!r}")
         return indices
@@ -0,0 +1,297 @@
+from datetime import datetime
+from http import HTTPStatus
+from logging import Logger
+from typing import Optional, Tuple
+
+from flask import jsonify
+from flask.wrappers import Response
+
+from pbench.server import JSON, PbenchServerConfig
+from pbench.server.api.resources import (
+    API_AUTHORIZATION,
+    API_METHOD,
+    API_OPERATION,
+    APIAbort,
+    ApiParams,
+    ApiSchema,
+    Parameter,
+    ParamType,
+    Schema,
+)
+from pbench.server.api.resources.query_apis import CONTEXT, PostprocessError
+from pbench.server.api.resources.query_apis.datasets import IndexMapBase
+from pbench.server.database.models.datasets import Dataset, Metadata, MetadataError
+from pbench.server.utils import UtcTimeHelper
+
+
+class DatasetsTimeseries(IndexMapBase):
+    """
+    Pbench ES query API returning a time series of a tool or result metric of
+    a dataset, bucketed by Elasticsearch into a date histogram holding the
+    min, max, avg and count of the metric in each bucket, instead of the raw
+    documents.
+    """
+
+    # The most buckets a time series may have
+    MAX_BUCKETS = 10000
+
+    def __init__(self, config: PbenchServerConfig, logger: Logger):
+        super().__init__(
+            config,
+            logger,
+            ApiSchema(
+                API_METHOD.POST,
+                API_OPERATION.READ,
+                uri_schema=Schema(
+                    Parameter("dataset", ParamType.DATASET, required=True),
+                ),
+                body_schema=Schema(
+                    Parameter("metric", ParamType.STRING, required=True),
+                    Parameter("interval", ParamType.INT, required=True),
+                    Parameter("tool", ParamType.STRING),
+                    Parameter("start", ParamType.DATE),
+                    Parameter("end", ParamType.DATE),
+                    Parameter("filters", ParamType.JSON),
+                    Parameter("group_by", ParamType.STRING),
+                ),
+                authorization=API_AUTHORIZATION.DATASET,
+            ),
+        )
+
+    def _run_times(
+        self, dataset: Dataset
+    ) -> Tuple[Optional[datetime], Optional[datetime]]:
+        """
+        Find the start and end times of the dataset's run, as recorded in its
+        metadata.log.
+
+        Args:
+            dataset: The dataset
+
+        Returns:
+            The start and end times, each None if it isn't recorded
+        """
+        try:
+            run = Metadata.getvalue(dataset=dataset, key="dataset.metalog.run")
+        except MetadataError as e:
+            self.logger.warning("Unable to find the run times of {}: {}", dataset, e)
+            return None, None
+        times = []
+        for key in ("start_run", "end_run"):
+            value = run.get(key) if isinstance(run, dict) else None
+            try:
+                times.append(
+                    UtcTimeHelper.from_string(value).utc_time if value else None
+                )
+            except Exception as e:
+                self.logger.warning(
+                    "Bad run {} of {}, {!r}: {}", key, dataset, value, e
+                )
+                times.append(None)
+        return times[0], times[1]
+
+    def preprocess(self, params: ApiParams) -> CONTEXT:
+        """
+        Validate the bucketing of the time series, and find the indices of the
+        dataset holding the metric.
+
+        A time range not given by the client is bounded by the start and end
+        of the dataset's run, so that the number of buckets can always be
+        checked before Elasticsearch is asked for them; the tool data rolled
+        up by the indexer is used when the time range holds too many raw tool
+        data samples.
+        """
+        context = super().preprocess(params)
+        dataset: Dataset = context["dataset"]
+        interval = params.body["interval"]
+        start = params.body.get("start")
+        end = params.body.get("end")
+        tool = params.body.get("tool")
+
+        if interval <= 0:
+            raise APIAbort(
+                HTTPStatus.BAD_REQUEST, "The interval must be a positive number"
+            )
+        if start:
+            start = UtcTimeHelper(start).utc_time
+        if end:
+            end = UtcTimeHelper(end).utc_time
+        if not start or not end:
+            run_start, run_end = self._run_times(dataset)
+            start = start or run_start
+            end = end or run_end
+            if not start or not end:
+                raise APIAbort(
+                    HTTPStatus.BAD_REQUEST,
+                    f"Dataset {dataset.name} has no recorded run times:"
+                    " the start and end times are required",
+                )
+        if start > end:
+            raise APIAbort(
+                HTTPStatus.BAD_REQUEST, "The start time is after the end time"
+            )
+        # Every series of a split histogram has a bucket for each interval of
+        # the time range, empty or not.
+        buckets = (end - start).total_seconds() / interval
+        if params.body.get("group_by"):
+            buckets *= self.TIMESERIES_MAX_SERIES
+        if buckets > self.MAX_BUCKETS:
+            raise APIAbort(
+                HTTPStatus.BAD_REQUEST,
+                f"The interval is too small: more than {self.MAX_BUCKETS} buckets",
+            )
+
+        rollup = False
+        if tool:
+            indices = None
+            if self._use_tool_data_rollup(start, end, interval):
+                indices = self.get_index(
+                    dataset, f"tool-data-rollup-{tool}", exact=True
+                )
+                rollup = bool(indices)
+            if not indices:
+                indices = self.get_index(dataset, f"tool-data-{tool}", exact=True)
+        else:
+            indices = self.get_index(dataset, "result-data", exact=True)
+        if not indices:
+            raise APIAbort(
+                HTTPStatus.NOT_FOUND,
+                f"Dataset {dataset.name} has no {tool or 'result'} data",
+            )
+
+        context.update(
+            {
+                "indices": indices,
+                "interval": interval,
+                "rollup": rollup,
+                "start": start,
+                "end": end,
+            }
+        )
+        return context
+
+    def assemble(self, params: ApiParams, context: CONTEXT) -> JSON:
+        """
+        Construct an Elasticsearch query aggregating the values of a metric of
+        the dataset documents into a date histogram.
+
+        POST /datasets/timeseries/<dataset>
+
+        params: API parameter set
+
+            URI parameters:
+                "dataset" is the name of a Pbench agent dataset (tarball).
+
+            JSON body parameters:
+                "metric" is the field of a tool sub-document when a tool is
+                    given (e.g., "util" or "iops.read" for "iostat"), or the
+                    measurement title of the result data (e.g., "Gb_sec").
+
+                "interval" is the bucket width in seconds.
+
+                "tool" is an optional tool name (e.g., "iostat"); without it,
+                    the result data is aggregated.
+
+                "start" and "end" optionally restrict the time range, which
+                    is otherwise that of the dataset's run.
+
+                "filters" optionally restricts the documents to those
+                    matching key/value pairs: e.g., {"iostat.id": "sda"}.
+
+                "group_by" is an optional keyword field splitting the time
+                    series by its values: e.g., "sample.hostname".  The
+                    buckets of each of the (at most TIMESERIES_MAX_SERIES)
+                    series count against MAX_BUCKETS.
+
+        EXAMPLE:
+            {
+                "tool": "iostat",
+                "metric": "util",
+                "interval": 60,
+                "group_by": "iostat.id"
+            }
+        """
+        dataset: Dataset = context["dataset"]
+        metric = params.body["metric"]
+        tool = params.body.get("tool")
+        start = context["start"]
+        end = context["end"]
+
+        self.logger.info(
+            "Return {} time series of dataset {}, interval {}s{}",
+            f"{tool}.{metric}" if tool else metric,
+            dataset,
+            context["interval"],
+            " (rollup)" if context["rollup"] else "",
+        )
+
+        es_filter = [{"term": {"run.id": dataset.resource_id}}]
+        if tool:
+            field = f"{tool}.{metric}"
+        else:
+            field = "result.value"
+            es_filter.append({"match_phrase": {"sample.measurement_title": metric}})
+        es_filter.append(
+            {
+                "range": {
+                    "@timestamp": {"gte": start.isoformat(), "lte": end.isoformat()}
+                }
+            }
+        )
+        for key, value in (params.body.get("filters") or {}).items():
+            es_filter.append({"match": {key: value}})
+
+        return {
+            "path": f"/{context['indices']}/_search",
+            "kwargs": {
+                "json": {
+                    "size": 0,
+                    "query": {"bool": {"filter": es_filter}},
+                    "aggs": self._date_histogram_aggs(
+                        field,
+                        context["interval"],
+                        rollup=context["rollup"],
+                        group_by=params.body.get("group_by"),
+                        bounds=(start.isoformat(), end.isoformat()),
+                    ),
+                },
+                "params": {"ignore_unavailable": "true"},
+            },
+        }
+
+    def postprocess(self, es_json: JSON, context: CONTEXT) -> Response:
+        """
+        Returns a Flask Response containing a JSON object with the bucket
+        width, whether the rolled up tool data was used, and the series of
+        buckets, as arrays of equal lengths.
+
+        Example:
+            {
+                "interval": 60,
+                "rollup": false,
+                "series": [
+                    {
+                        "key": "sda",
+                        "timestamps": [1646136000000, 1646136060000],
+                        "min": [0.25, 1.5],
+                        "max": [99.25, 97.0],
+                        "avg": [48.4, 50.1],
+                        "count": [60, 60]
+                    }
+                ]
+            }
+        """
+        try:
+            series = self._date_histogram_series(es_json["aggregations"])
+        except KeyError as e:
+            raise PostprocessError(
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                f"Can't find Elasticsearch match data {e} in {es_json!r}",
+            )
+        return jsonify(
+            {
+                "interval": context["interval"],
+                "rollup": context["rollup"],
+                "series": series,
+            }
+        )
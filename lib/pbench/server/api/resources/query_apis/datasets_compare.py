@@ -0,0 +1,211 @@
+from http import HTTPStatus
+from logging import Logger
+from typing import Dict, List, Tuple
+
+from flask import jsonify
+from flask.wrappers import Response
+
+from pbench.server import JSON, PbenchServerConfig
+from pbench.server.api.resources import (
+    API_AUTHORIZATION,
+    API_METHOD,
+    API_OPERATION,
+    APIAbort,
+    ApiAuthorization,
+    ApiParams,
+    ApiSchema,
+    Parameter,
+    ParamType,
+    Schema,
+)
+from pbench.server.api.resources.query_apis import (
+    CONTEXT,
+    ElasticBase,
+    PostprocessError,
+)
+from pbench.server.database.models.datasets import Dataset
+
+
+class DatasetsCompare(ElasticBase):
+    """
+    Pbench ES query API returning side-by-side statistics of a result metric
+    of several datasets: one aggregation query per dataset, issued
+    concurrently.
+    """
+
+    # The most datasets which can be compared at once
+    MAX_DATASETS = 100
+
+    # The statistics returned for each dataset (or group of a dataset)
+    STATS = ("count", "min", "max", "avg", "std_deviation")
+
+    def __init__(self, config: PbenchServerConfig, logger: Logger):
+        super().__init__(
+            config,
+            logger,
+            ApiSchema(
+                API_METHOD.POST,
+                API_OPERATION.READ,
+                body_schema=Schema(
+                    Parameter(
+                        "datasets",
+                        ParamType.LIST,
+                        element_type=ParamType.DATASET,
+                        required=True,
+                    ),
+                    Parameter("metric", ParamType.STRING, required=True),
+                    Parameter("filters", ParamType.JSON),
+                    Parameter("group_by", ParamType.STRING),
+                ),
+                # Each of the datasets is authorized by preprocess
+                authorization=API_AUTHORIZATION.NONE,
+            ),
+        )
+
+    def preprocess(self, params: ApiParams) -> CONTEXT:
+        """
+        Authorize READ access to each of the datasets, and compute the list
+        of result data indices spanning the life of each dataset: from its
+        creation to its upload, the month range of a run is computed once,
+        and shared by the datasets which ran in the same months.
+        """
+        datasets: List[Dataset] = params.body["datasets"]
+        if not datasets:
+            raise APIAbort(HTTPStatus.BAD_REQUEST, "No datasets to compare")
+        if len(datasets) > self.MAX_DATASETS:
+            raise APIAbort(
+                HTTPStatus.BAD_REQUEST,
+                f"At most {self.MAX_DATASETS} datasets can be compared",
+            )
+
+        month_ranges: Dict[Tuple[int, int, int, int], str] = {}
+        indices = []
+        for dataset in datasets:
+            self._check_authorization(
+                ApiAuthorization(
+                    API_AUTHORIZATION.DATASET,
+                    API_OPERATION.READ,
+                    str(dataset.owner_id),
+                    dataset.access,
+                )
+            )
+            start = dataset.created or dataset.uploaded
+            end = max(start, dataset.uploaded)
+            span = (start.year, start.month, end.year, end.month)
+            if span not in month_ranges:
+                month_ranges[span] = self._gen_month_range("result-data", start, end)
+            indices.append(month_ranges[span])
+        return {"datasets": datasets, "indices": indices}
+
+    def assemble(self, params: ApiParams, context: CONTEXT) -> List[JSON]:
+        """
+        Construct an Elasticsearch query per dataset, aggregating the values
+        of a result metric into statistics.
+
+        POST /datasets/compare
+
+        params: API parameter set
+
+            JSON body parameters:
+                "datasets" is a list of dataset resource IDs.
+
+                "metric" is the measurement title of the result data (e.g.,
+                    "Gb_sec").
+
+                "filters" optionally restricts the results to those matching
+                    key/value pairs: e.g., {"sample.measurement_type": "rate"}.
+
+                "group_by" is an optional keyword field splitting the
+                    statistics of each dataset by its values: e.g.,
+                    "iteration.name".
+
+        EXAMPLE:
+            {
+                "datasets": ["52adfdd3dbf2a87ed6c1c41a1ce278ed", ...],
+                "metric": "Gb_sec",
+                "group_by": "iteration.name"
+            }
+        """
+        metric = params.body["metric"]
+        group_by = params.body.get("group_by")
+        filters = params.body.get("filters") or {}
+
+        self.logger.info("Compare {} of {} datasets", metric, len(context["datasets"]))
+
+        aggs = {"stats": {"extended_stats": {"field": "result.value"}}}
+        if group_by:
+            aggs = {
+                "groups": {
+                    "terms": {"field": group_by, "size": self.TIMESERIES_MAX_SERIES},
+                    "aggs": aggs,
+                }
+            }
+
+        es_requests = []
+        for dataset, indices in zip(context["datasets"], context["indices"]):
+            es_filter = [
+                {"term": {"run.id": dataset.resource_id}},
+                {"match_phrase": {"sample.measurement_title": metric}},
+            ]
+            for key, value in filters.items():
+                es_filter.append({"match": {key: value}})
+            es_requests.append(
+                {
+                    "path": f"/{indices}/_search",
+                    "kwargs": {
+                        "json": {
+                            "size": 0,
+                            "query": {"bool": {"filter": es_filter}},
+                            "aggs": aggs,
+                        },
+                        "params": {"ignore_unavailable": "true"},
+                    },
+                }
+            )
+        return es_requests
+
+    def postprocess(self, es_json: List[JSON], context: CONTEXT) -> Response:
+        """
+        Returns a Flask Response containing a JSON list with the statistics
+        of the metric for each dataset, in the order of the request.
+
+        Example:
+            [
+                {
+                    "dataset": "52adfdd3dbf2a87ed6c1c41a1ce278ed",
+                    "name": "uperf_2022.03.01T12.00.00",
+                    "count": 5,
+                    "min": 9.75,
+                    "max": 10.5,
+                    "avg": 10.1,
+                    "std_deviation": 0.27
+                },
+                ...
+            ]
+
+        With a "group_by" field, each dataset holds a "groups" list of the
+        statistics of each value of the field, with its "key".
+        """
+
+        def stats(aggs: JSON) -> JSON:
+            return {s: aggs["stats"][s] for s in self.STATS}
+
+        results = []
+        try:
+            for dataset, response in zip(context["datasets"], es_json):
+                aggregations = response["aggregations"]
+                result = {"dataset": dataset.resource_id, "name": dataset.name}
+                if "groups" in aggregations:
+                    result["groups"] = [
+                        {"key": b["key"], **stats(b)}
+                        for b in aggregations["groups"]["buckets"]
+                    ]
+                else:
+                    result.update(stats(aggregations))
+                results.append(result)
+        except KeyError as e:
+            raise PostprocessError(
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                f"Can't find Elasticsearch match data {e} in {es_json!r}",
+            )
+        return jsonify(results)
@@ -0,0 +1,45 @@
+from http import HTTPStatus
+from logging import Logger
+
+from flask.wrappers import Request, Response
+
+from pbench.server import metrics, PbenchServerConfig
+from pbench.server.api.resources import (
+    API_AUTHORIZATION,
+    API_METHOD,
+    API_OPERATION,
+    ApiBase,
+    ApiParams,
+    ApiSchema,
+)
+
+
+class ServerMetrics(ApiBase):
+    """
+    API class exporting the server metrics in the Prometheus text format.
+    """
+
+    def __init__(self, config: PbenchServerConfig, logger: Logger):
+        super().__init__(
+            config,
+            logger,
+            ApiSchema(
+                API_METHOD.GET,
+                API_OPERATION.READ,
+                authorization=API_AUTHORIZATION.NONE,
+            ),
+            always_enabled=True,
+        )
+
+    def _get(self, params: ApiParams, request: Request) -> Response:
+        """
+        Return the metrics of this API server worker, merged with the ones
+        written by the other workers and by the unpacker and the indexer.
+
+        GET /api/v1/metrics
+        """
+        return Response(
+            metrics.worker_exposition(),
+            status=HTTPStatus.OK,
+            content_type=metrics.CONTENT_TYPE,
+        )
@@ -2,15 +2,23 @@ import datetime
 import errno
 import hashlib
 from http import HTTPStatus
+import json
+from logging import Logger
 import os
+from pathlib import Path
+import shutil
+from typing import Iterator, List, Optional
 
 from flask import jsonify, request
+from flask.wrappers import Response
 from flask_restful import abort, Resource
 import humanize
 
+from pbench.common.compression import codec_for
 from pbench.common.utils import Cleanup, validate_hostname
+from pbench.server import JSONOBJECT
 from pbench.server.auth.auth import Auth
-from pbench.server.cache_manager import CacheManager
+from pbench.server.cache_manager import CacheManager, Tarball, TarballScanner
 from pbench.server.database.models.datasets import (
     Dataset,
     DatasetDuplicate,
@@ -35,13 +43,11 @@ class CleanupTime(Exception):
         self.message = message
 
 
-class Upload(Resource):
+class UploadBase(Resource):
     """
-    Upload a dataset from an agent. This API accepts a tarball, controller
-    name, and MD5 value from a client. After validation, it creates a new
-    Dataset DB row describing the dataset, along with some metadata, and it
-    creates a pair of files (tarball and MD5 file) within the designated
-    controller directory under the configured ARCHIVE file tree.
+    Common support for the APIs which allow an agent to upload a dataset,
+    either in a single PUT (the `Upload` API) or as a sequence of separately
+    uploaded parts (the `UploadSession` and `UploadPart` APIs).
     """
 
     CHUNK_SIZE = 65536
@@ -59,45 +65,438 @@ class Upload(Resource):
         self.temporary.mkdir(mode=0o755, parents=True, exist_ok=True)
         self.logger.info("Configured PUT temporary directory as {}", self.temporary)
 
-    @Auth.token_auth.login_required()
-    def put(self, filename: str):
+    @staticmethod
+    def _check_disabled():
         disabled = ServerConfig.get_disabled()
         if disabled:
             abort(HTTPStatus.SERVICE_UNAVAILABLE, **disabled)
 
-        # Used to record what steps have been completed during the upload, and
-        # need to be undone on failure
-        recovery = Cleanup(self.logger)
+    @staticmethod
+    def _current_user() -> tuple[int, str]:
+        """
+        Identify the authenticated user.
+
+        Raises:
+            CleanupTime if the user can't be identified
 
+        Returns:
+            The user's ID and username
+        """
         try:
+            return (
+                Auth.token_auth.current_user().id,
+                Auth.token_auth.current_user().username,
+            )
+        except Exception:
+            raise CleanupTime(HTTPStatus.UNAUTHORIZED, "Verifying user_id failed")
+
+    @staticmethod
+    def _check_controller(controller: Optional[str]):
+        if not controller:
+            raise CleanupTime(
+                HTTPStatus.BAD_REQUEST, "Missing required 'controller' header"
+            )
+
+        if validate_hostname(controller) != 0:
+            raise CleanupTime(HTTPStatus.BAD_REQUEST, "Invalid 'controller' header")
+
+    @staticmethod
+    def _check_filename(filename: str):
+        if os.path.basename(filename) != filename:
+            raise CleanupTime(
+                HTTPStatus.BAD_REQUEST, "Filename must not contain a path"
+            )
+
+        if not Dataset.is_tarball(filename):
+            raise CleanupTime(
+                HTTPStatus.BAD_REQUEST,
+                "File extension not supported, must be"
+                f" {' or '.join(Dataset.TARBALL_SUFFIXES)}",
+            )
+
+    def _create_dataset(
+        self, user_id: int, username: str, tar_full_path: Path, md5sum: str
+    ) -> Optional[Dataset]:
+        """
+        Create a tracking dataset object; it'll begin in UPLOADING state.
+
+        Args:
+            user_id: The ID of the owning user
+            username: The name of the owning user
+            tar_full_path: The path of the tarball being uploaded
+            md5sum: The MD5 of the tarball, which is the dataset resource ID
+
+        Raises:
+            CleanupTime on failure
+
+        Returns:
+            The new Dataset, or None if an identical dataset already exists
+        """
+        try:
+            dataset = Dataset(
+                owner_id=user_id,
+                name=Dataset.stem(tar_full_path),
+                resource_id=md5sum,
+            )
+            dataset.add()
+        except DatasetDuplicate:
+            dataset_name = Dataset.stem(tar_full_path)
+            self.logger.info(
+                "Dataset already exists, user = (user_id: {}, username: {}), file = {!a}",
+                user_id,
+                username,
+                dataset_name,
+            )
             try:
-                user_id = Auth.token_auth.current_user().id
-                username = Auth.token_auth.current_user().username
-            except Exception:
-                username = None
-                raise CleanupTime(HTTPStatus.UNAUTHORIZED, "Verifying user_id failed")
+                Dataset.query(resource_id=md5sum)
+            except DatasetNotFound:
+                self.logger.error(
+                    "Duplicate dataset {} for user = (user_id: {}, username: {}) not found",
+                    dataset_name,
+                    user_id,
+                    username,
+                )
+                raise CleanupTime(HTTPStatus.INTERNAL_SERVER_ERROR, "INTERNAL ERROR")
+            else:
+                return None
+        except CleanupTime:
+            raise  # Propagate a CleanupTime exception to the outer block
+        except Exception:
+            raise CleanupTime(
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                message="Unable to create dataset",
+            )
+        return dataset
 
-            controller = request.headers.get("controller")
-            if not controller:
+    @staticmethod
+    def _duplicate() -> Response:
+        response = jsonify(dict(message="Dataset already exists"))
+        response.status_code = HTTPStatus.OK
+        return response
+
+    def _receive(
+        self,
+        path: Path,
+        chunks: Iterator[bytes],
+        length: int,
+        md5sum: str,
+        scanner: Optional[TarballScanner] = None,
+    ):
+        """
+        Write a stream of data to a file, verifying the length and MD5 of the
+        data as it's written, and optionally feeding it to a tarball scanner.
+
+        Args:
+            path: The file to write
+            chunks: An iterator yielding the data
+            length: The expected data length
+            md5sum: The expected data MD5
+            scanner: An optional TarballScanner
+
+        Raises:
+            CleanupTime on failure
+        """
+        bytes_received = 0
+        with path.open(mode="wb") as ofp:
+            hash_md5 = hashlib.md5()
+
+            try:
+                for chunk in chunks:
+                    bytes_received += len(chunk)
+                    if len(chunk) == 0 or bytes_received > length:
+                        break
+
+                    ofp.write(chunk)
+                    hash_md5.update(chunk)
+                    if scanner:
+                        scanner.feed(chunk)
+            except OSError as exc:
+                if exc.errno == errno.ENOSPC:
+                    raise CleanupTime(
+                        HTTPStatus.INSUFFICIENT_STORAGE,
+                        f"Out of space on {path.root}",
+                    )
+                else:
+                    raise CleanupTime(
+                        HTTPStatus.INTERNAL_SERVER_ERROR,
+                        "Unexpected error encountered during file upload",
+                    )
+            except Exception:
                 raise CleanupTime(
-                    HTTPStatus.BAD_REQUEST, "Missing required 'controller' header"
+                    HTTPStatus.INTERNAL_SERVER_ERROR,
+                    "Unexpected error encountered during file upload",
                 )
 
-            if validate_hostname(controller) != 0:
-                raise CleanupTime(HTTPStatus.BAD_REQUEST, "Invalid 'controller' header")
+        if bytes_received != length:
+            raise CleanupTime(
+                HTTPStatus.BAD_REQUEST,
+                f"Expected {length} bytes but received {bytes_received} bytes",
+            )
+        elif hash_md5.hexdigest() != md5sum:
+            raise CleanupTime(
+                HTTPStatus.BAD_REQUEST,
+                f"MD5 checksum {hash_md5.hexdigest()} does not match expected {md5sum}",
+            )
 
-            self.logger.info("Uploading {} on controller {}", filename, controller)
+    def _finalize(
+        self,
+        dataset: Dataset,
+        controller: str,
+        tar_full_path: Path,
+        md5sum: str,
+        scanner: TarballScanner,
+        recovery: Cleanup,
+    ):
+        """
+        Once a tarball has been received and verified, write the companion
+        MD5 and manifest files, move the tarball into the cache manager, set
+        the dataset metadata, and mark the dataset as uploaded.
+
+        Args:
+            dataset: The new Dataset
+            controller: The dataset's controller
+            tar_full_path: The path of the received tarball
+            md5sum: The MD5 of the tarball
+            scanner: The TarballScanner which processed the tarball
+            recovery: The Cleanup object tracking the upload
+
+        Raises:
+            CleanupTime on failure
+        """
+        filename = tar_full_path.name
+        md5_full_path = self.temporary / f"{filename}.md5"
+        manifest_full_path = self.temporary / f"{filename}.manifest"
+
+        # First write the .md5
+        self.logger.info("Creating MD5 file {}: {}", md5_full_path, md5sum)
+
+        # From this point attempt to remove the MD5 file on error exit
+        recovery.add(md5_full_path.unlink)
+        try:
+            md5_full_path.write_text(f"{md5sum} {filename}\n")
+        except Exception:
+            raise CleanupTime(
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                f"Failed to write .md5 file '{md5_full_path}'",
+            )
 
-            if os.path.basename(filename) != filename:
-                raise CleanupTime(
-                    HTTPStatus.BAD_REQUEST, "Filename must not contain a path"
+        # Write the manifest captured by the scanner; if the scanner was
+        # unable to parse the stream, we simply don't have a manifest, and
+        # later stages will examine the tarball directly.
+        manifest = scanner.finish()
+        if manifest:
+            recovery.add(manifest_full_path.unlink)
+            try:
+                Tarball.write_manifest(manifest_full_path, manifest)
+            except Exception as exc:
+                self.logger.warning(
+                    "Unable to write manifest file '{}': {}",
+                    manifest_full_path,
+                    exc,
                 )
 
-            if not Dataset.is_tarball(filename):
-                raise CleanupTime(
-                    HTTPStatus.BAD_REQUEST,
-                    f"File extension not supported, must be {Dataset.TARBALL_SUFFIX}",
+        # Create a cache manager object
+        try:
+            cache_m = CacheManager(self.config, self.logger)
+        except Exception:
+            raise CleanupTime(
+                HTTPStatus.INTERNAL_SERVER_ERROR, "Unable to map the cache manager"
+            )
+
+        # Move the files to their final location
+        try:
+            tarball = cache_m.create(controller, tar_full_path)
+        except Exception:
+            raise CleanupTime(
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                f"Unable to create dataset in file system for {tar_full_path}",
+            )
+
+        # From this point, failure will remove the tarball from the cache
+        # manager.
+        #
+        # NOTE: the Tarball.delete method won't clean up empty controller
+        # directories. This isn't ideal, but we don't want to deal with the
+        # potential synchronization issues and it'll become irrelevant with
+        # the switch to object store. For now we ignore it.
+        recovery.add(tarball.delete)
+
+        # Now that we have the tarball, extract the dataset timestamp from
+        # the metadata.log file.
+        #
+        # If the metadata.log is missing or corrupt, or doesn't contain the
+        # "date" property in the "pbench" section, the resulting exception
+        # will cause the upload to fail with an error.
+        #
+        # NOTE: The full metadata.log (as a JSON object with section names
+        # as the top level key) will be stored as a Metadata key using the
+        # reserved internal key "metalog". For retrieval, the "dataset" key
+        # provides a JSON mapping of the Dataset SQL object, enhanced with
+        # the dataset's "metalog" Metadata key value.
+        #
+        # NOTE: we're setting the Dataset "created" timestamp here, but it
+        # won't be committed to the database until the "advance" operation
+        # at the end.
+        try:
+            metadata = tarball.get_metadata()
+            dataset.created = UtcTimeHelper.from_string(
+                metadata["pbench"]["date"]
+            ).utc_time
+            Metadata.create(dataset=dataset, key=Metadata.METALOG, value=metadata)
+        except Exception as exc:
+            raise CleanupTime(
+                HTTPStatus.BAD_REQUEST,
+                f"Tarball {dataset.name!r} is invalid or missing required metadata.log: {exc}",
+            )
+
+        try:
+            retention_days = int(
+                self.config.get_conf(
+                    __name__,
+                    "pbench-server",
+                    "default-dataset-retention-days",
+                    self.DEFAULT_RETENTION_DAYS,
                 )
+            )
+        except Exception as e:
+            raise CleanupTime(
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                f"Unable to get integer retention days: {e!s}",
+            )
+
+        # Calculate a default deletion time for the dataset, based on the
+        # time it was uploaded rather than the time it was originally
+        # created which might much earlier.
+        try:
+            retention = datetime.timedelta(days=retention_days)
+            deletion = dataset.uploaded + retention
+            Metadata.setvalue(
+                dataset=dataset,
+                key=Metadata.TARBALL_PATH,
+                value=str(tarball.tarball_path),
+            )
+            Metadata.setvalue(
+                dataset=dataset,
+                key=Metadata.DELETION,
+                value=UtcTimeHelper(deletion).to_iso_string(),
+            )
+        except Exception as e:
+            raise CleanupTime(
+                HTTPStatus.INTERNAL_SERVER_ERROR, f"Unable to set metadata: {e!s}"
+            )
+
+        # Finally, update the dataset state and commit the `created` date
+        # and state change.
+        try:
+            dataset.advance(States.UPLOADED)
+            Sync(self.logger, "upload").update(
+                dataset=dataset, enabled=[Operation.BACKUP, Operation.UNPACK]
+            )
+        except Exception as exc:
+            raise CleanupTime(
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                f"Unable to finalize dataset {dataset}: {exc!s}",
+            )
+
+    def _session(self, filename: str, user_id: int) -> "UploadSessionState":
+        """
+        Find an active upload session owned by the authenticated user.
+
+        Args:
+            filename: The name of the tarball
+            user_id: The authenticated user's ID
+
+        Raises:
+            CleanupTime if there's no session for the user
+
+        Returns:
+            The upload session
+        """
+        self._check_filename(filename)
+        session = UploadSessionState(self.temporary, filename, user_id)
+        if not session.exists():
+            raise CleanupTime(
+                HTTPStatus.NOT_FOUND, f"No upload session found for {filename!r}"
+            )
+        session.load()
+        return session
+
+    @staticmethod
+    def _respond(payload: JSONOBJECT, status: int) -> Response:
+        response = jsonify(payload)
+        response.status_code = status
+        return response
+
+    def _fail(
+        self,
+        e: Exception,
+        recovery: Cleanup,
+        username: Optional[str],
+        controller: Optional[str],
+        filename: str,
+    ):
+        """
+        Report an upload failure, clean up, and abort the request.
+
+        Args:
+            e: The exception that ended the upload
+            recovery: The Cleanup object tracking the upload
+            username: The authenticated username, if known
+            controller: The dataset controller, if known
+            filename: The tarball name
+        """
+        status = HTTPStatus.INTERNAL_SERVER_ERROR
+        abort_msg = "INTERNAL ERROR"
+        if isinstance(e, CleanupTime):
+            cause = e.__cause__ if e.__cause__ else e.__context__
+            if e.status == HTTPStatus.INTERNAL_SERVER_ERROR:
+                log_func = self.logger.exception if cause else self.logger.error
+                log_func("{}:{}:{} error {}", username, controller, filename, e.message)
+            else:
+                self.logger.warning(
+                    "{}:{}:{} error {} ({})",
+                    username,
+                    controller,
+                    filename,
+                    e.message,
+                    cause,
+                )
+                abort_msg = e.message
+            status = e.status
+        else:
+            self.logger.exception("Unexpected exception in outer try")
+        recovery.cleanup()
+        abort(status, message=abort_msg)
+
+
+class Upload(UploadBase):
+    """
+    Upload a dataset from an agent. This API accepts a tarball, controller
+    name, and MD5 value from a client. After validation, it creates a new
+    Dataset DB row describing the dataset, along with some metadata, and it
+    creates a pair of files (tarball and MD5 file) within the designated
+    controller directory under the configured ARCHIVE file tree.
+    """
+
+    @Auth.token_auth.login_required()
+    def put(self, filename: str):
+        self._check_disabled()
+
+        # Used to record what steps have been completed during the upload, and
+        # need to be undone on failure
+        recovery = Cleanup(self.logger)
+        username = None
+        controller = None
+
+        try:
+            user_id, username = self._current_user()
+
+            controller = request.headers.get("controller")
+            self._check_controller(controller)
+
+            self.logger.info("Uploading {} on controller {}", filename, controller)
+
+            self._check_filename(filename)
 
             md5sum = request.headers.get("Content-MD5")
             if not md5sum:
@@ -139,8 +538,6 @@ class Upload(Resource):
                 )
 
             tar_full_path = self.temporary / filename
-            md5_full_path = self.temporary / f"{filename}.md5"
-            bytes_received = 0
 
             self.logger.info(
                 "PUT uploading {}:{} for user = (user_id: {}, username: {}) to {}",
@@ -151,45 +548,9 @@ class Upload(Resource):
                 tar_full_path,
             )
 
-            # Create a tracking dataset object; it'll begin in UPLOADING state
-            try:
-                dataset = Dataset(
-                    owner_id=user_id,
-                    name=Dataset.stem(tar_full_path),
-                    resource_id=md5sum,
-                )
-                dataset.add()
-            except DatasetDuplicate:
-                dataset_name = Dataset.stem(tar_full_path)
-                self.logger.info(
-                    "Dataset already exists, user = (user_id: {}, username: {}), file = {!a}",
-                    user_id,
-                    username,
-                    dataset_name,
-                )
-                try:
-                    Dataset.query(resource_id=md5sum)
-                except DatasetNotFound:
-                    self.logger.error(
-                        "Duplicate dataset {} for user = (user_id: {}, username: {}) not found",
-                        dataset_name,
-                        user_id,
-                        username,
-                    )
-                    raise CleanupTime(
-                        HTTPStatus.INTERNAL_SERVER_ERROR, "INTERNAL ERROR"
-                    )
-                else:
-                    response = jsonify(dict(message="Dataset already exists"))
-                    response.status_code = HTTPStatus.OK
-                    return response
-            except CleanupTime:
-                raise  # Propagate a CleanupTime exception to the outer block
-            except Exception:
-                raise CleanupTime(
-                    HTTPStatus.INTERNAL_SERVER_ERROR,
-                    message="Unable to create dataset",
-                )
+            dataset = self._create_dataset(user_id, username, tar_full_path, md5sum)
+            if not dataset:
+                return self._duplicate()
 
             recovery.add(dataset.delete)
 
@@ -207,187 +568,435 @@ class Upload(Resource):
             # error recovery.
             recovery.add(tar_full_path.unlink)
 
-            with tar_full_path.open(mode="wb") as ofp:
-                hash_md5 = hashlib.md5()
-
-                try:
-                    while True:
-                        chunk = request.stream.read(self.CHUNK_SIZE)
-                        bytes_received += len(chunk)
-                        if len(chunk) == 0 or bytes_received > content_length:
-                            break
-
-                        ofp.write(chunk)
-                        hash_md5.update(chunk)
-                except OSError as exc:
-                    if exc.errno == errno.ENOSPC:
-                        raise CleanupTime(
-                            HTTPStatus.INSUFFICIENT_STORAGE,
-                            f"Out of space on {tar_full_path.root}",
-                        )
-                    else:
-                        raise CleanupTime(
-                            HTTPStatus.INTERNAL_SERVER_ERROR,
-                            "Unexpected error encountered during file upload",
-                        )
-                except Exception:
-                    raise CleanupTime(
-                        HTTPStatus.INTERNAL_SERVER_ERROR,
-                        "Unexpected error encountered during file upload",
-                    )
+            # As the tarball is written, we also feed it to a scanner thread
+            # which captures the metadata.log and the list of members; this
+            # saves later stages from having to decompress the tarball again.
+            scanner = TarballScanner(
+                Dataset.stem(tar_full_path), self.logger, codec_for(tar_full_path)
+            )
+            recovery.add(scanner.finish)
 
-                if bytes_received != content_length:
-                    raise CleanupTime(
-                        HTTPStatus.BAD_REQUEST,
-                        f"Expected {content_length} bytes but received {bytes_received} bytes",
-                    )
-                elif hash_md5.hexdigest() != md5sum:
-                    raise CleanupTime(
-                        HTTPStatus.BAD_REQUEST,
-                        f"MD5 checksum {hash_md5.hexdigest()} does not match expected {md5sum}",
-                    )
+            self._receive(
+                tar_full_path,
+                iter(lambda: request.stream.read(self.CHUNK_SIZE), b""),
+                content_length,
+                md5sum,
+                scanner,
+            )
+            self._finalize(
+                dataset, controller, tar_full_path, md5sum, scanner, recovery
+            )
+        except Exception as e:
+            self._fail(e, recovery, username, controller, filename)
 
-                # First write the .md5
-                self.logger.info("Creating MD5 file {}: {}", md5_full_path, md5sum)
+        response = jsonify(dict(message="File successfully uploaded"))
+        response.status_code = HTTPStatus.CREATED
+        return response
 
-                # From this point attempt to remove the MD5 file on error exit
-                recovery.add(md5_full_path.unlink)
-                try:
-                    md5_full_path.write_text(f"{md5sum} {filename}\n")
-                except Exception:
-                    raise CleanupTime(
-                        HTTPStatus.INTERNAL_SERVER_ERROR,
-                        f"Failed to write .md5 file '{md5_full_path}'",
-                    )
 
-            # Create a cache manager object
-            try:
-                cache_m = CacheManager(self.config, self.logger)
-            except Exception:
-                raise CleanupTime(
-                    HTTPStatus.INTERNAL_SERVER_ERROR, "Unable to map the cache manager"
-                )
+class UploadSessionState:
+    """
+    The persistent state of a chunked upload session, which is kept in a
+    per-user directory under the ARCHIVE tree's temporary upload directory
+    along with the parts that have been received so far. Sessions are keyed
+    by the owning user and the tarball name, so that users uploading
+    tarballs with the same name don't disturb each other.
+
+    Parts are numbered from 1, and each part except the last is exactly
+    `part_size` bytes long. A part is written to a temporary file and renamed
+    only when its length and MD5 have been verified, so the set of part files
+    present is always the set of parts that have been successfully received.
+    """
 
-            # Move the files to their final location
+    STATE_FILE = "session.json"
+    SESSIONS = "sessions"
+
+    def __init__(self, temporary: Path, filename: str, user_id: int):
+        """
+        Locate a user's session for a tarball name; this doesn't create or
+        load the session.
+
+        Args:
+            temporary: The temporary upload directory
+            filename: The name of the tarball being uploaded
+            user_id: The ID of the user uploading the tarball
+        """
+        self.filename = filename
+        self.directory = temporary / self.SESSIONS / str(user_id) / f"{filename}.parts"
+        self.state: Optional[JSONOBJECT] = None
+
+    @classmethod
+    def expire(
+        cls, temporary: Path, max_age: datetime.timedelta, logger: Logger
+    ) -> List[Path]:
+        """
+        Remove the sessions of all users which have not been touched within
+        the maximum age, so that abandoned uploads don't accumulate parts in
+        the temporary upload directory indefinitely.
+
+        Args:
+            temporary: The temporary upload directory
+            max_age: The age beyond which a session is considered stale
+            logger: The logger on which to report expired sessions
+
+        Returns:
+            The list of session directories removed
+        """
+        oldest = datetime.datetime.now().timestamp() - max_age.total_seconds()
+        expired = []
+        for directory in (temporary / cls.SESSIONS).glob("*/*.parts"):
             try:
-                tarball = cache_m.create(controller, tar_full_path)
-            except Exception:
-                raise CleanupTime(
-                    HTTPStatus.INTERNAL_SERVER_ERROR,
-                    f"Unable to create dataset in file system for {tar_full_path}",
-                )
+                mtime = (directory / cls.STATE_FILE).stat().st_mtime
+            except FileNotFoundError:
+                mtime = directory.stat().st_mtime
+            if mtime < oldest:
+                logger.info("Expiring stale upload session {}", directory)
+                shutil.rmtree(directory, ignore_errors=True)
+                expired.append(directory)
+        return expired
+
+    def exists(self) -> bool:
+        return (self.directory / self.STATE_FILE).is_file()
+
+    def load(self) -> JSONOBJECT:
+        self.state = json.loads((self.directory / self.STATE_FILE).read_text())
+        return self.state
+
+    def create(self, state: JSONOBJECT):
+        """
+        Create a new session, discarding any previous session for the same
+        tarball name.
+
+        Args:
+            state: The session description
+        """
+        self.remove()
+        self.directory.mkdir(mode=0o755, parents=True)
+        (self.directory / self.STATE_FILE).write_text(json.dumps(state))
+        self.state = state
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def touch(self):
+        """
+        Record activity on the session, which defers its expiration.
+        """
+        (self.directory / self.STATE_FILE).touch()
+
+    @property
+    def parts(self) -> int:
+        """
+        The number of parts in the tarball.
+        """
+        return -(-self.state["size"] // self.state["part_size"])
+
+    def part_length(self, part: int) -> int:
+        """
+        Compute the expected length of a part.
+
+        Args:
+            part: The part number
+
+        Returns:
+            The length of the part in bytes
+        """
+        part_size = self.state["part_size"]
+        return min(part_size, self.state["size"] - (part - 1) * part_size)
+
+    def part_path(self, part: int) -> Path:
+        return self.directory / f"part.{part:06d}"
+
+    def received(self) -> List[int]:
+        """
+        Return the list of parts which have been received.
+        """
+        return [p for p in range(1, self.parts + 1) if self.part_path(p).is_file()]
+
+    def missing(self) -> List[int]:
+        """
+        Return the list of parts which have not been received.
+        """
+        return [p for p in range(1, self.parts + 1) if not self.part_path(p).is_file()]
+
+    def describe(self) -> JSONOBJECT:
+        """
+        Describe the session for a client.
+        """
+        return {
+            "name": self.filename,
+            "md5": self.state["md5"],
+            "size": self.state["size"],
+            "part_size": self.state["part_size"],
+            "parts": self.parts,
+            "received": self.received(),
+        }
+
+
+class UploadSession(UploadBase):
+    """
+    Manage a chunked upload session, which allows an agent to upload a large
+    dataset tarball as a set of parts which can be sent in parallel, and to
+    resume an interrupted upload by sending only the parts which the server
+    hasn't received.
+
+        POST /api/v1/upload/session/<filename>
+            Begin (or resume) a session, with a JSON payload specifying the
+            dataset "controller", the "md5" and "size" of the complete
+            tarball, and the "part_size". The response describes the session
+            including the list of parts already "received".
+
+        PUT /api/v1/upload/part/<filename>/<part>
+            Upload a part (see `UploadPart`).
+
+        GET /api/v1/upload/session/<filename>
+            Describe an active session.
+
+        PUT /api/v1/upload/session/<filename>
+            Complete the session: assemble the parts, verify the MD5 of the
+            complete tarball, and create the dataset exactly as a single
+            `upload` PUT would.
+
+        DELETE /api/v1/upload/session/<filename>
+            Abandon the session and discard any parts received.
+
+    A session which receives no parts for `SESSION_EXPIRY` is considered
+    abandoned, and is removed when any user next begins a session.
+    """
+
+    SESSION_EXPIRY = datetime.timedelta(days=2)
+
+    @Auth.token_auth.login_required()
+    def post(self, filename: str):
+        self._check_disabled()
+        recovery = Cleanup(self.logger)
+        username = None
+        controller = None
+        try:
+            user_id, username = self._current_user()
+            self._check_filename(filename)
 
-            # From this point, failure will remove the tarball from the cache
-            # manager.
-            #
-            # NOTE: the Tarball.delete method won't clean up empty controller
-            # directories. This isn't ideal, but we don't want to deal with the
-            # potential synchronization issues and it'll become irrelevant with
-            # the switch to object store. For now we ignore it.
-            recovery.add(tarball.delete)
-
-            # Now that we have the tarball, extract the dataset timestamp from
-            # the metadata.log file.
-            #
-            # If the metadata.log is missing or corrupt, or doesn't contain the
-            # "date" property in the "pbench" section, the resulting exception
-            # will cause the upload to fail with an error.
-            #
-            # NOTE: The full metadata.log (as a JSON object with section names
-            # as the top level key) will be stored as a Metadata key using the
-            # reserved internal key "metalog". For retrieval, the "dataset" key
-            # provides a JSON mapping of the Dataset SQL object, enhanced with
-            # the dataset's "metalog" Metadata key value.
-            #
-            # NOTE: we're setting the Dataset "created" timestamp here, but it
-            # won't be committed to the database until the "advance" operation
-            # at the end.
             try:
-                metadata = tarball.get_metadata()
-                dataset.created = UtcTimeHelper.from_string(
-                    metadata["pbench"]["date"]
-                ).utc_time
-                Metadata.create(dataset=dataset, key=Metadata.METALOG, value=metadata)
-            except Exception as exc:
+                json_data = request.get_json(force=True)
+                controller = json_data.get("controller")
+                md5sum = json_data["md5"]
+                size = int(json_data["size"])
+                part_size = int(json_data["part_size"])
+            except Exception as e:
                 raise CleanupTime(
                     HTTPStatus.BAD_REQUEST,
-                    f"Tarball {dataset.name!r} is invalid or missing required metadata.log: {exc}",
+                    f"Upload session requires 'controller', 'md5', 'size', and 'part_size': {e!s}",
                 )
+            self._check_controller(controller)
 
-            try:
-                retention_days = int(
-                    self.config.get_conf(
-                        __name__,
-                        "pbench-server",
-                        "default-dataset-retention-days",
-                        self.DEFAULT_RETENTION_DAYS,
-                    )
+            if size <= 0 or part_size <= 0:
+                raise CleanupTime(
+                    HTTPStatus.BAD_REQUEST,
+                    f"Upload 'size' {size} and 'part_size' {part_size} must be greater than 0",
                 )
-            except Exception as e:
+            elif part_size > self.max_content_length:
                 raise CleanupTime(
-                    HTTPStatus.INTERNAL_SERVER_ERROR,
-                    f"Unable to get integer retention days: {e!s}",
+                    HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                    f"'part_size' {part_size} must be no greater "
+                    f"than {humanize.naturalsize(self.max_content_length)}",
                 )
 
-            # Calculate a default deletion time for the dataset, based on the
-            # time it was uploaded rather than the time it was originally
-            # created which might much earlier.
             try:
-                retention = datetime.timedelta(days=retention_days)
-                deletion = dataset.uploaded + retention
-                Metadata.setvalue(
-                    dataset=dataset,
-                    key=Metadata.TARBALL_PATH,
-                    value=str(tarball.tarball_path),
+                Dataset.query(resource_id=md5sum)
+            except DatasetNotFound:
+                pass
+            else:
+                return self._duplicate()
+
+            UploadSessionState.expire(self.temporary, self.SESSION_EXPIRY, self.logger)
+            session = UploadSessionState(self.temporary, filename, user_id)
+            state = {
+                "controller": controller,
+                "md5": md5sum,
+                "size": size,
+                "part_size": part_size,
+                "user_id": user_id,
+            }
+            if session.exists() and session.load() == state:
+                session.touch()
+                self.logger.info(
+                    "Resuming upload session for {}:{} with {} of {} parts",
+                    controller,
+                    filename,
+                    len(session.received()),
+                    session.parts,
                 )
-                Metadata.setvalue(
-                    dataset=dataset,
-                    key=Metadata.DELETION,
-                    value=UtcTimeHelper(deletion).to_iso_string(),
+                status = HTTPStatus.OK
+            else:
+                self.logger.info(
+                    "Beginning upload session for {}:{} by {}: {} bytes in {} byte parts",
+                    controller,
+                    filename,
+                    username,
+                    size,
+                    part_size,
                 )
-            except Exception as e:
+                session.create(state)
+                status = HTTPStatus.CREATED
+            return self._respond(session.describe(), status)
+        except Exception as e:
+            self._fail(e, recovery, username, controller, filename)
+
+    @Auth.token_auth.login_required()
+    def get(self, filename: str):
+        recovery = Cleanup(self.logger)
+        username = None
+        try:
+            user_id, username = self._current_user()
+            session = self._session(filename, user_id)
+            return self._respond(session.describe(), HTTPStatus.OK)
+        except Exception as e:
+            self._fail(e, recovery, username, None, filename)
+
+    @Auth.token_auth.login_required()
+    def delete(self, filename: str):
+        recovery = Cleanup(self.logger)
+        username = None
+        try:
+            user_id, username = self._current_user()
+            session = self._session(filename, user_id)
+            session.remove()
+            return self._respond({"message": "Upload session removed"}, HTTPStatus.OK)
+        except Exception as e:
+            self._fail(e, recovery, username, None, filename)
+
+    def _assemble(self, session: UploadSessionState) -> Iterator[bytes]:
+        """
+        Read the parts of a session in order.
+
+        Args:
+            session: The upload session
+
+        Returns:
+            An iterator yielding the tarball data
+        """
+        for part in range(1, session.parts + 1):
+            with session.part_path(part).open("rb") as fp:
+                yield from iter(lambda: fp.read(self.CHUNK_SIZE), b"")
+
+    @Auth.token_auth.login_required()
+    def put(self, filename: str):
+        self._check_disabled()
+        recovery = Cleanup(self.logger)
+        username = None
+        controller = None
+        try:
+            user_id, username = self._current_user()
+            session = self._session(filename, user_id)
+            controller = session.state["controller"]
+            md5sum = session.state["md5"]
+
+            missing = session.missing()
+            if missing:
                 raise CleanupTime(
-                    HTTPStatus.INTERNAL_SERVER_ERROR, f"Unable to set metadata: {e!s}"
+                    HTTPStatus.CONFLICT,
+                    f"Upload session for {filename!r} is missing parts {missing}",
                 )
 
-            # Finally, update the dataset state and commit the `created` date
-            # and state change.
-            try:
-                dataset.advance(States.UPLOADED)
-                Sync(self.logger, "upload").update(
-                    dataset=dataset, enabled=[Operation.BACKUP, Operation.UNPACK]
+            tar_full_path = self.temporary / filename
+            dataset = self._create_dataset(user_id, username, tar_full_path, md5sum)
+            if not dataset:
+                session.remove()
+                return self._duplicate()
+
+            recovery.add(dataset.delete)
+            recovery.add(tar_full_path.unlink)
+
+            self.logger.info(
+                "Assembling {} parts of {!a} (user = (user_id: {}, username: {}), ctrl = {!a}) to {}",
+                session.parts,
+                filename,
+                user_id,
+                username,
+                controller,
+                dataset,
+            )
+
+            scanner = TarballScanner(
+                Dataset.stem(tar_full_path), self.logger, codec_for(tar_full_path)
+            )
+            recovery.add(scanner.finish)
+
+            self._receive(
+                tar_full_path,
+                self._assemble(session),
+                session.state["size"],
+                md5sum,
+                scanner,
+            )
+            self._finalize(
+                dataset, controller, tar_full_path, md5sum, scanner, recovery
+            )
+        except Exception as e:
+            self._fail(e, recovery, username, controller, filename)
+
+        session.remove()
+        response = jsonify(dict(message="File successfully uploaded"))
+        response.status_code = HTTPStatus.CREATED
+        return response
+
+
+class UploadPart(UploadBase):
+    """
+    Upload one part of a dataset tarball within an upload session.
+
+        PUT /api/v1/upload/part/<filename>/<part>
+
+    The request requires a "Content-MD5" header giving the MD5 of the part,
+    and the part must be exactly the expected length. A part may be sent
+    again, replacing any previous copy.
+    """
+
+    @Auth.token_auth.login_required()
+    def put(self, filename: str, part: int):
+        self._check_disabled()
+        recovery = Cleanup(self.logger)
+        username = None
+        controller = None
+        try:
+            user_id, username = self._current_user()
+            session = self._session(filename, user_id)
+            controller = session.state["controller"]
+
+            if part < 1 or part > session.parts:
+                raise CleanupTime(
+                    HTTPStatus.BAD_REQUEST,
+                    f"Part {part} is not in the range 1 to {session.parts}",
                 )
-            except Exception as exc:
+
+            md5sum = request.headers.get("Content-MD5")
+            if not md5sum:
                 raise CleanupTime(
-                    HTTPStatus.INTERNAL_SERVER_ERROR,
-                    f"Unable to finalize dataset {dataset}: {exc!s}",
+                    HTTPStatus.BAD_REQUEST, "Missing required 'Content-MD5' header"
+                )
+
+            length = session.part_length(part)
+            content_length = request.content_length
+            if content_length != length:
+                raise CleanupTime(
+                    HTTPStatus.BAD_REQUEST,
+                    f"'Content-Length' {content_length} for part {part} must be {length}",
                 )
+
+            part_path = session.part_path(part)
+            partial = part_path.parent / f"{part_path.name}.partial"
+            recovery.add(partial.unlink)
+            self._receive(
+                partial,
+                iter(lambda: request.stream.read(self.CHUNK_SIZE), b""),
+                length,
+                md5sum,
+            )
+            partial.rename(part_path)
+            session.touch()
         except Exception as e:
-            status = HTTPStatus.INTERNAL_SERVER_ERROR
-            abort_msg = "INTERNAL ERROR"
-            if isinstance(e, CleanupTime):
-                cause = e.__cause__ if e.__cause__ else e.__context__
-                if e.status == HTTPStatus.INTERNAL_SERVER_ERROR:
-                    log_func = self.logger.exception if cause else self.logger.error
-                    log_func(
-                        "{}:{}:{} error {}", username, controller, filename, e.message
-                    )
-                else:
-                    self.logger.warning(
-                        "{}:{}:{} error {} ({})",
-                        username,
-                        controller,
-                        filename,
-                        e.message,
-                        cause,
-                    )
-                    abort_msg = e.message
-                status = e.status
-            else:
-                self.logger.exception("Unexpected exception in outer try")
-            recovery.cleanup()
-            abort(status, message=abort_msg)
+            self._fail(e, recovery, username, controller, filename)
 
-        response = jsonify(dict(message="File successfully uploaded"))
+        response = jsonify(dict(message=f"Part {part} successfully uploaded"))
         response.status_code = HTTPStatus.CREATED
         return response
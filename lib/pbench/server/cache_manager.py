@@ -1,12 +1,16 @@
+import json
 from logging import Logger
 from pathlib import Path
+import queue
 import shlex
 import shutil
 import subprocess
 import tarfile
-from typing import Dict, Optional, Union
+import threading
+from typing import Dict, List, Optional, Union
 
 from pbench.common import MetadataLog, selinux
+from pbench.common.compression import Codec, codec_for, DEFAULT_CODEC, open_tar_stream
 from pbench.server import JSONOBJECT, PbenchServerConfig
 from pbench.server.database.models.datasets import Dataset
 from pbench.server.utils import get_tarball_md5
@@ -98,6 +102,153 @@ class TarballModeChangeError(CacheManagerError):
         return f"An error occurred while changing file permissions of {self.tarball}: {self.error}"
 
 
+class _ChunkReader:
+    """
+    A minimal read-only file object which returns the byte chunks handed to
+    a `TarballScanner` in order; this allows the Python `tarfile` package to
+    consume an upload stream incrementally.
+    """
+
+    # The read size used to discard unwanted trailing data
+    DRAIN_SIZE = 65536
+
+    def __init__(self, chunks: queue.Queue):
+        self.chunks = chunks
+        self.buffer = bytearray()
+        self.eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            chunk = self.chunks.get()
+            if chunk is None:
+                self.eof = True
+            else:
+                self.buffer += chunk
+        if size < 0 or size > len(self.buffer):
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+class TarballScanner:
+    """
+    Scan a dataset tarball while it's being received, so that the metadata.log
+    file, the list of tarball members, and the total unpacked size can be
+    captured in the same pass that writes the tarball to disk.
+
+    The caller feeds each chunk of the tarball to the scanner as it's written,
+    and calls `finish` when the stream is complete. The decompression and tar
+    parsing run on a helper thread, fed through a bounded queue, so the
+    upload is only throttled if the scanner falls far behind.
+
+    A tarball which can't be parsed doesn't cause an error here: the scanner
+    records the exception, continues to drain the stream, and reports no
+    manifest so that the caller can fall back to examining the tarball file.
+    """
+
+    # The maximum number of chunks which can be queued for the scanner thread
+    QUEUE_DEPTH = 256
+
+    def __init__(self, name: str, logger: Logger, codec: Codec = DEFAULT_CODEC):
+        """
+        Start a scanner thread for a new tarball.
+
+        Args:
+            name: The dataset name, which is the expected top level directory
+                of all tarball members
+            logger: A Pbench python Logger
+            codec: The compression codec of the tarball
+        """
+        self.name = name
+        self.logger = logger
+        self.codec = codec
+        self.metadata: Optional[JSONOBJECT] = None
+        self.members: List[JSONOBJECT] = []
+        self.raw_size = 0
+        self.error: Optional[Exception] = None
+        self.chunks = queue.Queue(maxsize=self.QUEUE_DEPTH)
+        self.thread = threading.Thread(
+            target=self._scan, name=f"scan-{name}", daemon=True
+        )
+        self.finished = False
+        self.thread.start()
+
+    def _scan(self):
+        """
+        The scanner thread: decompress and parse the stream, recording the
+        metadata.log contents and a manifest entry for each member.
+        """
+        reader = _ChunkReader(self.chunks)
+        metadata_log = f"{self.name}/metadata.log"
+        try:
+            with open_tar_stream(reader, self.codec) as tar:
+                for member in tar:
+                    self.members.append(
+                        {
+                            "name": member.name,
+                            "type": member.type.decode(),
+                            "size": member.size,
+                            "mode": member.mode,
+                            "mtime": member.mtime,
+                            "linkname": member.linkname,
+                        }
+                    )
+                    if member.isfile():
+                        self.raw_size += member.size
+                    if member.name == metadata_log:
+                        data = tar.extractfile(member).read().decode()
+                        metadata = MetadataLog()
+                        metadata.read_string(data)
+                        self.metadata = {
+                            s: dict(metadata.items(s)) for s in metadata.sections()
+                        }
+        except Exception as exc:
+            self.error = exc
+        finally:
+            # Drain anything the tar reader didn't consume (e.g., trailing
+            # padding, or everything after a parsing error) so that the
+            # writer never blocks on a full queue.
+            while not reader.eof:
+                reader.read(_ChunkReader.DRAIN_SIZE)
+
+    def feed(self, chunk: bytes):
+        """
+        Hand the next chunk of the tarball to the scanner thread.
+
+        Args:
+            chunk: The next sequential block of tarball data
+        """
+        if chunk:
+            self.chunks.put(chunk)
+
+    def finish(self) -> Optional[JSONOBJECT]:
+        """
+        Signal the end of the tarball stream and wait for the scanner thread
+        to complete. This may be called more than once.
+
+        Returns:
+            A JSON manifest with the tarball metadata.log (or None if it
+            wasn't found), the total size of the tarball's files, and the list
+            of members; or None if the stream couldn't be scanned.
+        """
+        if not self.finished:
+            self.finished = True
+            self.chunks.put(None)
+            self.thread.join()
+            if self.error:
+                self.logger.warning(
+                    "Unable to scan uploaded tarball {}: {}", self.name, self.error
+                )
+        if self.error:
+            return None
+        return {
+            "metadata": self.metadata,
+            "raw_size": self.raw_size,
+            "members": self.members,
+        }
+
+
 class Tarball:
     """
     This class corresponds to the physical representation of a Dataset: the
@@ -114,8 +265,8 @@ class Tarball:
         artifacts of a dataset.
 
         Args:
-            path: The file path to a discovered tarball (.tar.xz file) in the
-                configured ARCHIVE directory for a controller.
+            path: The file path to a discovered tarball (.tar.xz or .tar.zst
+                file) in the configured ARCHIVE directory for a controller.
             controller: The associated Controller object
         """
         self.logger: Logger = controller.logger
@@ -140,7 +291,10 @@ class Tarball:
         self.results_link: Optional[Path] = None
 
         # Record the path of the companion MD5 file
-        self.md5_path: Path = path.with_suffix(".xz.md5")
+        self.md5_path: Path = Path(f"{path}.md5")
+
+        # Record the path of the (optional) companion manifest file
+        self.manifest_path: Path = Path(f"{path}.manifest")
 
         # Record the name of the containing controller
         self.controller_name: str = controller.name
@@ -148,6 +302,9 @@ class Tarball:
         # Cache results metadata when it's been processed
         self.metadata: Optional[JSONOBJECT] = None
 
+        # Cache the manifest when it's been loaded
+        self.manifest: Optional[JSONOBJECT] = None
+
     def check_unpacked(self, incoming: Path) -> bool:
         """
         Determine whether a tarball in the ARCHIVE tree has been unpacked into
@@ -212,9 +369,9 @@ class Tarball:
         # Validate the tarball suffix and extract the dataset name
         name = Dataset.stem(tarball)
 
-        # NOTE: with_suffix replaces only the final suffix, .xz, not the full
-        # standard .tar.xz
-        md5_source = tarball.with_suffix(".xz.md5")
+        md5_source = Path(f"{tarball}.md5")
+
+        manifest_source = Path(f"{tarball}.manifest")
 
         # If either expected destination file exists, something is wrong
         if (controller.path / tarball.name).exists():
@@ -248,6 +405,18 @@ class Tarball:
             )
             raise
 
+        # Move the manifest file, if there is one, only once the MD5 and the
+        # tarball are in place, so that it is never left behind without them.
+        # Losing the manifest isn't fatal, since it can always be regenerated
+        # from the tarball.
+        if manifest_source.exists():
+            try:
+                shutil.move(manifest_source, controller.path / manifest_source.name)
+            except Exception as e:
+                controller.logger.warning(
+                    "Unable to move dataset {} ({}) manifest: {}", name, tarball, e
+                )
+
         # Restore the SELinux context properly
         try:
             if selinux.is_selinux_enabled():
@@ -279,28 +448,102 @@ class Tarball:
         Returns:
             The named file as a string
         """
+        codec = codec_for(self.tarball_path)
         try:
-            return (
-                tarfile.open(self.tarball_path, "r:*").extractfile(path).read().decode()
-            )
+            if codec is None or codec.native:
+                return (
+                    tarfile.open(self.tarball_path, "r:*")
+                    .extractfile(path)
+                    .read()
+                    .decode()
+                )
+            with self.tarball_path.open("rb") as f, open_tar_stream(f, codec) as tar:
+                for member in tar:
+                    if member.name == path:
+                        return tar.extractfile(member).read().decode()
+            raise KeyError(f"filename {path!r} not found")
         except Exception as exc:
             raise MetadataError(self.tarball_path, exc)
 
+    @staticmethod
+    def write_manifest(path: Path, manifest: JSONOBJECT):
+        """
+        Write a tarball manifest, as produced by a `TarballScanner`, to a
+        companion manifest file.
+
+        Args:
+            path: The path of the manifest file
+            manifest: The JSON manifest
+        """
+        with path.open("w") as fp:
+            json.dump(manifest, fp)
+
+    def get_manifest(self) -> Optional[JSONOBJECT]:
+        """
+        Return the manifest recorded for the tarball when it was uploaded,
+        which allows callers to avoid decompressing the tarball just to find
+        the list of members or the metadata.log file.
+
+        The manifest is loaded once, and cached.
+
+        Returns:
+            The JSON manifest, or None if the dataset doesn't have a valid
+            manifest file
+        """
+        if not self.manifest and self.manifest_path and self.manifest_path.exists():
+            try:
+                with self.manifest_path.open("r") as fp:
+                    self.manifest = json.load(fp)
+            except Exception as e:
+                self.logger.warning("Unable to load manifest for {}: {}", self.name, e)
+        return self.manifest
+
+    @staticmethod
+    def manifest_members(manifest: JSONOBJECT) -> List[tarfile.TarInfo]:
+        """
+        Reconstruct the list of tarball members recorded in a manifest, in the
+        form returned by `tarfile.TarFile.getmembers()`.
+
+        Args:
+            manifest: The JSON manifest
+
+        Returns:
+            A list of TarInfo objects, in tarball order
+        """
+        members = []
+        for entry in manifest["members"]:
+            member = tarfile.TarInfo(entry["name"])
+            member.type = entry["type"].encode()
+            member.size = entry["size"]
+            member.mode = entry["mode"]
+            member.mtime = entry["mtime"]
+            member.linkname = entry["linkname"]
+            members.append(member)
+        return members
+
     def get_metadata(self) -> JSONOBJECT:
         """
         Fetch the values in metadata.log from the tarball, and return a JSON
         document organizing the metadata by section.
 
-        The information is unpacked and processed once, and cached.
+        If the metadata.log was captured in the dataset manifest when the
+        tarball was uploaded, we use it; otherwise, the information is
+        unpacked and processed once, and cached.
 
         Returns:
             A JSON representation of the dataset `metadata.log`
         """
         if not self.metadata:
-            data = self.extract(f"{self.name}/metadata.log")
-            metadata = MetadataLog()
-            metadata.read_string(data)
-            self.metadata = {s: dict(metadata.items(s)) for s in metadata.sections()}
+            manifest = self.get_manifest()
+            if manifest and manifest.get("metadata"):
+                self.metadata = manifest["metadata"]
+            else:
+                data = self.extract(f"{self.name}/metadata.log")
+                metadata = MetadataLog()
+                metadata.read_string(data)
+                self.metadata = {
+                    s: dict(metadata.items(s)) for s in metadata.sections()
+                }
         return self.metadata
 
     @staticmethod
@@ -430,6 +673,14 @@ class Tarball:
             except Exception as e:
                 self.logger.error("archive unlink for {} failed with {}", self.name, e)
             self.md5_path = None
+        if self.manifest_path:
+            try:
+                self.manifest_path.unlink(missing_ok=True)
+            except Exception as e:
+                self.logger.error(
+                    "archive manifest unlink for {} failed with {}", self.name, e
+                )
+            self.manifest_path = None
         if self.tarball_path:
             try:
                 self.tarball_path.unlink()
@@ -780,7 +1031,9 @@ class CacheManager:
         incoming = self.options.INCOMING / controller
         self.delete_if_empty(incoming)
         archive = self.options.ARCHIVE / controller
-        if archive.exists() and not any(archive.glob(f"*{Dataset.TARBALL_SUFFIX}")):
+        if archive.exists() and not any(
+            Dataset.is_tarball(f) for f in archive.iterdir()
+        ):
             self.delete_if_empty(archive)
             del self.controllers[controller]
 
@@ -841,7 +1094,7 @@ class CacheManager:
         # and (if found) discover the controller containing that dataset.
         for dir in self.archive_root.iterdir():
             if dir.is_dir() and dir.name != self.TEMPORARY:
-                for file in dir.glob(f"*{Dataset.TARBALL_SUFFIX}"):
+                for file in filter(Dataset.is_tarball, dir.iterdir()):
                     md5 = get_tarball_md5(file)
                     if md5 == dataset_id:
                         self._add_controller(dir)
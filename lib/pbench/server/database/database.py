@@ -1,10 +1,11 @@
 import sys
+from time import perf_counter
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import scoped_session, sessionmaker
 
-from pbench.server import NoOptionError, NoSectionError
+from pbench.server import metrics, NoOptionError, NoSectionError
 
 
 class Database:
@@ -25,6 +26,17 @@ class Database:
                 print(msg, file=sys.stderr)
             return None
 
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, params, context, many):
+        context.pbench_start = perf_counter()
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, params, context, many):
+        # Charge the statement to the API request being processed, if any
+        elapsed = perf_counter() - context.pbench_start
+        metrics.add_backend_time("sql", elapsed)
+        metrics.trace_call("sql", statement, elapsed)
+
     @staticmethod
     def init_db(server_config, logger):
         # Attach the logger and server config object to the base class for
@@ -40,6 +52,8 @@ class Database:
         # metadata will not have any tables and create_all functionality will do nothing
 
         engine = create_engine(Database.get_engine_uri(server_config, logger))
+        event.listen(engine, "before_cursor_execute", Database._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", Database._after_cursor_execute)
         Database.Base.metadata.create_all(bind=engine)
         Database.db_session = scoped_session(
             sessionmaker(bind=engine, autocommit=False, autoflush=False)
@@ -36,7 +36,8 @@ class DatasetBadName(DatasetError):
         self.name: str = str(name)
 
     def __str__(self) -> str:
-        return f"File name {self.name!r} does not end in {Dataset.TARBALL_SUFFIX!r}"
+        suffixes = " or ".join(repr(s) for s in Dataset.TARBALL_SUFFIXES)
+        return f"File name {self.name!r} does not end in {suffixes}"
 
 
 class DatasetSqlError(DatasetError):
@@ -463,45 +464,65 @@ class Dataset(Database.Base):
 
     TARBALL_SUFFIX = ".tar.xz"
 
+    # All the suffixes of supported tarballs: xz (the standard) or zstd
+    # compressed.
+    TARBALL_SUFFIXES = (TARBALL_SUFFIX, ".tar.zst")
+
+    @staticmethod
+    def tarball_suffix(path: Union[Path, str]) -> Optional[str]:
+        """
+        Return the supported tarball suffix a path ends with, if any.
+
+        Args:
+            path: file path
+
+        Returns:
+            The suffix, or None if the path doesn't end in a supported suffix
+        """
+        name = str(path)
+        for suffix in Dataset.TARBALL_SUFFIXES:
+            if name.endswith(suffix):
+                return suffix
+        return None
+
     @staticmethod
     def is_tarball(path: Union[Path, str]) -> bool:
         """
-        Determine whether a path has the expected suffix to qualify as a Pbench
+        Determine whether a path has an expected suffix to qualify as a Pbench
         tarball.
 
         NOTE: The file represented by the path doesn't need to exist, only end
-        with the expected suffix.
+        with an expected suffix.
 
         Args:
             path: file path
 
         Returns:
-            True if path ends with the supported suffix, False if not
+            True if path ends with a supported suffix, False if not
         """
-        return str(path).endswith(Dataset.TARBALL_SUFFIX)
+        return __class__.tarball_suffix(path) is not None
 
     @staticmethod
     def stem(path: Union[str, Path]) -> str:
         """
         The Path.stem() removes a single suffix, so our standard "a.tar.xz"
         returns "a.tar" instead of "a". We could double-stem, but instead
-        this just checks for the expected 7 character suffix and strips it.
-
-        If the path does not end in ".tar.xz" then the full path.name is
-        returned.
+        this just checks for one of the expected suffixes and strips it.
 
         Args:
             path: A file path that might be a Pbench tarball
 
         Raises:
-            BadFilename: the path name does not end in TARBALL_SUFFIX
+            BadFilename: the path name does not end in one of the
+                TARBALL_SUFFIXES
 
         Returns:
             The stripped "stem" of the dataset
         """
         p = Path(path)
-        if __class__.is_tarball(p):
-            return p.name[: -len(Dataset.TARBALL_SUFFIX)]
+        suffix = __class__.tarball_suffix(p)
+        if suffix:
+            return p.name[: -len(suffix)]
         else:
             raise DatasetBadName(p)
 
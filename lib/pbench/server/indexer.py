@@ -2,26 +2,33 @@
 result tar balls.
 """
 
+import calendar
 from collections import Counter, OrderedDict
 import configparser
+from contextlib import contextmanager
 import csv
 from datetime import datetime, timedelta
 import errno
+import gzip
 import hashlib
 import json
 import logging
 import math
 from operator import itemgetter
 import os
+from pathlib import Path
 from random import SystemRandom
 import re
+import resource
 import socket
 import tarfile
+import time
 from time import sleep as _sleep
 
 from urllib3 import Timeout
 
 from pbench.common import MetadataLog
+from pbench.common.compression import codec_for, open_tar_stream
 from pbench.common.exceptions import (
     BadDate,
     BadIterationName,
@@ -31,6 +38,9 @@ from pbench.common.exceptions import (
     UnsupportedTarballFormat,
 )
 import pbench.server
+from pbench.server import tool_parsers
+from pbench.server.cache_manager import Tarball
+from pbench.server.database.models.datasets import Dataset
 from pbench.server.templates import PbenchTemplates
 
 # We import the entire pbench module so that mocking time works by changing
@@ -168,7 +178,8 @@ def es_index(es, actions, errorsfp, logger, _dbg=0):
     Args:
         es ([Elasticsearch]): An Elasticsearch object instance from either
             the "elasticsearch1" (Elasticsearch V1) or "elasticsearch"
-            Python module.
+            Python module, or a BulkFileSink object to write the actions
+            to a file instead.
         actions ([type]): Elasticsearch bulk index action tuples
         errorsfp ([type]): A file pointer for error reporting
         logger ([type]): Standard logging object for use by bulk indexer
@@ -177,9 +188,95 @@ def es_index(es, actions, errorsfp, logger, _dbg=0):
         tuple of (start time, end time, indexed count, duplicate count, failed
         count, and retries)
     """
+    if isinstance(es, BulkFileSink):
+        return es.write(actions)
     return pyesbulk.streaming_bulk(es, actions, errorsfp, logger)
 
 
+# File name suffix of the bulk action files written by a BulkFileSink.
+BULK_FILE_SUFFIX = ".ndjson.gz"
+
+# The bulk action files are short-lived, favor speed over size.
+_BULK_FILE_COMPRESSLEVEL = 3
+
+
+class BulkFileSink:
+    """A stand-in for an Elasticsearch object which has es_index() write the
+    actions it is given to a local, gzip compressed, NDJSON file, in the
+    format of the Elasticsearch bulk API, instead of indexing them.  The
+    files can be indexed later (see `read_bulk_file()`), or fed to the bulk
+    API directly.
+
+    Each es_index() call writes a new file, named so that the files sort in
+    the order they were written.  A file is only given its final name once
+    complete.
+    """
+
+    def __init__(self, directory, prefix, logger):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.logger = logger
+        # The path of the last file written
+        self.path = None
+        self._seq = 0
+
+    @staticmethod
+    def manifest_path(path):
+        """Return the path of the JSON document describing a bulk action
+        file, if any.
+        """
+        return path.with_name(f"{path.name[: -len(BULK_FILE_SUFFIX)]}.json")
+
+    def write(self, actions):
+        """Write the actions to a new file, returning the same tuple as
+        es_index(), with all the actions counted as indexed.
+        """
+        beg = pbench.server._time()
+        self._seq += 1
+        path = self.directory / f"{self.prefix}.{self._seq:04d}{BULK_FILE_SUFFIX}"
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        count = 0
+        try:
+            with gzip.open(
+                tmp_path, "wt", compresslevel=_BULK_FILE_COMPRESSLEVEL, encoding="utf-8"
+            ) as fp:
+                for action in actions:
+                    meta = {"_index": action["_index"], "_id": action["_id"]}
+                    op_type = action.get("_op_type", _op_type)
+                    fp.write(json.dumps({op_type: meta}))
+                    fp.write("\n")
+                    fp.write(json.dumps(action["_source"]))
+                    fp.write("\n")
+                    count += 1
+            tmp_path.rename(path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        self.path = path
+        self.logger.debug("wrote {:d} actions to {}", count, path)
+        return beg, pbench.server._time(), count, 0, 0, 0
+
+    def write_manifest(self, manifest):
+        """Describe the last file written with the given JSON document."""
+        self.manifest_path(self.path).write_text(json.dumps(manifest, sort_keys=True))
+
+
+def read_bulk_file(path):
+    """Generate the actions of a bulk action file written by a BulkFileSink,
+    for es_index().
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as fp:
+        for line in fp:
+            ((op_type, meta),) = json.loads(line).items()
+            yield {
+                "_op_type": op_type,
+                "_index": meta["_index"],
+                "_id": meta["_id"],
+                "_source": json.loads(next(fp)),
+            }
+
+
 class PbenchData:
     """Pbench Data abstract class - ToolData and ResultData inherit from it.
 
@@ -920,6 +1017,9 @@ class ResultData(PbenchData):
                 # Read the file and interpret it as a JSON document.
                 with open(result_json) as fp:
                     results = json.load(fp)
+                    self.idxctx.stats.add(
+                        "result-data", nbytes=os.fstat(fp.fileno()).st_size
+                    )
             except Exception as e:
                 self.logger.warning(
                     "result-data-indexing: encountered invalid JSON file,"
@@ -1778,6 +1878,46 @@ _known_tool_handlers = {
             }
         ],
     },
+    "sar": {
+        # Only the CPU utilization, process creation / context switch, and
+        # interrupt data of sar is indexed, one JSON document per CPU, plus one
+        # for the system wide data, per timestamp.
+        "@prospectus": {"handling": "csv", "method": "unify"},
+        "patterns": [
+            {
+                "pattern": re.compile(r"^cpu_all_cpu_busy\.csv$"),
+                "class": "cpu",
+                "metric": "busy",
+                "display": "CPU_Busy",
+                "units": "percent_cpu",
+                "subfields": [],
+                "colpat": re.compile(r"(?P<id>cpu_\d+)"),
+                "converter": float,
+            },
+            {
+                "pattern": re.compile(r"^system_interrupts_sec\.csv$"),
+                "class": "system",
+                "metric": "interrupts",
+                "display": "Interrupts",
+                "units": "count_per_sec",
+                "subfields": ["all_interrupts"],
+                "colpat": re.compile(r"(?P<subfield>all_interrupts)"),
+                "converter": float,
+            },
+            {
+                "pattern": re.compile(r"^system_proc_cswch_sec\.csv$"),
+                "class": "system",
+                "metric": "proc_cswch",
+                "display": "Processes_Context_Switches",
+                "units": "count_per_sec",
+                "subfields": ["context_switches_sec", "processes_created_sec"],
+                "colpat": re.compile(
+                    r"(?P<subfield>context_switches_sec|processes_created_sec)"
+                ),
+                "converter": float,
+            },
+        ],
+    },
     "proc-interrupts": {
         "@prospectus": {"handling": "stdout", "method": "periodic_timestamp"},
         "patterns": [
@@ -1801,9 +1941,10 @@ _known_tool_handlers = {
         ],
     },
     "prometheus-metrics": {"@prospectus": {"handling": "json", "method": "json"}},
-    # The following tools should be processed via JSON data generated from the
-    # sysstat tool suite itself, which we currently don't handle.
-    "sar": None,
+    # Not a registered tool: the per-tool summaries of the resources used by
+    # the tool processes, written by each Tool Meister for every start / stop
+    # interval (see pbench.agent.overhead).
+    "tool-overhead": {"@prospectus": {"handling": "json", "method": "json"}},
     # The following tools currently don't have output that is readily
     # indexable:
     "turbostat": None,
@@ -2772,32 +2913,10 @@ class ToolData(PbenchData):
         datafiles = []
         for p in paths:
             fname = os.path.basename(p)
-            for rec in handler["patterns"]:
-                if rec["pattern"].match(fname):
-                    handler_rec = rec
-                    break
-            else:
-                # Try an alias
-                try:
-                    alias_name = _aliases[fname]
-                except KeyError:
-                    # Ignore .csv files for which we don't have a handler,
-                    # after checking to see if they might have an alias
-                    # name.
-                    # self.logger.warning("no .csv handler for '{}' ({})\n",
-                    #        fname, p)
-                    continue
-                else:
-                    for rec in handler["patterns"]:
-                        if rec["pattern"].match(alias_name):
-                            handler_rec = rec
-                            break
-                    else:
-                        # Ignore .csv files for which we don't have a handler
-                        # self.logger.warning("no .csv handler for '{}' ({}, {})\n",
-                        #        alias_name, fname, p)
-                        continue
-            assert handler_rec is not None, "Logic error! handler_rec is None"
+            handler_rec = ToolData.get_csv_handler_rec(handler, fname)
+            if handler_rec is None:
+                # Ignore .csv files for which we don't have a handler.
+                continue
             datafile = _dict_const(path=p, basename=fname, handler_rec=handler_rec)
             datafile["reader"] = reader = csv.reader(
                 open(os.path.join(ptb.extracted_root, p))
@@ -2806,6 +2925,80 @@ class ToolData(PbenchData):
             datafiles.append(datafile)
         return datafiles
 
+    @staticmethod
+    def get_csv_handler_rec(handler, fname):
+        """
+        Return the handler record of the given .csv file name, checking to
+        see if it might have an alias name, or None if there is none.
+        """
+        for rec in handler["patterns"]:
+            if rec["pattern"].match(fname):
+                return rec
+        # Try an alias
+        try:
+            alias_name = _aliases[fname]
+        except KeyError:
+            return None
+        for rec in handler["patterns"]:
+            if rec["pattern"].match(alias_name):
+                return rec
+        return None
+
+    @staticmethod
+    def get_raw_stdout_files(handler, basepath, toolsgroup, tool, ptb):
+        """
+        Fetch the list of .csv files for this tool from its raw stdout file,
+        for when its postprocessing did not produce any .csv files, returning
+        the same list of dicts as get_csv_files(), their rows being parsed
+        from the stdout file (see pbench.server.tool_parsers).
+        """
+        try:
+            parser_class = tool_parsers.parsers[tool]
+        except KeyError:
+            return []
+        stdout_path = os.path.join(basepath, "{0}-stdout.txt".format(tool))
+        if stdout_path not in ptb.gen_files_by_partial_path(stdout_path):
+            return []
+        online_cpus = None
+        try:
+            with open(
+                os.path.join(ptb.extracted_root, basepath, "online-cpus.txt")
+            ) as fp:
+                online_cpus = _dict_const()
+                for line in fp:
+                    cpu, _, online = line.partition(":")
+                    online_cpus[cpu.strip()] = online.strip() == "1"
+        except FileNotFoundError:
+            pass
+        parser = parser_class(
+            os.path.join(ptb.extracted_root, stdout_path),
+            utc_offset=ptb.utc_offset,
+            online_cpus=online_cpus,
+        )
+        try:
+            headers = parser.headers()
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            ptb.idxctx.logger.warning(
+                "tool-data-indexing: unable to parse raw {} output, {}: {} ({})",
+                tool,
+                stdout_path,
+                e,
+                ptb._tbctx,
+            )
+            return []
+        datafiles = []
+        for fname, header in headers.items():
+            handler_rec = ToolData.get_csv_handler_rec(handler, fname)
+            if handler_rec is None:
+                continue
+            datafile = _dict_const(
+                path=stdout_path, basename=fname, handler_rec=handler_rec
+            )
+            datafile["reader"] = parser.reader(fname)
+            datafile["header"] = header
+            datafiles.append(datafile)
+        return datafiles
+
     @staticmethod
     def get_json_files(handler, basepath, toolsgroup, tool, ptb):
         """
@@ -2851,6 +3044,11 @@ class ToolData(PbenchData):
             datafiles = []
         elif handler["@prospectus"]["handling"] == "csv":
             datafiles = ToolData.get_csv_files(handler, basepath, toolsgroup, tool, ptb)
+            if not datafiles:
+                # Fall back to parsing the raw output of the tool.
+                datafiles = ToolData.get_raw_stdout_files(
+                    handler, basepath, toolsgroup, tool, ptb
+                )
         elif handler["@prospectus"]["handling"] == "json":
             datafiles = ToolData.get_json_files(
                 handler, basepath, toolsgroup, tool, ptb
@@ -2865,6 +3063,137 @@ class ToolData(PbenchData):
         return datafiles
 
 
+class ToolDataRollup:
+    """Roll up the tool data documents of a ToolData object into documents
+    holding the min, max, avg and count of each metric over fixed intervals.
+
+    The documents of each series are generated in time order by the
+    make_source methods, so only the current interval of each series is kept,
+    and it is emitted as soon as a document of a later interval is added.
+
+    A series is identified by the run, iteration, sample, and host of its
+    documents, together with the identifier (disk, CPU, process, ...) of the
+    tool sub-document; a tool reporting a single series has no identifier.
+    """
+
+    def __init__(self, td, interval):
+        self.td = td
+        self.interval = interval
+        # The current interval of each series: its start, the last
+        # timestamp seen, the number of documents, the first document, and
+        # the accumulated tool sub-document.
+        self.current = {}
+
+    @staticmethod
+    def _series(source, doc):
+        """The key of the series of a tool data document."""
+        return (
+            source["run"]["id"],
+            source["iteration"]["name"],
+            source["sample"]["name"],
+            source["sample"]["hostname"],
+            doc.get("id"),
+        )
+
+    @staticmethod
+    def _accumulate(acc, doc):
+        """Accumulate the numeric values of a tool sub-document as [min, max,
+        sum, count] lists, keeping the first of the other values."""
+        for key, val in doc.items():
+            if key.startswith("@"):
+                # Internal fields like the "@idx" of a row.
+                continue
+            if isinstance(val, dict):
+                ToolDataRollup._accumulate(acc.setdefault(key, _dict_const()), val)
+            elif isinstance(val, (int, float)) and not isinstance(val, bool):
+                stats = acc.get(key)
+                if stats is None:
+                    acc[key] = [val, val, val, 1]
+                elif isinstance(stats, list):
+                    if val < stats[0]:
+                        stats[0] = val
+                    if val > stats[1]:
+                        stats[1] = val
+                    stats[2] += val
+                    stats[3] += 1
+            elif key not in acc:
+                acc[key] = val
+
+    @staticmethod
+    def _summarize(acc):
+        summary = _dict_const()
+        for key, val in acc.items():
+            if isinstance(val, dict):
+                summary[key] = ToolDataRollup._summarize(val)
+            elif isinstance(val, list):
+                summary[key] = _dict_const(
+                    [
+                        ("min", val[0]),
+                        ("max", val[1]),
+                        ("avg", val[2] / val[3]),
+                        ("count", val[3]),
+                    ]
+                )
+            else:
+                summary[key] = val
+        return summary
+
+    def _mk_source(self, cur):
+        first = cur["first"]
+        return _dict_const(
+            [
+                (
+                    "@timestamp",
+                    datetime.utcfromtimestamp(cur["start"]).strftime(_STD_DATETIME_FMT),
+                ),
+                ("run", first["run"]),
+                ("iteration", first["iteration"]),
+                ("sample", first["sample"]),
+                (
+                    "rollup",
+                    _dict_const(
+                        [
+                            ("interval", self.interval),
+                            ("samples", cur["samples"]),
+                            ("end", cur["end"]),
+                        ]
+                    ),
+                ),
+                (self.td.toolname, self._summarize(cur["acc"])),
+            ]
+        )
+
+    def add(self, source):
+        """Add a tool data document to its interval, returning the list of
+        rollup documents of the intervals it completes."""
+        doc = source[self.td.toolname]
+        ts = source["@timestamp"]
+        dt = datetime.strptime(ts, _STD_DATETIME_FMT)
+        secs = calendar.timegm(dt.utctimetuple())
+        start = secs - secs % self.interval
+        key = self._series(source, doc)
+        done = []
+        cur = self.current.get(key)
+        if cur is not None and cur["start"] != start:
+            # A document out of time order also closes the current interval.
+            done.append(self._mk_source(cur))
+            cur = None
+        if cur is None:
+            cur = self.current[key] = dict(
+                start=start, end=ts, samples=0, first=source, acc=_dict_const()
+            )
+        cur["end"] = ts
+        cur["samples"] += 1
+        self._accumulate(cur["acc"], doc)
+        return done
+
+    def flush(self):
+        """Return the rollup documents of all the current intervals."""
+        done = [self._mk_source(cur) for cur in self.current.values()]
+        self.current = {}
+        return done
+
+
 ###########################################################################
 # Various helper methods.
 
@@ -3217,7 +3546,30 @@ class PbenchTarBall:
         # system, we repeatedly reference the list of TarInfo records from the
         # Python tarfile package rather than navigating the file tree directly.
         # This could likely be improved.
-        self.tb = tarfile.open(self.tbname)
+        #
+        # When the tar ball was uploaded, its list of members was recorded in
+        # a companion manifest file; we use that when it's available rather
+        # than decompressing the entire tar ball again.
+        self.members = None
+        manifest_path = "%s.manifest" % (self.tbname)
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, "r") as fp:
+                    self.members = Tarball.manifest_members(json.load(fp))
+            except Exception as e:
+                self.idxctx.logger.warning(
+                    "{} - unable to use manifest, {}: {}", self.tbname, manifest_path, e
+                )
+            else:
+                idxctx.stats.add("open", nbytes=os.path.getsize(manifest_path))
+        if self.members is None:
+            codec = codec_for(self.tbname)
+            if codec is None or codec.native:
+                self.members = tarfile.open(self.tbname).getmembers()
+            else:
+                with open(self.tbname, "rb") as fp, open_tar_stream(fp, codec) as tar:
+                    self.members = list(tar)
+            idxctx.stats.add("open", nbytes=tb_stat.st_size)
 
         # Build a map showing the documents in each Elasticsearch index so we
         # can find them later to UPDATE or DELETE without searching all
@@ -3233,14 +3585,14 @@ class PbenchTarBall:
         # This is the top-level name of the run - it should be the common
         # first component of every member of the tar ball.
         dirname = os.path.basename(self.tbname)
-        self.dirname = dirname[: dirname.rfind(".tar.xz")]
+        suffix = Dataset.tarball_suffix(dirname)
+        self.dirname = dirname[: -len(suffix)] if suffix else dirname
         # ... but let's make sure ...
         #
         # ... while we are at it, we verify we have a metadata.log file in the
         # tar ball before we start extracting.
         metadata_log_path = "%s/metadata.log" % (self.dirname)
         metadata_log_found = False
-        self.members = self.tb.getmembers()
         for m in self.members:
             if m.name == metadata_log_path:
                 metadata_log_found = True
@@ -3321,7 +3673,10 @@ class PbenchTarBall:
         # date. We then convert back to an ISO format date.
         offset = date_ts - self.start_run_ts
         res = round(((float(offset.seconds) / 60) / 60) + (offset.days * 24), 1)
-        date_ts -= timedelta(0, int(res * 60 * 60), 0)
+        # The UTC offset is also used to convert the local times found in the
+        # raw output of tools (see ToolData.get_raw_stdout_files()).
+        self.utc_offset = timedelta(0, int(res * 60 * 60), 0)
+        date_ts -= self.utc_offset
         date = date_ts.isoformat()
         # The pbench tar balls metadata.log file has two sections, "pbench"
         # and "run" that we merge together and fix up.  We first pull the
@@ -3631,11 +3986,13 @@ class PbenchTarBall:
         result data.
         """
         self.idxctx.logger.debug("start")
-        yield self.mk_run_action()
-        for action in self.mk_toc_actions():
-            yield action
-        for action in self.mk_result_data_actions():
-            yield action
+        stats = self.idxctx.stats
+        with stats.stage("run"):
+            action = self.mk_run_action()
+        stats.add("run", docs=1)
+        yield action
+        yield from stats.wrap("toc", self.mk_toc_actions())
+        yield from stats.wrap("result-data", self.mk_result_data_actions())
         self.idxctx.logger.debug("end")
         return
 
@@ -3676,6 +4033,10 @@ class PbenchTarBall:
         return action
 
     def mk_sosreports(self):
+        with self.idxctx.stats.stage("sosreports"):
+            return self._mk_sosreports()
+
+    def _mk_sosreports(self):
         self.idxctx.logger.debug("start")
 
         sosreports = [
@@ -3701,9 +4062,9 @@ class PbenchTarBall:
                     self._tbctx,
                 )
                 continue
-            ret_val = hostnames_if_ip_from_sosreport(
-                os.path.join(self.extracted_root, sos)
-            )
+            sos_path = os.path.join(self.extracted_root, sos)
+            ret_val = hostnames_if_ip_from_sosreport(sos_path)
+            self.idxctx.stats.add("sosreports", nbytes=os.path.getsize(sos_path))
             # get hostname (short and FQDN) from sosreport
             d = _dict_const()
             d["name"] = sos
@@ -3970,6 +4331,10 @@ class PbenchTarBall:
                         continue
                     hostname = host_tools["hostname"]
                     tool_names = list(tools_data.keys())
+                    # The overhead of the tools is recorded alongside their
+                    # data when there is any.
+                    if tool_names and "tool-overhead" not in tool_names:
+                        tool_names.append("tool-overhead")
                     tool_names.sort()
                     for tool in tool_names:
                         yield ToolData(
@@ -3980,6 +4345,7 @@ class PbenchTarBall:
     def mk_tool_data_actions(self):
         """Generate all the tool data actions from the entire run hierarchy."""
         self.idxctx.logger.debug("start")
+        stats = self.idxctx.stats
         count = 0
         for td in self.mk_tool_data():
             # Each ToolData object, td, that is returned here represents how
@@ -3992,7 +4358,22 @@ class PbenchTarBall:
             asource = td.make_source()
             if not asource:
                 continue
-            for source, source_id in asource:
+            stage = f"tool-data:{td.toolname}"
+            stats.add(
+                stage,
+                nbytes=sum(
+                    os.path.getsize(os.path.join(self.extracted_root, path))
+                    for path in {f["path"] for f in td.files}
+                ),
+            )
+            # When enabled, the documents are also rolled up into parallel
+            # indices holding fewer points for long time ranges.
+            rollup = (
+                ToolDataRollup(td, self.idxctx.rollup_interval)
+                if self.idxctx.rollup_interval
+                else None
+            )
+            for source, source_id in stats.wrap(stage, asource):
                 try:
                     idx_name = td.generate_index_name(
                         "tool-data", source, toolname=td.toolname
@@ -4000,6 +4381,7 @@ class PbenchTarBall:
                 except BadDate:
                     pass
                 else:
+                    rollups = rollup.add(source) if rollup else ()
                     self.map_document(idx_name, source_id)
                     source["@generated-by"] = self.idxctx.get_tracking_id()
                     source["authorization"] = self.authorization
@@ -4011,9 +4393,36 @@ class PbenchTarBall:
                     )
                     count += 1
                     yield action
+                    for action in self._mk_tool_data_rollup_actions(td, rollups):
+                        count += 1
+                        yield action
+            if rollup:
+                for action in self._mk_tool_data_rollup_actions(td, rollup.flush()):
+                    count += 1
+                    yield action
         self.idxctx.logger.debug("end [{:d} tool data documents]", count)
         return
 
+    def _mk_tool_data_rollup_actions(self, td, sources):
+        """Generate the actions indexing the given tool data rollup documents."""
+        for source in sources:
+            try:
+                idx_name = td.generate_index_name(
+                    "tool-data-rollup", source, toolname=td.toolname
+                )
+            except BadDate:
+                continue
+            source_id = PbenchData.make_source_id(source)
+            self.map_document(idx_name, source_id)
+            source["@generated-by"] = self.idxctx.get_tracking_id()
+            source["authorization"] = self.authorization
+            yield _dict_const(
+                _op_type=_op_type,
+                _index=idx_name,
+                _id=source_id,
+                _source=source,
+            )
+
     def mk_result_data_actions(self):
         """Generate all the result data actions."""
         self.idxctx.logger.debug("start")
@@ -4058,6 +4467,160 @@ class PbenchTarBall:
         return
 
 
+def _current_rss():
+    """Return the current resident set size of this process in KiB, falling
+    back to the peak RSS where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as fp:
+            resident = int(fp.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return resident * resource.getpagesize() // 1024
+
+
+class _Stage:
+    __slots__ = ("wall", "cpu", "docs", "bytes", "maxrss")
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.docs = 0
+        self.bytes = 0
+        self.maxrss = 0
+
+
+class StageStats:
+    """The resources used by each stage of indexing a tar ball: wall clock
+    and CPU time, documents produced, bytes of result data read, and the
+    largest RSS (KiB) sampled while the stage was active.
+
+    The actions are generated lazily, while es_index() consumes them, so the
+    stages are nested: time is only charged to the innermost active stage,
+    leaving the "bulk" stage with just the time spent by the Elasticsearch
+    client.  The current RSS is sampled at most every RSS_SAMPLE_INTERVAL
+    seconds while switching stages, and whenever a stage ends, and is also
+    only charged to the innermost active stage.
+    """
+
+    RSS_SAMPLE_INTERVAL = 0.1
+
+    def __init__(self):
+        self.stages = _dict_const()
+        self._active = []
+        self._wall = self._cpu = 0.0
+        self._sampled = None
+
+    def _switch(self):
+        """Charge the time since the last switch to the innermost stage,
+        sampling the current RSS for it if it is time to do so.
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        if self._active:
+            stage = self._active[-1]
+            stage.wall += wall - self._wall
+            stage.cpu += cpu - self._cpu
+            if (
+                self._sampled is None
+                or wall - self._sampled >= self.RSS_SAMPLE_INTERVAL
+            ):
+                self._sample(stage)
+                self._sampled = wall
+        self._wall, self._cpu = wall, cpu
+
+    def _get(self, name):
+        try:
+            return self.stages[name]
+        except KeyError:
+            stage = self.stages[name] = _Stage()
+            return stage
+
+    def add(self, name, docs=0, nbytes=0):
+        stage = self._get(name)
+        stage.docs += docs
+        stage.bytes += nbytes
+
+    def _enter(self, stage):
+        self._switch()
+        self._active.append(stage)
+
+    def _leave(self):
+        self._switch()
+        self._active.pop()
+
+    @staticmethod
+    def _sample(stage):
+        stage.maxrss = max(stage.maxrss, _current_rss())
+
+    @contextmanager
+    def stage(self, name):
+        stage = self._get(name)
+        self._enter(stage)
+        try:
+            yield stage
+        finally:
+            self._sample(stage)
+            self._leave()
+
+    def wrap(self, name, actions, count=True):
+        """Generate the given actions, charging the time taken to generate
+        each one to the named stage, and, unless `count` is False (when a
+        nested stage already counts them), counting them as its documents.
+        """
+        stage = self._get(name)
+        it = iter(actions)
+        while True:
+            self._enter(stage)
+            try:
+                action = next(it)
+            except StopIteration:
+                self._sample(stage)
+                break
+            finally:
+                self._leave()
+            if count:
+                stage.docs += 1
+            yield action
+
+    def merge(self, other):
+        """Add the usage of another StageStats object to this one, keeping
+        the largest peak RSS of each stage.
+        """
+        for name, theirs in other.stages.items():
+            ours = self._get(name)
+            ours.wall += theirs.wall
+            ours.cpu += theirs.cpu
+            ours.docs += theirs.docs
+            ours.bytes += theirs.bytes
+            ours.maxrss = max(ours.maxrss, theirs.maxrss)
+
+    def record(self):
+        """Return the usage of each stage as a JSON document."""
+        return {
+            name: {
+                "wall": round(stage.wall, 3),
+                "cpu": round(stage.cpu, 3),
+                "docs": stage.docs,
+                "bytes": stage.bytes,
+                "maxrss": stage.maxrss,
+            }
+            for name, stage in self.stages.items()
+        }
+
+    def table(self):
+        """Return the usage of each stage as lines of a text table."""
+        lines = [
+            f"{'stage':<32} {'wall (s)':>10} {'cpu (s)':>10} {'docs':>10}"
+            f" {'MiB read':>10} {'peak RSS (MiB)':>14}"
+        ]
+        for name, stage in self.stages.items():
+            lines.append(
+                f"{name:<32} {stage.wall:10.2f} {stage.cpu:10.2f} {stage.docs:10d}"
+                f" {stage.bytes / 2**20:10.1f} {stage.maxrss / 1024:14.1f}"
+            )
+        return lines
+
+
 class IdxContext:
     """
     The general indexing options, including configuration and other external
@@ -4115,13 +4678,22 @@ class IdxContext:
             self.getgid = os.getgid
             self.getuid = os.getuid
         self.TS = self.config.TS
+        self.stats = StageStats()
 
-        self.es = get_es(self.config, self.logger)
+        if options.bulk_dir:
+            # Write the documents to local files instead of indexing them.
+            self.es = BulkFileSink(options.bulk_dir, f"{name}.{self.TS}", logger)
+        else:
+            self.es = get_es(self.config, self.logger)
+        # Width in seconds of the intervals tool data is rolled up into, 0
+        # when no rollups are generated.
+        self.rollup_interval = self.config.tool_data_rollup_interval
         self.templates = PbenchTemplates(
             self.config.BINDIR,
             self.idx_prefix,
             self.logger,
             _known_tool_handlers,
+            rollup=bool(self.rollup_interval),
             _dbg=_dbg,
         )
         self.tracking_id = None
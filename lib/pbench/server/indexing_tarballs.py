@@ -2,10 +2,12 @@
 
 from argparse import Namespace
 from collections import deque
+import json
 import os
 from pathlib import Path
 import signal
 import tempfile
+from time import perf_counter
 from typing import Callable, List, NamedTuple, Optional, Tuple
 
 from pbench.common.exceptions import (
@@ -14,7 +16,7 @@ from pbench.common.exceptions import (
     TemplateError,
     UnsupportedTarballFormat,
 )
-from pbench.server import tstos
+from pbench.server import metrics, tstos
 from pbench.server.cache_manager import CacheManager, TarballNotFound
 from pbench.server.database.models.datasets import (
     Dataset,
@@ -23,7 +25,16 @@ from pbench.server.database.models.datasets import (
     Metadata,
     States,
 )
-from pbench.server.indexer import es_index, IdxContext, PbenchTarBall, VERSION
+from pbench.server.indexer import (
+    BULK_FILE_SUFFIX,
+    BulkFileSink,
+    es_index,
+    IdxContext,
+    PbenchTarBall,
+    read_bulk_file,
+    StageStats,
+    VERSION,
+)
 from pbench.server.report import Report
 from pbench.server.sync import Operation, Sync
 
@@ -140,6 +151,10 @@ class Index:
         # indexing context
         self.idxctx: IdxContext = idxctx
 
+        # Whether the documents are written to bulk action files instead of
+        # being indexed (see `replay()`)
+        self.offline: bool = isinstance(idxctx.es, BulkFileSink)
+
         # Index context name
         self.name: str = name
 
@@ -240,9 +255,11 @@ class Index:
         error_code = self.error_code
         try:
             # Now that we are ready to begin the actual indexing step, ensure we
-            # have the proper index templates in place.
+            # have the proper index templates in place; when writing bulk
+            # action files, that is done when they are replayed.
             idxctx.logger.debug("update_templates [start]")
-            idxctx.templates.update_templates(idxctx.es)
+            if not self.offline:
+                idxctx.templates.update_templates(idxctx.es)
         except TemplateError as e:
             res = self.emit_error(idxctx.logger.error, "TEMPLATE_CREATION_ERROR", e)
         except SigTermException:
@@ -290,6 +307,25 @@ class Index:
 
         return res
 
+    @staticmethod
+    def _update_index_map(dataset: Dataset, index_map: dict):
+        """Record the documents indexed for a dataset in its index map.
+
+        A pbench-index --tool-data follows a pbench-index and generates only
+        the tool-specific documents: we want to merge that with the existing
+        document map. On the other hand, a re-index should replace the entire
+        index. We accomplish this by overwriting each duplicate index key
+        separately.
+        """
+        map = Metadata.getvalue(dataset, Metadata.INDEX_MAP)
+        assert type(index_map) is dict
+        if map:
+            assert type(map) is dict
+            map.update(index_map)
+        else:
+            map = index_map
+        Metadata.setvalue(dataset, Metadata.INDEX_MAP, map)
+
     def process_tb(self, tarballs: List[TarballData]) -> int:
         """Process Tarballs For Indexing and create a summary report.
 
@@ -311,12 +347,18 @@ class Index:
             return res.value
 
         idxctx.logger.debug("Preparing to index {:d} tar balls", len(tb_deque))
+        start = perf_counter()
 
         with tempfile.TemporaryDirectory(
             prefix=f"{self.name}.", dir=idxctx.config.TMP
         ) as tmpdir:
             idxctx.logger.debug("start processing list of tar balls")
             tb_list = Path(tmpdir, f"{self.name}.{idxctx.TS}.list")
+            # The resources used by each indexing stage, for all tar balls;
+            # they are not reported by the legacy unit tests, whose output
+            # must be reproducible.
+            run_stats = StageStats()
+            report_stats = not idxctx.config._unittests
             try:
                 with tb_list.open(mode="w") as lfp:
                     # Write out all the tar balls we are processing so external
@@ -361,6 +403,7 @@ class Index:
                         userid = None
                         unpacked = None
                         tb_res = error_code["OK"]
+                        stats = idxctx.stats = StageStats()
 
                         # Sanity check source tar ball path
                         try:
@@ -407,7 +450,10 @@ class Index:
 
                             # "Open" the tar ball represented by the tar ball object
                             idxctx.logger.debug("open tar ball")
-                            ptb = PbenchTarBall(idxctx, userid, path, tmpdir, unpacked)
+                            with stats.stage("open"):
+                                ptb = PbenchTarBall(
+                                    idxctx, userid, path, tmpdir, unpacked
+                                )
 
                             # Construct the generator for emitting all actions.
                             # The `idxctx` dictionary is passed along to each
@@ -415,7 +461,13 @@ class Index:
                             # error handling to the list.
                             idxctx.logger.debug("generator setup")
                             if self.options.index_tool_data:
-                                actions = ptb.mk_tool_data_actions()
+                                # The documents are counted by the stage of
+                                # each tool.
+                                actions = stats.wrap(
+                                    "tool-data",
+                                    ptb.mk_tool_data_actions(),
+                                    count=False,
+                                )
                             else:
                                 actions = ptb.make_all_actions()
 
@@ -426,13 +478,14 @@ class Index:
                                 idxctx.logger.debug("begin indexing")
                                 try:
                                     signal.signal(signal.SIGINT, sigint_handler)
-                                    es_res = es_index(
-                                        idxctx.es,
-                                        actions,
-                                        fp,
-                                        idxctx.logger,
-                                        idxctx._dbg,
-                                    )
+                                    with stats.stage("bulk"):
+                                        es_res = es_index(
+                                            idxctx.es,
+                                            actions,
+                                            fp,
+                                            idxctx.logger,
+                                            idxctx._dbg,
+                                        )
                                 except SigIntException:
                                     idxctx.logger.exception(
                                         "Indexing interrupted by SIGINT, continuing to next tarball"
@@ -481,8 +534,26 @@ class Index:
                                 retries,
                             )
                             tb_res = error_code["OP_ERROR" if failures > 0 else "OK"]
+                            if self.offline and tb_res.success:
+                                # The dataset is only done with once its
+                                # documents are replayed.
+                                try:
+                                    idxctx.es.write_manifest(
+                                        {
+                                            "resource_id": dataset.resource_id,
+                                            "name": dataset.name,
+                                            "enabled": [
+                                                o.name for o in self.enabled or []
+                                            ],
+                                            "index_map": ptb.index_map,
+                                        }
+                                    )
+                                except Exception as e:
+                                    tb_res = self.emit_error(
+                                        idxctx.logger.exception, "GENERIC_ERROR", e
+                                    )
                         finally:
-                            if tb_res.success:
+                            if tb_res.success and not self.offline:
                                 try:
                                     dataset.advance(States.INDEXED)
 
@@ -495,26 +566,9 @@ class Index:
                                     # object, so don't try to write an index
                                     # map if there is none.
                                     if ptb:
-                                        # A pbench-index --tool-data follows a
-                                        # pbench-index and generates only the
-                                        # tool-specific documents: we want to
-                                        # merge that with the existing document
-                                        # map. On the other hand, a re-index
-                                        # should replace the entire index. We
-                                        # accomplish this by overwriting each
-                                        # duplicate index key separately.
                                         try:
-                                            map = Metadata.getvalue(
-                                                dataset, Metadata.INDEX_MAP
-                                            )
-                                            assert type(ptb.index_map) is dict
-                                            if map:
-                                                assert type(map) is dict
-                                                map.update(ptb.index_map)
-                                            else:
-                                                map = ptb.index_map
-                                            Metadata.setvalue(
-                                                dataset, Metadata.INDEX_MAP, map
+                                            self._update_index_map(
+                                                dataset, ptb.index_map
                                             )
                                         except Exception as e:
                                             idxctx.logger.exception(
@@ -589,11 +643,21 @@ class Index:
                             # Success
                             with indexed.open(mode="a") as fp:
                                 print(tb, file=fp)
-                            self.sync.update(
-                                dataset=dataset,
-                                did=self.operation,
-                                enabled=self.enabled,
-                            )
+                            if self.offline:
+                                # The operations enabled next are recorded
+                                # for the replay.
+                                self.sync.update(
+                                    dataset=dataset,
+                                    did=self.operation,
+                                    enabled=None,
+                                    status=f"written to {idxctx.es.path.name}",
+                                )
+                            else:
+                                self.sync.update(
+                                    dataset=dataset,
+                                    did=self.operation,
+                                    enabled=self.enabled,
+                                )
                         elif tb_res is error_code["OP_ERROR"]:
                             with erred.open(mode="a") as fp:
                                 print(tb, file=fp)
@@ -612,6 +676,13 @@ class Index:
                             with erred.open(mode="a") as fp:
                                 print(tb, file=fp)
                             self.sync.error(dataset, f"{tb_res.value}:{tb_res.message}")
+                        if stats.stages and report_stats:
+                            idxctx.logger.info(
+                                "{}: stage stats {}",
+                                os.path.basename(tb),
+                                json.dumps(stats.record()),
+                            )
+                        run_stats.merge(stats)
                         idxctx.logger.info(
                             "Finished{} {} (size {:d})",
                             "[SIGQUIT]" if sigquit_interrupt[0] else "",
@@ -666,6 +737,7 @@ class Index:
                 idx = _count_lines(indexed)
                 skp = _count_lines(skipped)
                 err = _count_lines(erred)
+                metrics.record_run(self.name, idx, perf_counter() - start)
 
                 idxctx.logger.info(
                     "{}.{}: indexed {:d} (skipped {:d}) results," " {:d} errors",
@@ -675,6 +747,13 @@ class Index:
                     skp,
                     err,
                 )
+                if run_stats.stages and report_stats:
+                    idxctx.logger.info(
+                        "{}.{}: stage stats {}",
+                        self.name,
+                        idxctx.TS,
+                        json.dumps(run_stats.record()),
+                    )
 
                 if err > 0:
                     if skp > 0:
@@ -714,6 +793,10 @@ class Index:
                         with skipped.open() as sfp:
                             for line in sorted(sfp):
                                 print(line.strip(), file=fp)
+                    if run_stats.stages and report_stats:
+                        print("\nIndexing Stages\n===============", file=fp)
+                        for line in run_stats.table():
+                            print(line, file=fp)
                 try:
                     self.report.post_status(
                         tstos(idxctx.time()), "status", report_fname
@@ -726,3 +809,98 @@ class Index:
                     pass
 
         return res.value
+
+    def replay(self, directory: Path) -> int:
+        """Index the bulk action files written by an earlier run (see
+        `BulkFileSink`), in the order they were written, completing the
+        processing of their datasets.
+
+        Files indexed without failures are removed; the others are kept, to
+        be replayed again, with their indexing errors in a ".errors.json"
+        file.
+
+        Args:
+            directory:  The directory holding the bulk action files
+
+        Returns:
+            status code
+        """
+        idxctx = self.idxctx
+        error_code = self.error_code
+
+        res = self.load_templates()
+        if not res.success:
+            idxctx.logger.info("Load templates {!r}", res)
+            return res.value
+
+        paths = sorted(directory.glob(f"*{BULK_FILE_SUFFIX}"))
+        idxctx.logger.debug("Preparing to replay {:d} bulk action files", len(paths))
+        replayed = failed = 0
+        for path in paths:
+            manifest_path = BulkFileSink.manifest_path(path)
+            errors_path = path.with_name(
+                f"{path.name[: -len(BULK_FILE_SUFFIX)]}.errors.json"
+            )
+            try:
+                manifest = json.loads(manifest_path.read_text())
+            except FileNotFoundError:
+                # Documents not associated with a dataset, e.g. reports.
+                manifest = None
+            dataset = None
+            try:
+                if manifest:
+                    dataset = Dataset.attach(manifest["resource_id"])
+                with errors_path.open(mode="w") as fp:
+                    es_res = es_index(
+                        idxctx.es, read_bulk_file(path), fp, idxctx.logger, idxctx._dbg
+                    )
+                beg, end, successes, duplicates, failures, retries = es_res
+                idxctx.logger.info(
+                    "done replaying {} (start ts: {}, end ts: {}, duration:"
+                    " {:.2f}s, successes: {:d}, duplicates: {:d},"
+                    " failures: {:d}, retries: {:d})",
+                    path.name,
+                    tstos(beg),
+                    tstos(end),
+                    end - beg,
+                    successes,
+                    duplicates,
+                    failures,
+                    retries,
+                )
+                if failures > 0:
+                    failed += 1
+                    if dataset:
+                        ec = error_code["OP_ERROR"]
+                        self.sync.error(dataset, f"{ec.value}:{ec.message}")
+                    continue
+                if dataset:
+                    dataset.advance(States.INDEXED)
+                    Metadata.setvalue(dataset, Metadata.REINDEX, False)
+                    self._update_index_map(dataset, manifest["index_map"])
+                    self.sync.update(
+                        dataset=dataset,
+                        did=None,
+                        enabled=[Operation[o] for o in manifest["enabled"]],
+                    )
+            except SigTermException:
+                idxctx.logger.exception("Replay interrupted by SIGTERM, terminating")
+                break
+            except Exception as e:
+                failed += 1
+                idxctx.logger.exception("Failed to replay {}: {}", path, e)
+                if dataset:
+                    self.sync.error(dataset, f"replay failed: {e}")
+                continue
+            replayed += 1
+            for p in (path, manifest_path, errors_path):
+                p.unlink(missing_ok=True)
+
+        idxctx.logger.info(
+            "{}.{}: replayed {:d} bulk action files, {:d} errors",
+            self.name,
+            idxctx.TS,
+            replayed,
+            failed,
+        )
+        return error_code["OP_ERROR" if failed else "OK"].value
@@ -0,0 +1,67 @@
+"""A persistent cache of the MD5 values of tar balls"""
+import sqlite3
+
+
+class Md5Cache:
+    """A persistent cache of the MD5 values computed for tar balls.
+
+    Entries are keyed by the device, inode, size, and modification time (in
+    nanoseconds) of a tar ball, so that any change to, or replacement of, a
+    tar ball causes its MD5 to be recomputed.  An entry is only used until it
+    is `reverify_age` seconds old, after which the tar ball is read again, so
+    that all tar balls are periodically scrubbed for bit-rot.
+
+    The cache is an SQLite database so that updates are cheap and incremental
+    even for very large numbers of tar balls.  A path of None provides a cache
+    which never remembers anything.
+    """
+
+    def __init__(self, path, reverify_age):
+        self.reverify_age = reverify_age
+        self.db = sqlite3.connect(str(path) if path else ":memory:")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS md5 ("
+            " dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER,"
+            " md5 TEXT, verified REAL, checked REAL,"
+            " PRIMARY KEY (dev, ino, size, mtime_ns)) WITHOUT ROWID"
+        )
+        self.db.commit()
+
+    @staticmethod
+    def key(st):
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def lookup(self, key, now):
+        """Return the cached MD5 for the given key, or None if there is no
+        entry or the entry is due to be re-verified.
+        """
+        row = self.db.execute(
+            "SELECT md5, verified FROM md5"
+            " WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?",
+            key,
+        ).fetchone()
+        if row is None or now - row[1] >= self.reverify_age:
+            return None
+        self.db.execute(
+            "UPDATE md5 SET checked = ?"
+            " WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?",
+            (now, *key),
+        )
+        return row[0]
+
+    def update(self, key, md5, now):
+        self.db.execute(
+            "INSERT OR REPLACE INTO md5 VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (*key, md5, now, now),
+        )
+
+    def commit(self, now):
+        """Commit the entries looked up or updated, discarding entries which
+        have not been used for longer than the re-verify age (they belong to
+        tar balls which no longer exist, and would be recomputed anyway).
+        """
+        self.db.execute("DELETE FROM md5 WHERE checked < ?", (now - self.reverify_age,))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
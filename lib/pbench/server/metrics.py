@@ -0,0 +1,543 @@
+"""
+Pbench Server metrics, exported in the Prometheus text exposition format.
+
+The metrics of a process are kept in the module's REGISTRY.  Each process
+writes them to a "textfile" in the metrics directory: the periodic server
+processes (the unpacker and the indexer) at the end of each run, and each API
+server worker periodically while serving requests.  The metrics endpoint
+merges the textfiles of the other processes into the exposition of its own
+registry, labeling each of their samples with the name of its source file.
+
+This is a deliberately small implementation of the counters, gauges and
+histograms we need, without any third party dependency.
+"""
+
+from collections import defaultdict
+from contextvars import ContextVar
+from logging import Logger
+import math
+import os
+from pathlib import Path
+import threading
+from time import perf_counter, time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# The content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# The suffix of the metrics textfiles written by the server processes
+TEXTFILE_SUFFIX = ".prom"
+
+# The prefix of the metrics textfiles of the API server workers, followed by
+# their PID
+WORKER_PREFIX = "api-"
+
+# The most seconds between two textfiles written by an API server worker
+WORKER_INTERVAL = 10
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    labels = ",".join(
+        '{}="{}"'.format(
+            n,
+            str(v).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\""),
+        )
+        for n, v in zip(names, values)
+    )
+    return f"{{{labels}}}" if labels else ""
+
+
+class Metric:
+    """
+    A metric family: the values of a metric for each combination of its label
+    values.
+    """
+
+    TYPE = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(
+                f"Metric {self.name} has labels {self.labels}, not {tuple(labels)}"
+            )
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def get(self, **labels: str) -> float:
+        with self.lock:
+            return self.values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            return [
+                f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}"
+                for k, v in sorted(self.values.items())
+            ]
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = (),
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.observations: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self.lock:
+            # The count of each bucket, followed by the sum of the values
+            counts = self.observations.setdefault(key, [0] * len(self.buckets) + [0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += value
+
+    def get(self, **labels: str) -> float:
+        """
+        Return the number of observations.
+        """
+        with self.lock:
+            counts = self.observations.get(self._key(labels))
+            return counts[-2] if counts else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        names = self.labels + ("le",)
+        with self.lock:
+            for key, counts in sorted(self.observations.items()):
+                for bound, count in zip(self.buckets, counts):
+                    labels = _format_labels(names, key + (_format_value(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(counts[-1])}")
+                lines.append(f"{self.name}_count{labels} {counts[-2]}")
+        return lines
+
+
+class Registry:
+    """
+    The collection of the metric families of a process.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels=()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels=(), buckets=()):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def exposition(self, textfiles: Iterable[Path] = ()) -> str:
+        """
+        Render the metrics in the Prometheus text format, merging the samples
+        of the given textfiles: each metric family must only be described
+        once, so the samples of all sources are grouped under one header.
+
+        Args:
+            textfiles: Paths of metrics textfiles written by other processes
+
+        Returns:
+            The metrics in the Prometheus text exposition format
+        """
+        families: Dict[str, List] = {}
+        for metric in self.metrics.values():
+            families[metric.name] = [
+                metric.documentation,
+                metric.TYPE,
+                metric.samples(),
+            ]
+        for path in textfiles:
+            try:
+                text = path.read_text()
+            except FileNotFoundError:
+                # Removed since it was listed
+                continue
+            for name, (doc, mtype, lines) in _parse_textfile(
+                text, source=path.stem
+            ).items():
+                families.setdefault(name, [doc, mtype, []])[2].extend(lines)
+
+        text = []
+        for name, (doc, mtype, lines) in families.items():
+            if not lines:
+                continue
+            text.append(f"# HELP {name} {doc}")
+            text.append(f"# TYPE {name} {mtype}")
+            text.extend(lines)
+        return "\n".join(text) + "\n" if text else ""
+
+
+def _parse_textfile(text: str, source: str) -> Dict[str, List]:
+    """
+    Parse the metric families of a textfile written by write_textfile, adding
+    a "source" label to each sample.
+    """
+    families: Dict[str, List] = {}
+    family = None
+    label = _format_labels(("source",), (source,))[1:-1]
+    for line in text.splitlines():
+        if line.startswith("# HELP ") or line.startswith("# TYPE "):
+            name, _, value = line[7:].partition(" ")
+            family = families.setdefault(name, ["", "untyped", []])
+            family[0 if line[2] == "H" else 1] = value
+        elif line and not line.startswith("#") and family is not None:
+            series, _, value = line.partition(" ")
+            name, brace, labels = series.partition("{")
+            labels = f"{label},{labels}" if brace and labels != "}" else f"{label}}}"
+            family[2].append(f"{name}{{{labels} {value}")
+    return families
+
+
+REGISTRY = Registry()
+
+API_REQUESTS = REGISTRY.counter(
+    "pbench_server_api_requests_total",
+    "The number of API requests, by endpoint, method and HTTP status",
+    ("endpoint", "method", "status"),
+)
+API_LATENCY = REGISTRY.histogram(
+    "pbench_server_api_request_duration_seconds",
+    "The duration of the API requests",
+    ("endpoint", "method"),
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+API_RESPONSE_SIZE = REGISTRY.histogram(
+    "pbench_server_api_response_size_bytes",
+    "The size of the API responses",
+    ("endpoint", "method"),
+    (100, 1000, 10000, 100000, 1000000, 10000000, 100000000),
+)
+API_BACKEND_TIME = REGISTRY.counter(
+    "pbench_server_api_backend_seconds_total",
+    "The time spent by the API requests in each backend (sql, elasticsearch)",
+    ("endpoint", "backend"),
+)
+SYNC_BACKLOG = REGISTRY.gauge(
+    "pbench_server_sync_backlog",
+    "The number of datasets ready for an operation when a component last looked",
+    ("component", "operation"),
+)
+SYNC_COMPLETED = REGISTRY.counter(
+    "pbench_server_sync_completed_total",
+    "The number of operations completed by a component",
+    ("component", "operation"),
+)
+SYNC_ERRORS = REGISTRY.counter(
+    "pbench_server_sync_errors_total",
+    "The number of dataset errors recorded by a component",
+    ("component",),
+)
+RUN_DATASETS = REGISTRY.gauge(
+    "pbench_server_run_datasets",
+    "The number of datasets processed by the last run of a component",
+    ("component",),
+)
+RUN_DURATION = REGISTRY.gauge(
+    "pbench_server_run_duration_seconds",
+    "The duration of the last run of a component",
+    ("component",),
+)
+RUN_THROUGHPUT = REGISTRY.gauge(
+    "pbench_server_run_throughput_datasets_per_second",
+    "The datasets processed per second by the last run of a component",
+    ("component",),
+)
+RUN_TIMESTAMP = REGISTRY.gauge(
+    "pbench_server_run_timestamp_seconds",
+    "The time at which the last run of a component completed",
+    ("component",),
+)
+
+# The API request being processed by the current thread (or task)
+_current_request: ContextVar[Optional["RequestMetrics"]] = ContextVar(
+    "pbench_request_metrics", default=None
+)
+
+
+class RequestMetrics:
+    """
+    Measure an API request: used as a context manager around the request, so
+    that the time spent in the backends can be charged to it.
+    """
+
+    def __init__(self, endpoint: str, method: str, trace: bool = False):
+        self.endpoint = endpoint
+        self.method = method
+        self.start = perf_counter()
+        self.backends: Dict[str, float] = defaultdict(float)
+
+        # When tracing, the count and total duration of each distinct backend
+        # call (e.g., a SQL statement), in the order they were first made, so
+        # that repeated statements are reported once with their count.
+        self.calls: Optional[Dict[Tuple[str, str], List]] = {} if trace else None
+        self.lock = threading.Lock()
+
+    def __enter__(self) -> "RequestMetrics":
+        self.token = _current_request.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current_request.reset(self.token)
+
+    @property
+    def elapsed(self) -> float:
+        """The time elapsed since the start of the request, in seconds"""
+        return perf_counter() - self.start
+
+    def finish(self, status: int, size: Optional[int] = None):
+        """
+        Record the metrics of the completed request.
+
+        Args:
+            status: The HTTP status of the response
+            size: The size of the response, if known
+        """
+        API_REQUESTS.inc(
+            endpoint=self.endpoint, method=self.method, status=str(int(status))
+        )
+        API_LATENCY.observe(self.elapsed, endpoint=self.endpoint, method=self.method)
+        if size is not None:
+            API_RESPONSE_SIZE.observe(size, endpoint=self.endpoint, method=self.method)
+        for backend, seconds in self.backends.items():
+            API_BACKEND_TIME.inc(seconds, endpoint=self.endpoint, backend=backend)
+
+
+def add_backend_time(backend: str, seconds: float):
+    """
+    Charge time spent in a backend to the API request being processed, if
+    any.
+
+    Args:
+        backend: The backend name ("sql" or "elasticsearch")
+        seconds: The time spent
+    """
+    request = _current_request.get()
+    if request:
+        request.backends[backend] += seconds
+
+
+def trace_call(backend: str, call: str, seconds: float):
+    """
+    Record a backend call in the trace of the API request being processed, if
+    it is traced. The description is recorded with its whitespace collapsed,
+    so that the calls of a multi-line SQL statement are counted together.
+
+    Args:
+        backend: The backend name ("sql" or "elasticsearch")
+        call: A description of the call (e.g., the SQL statement)
+        seconds: The duration of the call
+    """
+    request = _current_request.get()
+    if request and request.calls is not None:
+        call = " ".join(call.split())
+        with request.lock:
+            entry = request.calls.setdefault((backend, call), [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+
+def trace_report(request: RequestMetrics, status: int) -> str:
+    """
+    Describe a traced API request: its duration, the time it spent in each
+    backend, and each distinct backend call with the number of times it was
+    made and their total duration.
+
+    Args:
+        request: The traced request
+        status: The HTTP status of the response
+
+    Returns:
+        A multi-line report
+    """
+    counts = defaultdict(int)
+    for (backend, _), (count, _) in request.calls.items():
+        counts[backend] += count
+    backends = ", ".join(
+        f"{b} {counts[b]} calls {t:.3f}s" for b, t in sorted(request.backends.items())
+    )
+    lines = [
+        f"Slow request {request.method} {request.endpoint} ({int(status)}):"
+        f" {request.elapsed:.3f}s" + (f" [{backends}]" if backends else "")
+    ]
+    for (backend, call), (count, seconds) in request.calls.items():
+        lines.append(f"  {backend} {count}x {seconds:.3f}s: {call}")
+    return "\n".join(lines)
+
+
+def record_run(component: str, datasets: int, seconds: float):
+    """
+    Record the throughput of a run of a periodic server component.
+
+    Args:
+        component: The component name (e.g., "unpack")
+        datasets: The number of datasets processed
+        seconds: The duration of the run
+    """
+    RUN_DATASETS.set(datasets, component=component)
+    RUN_DURATION.set(seconds, component=component)
+    RUN_THROUGHPUT.set(datasets / seconds if seconds > 0 else 0.0, component=component)
+    RUN_TIMESTAMP.set(time(), component=component)
+
+
+def textfiles(directory: Optional[Path]) -> List[Path]:
+    """
+    Return the metrics textfiles of a directory.
+    """
+    if not directory or not directory.is_dir():
+        return []
+    return sorted(directory.glob(f"*{TEXTFILE_SUFFIX}"))
+
+
+def write_textfile(directory: Optional[Path], name: str, logger: Logger):
+    """
+    Write the metrics of the process to a textfile of the metrics directory,
+    replacing the one written by the previous run atomically.
+
+    Args:
+        directory: The metrics directory (nothing is written if None)
+        name: The name of the textfile, without its suffix
+        logger: A logger for errors
+    """
+    if not directory:
+        return
+    path = directory / f"{name}{TEXTFILE_SUFFIX}"
+    tmp = directory / f".{name}{TEXTFILE_SUFFIX}.tmp"
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(REGISTRY.exposition())
+        tmp.rename(path)
+    except OSError as e:
+        logger.warning("Unable to write the metrics to {}: {}", path, e)
+
+
+class WorkerTextfile:
+    """
+    Periodically write the metrics of an API server worker to the metrics
+    directory, so that whichever worker serves the metrics endpoint can
+    include them.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Path],
+        logger: Logger,
+        interval: float = WORKER_INTERVAL,
+    ):
+        self.directory = directory
+        self.logger = logger
+        self.interval = interval
+        self.last = None
+
+    @staticmethod
+    def name(pid: Optional[int] = None) -> str:
+        return f"{WORKER_PREFIX}{pid or os.getpid()}"
+
+    def flush(self):
+        """
+        Write the worker's textfile, unless it was written recently.
+        """
+        now = perf_counter()
+        if self.directory and (self.last is None or now - self.last >= self.interval):
+            self.last = now
+            write_textfile(self.directory, self.name(), self.logger)
+
+    def others(self) -> List[Path]:
+        """
+        Return the textfiles of the other processes, removing the ones left
+        by API server workers which have exited.
+        """
+        paths = []
+        for path in textfiles(self.directory):
+            if path.stem == self.name():
+                continue
+            if path.stem.startswith(WORKER_PREFIX):
+                try:
+                    os.kill(int(path.stem[len(WORKER_PREFIX) :]), 0)
+                except ProcessLookupError:
+                    path.unlink(missing_ok=True)
+                    continue
+                except (ValueError, PermissionError):
+                    pass
+            paths.append(path)
+        return paths
+
+
+# The textfile of the current API server worker, if any
+_worker: Optional[WorkerTextfile] = None
+
+
+def init_worker(directory: Optional[Path], logger: Logger):
+    """
+    Set up the periodic textfile of an API server worker.
+
+    Args:
+        directory: The metrics directory
+        logger: A logger for errors
+    """
+    global _worker
+    _worker = WorkerTextfile(directory, logger)
+
+
+def flush_worker():
+    """
+    Write the textfile of the API server worker, if it's due.
+    """
+    if _worker:
+        _worker.flush()
+
+
+def worker_exposition() -> str:
+    """
+    Render the metrics of the API server worker, merged with those of the
+    other server processes.
+    """
+    return REGISTRY.exposition(_worker.others() if _worker else ())
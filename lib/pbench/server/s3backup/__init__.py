@@ -2,16 +2,22 @@
 This module provides convenience functions that interface to lower-level services, provided by the boto3 module.
 """
 import base64
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from configparser import NoOptionError, NoSectionError
 from enum import Enum
 import glob
 import hashlib
+import json
 import os
+from pathlib import Path
+import shutil
 
 import boto3
 from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError, ConnectionClosedError
 
+from pbench.server.database.models.datasets import Dataset
+
 
 class Status(Enum):
     SUCCESS = 0
@@ -22,6 +28,18 @@ class NoSuchKey(Exception):
     pass
 
 
+class NoSuchUpload(Exception):
+    pass
+
+
+class PartChanged(Exception):
+    """S3 did not receive an uploaded part intact: the upload cannot be
+    completed, nor resumed.
+    """
+
+    pass
+
+
 class MockGetObjectException(Exception):
     """A generic exception for testing - only raised by the mocked get_object()
     so that get_tarball_header() can be tested.
@@ -69,6 +87,23 @@ class S3Config:
             multipart_chunksize=self.chunk_size,
         )
         self.logger = logger
+
+        # Parts of large objects are uploaded concurrently by a pool of
+        # `part_workers` threads for each upload; each thread holds at most
+        # one part (`chunk_size` bytes) in memory.  Applications may upload
+        # up to `tarball_workers` objects at once.  The state of each
+        # multipart upload is persisted in `upload_state_dir` so that an
+        # interrupted upload can be resumed.
+        self.part_workers = int(
+            config.get("pbench-server-backup", "part_workers", fallback=4)
+        )
+        self.tarball_workers = (
+            1
+            if debug_unittest
+            else int(config.get("pbench-server-backup", "tarball_workers", fallback=2))
+        )
+        state_dir = config.get("pbench-server", "pbench-s3-upload-dir", fallback=None)
+        self.upload_state_dir = Path(state_dir) if state_dir else None
         if debug_unittest:
             self.connector = MockS3Connector(config, logger)
         else:
@@ -112,9 +147,14 @@ class S3Config:
             return resp
 
     def put_tarball(
-        self, Name=None, Body=None, Size=0, ContentMD5=None, Bucket=None, Key=None
+        self,
+        Name=None,
+        Body=None,
+        Size=0,
+        ContentMD5=None,
+        Bucket=None,
+        Key=None,
     ):
-
         if Size < (5 * self.GB):
             try:
                 # The S3 put_object() expects ContentMD5 to be base64-encoded.
@@ -145,57 +185,126 @@ class S3Config:
                 self.logger.info("Upload to s3 succeeded: {}", Key)
                 return Status.SUCCESS
         else:
-            # calculate multi etag value
-            etag = self.connector.calculate_multipart_etag(Name, self.chunk_size)
-            if not etag:
-                return Status.FAIL
+            return self.put_tarball_multipart(
+                Name=Name, ContentMD5=ContentMD5, Bucket=Bucket, Key=Key
+            )
+
+    def _state_file(self, Key):
+        if self.upload_state_dir is None:
+            return None
+        return self.upload_state_dir / f"{Key}.json"
+
+    def _load_upload(self, Key, size, ContentMD5):
+        """Find an earlier, interrupted, upload of the same object which can be
+        resumed, returning its upload ID and its already uploaded parts, or
+        (None, {}) if there is none.
+        """
+        state_file = self._state_file(Key)
+        if state_file is None or not state_file.exists():
+            return None, {}
+        try:
+            state = json.loads(state_file.read_text())
+            upload_id = state["upload_id"]
+        except Exception as e:
+            self.logger.warning("Ignoring bad upload state {}: {}", state_file, e)
+            return None, {}
+        if (state.get("size"), state.get("md5"), state.get("part_size")) != (
+            size,
+            ContentMD5,
+            self.chunk_size,
+        ):
+            # The object has changed: start over.
+            self._abort_upload(Key, upload_id)
+            return None, {}
+        try:
+            uploaded = self.connector.list_parts(
+                Bucket=self.bucket_name, Key=Key, UploadId=upload_id
+            )
+        except NoSuchUpload:
+            self._remove_state(Key)
+            return None, {}
+        # Only trust the parts both we and S3 know about.
+        parts = {
+            int(n): etag
+            for n, etag in state.get("parts", {}).items()
+            if uploaded.get(int(n)) == etag
+        }
+        return upload_id, parts
+
+    def _save_upload(self, Key, upload_id, size, ContentMD5, parts):
+        state_file = self._state_file(Key)
+        if state_file is None:
+            return
+        state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = state_file.with_name(f".{state_file.name}")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "upload_id": upload_id,
+                    "size": size,
+                    "md5": ContentMD5,
+                    "part_size": self.chunk_size,
+                    "parts": {str(n): etag for n, etag in sorted(parts.items())},
+                }
+            )
+        )
+        tmp.rename(state_file)
+
+    def _remove_state(self, Key):
+        state_file = self._state_file(Key)
+        if state_file is None:
+            return
+        state_file.unlink(missing_ok=True)
+        # Prune the directories of the state file which are now empty.
+        parent = state_file.parent
+        while parent != self.upload_state_dir and parent.is_relative_to(
+            self.upload_state_dir
+        ):
             try:
-                self.connector.upload_fileobj(
-                    Body=Body,
-                    Bucket=Bucket,
-                    Key=Key,
-                    Config=self.transfer_config,
-                    ExtraArgs={
-                        "Metadata": {
-                            # S3 insists on lower-casing these field names, so
-                            # we succumb in order to avoid confusion.
-                            "etag": etag,
-                            "md5": ContentMD5,
-                        }
-                    },
-                )
-            except ClientError as e:
-                self.logger.error("Multi-upload to s3 failed, client error: {}", e)
-                return Status.FAIL
-            else:
-                # compare the multi etag value uploaded in metadata
-                # field with s3 etag for data integrity.
-                try:
-                    obj = self.connector.get_object(Bucket=self.bucket_name, Key=Key)
-                except Exception:
-                    self.logger.exception("get_object failed: {}", Key)
-                    return Status.FAIL
-                else:
-                    # The ETag value is wrapped in double quotes
-                    # so we get rid of them here.
-                    s3_multipart_etag = obj["ETag"].strip('"')
-                    if s3_multipart_etag == etag:
-                        self.logger.info("Multi-upload to s3 succeeded: {}", Key)
-                        return Status.SUCCESS
-                    else:
-                        # delete object from s3
-                        # TBD: this should be flagged for retry, but
-                        # currently we just fail.
-                        self.connector.delete_object(Bucket=self.bucket_name, Key=Key)
-                        self.logger.error(
-                            "Multi-upload to s3 failed: {}, etag doesn't match", Key
-                        )
-                        self.logger.debug(
-                            "object ETag = {}, calculated ETag = {}",
-                            s3_multipart_etag,
-                            etag,
-                        )
-                        return Status.FAIL
+                parent.rmdir()
+            except OSError:
+                break
+            parent = parent.parent
+        try:
+            self.upload_state_dir.rmdir()
+        except OSError:
+            pass
+
+    def _abort_upload(self, Key, upload_id):
+        try:
+            self.connector.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=Key, UploadId=upload_id
+            )
+        except Exception as e:
+            self.logger.warning(
+                "Unable to abort upload {} of {}: {}", upload_id, Key, e
+            )
+        self._remove_state(Key)
+
+    def multipart_upload(self, Key=None, Size=0, ContentMD5=None):
+        """Start (or resume) the multipart upload of a large object, whose
+        parts are then handed to the returned MultipartUpload as they are
+        read; returns None if the upload can't be started.
+        """
+        try:
+            return MultipartUpload(self, Key, Size, ContentMD5)
+        except Exception as e:
+            self.logger.error("Multi-upload to s3 failed, client error: {}", e)
+            return None
+
+    def put_tarball_multipart(self, Name=None, ContentMD5=None, Bucket=None, Key=None):
+        """Upload a large object from the named file, in `chunk_size` parts."""
+        upload = self.multipart_upload(
+            Key=Key, Size=os.path.getsize(Name), ContentMD5=ContentMD5
+        )
+        if upload is None:
+            return Status.FAIL
+        with upload, open(Name, "rb") as f:
+            for number, data in enumerate(
+                iter(lambda: f.read(self.chunk_size), b""), start=1
+            ):
+                upload.add_part(number, data)
+            return upload.complete()
 
     # pass through to the corresponding connector
     def head_bucket(self, Bucket=None):
@@ -249,6 +358,186 @@ class S3Config:
 # abstract connector class
 
 
+class MultipartUpload:
+    """The multipart upload of a large object, in `chunk_size` parts which
+    are handed to it, in order, by whatever is reading the object, so that
+    the object is only read once.
+
+    The parts are uploaded concurrently by a pool of `part_workers` threads,
+    at most `part_workers` of them being held in memory at a time.  The
+    upload ID and the ETags of the uploaded parts are recorded as the parts
+    complete, so that if the upload is interrupted, the next attempt only
+    uploads the parts which are missing or have changed; if S3 did not
+    receive a part intact, though, the upload is aborted.  The ETag of the
+    complete object is then checked against the ETag expected from the MD5s
+    of its parts.
+
+    The upload must be closed, which is done when used as a context manager;
+    an upload which is closed before it is completed or aborted is kept so
+    that it can be resumed.
+    """
+
+    def __init__(self, s3, Key, size, ContentMD5):
+        self.s3 = s3
+        self.logger = s3.logger
+        self.key = Key
+        self.part_size = s3.chunk_size
+        self.size = size
+        self.md5 = ContentMD5
+        self.upload_id, self.parts = s3._load_upload(Key, size, ContentMD5)
+        if self.upload_id is None:
+            self.upload_id = s3.connector.create_multipart_upload(
+                Bucket=s3.bucket_name,
+                Key=Key,
+                # S3 insists on lower-casing these field names, so we
+                # succumb in order to avoid confusion.
+                Metadata={"md5": ContentMD5},
+            )
+            s3._save_upload(Key, self.upload_id, size, ContentMD5, self.parts)
+        elif self.parts:
+            self.logger.info(
+                "Resuming upload of {}: {} parts already uploaded",
+                Key,
+                len(self.parts),
+            )
+        self.nparts = 0
+        self.failed = self.changed = False
+        self._pending = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=s3.part_workers, thread_name_prefix="s3-part"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Wait for the parts being uploaded, and stop the part workers."""
+        self._executor.shutdown(wait=True)
+        self._collect(list(self._pending))
+
+    def _upload_part(self, number, data, md5):
+        # Runs in a part worker thread: upload the part with its MD5 so that
+        # S3 verifies what it received.
+        s3 = self.s3
+        etag = s3.connector.upload_part(
+            Bucket=s3.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=number,
+            Body=data,
+            ContentMD5=s3_contentMD5(md5),
+        )
+        if etag != md5:
+            raise PartChanged(
+                f"part {number} of {self.key} has ETag {etag}, expected {md5}"
+            )
+        return etag
+
+    def _collect(self, futures):
+        """Record the outcome of the given finished part uploads."""
+        for future in futures:
+            n = self._pending.pop(future)
+            try:
+                self.parts[n] = future.result()
+            except PartChanged as e:
+                self.logger.error(
+                    "Multi-upload to s3 of {} part {} failed: {}", self.key, n, e
+                )
+                self.changed = True
+            except Exception as e:
+                self.logger.error(
+                    "Multi-upload to s3 of {} part {} failed: {}", self.key, n, e
+                )
+                self.failed = True
+            else:
+                self.s3._save_upload(
+                    self.key, self.upload_id, self.size, self.md5, self.parts
+                )
+
+    def add_part(self, number, data):
+        """Upload part `number` of the object, unless an interrupted attempt
+        already did, waiting for a part worker to be free.
+        """
+        self.nparts = max(self.nparts, number)
+        md5 = hashlib.md5(data).hexdigest()
+        if self.parts.get(number) == md5:
+            return
+        self.parts.pop(number, None)
+        if len(self._pending) >= self.s3.part_workers:
+            done, _ = wait(self._pending, return_when=FIRST_COMPLETED)
+            self._collect(done)
+        future = self._executor.submit(self._upload_part, number, data, md5)
+        self._pending[future] = number
+
+    def abort(self):
+        """Abandon the upload: it won't be resumed."""
+        self.close()
+        self.s3._abort_upload(self.key, self.upload_id)
+
+    def complete(self):
+        """Wait for all the parts to be uploaded, and complete the upload."""
+        self.close()
+        if self.changed:
+            # A part was corrupted on its way to S3: the upload can't be
+            # trusted, so start over on the next attempt.
+            self.s3._abort_upload(self.key, self.upload_id)
+            return Status.FAIL
+        if self.failed:
+            # Keep the upload (and its state) so that the next attempt
+            # resumes it.
+            return Status.FAIL
+
+        s3 = self.s3
+        parts = [self.parts[n] for n in range(1, self.nparts + 1)]
+        try:
+            s3.connector.complete_multipart_upload(
+                Bucket=s3.bucket_name,
+                Key=self.key,
+                UploadId=self.upload_id,
+                Parts=[
+                    {"PartNumber": n, "ETag": etag}
+                    for n, etag in enumerate(parts, start=1)
+                ],
+            )
+        except Exception as e:
+            self.logger.error("Multi-upload to s3 failed, client error: {}", e)
+            return Status.FAIL
+        s3._remove_state(self.key)
+
+        # compare the multi etag value computed from the parts with the s3
+        # etag for data integrity.
+        etag = s3.connector.multipart_etag(parts)
+        try:
+            obj = s3.connector.get_object(Bucket=s3.bucket_name, Key=self.key)
+        except Exception:
+            self.logger.exception("get_object failed: {}", self.key)
+            return Status.FAIL
+        else:
+            # The ETag value is wrapped in double quotes
+            # so we get rid of them here.
+            s3_multipart_etag = obj["ETag"].strip('"')
+            if s3_multipart_etag == etag:
+                self.logger.info("Multi-upload to s3 succeeded: {}", self.key)
+                return Status.SUCCESS
+            else:
+                # delete object from s3
+                # TBD: this should be flagged for retry, but
+                # currently we just fail.
+                s3.connector.delete_object(Bucket=s3.bucket_name, Key=self.key)
+                self.logger.error(
+                    "Multi-upload to s3 failed: {}, etag doesn't match", self.key
+                )
+                self.logger.debug(
+                    "object ETag = {}, calculated ETag = {}",
+                    s3_multipart_etag,
+                    etag,
+                )
+                return Status.FAIL
+
+
 class Connector:
     def __init__(self):
         pass
@@ -273,6 +562,31 @@ class Connector:
     def delete_object(self, Bucket=None, Key=None):
         pass
 
+    def create_multipart_upload(self, Bucket=None, Key=None, Metadata=None):
+        pass
+
+    def upload_part(
+        self,
+        Bucket=None,
+        Key=None,
+        UploadId=None,
+        PartNumber=None,
+        Body=None,
+        ContentMD5=None,
+    ):
+        pass
+
+    def list_parts(self, Bucket=None, Key=None, UploadId=None):
+        pass
+
+    def complete_multipart_upload(
+        self, Bucket=None, Key=None, UploadId=None, Parts=None
+    ):
+        pass
+
+    def abort_multipart_upload(self, Bucket=None, Key=None, UploadId=None):
+        pass
+
     def getsize(self, tb):
         return os.path.getsize(tb)
 
@@ -301,21 +615,31 @@ class S3Connector(Connector):
             )
         self.logger = logger
 
-    @staticmethod
-    def calculate_multipart_etag(tb, chunk_size):
+    @classmethod
+    def calculate_multipart_etag(cls, tb, chunk_size):
         md5s = []
 
         with open(tb, "rb") as fp:
             for data in iter(lambda: fp.read(chunk_size), b""):
                 md5s.append(hashlib.md5(data))
 
+        return cls.multipart_etag(md5s)
+
+    @staticmethod
+    def multipart_etag(md5s):
+        # Combine the MD5 hash objects (or hex digests) of the individual
+        # parts of an object into the ETag S3 reports for the object uploaded
+        # in those parts.
         if len(md5s) > 1:
-            digests = b"".join(m.digest() for m in md5s)
+            digests = b"".join(
+                bytes.fromhex(m) if isinstance(m, str) else m.digest() for m in md5s
+            )
             new_md5 = hashlib.md5(digests)
             new_etag = "{}-{}".format(new_md5.hexdigest(), len(md5s))
         elif len(md5s) == 1:
             # file smaller than chunk size
-            new_etag = md5s[0].hexdigest()
+            m = md5s[0]
+            new_etag = m if isinstance(m, str) else m.hexdigest()
         else:
             new_etag = ""
 
@@ -345,6 +669,63 @@ class S3Connector(Connector):
     def delete_object(self, Bucket=None, Key=None):
         return self.s3client.delete_object(Bucket=Bucket, Key=Key)
 
+    def create_multipart_upload(self, Bucket=None, Key=None, Metadata=None):
+        resp = self.s3client.create_multipart_upload(
+            Bucket=Bucket, Key=Key, Metadata=Metadata
+        )
+        return resp["UploadId"]
+
+    def upload_part(
+        self,
+        Bucket=None,
+        Key=None,
+        UploadId=None,
+        PartNumber=None,
+        Body=None,
+        ContentMD5=None,
+    ):
+        resp = self.s3client.upload_part(
+            Bucket=Bucket,
+            Key=Key,
+            UploadId=UploadId,
+            PartNumber=PartNumber,
+            Body=Body,
+            ContentMD5=ContentMD5,
+        )
+        # The ETag value is wrapped in double quotes.
+        return resp["ETag"].strip('"')
+
+    def list_parts(self, Bucket=None, Key=None, UploadId=None):
+        parts = {}
+        kwargs = {"Bucket": Bucket, "Key": Key, "UploadId": UploadId}
+        while True:
+            try:
+                resp = self.s3client.list_parts(**kwargs)
+            except ClientError as e:
+                if e.response["Error"]["Code"] == "NoSuchUpload":
+                    raise NoSuchUpload
+                raise
+            for part in resp.get("Parts", []):
+                parts[part["PartNumber"]] = part["ETag"].strip('"')
+            if not resp.get("IsTruncated"):
+                return parts
+            kwargs["PartNumberMarker"] = resp["NextPartNumberMarker"]
+
+    def complete_multipart_upload(
+        self, Bucket=None, Key=None, UploadId=None, Parts=None
+    ):
+        return self.s3client.complete_multipart_upload(
+            Bucket=Bucket,
+            Key=Key,
+            UploadId=UploadId,
+            MultipartUpload={"Parts": Parts},
+        )
+
+    def abort_multipart_upload(self, Bucket=None, Key=None, UploadId=None):
+        return self.s3client.abort_multipart_upload(
+            Bucket=Bucket, Key=Key, UploadId=UploadId
+        )
+
 
 # Connector to the mock "S3" service for unit testing.
 class MockS3Connector(Connector):
@@ -379,10 +760,19 @@ class MockS3Connector(Connector):
         # just return a dummy string
         return "1234567890abcde-2"
 
+    @staticmethod
+    def multipart_etag(md5s):
+        # just return a dummy string
+        return "1234567890abcde-2"
+
     def list_objects(self, **kwargs):
         ob_dict = {}
         bucketpath = os.path.join(self.path, kwargs["Bucket"])
-        result_list = glob.glob(os.path.join(bucketpath, "*/*.tar.xz"))
+        result_list = [
+            p
+            for suffix in Dataset.TARBALL_SUFFIXES
+            for p in glob.glob(os.path.join(bucketpath, f"*/*{suffix}"))
+        ]
         result_list.sort()
         # We pretend that SPECIAL_BUCKET contains too many objects to
         # be returned in one call: we'll need a continuation call to get
@@ -419,7 +809,7 @@ class MockS3Connector(Connector):
             with open(etag_file) as f:
                 etag = f.read()[:-1]
 
-            # prepare to lie about the size: if there is a <foo>.tar.xz.MD5
+            # prepare to lie about the size: if there is a <foo>.tar.*.MD5
             # file, this is a Large Object, so we set the size to 6Gib.
             md5_file = "{}.MD5".format(i)
             if os.path.exists(md5_file):
@@ -485,6 +875,71 @@ class MockS3Connector(Connector):
         with open("{}/{}/{}.MD5".format(self.path, self.bucket_name, Key), "w") as f:
             f.write(f"{md5}\n")
 
+    # Multipart uploads are kept in an ".uploads" directory of the bucket,
+    # one sub-directory per upload holding its metadata and its parts.
+    def _upload_dir(self, Bucket, UploadId):
+        return Path(self.path, Bucket, ".uploads", UploadId)
+
+    def create_multipart_upload(self, Bucket=None, Key=None, Metadata=None):
+        upload_id = hashlib.md5(Key.encode()).hexdigest()
+        upload_dir = self._upload_dir(Bucket, upload_id)
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        (upload_dir / "metadata").write_text(json.dumps({"Key": Key, **Metadata}))
+        return upload_id
+
+    def upload_part(
+        self,
+        Bucket=None,
+        Key=None,
+        UploadId=None,
+        PartNumber=None,
+        Body=None,
+        ContentMD5=None,
+    ):
+        md5 = hashlib.md5(Body).hexdigest()
+        if s3_contentMD5(md5) != ContentMD5:
+            raise ValueError(f"part {PartNumber} of {Key} is corrupt")
+        upload_dir = self._upload_dir(Bucket, UploadId)
+        if not upload_dir.is_dir():
+            raise NoSuchUpload
+        (upload_dir / f"part.{PartNumber:05d}").write_bytes(Body)
+        return md5
+
+    def list_parts(self, Bucket=None, Key=None, UploadId=None):
+        upload_dir = self._upload_dir(Bucket, UploadId)
+        if not upload_dir.is_dir():
+            raise NoSuchUpload
+        return {
+            int(p.suffix[1:]): hashlib.md5(p.read_bytes()).hexdigest()
+            for p in upload_dir.glob("part.*")
+        }
+
+    def complete_multipart_upload(
+        self, Bucket=None, Key=None, UploadId=None, Parts=None
+    ):
+        upload_dir = self._upload_dir(Bucket, UploadId)
+        metadata = json.loads((upload_dir / "metadata").read_text())
+        result_path = Path(self.path, Bucket, Key)
+        result_path.parent.mkdir(exist_ok=True)
+        with result_path.open("wb") as f:
+            for part in Parts:
+                with (upload_dir / f"part.{part['PartNumber']:05d}").open("rb") as p:
+                    shutil.copyfileobj(p, f)
+        etag = self.multipart_etag([part["ETag"] for part in Parts])
+        # N.B. the double quotes are intentional: they simulate
+        # what the real S3 service does with the ETag field.
+        Path(f"{result_path}.ETag").write_text(f'"{etag}"\n')
+        Path(f"{result_path}.MD5").write_text(f"{metadata['md5']}\n")
+        self.abort_multipart_upload(Bucket=Bucket, Key=Key, UploadId=UploadId)
+
+    def abort_multipart_upload(self, Bucket=None, Key=None, UploadId=None):
+        upload_dir = self._upload_dir(Bucket, UploadId)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        try:
+            upload_dir.parent.rmdir()
+        except OSError:
+            pass
+
     def head_bucket(self, Bucket=None):
         if os.path.exists(os.path.join(self.path, Bucket)):
             ob_dict = {}
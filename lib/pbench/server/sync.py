@@ -2,7 +2,7 @@ from enum import auto, Enum
 from logging import DEBUG, Logger
 from typing import List, Optional
 
-from pbench.server import JSONVALUE
+from pbench.server import JSONVALUE, metrics
 from pbench.server.database.database import Database
 from pbench.server.database.models.datasets import Dataset, Metadata
 
@@ -74,10 +74,14 @@ class Sync:
             if self.logger.isEnabledFor(DEBUG):
                 q_str = query.statement.compile(compile_kwargs={"literal_binds": True})
                 self.logger.debug("QUERY {}", q_str)
-            return list(query.all())
+            datasets = list(query.all())
         except Exception as e:
             self.logger.exception("Failed to query for {}", operation)
             raise SyncSqlError("next") from e
+        metrics.SYNC_BACKLOG.set(
+            len(datasets), component=self.component, operation=operation.name
+        )
+        return datasets
 
     def update(
         self,
@@ -121,6 +125,8 @@ class Sync:
         Metadata.setvalue(dataset, Metadata.OPERATION, sorted(operations))
         if message:
             Metadata.setvalue(dataset, "server.status." + self.component, message)
+        if did:
+            metrics.SYNC_COMPLETED.inc(component=self.component, operation=did.name)
 
     def error(self, dataset: Dataset, message: str):
         """
@@ -131,3 +137,4 @@ class Sync:
             message: A message to be stored at "server.status.{component}"
         """
         Metadata.setvalue(dataset, "server.status." + self.component, message)
+        metrics.SYNC_ERRORS.inc(component=self.component)
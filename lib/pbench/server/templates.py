@@ -212,6 +212,67 @@ class JsonToolFile(JsonFile):
         self.add_mapping(name, sub_map)
 
 
+class JsonRollupToolFile(JsonToolFile):
+    """
+    Extend the JSON tool template file handling to describe the rollup
+    documents of a tool, where each numeric metric of the tool mapping is
+    replaced by its min, max, avg and count over an interval.
+    """
+
+    # Elasticsearch numeric field types which are rolled up
+    NUMERIC_TYPES = frozenset(
+        ("byte", "double", "float", "half_float", "integer", "long", "short")
+    )
+
+    # The rollup of a numeric field
+    ROLLUP_MAPPING = {
+        "properties": {
+            "min": {"type": "double"},
+            "max": {"type": "double"},
+            "avg": {"type": "double"},
+            "count": {"type": "long"},
+        }
+    }
+
+    @classmethod
+    def rollup(cls, properties: Dict[AnyStr, Any]) -> Dict[AnyStr, Any]:
+        """
+        Return a copy of the given mapping properties with each numeric field
+        replaced by the rollup of its values. Internal "@" fields, like the
+        "@idx" of the rows, have no meaning in a rollup and are dropped.
+
+        Args:
+            properties: Elasticsearch mapping properties
+
+        Returns:
+            The mapping properties of the rollup documents
+        """
+        rollup = {}
+        for name, body in properties.items():
+            if name.startswith("@"):
+                continue
+            if "properties" in body:
+                rollup[name] = dict(body, properties=cls.rollup(body["properties"]))
+            elif body.get("type") in cls.NUMERIC_TYPES:
+                rollup[name] = copy.deepcopy(cls.ROLLUP_MAPPING)
+            else:
+                rollup[name] = body
+        return rollup
+
+    def merge(self, name: str, base: JsonFile):
+        """
+        Merge the rollup of a tool-specific sub-document into the common base
+        Elasticsearch template document.
+
+        Args:
+            name: property name
+            base: The base JsonFile
+        """
+        if "properties" in self.json:
+            self.json["properties"] = self.rollup(self.json["properties"])
+        super().merge(name, base)
+
+
 class TemplateFile:
     """
     Describes an Elasticsearch template. This may include both mapping file
@@ -228,12 +289,16 @@ class TemplateFile:
 
     # Internal fixed "pattern" information for processing index templates; each
     # of these defines properties associated with a particular Elasticsearch
-    # index and document template pair. The exception is the final "tool-data"
-    # element which describes a set of index/template documents, one for each
-    # tool-specific document. (E.g., iostat, pidstat.)
+    # index and document template pair. The exceptions are the final
+    # "tool-data" and "tool-data-rollup" elements which describe sets of
+    # index/template documents, one for each tool-specific document. (E.g.,
+    # iostat, pidstat.)
     #
     # Properties:
     #     (key):            The internal reference name.
+    #     name:             The template name in the DB, formatted with the
+    #                       tool name (optional, defaults to the tool name)
+    #     rollup:           The tool mappings are rolled up (optional)
     #     idxname:          The root name of the Elasticsearch index
     #     template_name:    The document template name to be registered with
     #                       Elasticsearch
@@ -302,6 +367,18 @@ class TemplateFile:
             "desc": "Daily tool data for all tools land in indices"
             " named by tool; e.g. prefix.v0.tool-data-iostat.YYYY-MM-DD",
         },
+        "tool-data-rollup": {
+            "name": "{tool}-rollup",
+            "rollup": True,
+            "idxname": "tool-data-rollup-{tool}",
+            "template_name": "{prefix}.v{version}.{idxname}",
+            "template_pat": "{prefix}.v{version}.{idxname}.*",
+            "template": "{prefix}.v{version}.{idxname}.{year}-{month}-{day}",
+            "owned": True,
+            "desc": "Daily tool data rolled up into fixed intervals land in"
+            " indices named by tool; e.g."
+            " prefix.v0.tool-data-rollup-iostat.YYYY-MM-DD",
+        },
     }
 
     # REGEX pattern to pull the tool name out of the standard file name pattern
@@ -339,26 +416,33 @@ class TemplateFile:
         self.prefix = prefix
         self.settings = settings
         if tool:
-            self.mappings = JsonToolFile(mappings)
             self.key = tool
             m = self._fpat.match(mappings.name)
             if m:
-                self.name = m.group("toolname")
+                self.toolname = m.group("toolname")
             else:
                 raise TemplateError(
                     f"Tool template {mappings.name} ({tool}) doesn't match expected pattern."
                 )
         else:
-            self.mappings = JsonFile(mappings)
-            self.name = mappings.stem
-            self.key = self.name
+            self.toolname = None
+            self.key = mappings.stem
         try:
             self.index_info = self.index_patterns[self.key]
         except KeyError:
             raise TemplateError(
-                f"Template {self.name} (key {self.key}) does not resolve to a known index pattern"
+                f"Template {self.toolname or self.key} (key {self.key}) does not resolve to a known index pattern"
             )
-        self.idxname = self.index_info["idxname"].format(tool=self.name)
+        if tool:
+            if self.index_info.get("rollup"):
+                self.mappings = JsonRollupToolFile(mappings)
+            else:
+                self.mappings = JsonToolFile(mappings)
+            self.name = self.index_info.get("name", "{tool}").format(tool=self.toolname)
+        else:
+            self.mappings = JsonFile(mappings)
+            self.name = self.key
+        self.idxname = self.index_info["idxname"].format(tool=self.toolname)
         self.version = None
         self.tool = tool
         self.skeleton = skeleton
@@ -388,7 +472,7 @@ class TemplateFile:
         self.version = self.mappings.get_version()
         if self.skeleton:
             self.skeleton.load()
-            self.mappings.merge(self.name, self.skeleton)
+            self.mappings.merge(self.toolname, self.skeleton)
         self.settings.load()
         idxver = self.version
         ip = self.index_info
@@ -412,6 +496,19 @@ class TemplateFile:
                     }
                 },
             )
+
+        # Rolled up documents describe the interval they cover.
+        if ip.get("rollup"):
+            self.add_mapping(
+                "rollup",
+                {
+                    "properties": {
+                        "interval": {"type": "long"},
+                        "samples": {"type": "long"},
+                        "end": {"type": "date"},
+                    }
+                },
+            )
         self.loaded = True
 
     def add_mapping(self, name: str, body: Dict[AnyStr, Any]):
@@ -540,7 +637,15 @@ class PbenchTemplates:
     templates needed to define our Elasticsearch document schema.
     """
 
-    def __init__(self, basepath, idx_prefix, logger, known_tool_handlers=None, _dbg=0):
+    def __init__(
+        self,
+        basepath,
+        idx_prefix,
+        logger,
+        known_tool_handlers=None,
+        rollup=False,
+        _dbg=0,
+    ):
         """
         This contains the embedded knowledge of how the Pbench server defines
         and managed Elasticsearch template documents and indices. It relies on
@@ -559,6 +664,8 @@ class PbenchTemplates:
             known_tool_handlers:    Describes the set of tools that will have
                                     templates generated from a common tool-data
                                     skeleton.
+            rollup:                 Whether templates are also generated for
+                                    the rollups of the tool data.
             _dbg:                   Debug level for output (historical: not
                                     used)
         """
@@ -615,6 +722,16 @@ class PbenchTemplates:
                     tool="tool-data",
                 )
             )
+            if rollup:
+                self.add_template(
+                    TemplateFile(
+                        prefix=idx_prefix,
+                        mappings=mapping_dir / mapping_fn,
+                        settings=tool_settings,
+                        skeleton=skeleton,
+                        tool="tool-data-rollup",
+                    )
+                )
         self.resolve()
 
     def add_template(self, template: TemplateFile):
@@ -642,11 +759,16 @@ class PbenchTemplates:
         NOTE: This doesn't do a simple traversal of the templates dictionary
         in order to retain an output style identical to the previous, with the
         generic "tool-data" description appearing only once following the last
-        tool data pattern.
+        tool data pattern. The "tool-data-rollup" patterns are only listed when
+        their templates were generated.
         """
         patterns = TemplateFile.index_patterns
         for idx in sorted(patterns.keys()):
-            if idx != "tool-data":
+            if idx == "tool-data-rollup" and not any(
+                t.key == idx for t in self.templates.values()
+            ):
+                continue
+            if not idx.startswith("tool-data"):
                 idxname = patterns[idx]["idxname"]
                 print(
                     patterns[idx]["template"].format(
@@ -754,7 +876,7 @@ class PbenchTemplates:
             expanded index name including date
         """
         for t in self.templates.values():
-            if t.key == template_name and (toolname is None or t.name == toolname):
+            if t.key == template_name and (toolname is None or t.toolname == toolname):
                 template = t
                 break
         else:
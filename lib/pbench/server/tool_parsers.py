@@ -0,0 +1,430 @@
+"""Native parsers for the raw stdout files of the sysstat tools.
+
+The postprocessing scripts of the agent (agent/tool-scripts/postprocess/)
+turn the raw stdout file of a tool into .csv files, which the indexer then
+turns into tool data documents.  The parsers below produce the rows of the
+same .csv files directly from the raw stdout file, so that the tool data of a
+result can be indexed even when its postprocessing was skipped or failed.
+"""
+from calendar import timegm
+from collections import deque
+from datetime import datetime, timedelta
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# A sample taken from a raw stdout file: its timestamp, in milliseconds since
+# the epoch, and its values by .csv file name and column name.
+Sample = Tuple[int, Dict[str, Dict[str, str]]]
+
+_TIME_RE = r"\d+:\d+:\d+(?:\s[AP]M)?"
+_time_pat = re.compile(r"(\d+):(\d+):(\d+)(?:\s([AP]M))?")
+_date_pat = re.compile(r"\s(\d\d/\d\d/(?:\d\d)?\d\d)\s")
+
+
+def _num(value: float) -> str:
+    """Format a computed value the way perl stringifies a number."""
+    return "%.15g" % value
+
+
+def _parse_date(date: str) -> datetime:
+    """Parse an MM/DD/YY or MM/DD/YYYY date."""
+    return datetime.strptime(date, "%m/%d/%Y" if len(date) == 10 else "%m/%d/%y")
+
+
+def _parse_time(time: str) -> timedelta:
+    """Parse an HH:MM:SS time of day, with an optional AM/PM designator."""
+    hour, minute, second, ampm = _time_pat.match(time).groups()
+    hour = int(hour)
+    if ampm is not None:
+        hour = hour % 12 + (12 if ampm == "PM" else 0)
+    return timedelta(hours=hour, minutes=int(minute), seconds=int(second))
+
+
+class _TimeOfDay:
+    """Combine the date found at the top of a sysstat output file with the
+    times of day of its samples, moving on to the next day each time the time
+    of day goes backwards.
+    """
+
+    def __init__(self, first_line: str):
+        m = _date_pat.search(first_line)
+        if not m:
+            raise ValueError(f"no date found in the first line, {first_line!r}")
+        self.day = _parse_date(m.group(1))
+        self.prev = None
+
+    def __call__(self, time: str) -> datetime:
+        tod = _parse_time(time)
+        if self.prev is not None and tod < self.prev:
+            self.day += timedelta(days=1)
+        self.prev = tod
+        return self.day + tod
+
+
+class StdoutParser:
+    """Parse the raw stdout file of a tool into the rows of the .csv files its
+    postprocessing script writes.
+
+    Sub-classes implement `samples()`, yielding the timestamp and the values
+    of each sample found in the file; consecutive samples with the same
+    timestamp are merged into one row per .csv file.  The local times found in
+    the output of most tools are converted to UTC by subtracting the given UTC
+    offset.
+
+    `headers()` makes a first pass over the file to find the columns of each
+    .csv file (the devices, CPUs or processes seen), and `reader()` a second
+    one, handing out the rows of each .csv file the way a `csv.reader` would.
+    Rows parsed for the other .csv files are held until read, so reading all
+    the files in lock step, as `ToolData._make_source_unified()` does, only
+    holds one row per file.
+    """
+
+    # The value of a column with no value in a given row.
+    missing = ""
+
+    def __init__(
+        self,
+        path: str,
+        utc_offset: timedelta = timedelta(0),
+        online_cpus: Optional[Dict[str, bool]] = None,
+    ):
+        self.path = path
+        self.utc_offset = utc_offset
+        self.online_cpus = online_cpus
+        self._headers = None
+        self._rows = None
+        self._buffers = None
+
+    def local_ms(self, local: datetime) -> int:
+        """Return the milliseconds since the epoch of a local time."""
+        return timegm((local - self.utc_offset).timetuple()) * 1000
+
+    def samples(self, fp) -> Iterator[Sample]:
+        raise NotImplementedError()
+
+    def headers(self) -> Dict[str, List[str]]:
+        """Return the header row of each .csv file, by file name."""
+        if self._headers is None:
+            columns = {}
+            with open(self.path) as fp:
+                for _, sample in self.samples(fp):
+                    for name, values in sample.items():
+                        columns.setdefault(name, set()).update(values)
+            self._headers = {
+                name: ["timestamp_ms"] + sorted(cols)
+                for name, cols in sorted(columns.items())
+            }
+        return self._headers
+
+    def _gen_rows(self) -> Iterator[Sample]:
+        with open(self.path) as fp:
+            ts_ms, row = None, {}
+            for sample_ts_ms, sample in self.samples(fp):
+                if sample_ts_ms != ts_ms and row:
+                    yield ts_ms, row
+                    row = {}
+                ts_ms = sample_ts_ms
+                for name, values in sample.items():
+                    row.setdefault(name, {}).update(values)
+            if row:
+                yield ts_ms, row
+
+    def _advance(self) -> bool:
+        """Parse the next row of the file, queueing it for each .csv file,
+        returning False at the end of the file.
+        """
+        try:
+            ts_ms, row = next(self._rows)
+        except StopIteration:
+            return False
+        for name, values in row.items():
+            self._buffers[name].append(
+                [str(ts_ms)]
+                + [values.get(col, self.missing) for col in self._headers[name][1:]]
+            )
+        return True
+
+    def reader(self, name: str) -> Iterator[List[str]]:
+        """Generate the (data) rows of the given .csv file."""
+        if self._rows is None:
+            self._buffers = {n: deque() for n in self.headers()}
+            self._rows = self._gen_rows()
+        buf = self._buffers[name]
+        while True:
+            while not buf:
+                if not self._advance():
+                    return
+            yield buf.popleft()
+
+
+class IostatParser(StdoutParser):
+    """Parse the output of "iostat -N -t -y -x -m <interval>"."""
+
+    _ts_pat = re.compile(r"(\d\d/\d\d/\d\d(?:\d\d)?)\s(\d\d:\d\d:\d\d(?:\s[AP]M)?)")
+    _dev_pat = re.compile(r"(\S+)" + r"\s+(\d+\.\d+)" * 15)
+
+    def samples(self, fp) -> Iterator[Sample]:
+        ts_ms = None
+        for line in fp:
+            m = self._ts_pat.match(line)
+            if m:
+                date, time = m.groups()
+                ts_ms = self.local_ms(_parse_date(date) + _parse_time(time))
+                continue
+            m = self._dev_pat.match(line)
+            if not m or ts_ms is None:
+                continue
+            (dev, rs, ws, rmb, wmb, rrqm, wrqm, _, _) = m.groups()[:9]
+            (r_await, w_await, aqu, rareq, wareq, _, util) = m.groups()[9:]
+            read, write = f"{dev}-read", f"{dev}-write"
+            yield ts_ms, {
+                "disk_IOPS.csv": {read: rs, write: ws},
+                "disk_Queue_Size.csv": {dev: aqu},
+                "disk_Request_Merges_per_sec.csv": {read: rrqm, write: wrqm},
+                "disk_Request_Size_in_512_byte_sectors.csv": {
+                    dev: _num((float(rareq) + float(wareq)) * 2)
+                },
+                "disk_Request_Size_in_kB.csv": {read: rareq, write: wareq},
+                "disk_Throughput_MB_per_sec.csv": {read: rmb, write: wmb},
+                "disk_Utilization_percent.csv": {dev: util},
+                "disk_Wait_Time_msec.csv": {read: r_await, write: w_await},
+            }
+
+
+class MpstatParser(StdoutParser):
+    """Parse the output of "mpstat -P ALL <interval>", skipping the CPUs
+    recorded as offline.
+    """
+
+    _modes = ("usr", "nice", "sys", "iowait", "irq", "soft", "steal", "guest")
+    _modes += ("gnice", "idle")
+    _line_pat = re.compile(rf"({_TIME_RE})\s+(\S+)(.*)")
+    _values_pat = re.compile(r"\s+(\d+\.\d+)" * 10)
+
+    def samples(self, fp) -> Iterator[Sample]:
+        clock = _TimeOfDay(next(fp, ""))
+        for line in fp:
+            m = self._line_pat.match(line)
+            if not m:
+                continue
+            # Header lines carry the time too, which matters for noticing the
+            # move to the next day.
+            ts_ms = self.local_ms(clock(m.group(1)))
+            cpu = m.group(2)
+            values = self._values_pat.match(m.group(3))
+            if not values:
+                continue
+            if cpu != "all" and self.online_cpus is not None:
+                if not self.online_cpus.get(cpu, False):
+                    continue
+            # The legacy name of the "soft" mode is "softirq", and "gnice" is
+            # not recorded.
+            cols = {
+                "softirq" if mode == "soft" else mode: val
+                for mode, val in zip(self._modes, values.groups())
+                if mode != "gnice"
+            }
+            yield ts_ms, {f"cpu{cpu}_cpu{cpu}.csv": cols}
+
+
+class PidstatParser(StdoutParser):
+    """Parse the output of "pidstat -l -H -w -u -h -d -r [-t] -p ALL
+    <interval>", labelling each process (or thread) with its PID and its
+    command line, the way pidstat-convert and pidstat-postprocess do.
+    """
+
+    # Processes not seen in a sample are recorded with zero values.
+    missing = "0"
+
+    _f = r"(\d+\.\d+)\s+"
+    _i = r"(\d+)\s+"
+    _line_pat = re.compile(
+        r"\s?(\d+)\s+\d+\s+(\S+|\S+\s+\S+)\s+"
+        + _f * 5
+        + _i
+        + _f * 2
+        + _i * 2
+        + _f * 4
+        + _i
+        + _f * 2
+        + r"(.*)"
+    )
+    # The .csv file of each of the values of a line, in order.
+    _files = (
+        None,  # %usr
+        None,  # %system
+        None,  # %guest
+        None,  # %wait
+        "cpu_usage_percent_cpu.csv",
+        None,  # CPU
+        "memory_faults_minor_faults_sec.csv",
+        "memory_faults_major_faults_sec.csv",
+        "memory_usage_virtual_size.csv",
+        "memory_usage_resident_set_size.csv",
+        None,  # %MEM
+        "file_io_io_reads_KB_sec.csv",
+        "file_io_io_writes_KB_sec.csv",
+        None,  # kB_ccwr/s
+        None,  # iodelay
+        "context_switches_voluntary_switches_sec.csv",
+        "context_switches_nonvoluntary_switches_sec.csv",
+    )
+    _vm_name_pat = re.compile(r"name\s(\S+)")
+
+    @classmethod
+    def label(cls, pid: str, cmd: str) -> str:
+        """Return the column name of a process: its PID and a sanitized
+        version of its command line, or of the name of a KVM guest.
+        """
+        m = cls._vm_name_pat.search(cmd) if "qemu" in cmd else None
+        if m:
+            cmd = f"KVMguest--{m.group(1)}"
+        cmd = cmd.replace("%", "%%")
+        cmd = re.sub(r"['|\"]", "", cmd)
+        cmd = re.sub(r"\s", "_", cmd)
+        cmd = cmd.replace(",", "")
+        return f"{pid}-{cmd[:40]}"
+
+    def samples(self, fp) -> Iterator[Sample]:
+        prev_pid = None
+        for line in fp:
+            m = self._line_pat.match(line)
+            if not m:
+                continue
+            values = m.groups()
+            ts, pid, cmd = values[0], values[1], values[-1].strip()
+            ids = pid.split()
+            if len(ids) == 2:
+                # With "-t" each process line, which we skip, is followed by
+                # the lines of its threads, with a TGID of "-".
+                tgid, tid = ids
+                if not re.search(r"^0|-$", tgid):
+                    prev_pid = tgid
+                    continue
+                pid = f"{prev_pid}:{tid}"
+                cmd = cmd.replace("|__", "", 1)
+            label = self.label(pid, cmd)
+            sample = {}
+            for name, val in zip(self._files, values[2:-1]):
+                if name is not None:
+                    sample[name] = {label: val}
+            yield int(ts) * 1000, sample
+
+
+class SarParser(StdoutParser):
+    """Parse the CPU utilization, task creation and context switch, and
+    interrupt sections of the output of "sar -A <interval>".
+    """
+
+    _cpu_hdr_pat = re.compile(
+        rf"{_TIME_RE}\s+CPU\s+%usr\s+%nice\s+%sys\s+%iowait\s+%steal\s+%irq"
+        r"\s+%soft\s+%guest\s+%gnice\s+%idle"
+    )
+    _cpu_pat = re.compile(rf"({_TIME_RE})\s+(\d+)" + r"\s+(\d+\.\d+)" * 10)
+    _proc_hdr_pat = re.compile(rf"{_TIME_RE}\s+proc/s\s+cswch/s$")
+    _proc_pat = re.compile(rf"({_TIME_RE})\s+(\d+\.\d+)\s+(\d+\.\d+)$")
+    _intr_hdr_pat = re.compile(rf"{_TIME_RE}\s+INTR\s+intr/s$")
+    _intr_pat = re.compile(rf"({_TIME_RE})\s+sum\s+(\d+\.\d+)$")
+    _line_pat = re.compile(rf"({_TIME_RE})\s")
+
+    def samples(self, fp) -> Iterator[Sample]:
+        clock = _TimeOfDay(next(fp, ""))
+        mode = None
+        for line in fp:
+            line = line.rstrip("\n")
+            if not line:
+                mode = None
+                continue
+            m = self._line_pat.match(line)
+            if not m:
+                continue
+            if mode is None:
+                # The header line of each section carries the time of the
+                # previous sample, so it is not fed to the clock.
+                if self._cpu_hdr_pat.match(line):
+                    mode = "cpu"
+                elif self._proc_hdr_pat.match(line):
+                    mode = "proc"
+                elif self._intr_hdr_pat.match(line):
+                    mode = "intr"
+                else:
+                    mode = "other"
+                continue
+            ts_ms = self.local_ms(clock(m.group(1)))
+            if mode == "cpu":
+                m = self._cpu_pat.match(line)
+                if m:
+                    # usr, nice, sys, iowait, steal, irq, soft, guest, gnice
+                    vals = [float(v) for v in m.groups()[2:]]
+                    busy = vals[0] + vals[1] + vals[2] + sum(vals[5:9])
+                    cpu = f"cpu_{int(m.group(2)):02d}"
+                    yield ts_ms, {"cpu_all_cpu_busy.csv": {cpu: _num(busy)}}
+            elif mode == "proc":
+                m = self._proc_pat.match(line)
+                if m:
+                    yield ts_ms, {
+                        "system_proc_cswch_sec.csv": {
+                            "processes_created_sec": m.group(2),
+                            "context_switches_sec": m.group(3),
+                        }
+                    }
+            elif mode == "intr":
+                m = self._intr_pat.match(line)
+                if m:
+                    yield ts_ms, {
+                        "system_interrupts_sec.csv": {"all_interrupts": m.group(2)}
+                    }
+
+
+class VmstatParser(StdoutParser):
+    """Parse the output of "vmstat -t -w <interval>", skipping the first
+    sample, an average since boot.
+    """
+
+    # The .csv file and column of each of the numbers of a line, in order.
+    _columns = (
+        ("vmstat_procs.csv", "running"),
+        ("vmstat_procs.csv", "blocked"),
+        ("vmstat_memory.csv", "swapped_KiB"),
+        ("vmstat_memory.csv", "free_KiB"),
+        ("vmstat_memory.csv", "inactive_KiB"),
+        ("vmstat_memory.csv", "active_KiB"),
+        ("vmstat_swap.csv", "in_KiB"),
+        ("vmstat_swap.csv", "out_KiB"),
+        ("vmstat_block.csv", "in_KiB"),
+        ("vmstat_block.csv", "out_KiB"),
+        ("vmstat_system.csv", "interrupts"),
+        ("vmstat_system.csv", "cntx_switches"),
+        ("vmstat_cpu.csv", "user"),
+        ("vmstat_cpu.csv", "sys"),
+        ("vmstat_cpu.csv", "idle"),
+        ("vmstat_cpu.csv", "wait"),
+        ("vmstat_cpu.csv", "steal"),
+    )
+    _line_pat = re.compile(r"\s*" + r"(\d+)\s+" * 17 + r"(.+)")
+
+    def samples(self, fp) -> Iterator[Sample]:
+        first = True
+        for line in fp:
+            m = self._line_pat.match(line)
+            if not m:
+                continue
+            if first:
+                first = False
+                continue
+            values = m.groups()
+            local = datetime.strptime(values[-1].strip(), "%Y-%m-%d %H:%M:%S")
+            sample = {}
+            for (name, col), val in zip(self._columns, values):
+                sample.setdefault(name, {})[col] = val
+            yield self.local_ms(local), sample
+
+
+# The native parser of each tool, by tool name.
+parsers = {
+    "iostat": IostatParser,
+    "mpstat": MpstatParser,
+    "pidstat": PidstatParser,
+    "sar": SarParser,
+    "vmstat": VmstatParser,
+}
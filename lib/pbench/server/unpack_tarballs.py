@@ -2,8 +2,9 @@ from dataclasses import dataclass
 from logging import Logger
 from pathlib import Path
 import tempfile
+from time import perf_counter
 
-from pbench.server import PbenchServerConfig
+from pbench.server import metrics, PbenchServerConfig
 from pbench.server.cache_manager import CacheManager
 from pbench.server.database.models.datasets import Dataset, Metadata
 from pbench.server.report import Report
@@ -65,6 +66,7 @@ class UnpackTarballs:
         Returns:
             Results tuple containing the counts of Total and Successful tarballs.
         """
+        start = perf_counter()
         datasets = self.sync.next(Operation.UNPACK)
         tarlist: list[Target] = []
         for d in datasets:
@@ -105,6 +107,7 @@ class UnpackTarballs:
             )
             nsuccess += 1
 
+        metrics.record_run(self.sync.component, nsuccess, perf_counter() - start)
         return Results(total=ntotal, success=nsuccess)
 
     def report(self, prog: str, result_string: str):
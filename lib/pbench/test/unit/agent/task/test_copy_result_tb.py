@@ -4,6 +4,7 @@ import os
 from pathlib import Path
 
 import pytest
+import requests
 import responses
 
 from pbench.agent import PbenchAgentConfig
@@ -57,3 +58,109 @@ class TestCopyResults:
         assert str(excinfo.value).endswith(
             expected_error_message
         ), f"expected='...{expected_error_message}', found='{str(excinfo.value)}'"
+
+    @responses.activate
+    def test_copy_tar_parts(self):
+        tbname = Path(tarball)
+        size = tbname.stat().st_size
+        part_size = 100
+        parts = (size + part_size - 1) // part_size
+        assert parts > 2, "The test tar ball is too small to upload in parts"
+        session_url = f"http://pbench.example.com/api/v1/upload/session/{tbname.name}"
+        part_url = f"http://pbench.example.com/api/v1/upload/part/{tbname.name}"
+        responses.add(
+            responses.POST,
+            session_url,
+            json={"parts": parts, "received": [1]},
+            status=HTTPStatus.CREATED,
+        )
+        for part in range(2, parts + 1):
+            responses.add(
+                responses.PUT, f"{part_url}/{part}", status=HTTPStatus.CREATED
+            )
+        responses.add(responses.PUT, session_url, status=HTTPStatus.CREATED)
+        crt = CopyResultTb(
+            "controller", tbname, size, "someMD5", self.config, self.logger
+        )
+        crt.part_size = part_size
+        crt.copy_result_tb("token")
+
+        # The part already received is not resent, and the session is
+        # completed only after all the missing parts were sent.
+        urls = [c.request.url for c in responses.calls]
+        assert urls[0] == session_url
+        assert sorted(urls[1:-1]) == sorted(
+            f"{part_url}/{p}" for p in range(2, parts + 1)
+        )
+        assert urls[-1] == session_url
+        data = tbname.read_bytes()
+        for call in responses.calls[1:-1]:
+            part = int(call.request.url.rsplit("/", 1)[1])
+            length = int(call.request.headers["Content-Length"])
+            assert length == len(data[(part - 1) * part_size :][:part_size])
+
+    @responses.activate
+    def test_copy_tar_parts_retry(self, monkeypatch):
+        tbname = Path(tarball)
+        size = tbname.stat().st_size
+        session_url = f"http://pbench.example.com/api/v1/upload/session/{tbname.name}"
+        part_url = f"http://pbench.example.com/api/v1/upload/part/{tbname.name}"
+        responses.add(
+            responses.POST,
+            session_url,
+            json={"parts": 2, "received": [1]},
+            status=HTTPStatus.CREATED,
+        )
+        responses.add(
+            responses.PUT,
+            f"{part_url}/2",
+            body=requests.exceptions.ConnectionError("connection reset"),
+        )
+        responses.add(
+            responses.PUT, f"{part_url}/2", body=requests.exceptions.ReadTimeout()
+        )
+        responses.add(responses.PUT, f"{part_url}/2", status=HTTPStatus.CREATED)
+        responses.add(responses.PUT, session_url, status=HTTPStatus.CREATED)
+        delays = []
+        monkeypatch.setattr("pbench.agent.results.time.sleep", delays.append)
+        crt = CopyResultTb(
+            "controller", tbname, size, "someMD5", self.config, self.logger
+        )
+        crt.part_size = (size + 1) // 2
+        crt.copy_result_tb("token")
+
+        # The part is retried after each failure, with an increasing delay,
+        # and the session completed once it is sent.
+        part_calls = [c for c in responses.calls if c.request.url == f"{part_url}/2"]
+        assert len(part_calls) == 3
+        assert delays == [crt.PART_RETRY_DELAY, crt.PART_RETRY_DELAY * 2]
+        assert responses.calls[-1].request.url == session_url
+
+    @responses.activate
+    def test_copy_tar_parts_failure(self, monkeypatch):
+        tbname = Path(tarball)
+        size = tbname.stat().st_size
+        session_url = f"http://pbench.example.com/api/v1/upload/session/{tbname.name}"
+        part_url = f"http://pbench.example.com/api/v1/upload/part/{tbname.name}"
+        responses.add(
+            responses.POST,
+            session_url,
+            json={"parts": 2, "received": []},
+            status=HTTPStatus.CREATED,
+        )
+        responses.add(responses.PUT, f"{part_url}/1", status=HTTPStatus.CREATED)
+        responses.add(
+            responses.PUT, f"{part_url}/2", status=HTTPStatus.INTERNAL_SERVER_ERROR
+        )
+        crt = CopyResultTb(
+            "controller", tbname, size, "someMD5", self.config, self.logger
+        )
+        crt.part_size = (size + 1) // 2
+        monkeypatch.setattr("pbench.agent.results.time.sleep", lambda _: None)
+        with pytest.raises(CopyResultTb.FileUploadError) as excinfo:
+            crt.copy_result_tb("token")
+        assert str(excinfo.value).startswith("Parts [2] failed to upload")
+        assert not any(
+            c.request.method == "PUT" and c.request.url == session_url
+            for c in responses.calls
+        )
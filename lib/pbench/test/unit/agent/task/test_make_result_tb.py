@@ -10,6 +10,7 @@ import pytest
 from pbench.agent import PbenchAgentConfig
 from pbench.agent.results import MakeResultTb
 from pbench.common import MetadataLog
+from pbench.common.compression import CODECS, open_tar_stream
 from pbench.common.logger import get_pbench_logger
 from pbench.common.utils import md5sum
 from pbench.test.unit.agent.task.common import MockDatetime
@@ -127,3 +128,52 @@ class TestMakeResultTb:
                 assert tf_entry.name.startswith(
                     self.name
                 ), f"tar ball entry does not start with {self.name}, '{tf_entry.name}'"
+
+    def test_make_tb_zstd(self, monkeypatch):
+        monkeypatch.setattr(datetime, "datetime", MockDatetime)
+        self.config.conf.set("results", "compression", "zstd")
+        expected_tb = self.target_dir / f"{self.name}.tar.zst"
+        mrt = MakeResultTb(
+            self.result_dir, self.target_dir, self.controller, self.config, self.logger
+        )
+        tarball, tarball_len, tarball_md5 = mrt.make_result_tb()
+        assert tarball.samefile(expected_tb), f"{tarball} {expected_tb}"
+        calc_len, calc_md5 = md5sum(tarball)
+        assert (tarball_len, tarball_md5) == (calc_len, calc_md5)
+        with tarball.open("rb") as f, open_tar_stream(f, CODECS["zstd"]) as tf:
+            names = [tf_entry.name for tf_entry in tf]
+        assert f"{self.name}/metadata.log" in names
+
+    def test_bad_compression(self):
+        self.config.conf.set("results", "compression", "lz4")
+        with pytest.raises(ValueError) as exc:
+            MakeResultTb(
+                self.result_dir,
+                self.target_dir,
+                self.controller,
+                self.config,
+                self.logger,
+            )
+        assert "Unsupported result tar ball compression 'lz4'" in str(exc.value)
+
+    def test_raw_size(self):
+        sub = self.result_dir / "sub" / "dir"
+        sub.mkdir(parents=True)
+        (sub / "data.txt").write_text("x" * 4096)
+        (self.result_dir / "link").symlink_to(sub, target_is_directory=True)
+        expected = sum(f.stat().st_size for f in self.result_dir.rglob("*"))
+        assert MakeResultTb._raw_size(self.result_dir) == expected
+
+    def test_make_tb_write_md5(self, monkeypatch):
+        monkeypatch.setattr(datetime, "datetime", MockDatetime)
+        mrt = MakeResultTb(
+            self.result_dir, self.target_dir, self.controller, self.config, self.logger
+        )
+        tarball, tarball_len, tarball_md5 = mrt.make_result_tb(write_md5=True)
+        assert md5sum(tarball) == (tarball_len, tarball_md5)
+        md5_file = Path(f"{tarball}.md5")
+        assert md5_file.read_text() == f"{tarball_md5}  {tarball.name}\n"
+        mdlog = MetadataLog()
+        with (self.result_dir / "metadata.log").open() as fp:
+            mdlog.read_file(fp)
+        assert int(mdlog.get("run", "raw_size")) > 0
@@ -4,6 +4,7 @@ import logging
 from click.testing import CliRunner
 import responses
 
+from pbench.agent import PbenchAgentConfig
 from pbench.cli.agent.commands.results.move import main
 from pbench.test.unit.agent.task.common import MockDatetime
 
@@ -182,3 +183,109 @@ class TestMoveResults:
             result.stdout
             == "Status: total # of result directories considered 1, successfully moved 1, encountered 0 failures\n"
         )
+
+    @staticmethod
+    @responses.activate
+    def test_results_move_pipeline(monkeypatch, caplog, setup):
+        """Several result directories are moved concurrently, and an upload
+        which fails once is retried.
+        """
+        monkeypatch.setenv("_pbench_full_hostname", "localhost")
+        monkeypatch.setattr(datetime, "datetime", MockDatetime)
+        overrides = {
+            "move_compressors": "2",
+            "move_uploaders": "2",
+            "move_retry_backoff": "0",
+        }
+        get = PbenchAgentConfig.get
+
+        def mock_get(self, section, option, **kwargs):
+            if section == "results" and option in overrides:
+                return overrides[option]
+            return get(self, section, option, **kwargs)
+
+        monkeypatch.setattr(PbenchAgentConfig, "get", mock_get)
+
+        pbrun = setup["tmp"] / "var" / "lib" / "pbench-agent"
+        script = "pbench-user-benchmark"
+        date = "YYYY.MM.DDTHH.MM.SS"
+        names = []
+        for config in ("run-a", "run-b", "run-c"):
+            name = f"{script}_{config}_{date}"
+            names.append(name)
+            (pbrun / name).mkdir(parents=True)
+            (pbrun / name / "metadata.log").write_text(mdlog_tmpl.format(**locals()))
+            url = f"{TestMoveResults.URL}/upload/{name}.tar.xz"
+            if config == "run-b":
+                responses.add(responses.PUT, url, status=503)
+            responses.add(responses.PUT, url, status=200)
+
+        caplog.set_level(logging.DEBUG)
+        runner = CliRunner(mix_stderr=False)
+        result = runner.invoke(
+            main,
+            args=[
+                TestMoveResults.CTRL_SWITCH,
+                TestMoveResults.CTRL_TEXT,
+                TestMoveResults.TOKN_SWITCH,
+                TestMoveResults.TOKN_TEXT,
+            ],
+        )
+        assert (
+            result.exit_code == 0
+        ), f"Expected a successful operation, exit_code = {result.exit_code:d}, stderr: {result.stderr}, stdout: {result.stdout}"
+        assert (
+            result.stdout
+            == "Status: total # of result directories considered 3, successfully moved 3, encountered 0 failures\n"
+        )
+        assert len(responses.calls) == 4
+        for name in names:
+            assert not (pbrun / name).exists()
+        assert "retrying in 0.0 seconds" in caplog.text
+
+    @staticmethod
+    @responses.activate
+    def test_results_move_upload_failure(monkeypatch, setup):
+        """An upload which keeps failing stops the move, keeping the result
+        directory.
+        """
+        monkeypatch.setenv("_pbench_full_hostname", "localhost")
+        monkeypatch.setattr(datetime, "datetime", MockDatetime)
+        get = PbenchAgentConfig.get
+        monkeypatch.setattr(
+            PbenchAgentConfig,
+            "get",
+            lambda self, section, option, **kwargs: "0"
+            if option == "move_retry_backoff"
+            else get(self, section, option, **kwargs),
+        )
+
+        pbrun = setup["tmp"] / "var" / "lib" / "pbench-agent"
+        script, config, date = "pbench-user-benchmark", "fail", "YYYY.MM.DDTHH.MM.SS"
+        name = f"{script}_{config}_{date}"
+        (pbrun / name).mkdir(parents=True)
+        (pbrun / name / "metadata.log").write_text(mdlog_tmpl.format(**locals()))
+        responses.add(
+            responses.PUT,
+            f"{TestMoveResults.URL}/upload/{name}.tar.xz",
+            status=500,
+        )
+
+        runner = CliRunner(mix_stderr=False)
+        result = runner.invoke(
+            main,
+            args=[
+                TestMoveResults.CTRL_SWITCH,
+                TestMoveResults.CTRL_TEXT,
+                TestMoveResults.TOKN_SWITCH,
+                TestMoveResults.TOKN_TEXT,
+            ],
+        )
+        assert result.exit_code == 1
+        assert (
+            result.stdout
+            == "Status: total # of result directories considered 1, successfully moved 0, encountered 1 failures\n"
+        )
+        # The initial attempt plus the default two retries
+        assert len(responses.calls) == 3
+        assert (pbrun / name / "metadata.log").exists()
@@ -0,0 +1,196 @@
+"""Tests for the accounting of the resources used by the tool processes.
+"""
+import json
+import logging
+import os
+from pathlib import Path
+
+import pytest
+
+from pbench.agent.overhead import (
+    OverheadMonitor,
+    process_trees,
+    read_proc_stats,
+    summarize_overhead,
+    write_overhead,
+)
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class FakeProc:
+    """A /proc hierarchy holding the processes we set up."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        root.mkdir()
+        (root / "self").mkdir()
+        (root / "meminfo").write_text("MemTotal: 1 kB\n")
+
+    def set(
+        self,
+        pid: int,
+        ppid: int,
+        comm: str = "sar",
+        utime: int = 0,
+        stime: int = 0,
+        rss: int = 0,
+        io: bool = True,
+        reads: int = 0,
+        writes: int = 0,
+        ctxt: int = 0,
+    ):
+        """Create or update a process, CPU times in seconds, RSS in pages."""
+        d = self.root / str(pid)
+        d.mkdir(exist_ok=True)
+        fields = ["S", str(ppid)] + ["0"] * 9
+        fields += [str(utime * CLK_TCK), str(stime * CLK_TCK)] + ["0"] * 8
+        fields += [str(rss)] + ["0"] * 20
+        (d / "stat").write_text(f"{pid} ({comm}) {' '.join(fields)}\n")
+        if io:
+            (d / "io").write_text(
+                f"rchar: 1\nwchar: 2\nread_bytes: {reads}\nwrite_bytes: {writes}\n"
+            )
+        (d / "status").write_text(
+            f"Name:\t{comm}\nvoluntary_ctxt_switches:\t{ctxt}\n"
+            f"nonvoluntary_ctxt_switches:\t{ctxt // 2}\n"
+        )
+
+    def kill(self, pid: int):
+        for f in (self.root / str(pid)).iterdir():
+            f.unlink()
+        (self.root / str(pid)).rmdir()
+
+
+@pytest.fixture
+def proc(tmp_path) -> FakeProc:
+    return FakeProc(tmp_path / "proc")
+
+
+class TestProcStats:
+    def test_read(self, proc):
+        proc.set(42, 1, comm="my (odd) tool", utime=3, stime=1, rss=10, reads=7)
+        st = read_proc_stats(42, proc.root)
+        assert st.ppid == 1
+        assert (st.utime, st.stime) == (3, 1)
+        assert st.rss == 10 * PAGE_SIZE
+        assert (st.read_bytes, st.write_bytes) == (7, 0)
+
+    def test_no_io(self, proc):
+        """The I/O counters of processes of other users are not readable."""
+        proc.set(42, 1, io=False, ctxt=10)
+        st = read_proc_stats(42, proc.root)
+        assert (st.read_bytes, st.voluntary, st.involuntary) == (0, 10, 5)
+
+    def test_gone(self, proc):
+        assert read_proc_stats(42, proc.root) is None
+
+    def test_process_trees(self, proc):
+        proc.set(10, 1)
+        proc.set(11, 10)
+        proc.set(12, 11)
+        proc.set(20, 1)
+        proc.set(21, 20)
+        assert process_trees({10, 99}, proc.root) == {10, 11, 12}
+        assert process_trees({20}, proc.root) == {20, 21}
+
+
+class TestOverheadMonitor:
+    def test_summaries(self, proc):
+        """The usage of a tool's whole process tree is summed, including the
+        processes which exited before the last sample; only the usage since
+        the first sample counts for tools using a baseline.
+        """
+        proc.set(10, 1, utime=1, rss=100, ctxt=2)
+        proc.set(30, 1, utime=100, stime=50, writes=1000)
+        monitor = OverheadMonitor(logging.getLogger(), proc=proc.root)
+        monitor.add("sar", lambda: [10])
+        monitor.add("node-exporter", lambda: [30], baseline=True)
+        monitor.add("iostat", lambda: [])
+        monitor.sample()
+
+        proc.set(10, 1, utime=2, rss=100, ctxt=4)
+        proc.set(11, 10, utime=4, stime=2, rss=200, reads=5)
+        proc.set(30, 1, utime=110, stime=51, writes=3000)
+        monitor.sample()
+        proc.kill(11)
+        proc.set(10, 1, utime=3, stime=1, rss=50, ctxt=6)
+
+        docs = {d["tool"]: d for d in monitor.stop()}
+        assert sorted(docs) == ["iostat", "node-exporter", "sar"]
+
+        sar = docs["sar"]
+        assert sar["samples"] == 3
+        assert sar["processes"] == 2
+        assert sar["cpu"]["user"] == 7 and sar["cpu"]["system"] == 3
+        assert sar["memory"]["rss_max"] == 300 * PAGE_SIZE
+        assert sar["io"] == {"read_bytes": 5, "write_bytes": 0}
+        assert sar["ctxt_switches"] == {"voluntary": 6, "involuntary": 3}
+
+        node = docs["node-exporter"]
+        assert node["cpu"]["user"] == 10 and node["cpu"]["system"] == 1
+        assert node["io"]["write_bytes"] == 2000
+
+        assert docs["iostat"]["processes"] == 0
+        assert docs["iostat"]["cpu"]["percent"] == 0
+
+    def test_thread(self, proc):
+        proc.set(10, 1, utime=1)
+        monitor = OverheadMonitor(logging.getLogger(), interval=0.01, proc=proc.root)
+        monitor.add("sar", lambda: [10])
+        monitor.start()
+        try:
+            while monitor._accounts["sar"].samples < 3:
+                pass
+        finally:
+            (doc,) = monitor.stop()
+        assert doc["samples"] >= 4
+        assert doc["duration"] >= 0
+
+    def test_bad_pids(self, proc, caplog):
+        def pids():
+            raise AttributeError("no process")
+
+        monitor = OverheadMonitor(logging.getLogger(), proc=proc.root)
+        monitor.add("perf", pids)
+        monitor.sample()
+        assert "Failed to find the perf processes" in caplog.text
+
+
+def test_write_and_summarize(tmp_path):
+    doc = {
+        "@timestamp": 1.5,
+        "tool": "sar",
+        "duration": 10.0,
+        "samples": 2,
+        "processes": 1,
+        "cpu": {"user": 0.5, "system": 0.5, "percent": 10.0},
+        "memory": {"rss_max": 100},
+        "io": {"read_bytes": 1, "write_bytes": 2},
+        "ctxt_switches": {"voluntary": 3, "involuntary": 4},
+    }
+    paths = []
+    for i, rss in enumerate((100, 300)):
+        paths.append(
+            write_overhead(tmp_path / str(i), [dict(doc, memory={"rss_max": rss})])
+        )
+    assert paths[0] == tmp_path / "0/tool-overhead/json/tool-overhead.json"
+    assert json.loads(paths[0].read_text()) == [doc]
+    bad = tmp_path / "bad.json"
+    bad.write_text("[")
+
+    assert summarize_overhead(paths + [bad, tmp_path / "missing.json"]) == {
+        "sar": {
+            "intervals": 2,
+            "duration": 20.0,
+            "cpu_user": 1.0,
+            "cpu_system": 1.0,
+            "cpu_percent": 10.0,
+            "rss_max": 300,
+            "read_bytes": 2,
+            "write_bytes": 4,
+            "ctxt_voluntary": 6,
+            "ctxt_involuntary": 8,
+        }
+    }
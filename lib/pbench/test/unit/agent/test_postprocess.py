@@ -0,0 +1,113 @@
+"""Tests for the parallel post-processing of tool data.
+"""
+from pathlib import Path
+import time
+
+import pytest
+
+from pbench.agent import postprocess
+from pbench.agent.postprocess import DONE_FILE, find_jobs, host_jobs, LOG_FILE, run_jobs
+from pbench.agent.tool_group import ToolGroup
+
+
+@pytest.fixture
+def tool_scripts(tmp_path) -> Path:
+    """A tool-scripts directory where "iostat" and "mpstat" succeed, "sar"
+    fails, and "vmstat" is not executable.
+    """
+    scripts = tmp_path / "tool-scripts"
+    scripts.mkdir()
+    for tool, status in (("iostat", 0), ("mpstat", 0), ("sar", 3), ("pcp", 0)):
+        script = scripts / tool
+        script.write_text(
+            f"#!/bin/sh\necho {tool}: post-processing data in ${{2#--dir=}}\n"
+            f"sleep 0.2\nexit {status}\n"
+        )
+        script.chmod(0o755)
+    (scripts / "vmstat").write_text("#!/bin/sh\n")
+    return scripts
+
+
+class TestHostJobs:
+    def test_skipped_tools(self, tmp_path, tool_scripts):
+        host_dir = tmp_path / "host"
+        host_dir.mkdir()
+        jobs = host_jobs(
+            host_dir, ["vmstat", "sar", "bogus", "pcp", "iostat"], tool_scripts
+        )
+        assert [j.tool for j in jobs] == ["iostat", "sar"]
+        assert jobs[0].args == [
+            str(tool_scripts / "iostat"),
+            "--postprocess",
+            f"--dir={host_dir}",
+        ]
+
+    def test_done_tools(self, tmp_path, tool_scripts):
+        host_dir = tmp_path / "host"
+        host_dir.mkdir()
+        (host_dir / DONE_FILE).write_text("iostat\n")
+        jobs = host_jobs(host_dir, ["iostat", "mpstat"], tool_scripts)
+        assert [j.tool for j in jobs] == ["mpstat"]
+
+
+class TestFindJobs:
+    def test_hosts(self, tmp_path, tool_scripts, monkeypatch):
+        pbench_run = tmp_path / "run"
+        for host in ("h1", "h2", "h3"):
+            (pbench_run / "tools-v1-default" / host).mkdir(parents=True)
+            (pbench_run / "tools-v1-default" / host / "iostat").write_text("")
+        out = tmp_path / "tools-default"
+        (out / "h1").mkdir(parents=True)
+        (out / "h3").mkdir()
+        warnings = []
+        monkeypatch.setattr(postprocess, "warn_log", warnings.append)
+
+        jobs, missing = find_jobs(
+            ToolGroup("default", str(pbench_run)), out, tool_scripts
+        )
+        assert [j.host_dir.name for j in jobs] == ["h1", "h3"]
+        assert missing == 1
+        assert len(warnings) == 1 and "/tools-default/h2'" in warnings[0]
+
+
+class TestRunJobs:
+    def test_no_jobs(self):
+        assert run_jobs([]) == 0
+
+    def test_parallel(self, tmp_path, tool_scripts):
+        """The jobs run concurrently, each one's output and timing goes to its
+        host's log, and failures are counted and reported.
+        """
+        jobs = []
+        for host in ("h1", "h2"):
+            host_dir = tmp_path / host
+            host_dir.mkdir()
+            jobs += host_jobs(host_dir, ["iostat", "mpstat", "sar"], tool_scripts)
+        failed = []
+
+        start = time.perf_counter()
+        failures = run_jobs(jobs, workers=6, report_failure=failed.append)
+        elapsed = time.perf_counter() - start
+
+        assert failures == 2
+        assert sorted(r.job.host_dir.name for r in failed) == ["h1", "h2"]
+        assert {r.returncode for r in failed} == {3}
+        # Six jobs of 0.2 seconds each, run at the same time.
+        assert elapsed < 1.0
+        log = (tmp_path / "h1" / LOG_FILE).read_text()
+        for tool, status in (("iostat", 0), ("mpstat", 0), ("sar", 3)):
+            assert f"+++ {tool} --postprocess --dir={tmp_path / 'h1'}\n" in log
+            assert f"{tool}: post-processing data in {tmp_path / 'h1'}\n" in log
+            assert f"--- {tool}: exit status {status}, " in log
+        assert not (tmp_path / "h1" / DONE_FILE).exists()
+
+    def test_record_done(self, tmp_path, tool_scripts):
+        host_dir = tmp_path / "h1"
+        host_dir.mkdir()
+        jobs = host_jobs(host_dir, ["iostat", "sar"], tool_scripts)
+        assert run_jobs(jobs, workers=1, record_done=True) == 1
+        assert (host_dir / DONE_FILE).read_text() == "iostat\n"
+        # Only the failed tool is left to post-process.
+        assert [
+            j.tool for j in host_jobs(host_dir, ["iostat", "sar"], tool_scripts)
+        ] == ["sar"]
@@ -0,0 +1,322 @@
+"""Tests for the Redis convenience classes of the Tool Meister transports.
+"""
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+import pytest
+import redis
+
+from pbench.agent.redis_utils import (
+    open_subscriber,
+    redis_publish,
+    RedisChannelSubscriberError,
+    RedisHandler,
+    RedisStreamSubscriber,
+    streams_supported,
+)
+
+
+class FakeStreamRedis:
+    """An in-memory Redis client providing the subset of stream commands used
+    by the Tool Meister transports.
+    """
+
+    def __init__(self):
+        self.streams: Dict[str, List[Tuple[bytes, Dict[bytes, bytes]]]] = {}
+        # (stream, group) -> {"next": index of the next new entry, "pending": ids}
+        self.groups: Dict[Tuple[str, str], Dict] = {}
+        self.published = []
+        self.fail_reads = 0
+        self.version = "6.2.6"
+
+    def publish(self, name, message):
+        self.published.append((name, message))
+        return 3
+
+    def info(self, section):
+        if self.version is None:
+            raise redis.ConnectionError("no server")
+        return {"redis_version": self.version}
+
+    def xgroup_create(self, name, groupname, id="$", mkstream=False):
+        assert mkstream and id == "0"
+        self.streams.setdefault(name, [])
+        if (name, groupname) in self.groups:
+            raise redis.ResponseError("BUSYGROUP Consumer Group name already exists")
+        self.groups[(name, groupname)] = {"next": 0, "pending": []}
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        entries = self.streams.setdefault(name, [])
+        entry_id = f"{len(entries) + 1}-0".encode()
+        entries.append((entry_id, {k.encode(): v.encode() for k, v in fields.items()}))
+        return entry_id
+
+    def xinfo_groups(self, name):
+        return [g for (s, g) in self.groups if s == name]
+
+    def delete(self, name):
+        self.streams.pop(name, None)
+        for key in [k for k in self.groups if k[0] == name]:
+            del self.groups[key]
+
+    def _group(self, name, groupname):
+        try:
+            return self.groups[(name, groupname)]
+        except KeyError:
+            raise redis.ResponseError(
+                f"NOGROUP No such key '{name}' or consumer group '{groupname}'"
+            )
+
+    def xreadgroup(self, groupname, consumername, streams, count=None, block=None):
+        if self.fail_reads:
+            self.fail_reads -= 1
+            raise redis.ConnectionError("Connection closed by server.")
+        ((name, last_id),) = streams.items()
+        group = self._group(name, groupname)
+        entries = self.streams[name]
+        if last_id == "0":
+            found = [e for e in entries if e[0] in group["pending"]][:count]
+        else:
+            assert block is not None
+            found = entries[group["next"] :][:count]
+            group["next"] += len(found)
+            group["pending"].extend(e[0] for e in found)
+        return [[name.encode(), found]] if found or last_id == "0" else []
+
+    def xack(self, name, groupname, *ids):
+        pending = self._group(name, groupname)["pending"]
+        for entry_id in ids:
+            pending.remove(entry_id)
+        return len(ids)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.client, n)(*a, **kw) for n, a, kw in self.calls]
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeStreamRedis()
+
+
+def take(subscriber: RedisStreamSubscriber, count: int) -> List[str]:
+    """Read count messages, closing the generator after the last one."""
+    messages = []
+    for msg in subscriber.fetch_message(logging.getLogger()):
+        messages.append(msg)
+        if len(messages) == count:
+            break
+    return messages
+
+
+def take_json(subscriber, count):
+    for data in subscriber.fetch_json(logging.getLogger()):
+        yield data
+        count -= 1
+        if count == 0:
+            break
+
+
+class TestPublish:
+    def test_pubsub(self, fake_redis):
+        assert redis_publish(fake_redis, "chan", "hello") == 3
+        assert fake_redis.published == [("chan", "hello")]
+
+    def test_streams(self, fake_redis):
+        """Every consumer group of a stream receives every message, and the
+        number of groups is returned.
+        """
+        tm1 = open_subscriber(fake_redis, "to-tms", "streams", group_name="tm-1")
+        tm2 = open_subscriber(fake_redis, "to-tms", "streams", group_name="tm-2")
+        for action in ("start", "stop"):
+            assert redis_publish(fake_redis, "to-tms", action, "streams") == 2
+        assert fake_redis.published == []
+        assert take(tm1, 2) == ["start", "stop"]
+        assert take(tm2, 2) == ["start", "stop"]
+
+
+class TestRedisStreamSubscriber:
+    def test_messages_before_subscribing(self, fake_redis):
+        """Unlike pub/sub, messages sent before the reader starts are kept."""
+        redis_publish(fake_redis, "from-tms", '{"kind": "tm"}', "streams")
+        sub = RedisStreamSubscriber(fake_redis, "from-tms", "tds")
+        assert list(take_json(sub, 1)) == [{"kind": "tm"}]
+
+    def test_existing_group(self, fake_redis):
+        RedisStreamSubscriber(fake_redis, "s", "tds")
+        RedisStreamSubscriber(fake_redis, "s", "tds")
+        assert fake_redis.xinfo_groups("s") == ["tds"]
+
+    def test_bad_group(self, fake_redis, monkeypatch):
+        def xgroup_create(*args, **kwargs):
+            raise redis.ResponseError("WRONGTYPE Operation against a key")
+
+        monkeypatch.setattr(fake_redis, "xgroup_create", xgroup_create)
+        with pytest.raises(RedisChannelSubscriberError):
+            RedisStreamSubscriber(fake_redis, "s", "tds")
+
+    def test_unread_batch_replayed(self, fake_redis):
+        """Messages of a batch not consumed by a reader which stopped early
+        are read by its next fetch, the consumed ones are acknowledged.
+        """
+        sub = RedisStreamSubscriber(fake_redis, "s", "tds", batch=10)
+        for i in range(4):
+            redis_publish(fake_redis, "s", f"m{i}", "streams")
+        assert take(sub, 1) == ["m0"]
+        assert fake_redis.groups[("s", "tds")]["pending"] == [
+            b"2-0",
+            b"3-0",
+            b"4-0",
+        ]
+        assert take(sub, 3) == ["m1", "m2", "m3"]
+        assert fake_redis.groups[("s", "tds")]["pending"] == []
+
+    def test_reconnect(self, fake_redis, caplog):
+        """A lost connection is retried, and no message is lost."""
+        sub = RedisStreamSubscriber(fake_redis, "s", "tds")
+        redis_publish(fake_redis, "s", "m0", "streams")
+        fake_redis.fail_reads = 2
+        with caplog.at_level(logging.INFO):
+            assert take(sub, 1) == ["m0"]
+        assert "re-connecting" in caplog.text
+        assert "re-connected" in caplog.text
+
+    def test_stream_deleted(self, fake_redis, caplog):
+        """The reader stops when its stream is deleted while it reads it."""
+        sub = RedisStreamSubscriber(fake_redis, "s", "tds")
+        for msg in ("m0", "m1"):
+            redis_publish(fake_redis, "s", msg, "streams")
+        messages = []
+        with caplog.at_level(logging.WARNING):
+            for msg in sub.fetch_message(logging.getLogger()):
+                messages.append(msg)
+                fake_redis.delete("s")
+        assert messages == ["m0", "m1"]
+        assert "was deleted" in caplog.text
+
+    def test_close(self, fake_redis):
+        sub = RedisStreamSubscriber(fake_redis, "s", "tds")
+        for msg in ("m0", "m1"):
+            redis_publish(fake_redis, "s", msg, "streams")
+        messages = []
+        for msg in sub.fetch_message(logging.getLogger()):
+            messages.append(msg)
+            sub.close()
+        # The rest of the batch is still delivered, then the reader stops.
+        assert messages == ["m0", "m1"]
+        assert fake_redis.groups[("s", "tds")]["pending"] == []
+
+
+class TestRedisHandler:
+    @staticmethod
+    def make_logger(handler: RedisHandler) -> logging.Logger:
+        handler.setFormatter(logging.Formatter("%(levelname)s -- %(message)s"))
+        logger = logging.getLogger(f"test-redis-handler-{id(handler)}")
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        return logger
+
+    def test_batches(self, fake_redis):
+        """Records are published in batches, one record per line, and the
+        queued ones are published when the handler is closed.
+        """
+        gate = threading.Event()
+        publish = fake_redis.publish
+
+        def slow_publish(name, message):
+            gate.wait()
+            return publish(name, message)
+
+        fake_redis.publish = slow_publish
+        rh = RedisHandler("logs", hostname="tm1", redis_client=fake_redis, batch=4)
+        logger = self.make_logger(rh)
+        for i in range(10):
+            logger.debug("message %d", i)
+        gate.set()
+        rh.close()
+
+        lines = []
+        for name, message in fake_redis.published:
+            assert name == "logs"
+            assert len(message.split("\n")) <= 4
+            lines.extend(message.split("\n"))
+        assert lines == [f"tm1 {i:04d} DEBUG -- message {i}" for i in range(10)]
+        assert len(fake_redis.published) > 1
+        assert (rh.counter, rh.dropped, rh.overflow) == (10, 0, 0)
+
+    def test_overflow(self, fake_redis):
+        """When the queue is full, records are dropped and accounted for."""
+        gate = threading.Event()
+        publishing = threading.Event()
+        publish = fake_redis.publish
+
+        def blocked_publish(name, message):
+            publishing.set()
+            gate.wait()
+            return publish(name, message)
+
+        fake_redis.publish = blocked_publish
+        rh = RedisHandler(
+            "logs", hostname="tm1", redis_client=fake_redis, batch=1, queue_size=2
+        )
+        logger = self.make_logger(rh)
+        logger.info("message 0")
+        assert publishing.wait(5)
+        for i in range(1, 8):
+            logger.info("message %d", i)
+        logger.warning("a warning")
+        gate.set()
+        rh.close()
+
+        # The publisher holds the first record while blocked, two more are
+        # queued, the rest are dropped, and reported with the next batch.
+        assert rh.overflow == 6
+        assert [m for _, m in fake_redis.published] == [
+            "tm1 0000 INFO -- message 0",
+            "tm1 0001 INFO -- message 1\n"
+            "tm1 0009 WARNING RedisHandler -- 6 log records dropped, the queue is full",
+            "tm1 0002 INFO -- message 2",
+        ]
+
+    def test_no_subscribers(self, fake_redis):
+        fake_redis.publish = lambda name, message: 0
+        rh = RedisHandler("logs", hostname="tm1", redis_client=fake_redis)
+        logger = self.make_logger(rh)
+        logger.info("one")
+        rh.flush()
+        logger.info("two")
+        rh.close()
+        assert rh.dropped == 2
+
+    def test_redis_errors(self, fake_redis):
+        def publish(name, message):
+            raise redis.ConnectionError("no server")
+
+        fake_redis.publish = publish
+        rh = RedisHandler("logs", hostname="tm1", redis_client=fake_redis)
+        logger = self.make_logger(rh)
+        logger.info("one")
+        rh.close()
+        assert rh.redis_errors == 1
+
+
+@pytest.mark.parametrize(
+    "version,expected",
+    [("4.0.9", False), ("5.0.3", True), ("7.2.0", True), (None, False)],
+)
+def test_streams_supported(fake_redis, version, expected):
+    fake_redis.version = version
+    assert streams_supported(fake_redis) is expected
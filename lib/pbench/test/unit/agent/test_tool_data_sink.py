@@ -1,22 +1,31 @@
 """Tests for the Tool Data Sink module.
 """
 
+import hashlib
 from http import HTTPStatus
 from io import BytesIO
 import logging
+from pathlib import Path
 import shutil
-from threading import Condition, Lock, Thread
+import subprocess
+from threading import Barrier, Condition, Lock, Thread
 import time
 from unittest.mock import patch
 from wsgiref.simple_server import WSGIRequestHandler
 
+from bottle import HTTPError
 import pytest
+import requests
 
 from pbench.agent import tool_data_sink
 from pbench.agent.tool_data_sink import (
     BenchmarkRunDir,
     DataSinkWsgiServer,
+    ExternalEnvironment,
+    ToolDataSink,
     ToolDataSinkError,
+    ToolDataSinkParams,
+    UploadSlots,
 )
 
 
@@ -477,3 +486,254 @@ class TestDataSinkWsgiServer:
                     assert len(mocked_servers) == 0
                     caplog_idx += 1
                 assert len(caplog.records) == caplog_idx
+
+
+class TestReadChunked:
+    """Test decoding a request body sent with the "chunked" transfer
+    encoding.
+    """
+
+    def test_read_chunked(self):
+        body = BytesIO(b"5\r\nhello\r\n7;ext=1\r\n, world\r\n0\r\nTrailer: x\r\n\r\n")
+        assert b"".join(ToolDataSink._read_chunked(body)) == b"hello, world"
+
+    @pytest.mark.parametrize(
+        "body",
+        [b"x\r\nhello\r\n0\r\n\r\n", b"5\r\nhel", b"5\r\nhello, world\r\n0\r\n\r\n"],
+    )
+    def test_read_chunked_invalid(self, body):
+        with pytest.raises(HTTPError) as exc:
+            b"".join(ToolDataSink._read_chunked(BytesIO(body)))
+        assert exc.value.status_code == HTTPStatus.BAD_REQUEST
+
+
+class TestUploadSlots:
+    """Verify the limits on the Tool Meisters uploading at the same time."""
+
+    def test_reserve(self):
+        slots = UploadSlots(2)
+        assert slots.reserve("a") and slots.reserve("b")
+        assert not slots.reserve("c")
+        # Reserving again keeps the slot.
+        assert slots.reserve("a")
+        assert slots.waiting(["a", "b", "c", "d"]) == 2
+        slots.release("a")
+        assert slots.reserve("c")
+
+    def test_expire(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr(tool_data_sink.time, "monotonic", lambda: now[0])
+        slots = UploadSlots(1, ttl=30)
+        assert slots.reserve("a")
+        now[0] += 20
+        assert not slots.reserve("b")
+        now[0] += 20
+        assert slots.reserve("b")
+
+    def test_uploading_does_not_expire(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr(tool_data_sink.time, "monotonic", lambda: now[0])
+        slots = UploadSlots(1, ttl=30)
+        slots.acquire("a")
+        now[0] += 60
+        assert not slots.reserve("b")
+
+    def test_upload_time(self):
+        slots = UploadSlots(1)
+        slots.acquire("a")
+        slots.release("a", 6.0)
+        assert slots.upload_time == pytest.approx(2.0)
+        # A reservation given back without an upload does not count.
+        assert slots.reserve("b")
+        slots.release("b")
+        assert slots.upload_time == pytest.approx(2.0)
+
+    def test_reserve_waits(self):
+        """A slot freed while waiting is reserved."""
+        slots = UploadSlots(1)
+        slots.acquire("a")
+        thr = Thread(target=lambda: (time.sleep(0.1), slots.release("a")))
+        thr.start()
+        assert not slots.reserve("b")
+        assert slots.reserve("b", wait=5)
+        thr.join()
+
+    def test_acquire_waits(self):
+        """A PUT request without a reserved slot waits for one."""
+        slots = UploadSlots(1)
+        assert slots.reserve("a")
+        trace = []
+
+        def upload():
+            slots.acquire("b")
+            trace.append("b")
+
+        thr = Thread(target=upload)
+        thr.start()
+        slots.acquire("a")
+        time.sleep(0.1)
+        trace.append("a")
+        slots.release("a")
+        thr.join()
+        assert trace == ["a", "b"]
+        assert slots.waiting(["a", "b"]) == 1
+
+
+class TestTmLogCapture:
+    """Verify the capture of the Tool Meister logs into tm.logs."""
+
+    class MockLoggingChannel:
+        def __init__(self):
+            self.ended = Condition()
+            self.done = False
+
+        def fetch_message(self, logger):
+            yield "tm1 first record"
+            # No more messages arrive for a while.
+            with self.ended:
+                self.ended.wait_for(lambda: self.done, timeout=5)
+            yield "tm1 last record"
+
+        def end(self):
+            with self.ended:
+                self.done = True
+                self.ended.notify()
+
+    def test_flushed_while_idle(self, tmp_path, monkeypatch):
+        """Records are written out even when no more messages arrive, and
+        all of them are when the capture ends.
+        """
+        monkeypatch.setattr(tool_data_sink, "_TM_LOG_FLUSH_INTERVAL", 0.01)
+        (tmp_path / "tm").mkdir()
+        tds = ToolDataSink.__new__(ToolDataSink)
+        tds.benchmark_run_dir = BenchmarkRunDir(str(tmp_path), str(tmp_path))
+        tds.logger = logging.getLogger()
+        tds._lock = Lock()
+        tds._tm_log_capture_thread_cv = Condition(lock=tds._lock)
+        tds._to_logging_chan = self.MockLoggingChannel()
+        tm_logs = tmp_path / "tm" / "tm.logs"
+
+        thr = Thread(target=tds.tm_log_capture)
+        thr.start()
+        try:
+            timeout = time.monotonic() + 5
+            while (
+                not tm_logs.exists() or tm_logs.read_text() == ""
+            ) and time.monotonic() < timeout:
+                time.sleep(0.01)
+            assert tm_logs.read_text() == "tm1 first record\n"
+        finally:
+            tds._to_logging_chan.end()
+            thr.join()
+        assert tm_logs.read_text() == "tm1 first record\ntm1 last record\n"
+
+
+class TestPutStream:
+    """Verify tool data streamed to a running Tool Data Sink."""
+
+    HOSTS = ("tm0.example.com", "tm1.example.com", "tm2.example.com")
+
+    @pytest.fixture
+    def tds(self, tmp_path):
+        logger = logging.getLogger("test_put_stream")
+        run_dir = tmp_path / "pbench-run" / "benchmark"
+        directory = run_dir / "tools-default"
+        directory.mkdir(parents=True)
+        ext_env = ExternalEnvironment(
+            cp_path="cp",
+            hostname="tds.example.com",
+            logger_name="tds",
+            pbench_bin=Path("/opt/pbench-agent"),
+            pbench_run=str(tmp_path / "pbench-run"),
+            prog_name="test_put_stream",
+            tar_path=shutil.which("tar"),
+        )
+        params = ToolDataSinkParams(
+            benchmark_run_dir=str(run_dir),
+            bind_hostname="127.0.0.1",
+            channel_prefix="test",
+            optional_md={},
+            port="0",
+            tool_group="default",
+            tool_metadata={"persistent": {}, "transient": {}},
+            tool_trigger=None,
+            tools={},
+            instance_uuid="test",
+            max_uploads=len(self.HOSTS) + 1,
+            max_extracts=1,
+        )
+        tds = ToolDataSink(ext_env, None, "localhost", 0, params, logger)
+        tds.add_routes()
+        server = DataSinkWsgiServer(host="127.0.0.1", port=0, logger=logger)
+        server_thread = Thread(target=tds.run, kwargs={"server": server, "quiet": True})
+        server_thread.start()
+        try:
+            _, err_code = server.wait()
+            assert err_code == 0, "failed to start the WSGI server"
+            # Bottle refuses to re-assign an application's attributes.
+            vars(tds).update(
+                action="send",
+                directory=directory,
+                data_ctx=hashlib.md5(str(directory).encode("utf-8")).hexdigest(),
+                _tm_tracking={
+                    hostname: {"posted": "waiting", "transient_tools": ["iostat"]}
+                    for hostname in self.HOSTS
+                },
+            )
+            yield tds, server._server.server_port
+        finally:
+            server.stop()
+            server_thread.join()
+
+    def test_streams_exceed_extract_slots(self, tds, tmp_path, monkeypatch):
+        """More streams than extraction slots are received at the same time:
+        each stream waits, after its first chunk, for all the others to
+        start arriving, which never happens if receiving a stream holds an
+        extraction slot.
+        """
+        tds, port = tds
+        started = Barrier(len(self.HOSTS), timeout=5)
+        read_chunked = ToolDataSink._read_chunked
+
+        def barrier_read_chunked(iostr):
+            for i, buf in enumerate(read_chunked(iostr)):
+                yield buf
+                if i == 0:
+                    started.wait()
+
+        monkeypatch.setattr(
+            ToolDataSink, "_read_chunked", staticmethod(barrier_read_chunked)
+        )
+
+        tar_balls = {}
+        for hostname in self.HOSTS:
+            data_dir = tmp_path / "data" / hostname / "iostat"
+            data_dir.mkdir(parents=True)
+            (data_dir / "iostat-stdout.txt").write_text(f"{hostname}\n" * 1000)
+            tar = tmp_path / f"{hostname}.tar.xz"
+            subprocess.run(
+                ["tar", "-cJf", str(tar), hostname], cwd=tmp_path / "data", check=True
+            )
+            tar_balls[hostname] = tar.read_bytes()
+
+        responses = {}
+
+        def stream(hostname: str):
+            data = tar_balls[hostname]
+            responses[hostname] = requests.put(
+                f"http://127.0.0.1:{port}/tool-data/{tds.data_ctx}/{hostname}",
+                data=(data[i : i + 1024] for i in range(0, len(data), 1024)),
+            )
+
+        threads = [Thread(target=stream, args=(h,)) for h in self.HOSTS]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for hostname, data in tar_balls.items():
+            response = responses[hostname]
+            assert response.status_code == HTTPStatus.OK, response.text
+            assert response.text == hashlib.md5(data).hexdigest()
+            staged = tds.directory / f".{hostname}.staging" / hostname / "iostat"
+            assert (staged / "iostat-stdout.txt").read_text() == f"{hostname}\n" * 1000
@@ -1,8 +1,10 @@
 """Tests for the Tool Meister module.
 """
 
+import hashlib
 from http import HTTPStatus
 import io
+import json
 import logging
 from pathlib import Path
 import shutil
@@ -12,21 +14,28 @@ from typing import Any, List, NamedTuple, Tuple
 import uuid
 
 import pytest
+import redis
 import responses
 
+from pbench.agent.constants import tm_data_key
 from pbench.agent.tool_meister import (
+    Backoff,
     DcgmTool,
+    InstallationResult,
     log_raw_io_output,
     NodeExporterTool,
+    park,
     PcpTool,
     PcpTransientTool,
     PersistentTool,
+    reserve_upload_slot,
     Tool,
     ToolException,
     ToolMeister,
     ToolMeisterError,
     TransientTool,
 )
+from pbench.common.compression import Codec, CODECS, DEFAULT_CODEC
 
 
 def test_log_raw_io_output(caplog):
@@ -1146,8 +1155,8 @@ class TestCreateTar:
         assert functions_called == ["mock_run", "mock_run"]
 
 
-class TestSendDirectory:
-    """Test ToolMeister._send_directory()"""
+class TestSendTarball:
+    """Test ToolMeister._send_tarball()"""
 
     directory = tmp_dir / f"{tm_params['hostname']}"
 
@@ -1199,9 +1208,10 @@ class TestSendDirectory:
             f"http://{tm_params['tds_hostname']}:{tm_params['tds_port']}/uri"
             f"/ctx/{tm_params['hostname']}"
         )
+        responses.add(responses.POST, f"{url}/slot", status=HTTPStatus.OK)
         responses.add(responses.PUT, url, status=HTTPStatus.OK, body="succeeded")
 
-        failures = tool_meister._send_directory(self.directory, "uri", "ctx")
+        failures = tool_meister._send_tarball(self.directory, "uri", "ctx")
         assert functions_called == [
             "mock_create_tar",
             "mock_md5",
@@ -1230,9 +1240,394 @@ class TestSendDirectory:
         )
 
         with pytest.raises(ToolMeisterError) as exc:
-            tool_meister._send_directory(self.directory, "uri", "ctx")
+            tool_meister._send_tarball(self.directory, "uri", "ctx")
 
         assert functions_called == ["mock_create_tar", "mock_create_tar", "mock_unlink"]
         assert f"Failed to create an empty tar {self.directory}.tar.xz" in str(
             exc.value
         )
+
+
+class TestSendDirectory:
+    """Test ToolMeister._send_directory() and ToolMeister._stream_directory()"""
+
+    directory = tmp_dir / f"{tm_params['hostname']}"
+    url = (
+        f"http://{tm_params['tds_hostname']}:{tm_params['tds_port']}/uri"
+        f"/ctx/{tm_params['hostname']}"
+    )
+    slot_url = f"{url}/slot"
+    data = b"tar ball contents"
+    data_md5 = hashlib.md5(data).hexdigest()
+
+    @staticmethod
+    def mock_popen(data: bytes, returncode: int, codec: Codec = DEFAULT_CODEC):
+        class MockPopen:
+            def __init__(self, args, **kwargs):
+                assert args[:5] == [
+                    "tar_path",
+                    "--create",
+                    codec.tar_option(),
+                    "--force-local",
+                    "--file=-",
+                ]
+                assert kwargs["cwd"] == tmp_dir
+                self.stdout = io.BytesIO(data)
+
+            def kill(self):
+                pass
+
+            def wait(self):
+                return returncode
+
+        return MockPopen
+
+    @staticmethod
+    def tds_put(request) -> Tuple[int, dict, str]:
+        """Receive a streamed tar ball, replying with its MD5."""
+        received = b"".join(request.body)
+        return HTTPStatus.OK, {}, hashlib.md5(received).hexdigest()
+
+    @responses.activate
+    def test_stream(self, tool_meister, monkeypatch):
+        """The tar ball is streamed, and committed with the MD5 of what was
+        sent, which the Tool Data Sink reports it received.
+        """
+        monkeypatch.setattr(subprocess, "Popen", self.mock_popen(self.data, 0))
+        responses.add(responses.POST, self.slot_url, status=HTTPStatus.OK)
+        responses.add_callback(responses.PUT, self.url, callback=self.tds_put)
+        responses.add(responses.POST, self.url, status=HTTPStatus.OK)
+
+        assert tool_meister._stream_directory(self.directory, self.url)
+        assert len(responses.calls) == 3
+        assert responses.calls[2].request.headers["md5sum"] == self.data_md5
+
+    @responses.activate
+    def test_stream_codec(self, tool_meister, monkeypatch):
+        """The tar ball is compressed with the codec agreed with the Tool
+        Data Sink.
+        """
+
+        class MockRedis:
+            def get(self, key: str) -> str:
+                assert key == tm_data_key
+                return json.dumps({tm_params["hostname"]: {"codec": "zstd"}})
+
+        tool_meister._rs = MockRedis()
+        monkeypatch.setattr(
+            subprocess, "Popen", self.mock_popen(self.data, 0, CODECS["zstd"])
+        )
+        responses.add(responses.POST, self.slot_url, status=HTTPStatus.OK)
+        responses.add_callback(responses.PUT, self.url, callback=self.tds_put)
+        responses.add(responses.POST, self.url, status=HTTPStatus.OK)
+
+        assert tool_meister._stream_directory(self.directory, self.url)
+
+    @responses.activate
+    def test_stream_tar_failure(self, tool_meister, monkeypatch):
+        """A failing tar command means the tool data has to be sent another
+        way, so nothing is committed.
+        """
+        monkeypatch.setattr(subprocess, "Popen", self.mock_popen(self.data, 2))
+        responses.add(responses.POST, self.slot_url, status=HTTPStatus.OK)
+        responses.add(responses.PUT, self.url, status=HTTPStatus.OK, body="bogus")
+
+        assert not tool_meister._stream_directory(self.directory, self.url)
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_stream_put_failure(self, tool_meister, monkeypatch):
+        """A failed streaming PUT means nothing is committed."""
+        monkeypatch.setattr(subprocess, "Popen", self.mock_popen(self.data, 0))
+        responses.add(responses.POST, self.slot_url, status=HTTPStatus.OK)
+        responses.add(responses.PUT, self.url, status=HTTPStatus.INTERNAL_SERVER_ERROR)
+
+        assert not tool_meister._stream_directory(self.directory, self.url)
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_stream_commit_failure(self, tool_meister, monkeypatch):
+        """A rejected commit, e.g. on an MD5 mismatch, is a failure."""
+        monkeypatch.setattr(subprocess, "Popen", self.mock_popen(self.data, 0))
+        responses.add(responses.POST, self.slot_url, status=HTTPStatus.OK)
+        responses.add_callback(responses.PUT, self.url, callback=self.tds_put)
+        responses.add(responses.POST, self.url, status=HTTPStatus.BAD_REQUEST)
+
+        assert not tool_meister._stream_directory(self.directory, self.url)
+        assert responses.calls[2].request.headers["md5sum"] == self.data_md5
+
+    @pytest.mark.parametrize("streamed", [True, False])
+    def test_send_directory(self, tool_meister, monkeypatch, streamed):
+        """The directory is removed once streamed, otherwise a tar ball is
+        sent instead.
+        """
+        functions_called = []
+
+        def mock_stream(directory: Path, url: str) -> bool:
+            assert directory == self.directory and url == self.url
+            functions_called.append("mock_stream")
+            return streamed
+
+        def mock_send_tarball(directory: Path, uri: str, ctx: str) -> int:
+            assert (directory, uri, ctx) == (self.directory, "uri", "ctx")
+            functions_called.append("mock_send_tarball")
+            return 0
+
+        def mock_rmtree(directory: Path):
+            assert directory == tmp_dir
+            functions_called.append("mock_rmtree")
+
+        monkeypatch.setattr(tool_meister, "_stream_directory", mock_stream)
+        monkeypatch.setattr(tool_meister, "_send_tarball", mock_send_tarball)
+        monkeypatch.setattr(shutil, "rmtree", mock_rmtree)
+
+        assert tool_meister._send_directory(self.directory, "uri", "ctx") == 0
+        assert functions_called == [
+            "mock_stream",
+            "mock_rmtree" if streamed else "mock_send_tarball",
+        ]
+
+
+class TestReserveUploadSlot:
+    """Test how a Tool Meister waits for an upload slot."""
+
+    url = "http://tds.host:8080/tool-data/ctx/tm.host"
+
+    @pytest.fixture
+    def sleeps(self, monkeypatch) -> List[float]:
+        sleeps = []
+        monkeypatch.setattr("pbench.agent.tool_meister.time.sleep", sleeps.append)
+        return sleeps
+
+    @responses.activate
+    def test_retry_after(self, sleeps):
+        """The Tool Data Sink's Retry-After delays are honored, with some
+        jitter, until a slot is given.
+        """
+        for _ in range(2):
+            responses.add(
+                responses.POST,
+                f"{self.url}/slot",
+                status=HTTPStatus.SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "4"},
+            )
+        responses.add(responses.POST, f"{self.url}/slot", status=HTTPStatus.OK)
+
+        reserve_upload_slot(self.url, logging.getLogger())
+        assert len(responses.calls) == 3
+        assert len(sleeps) == 2 and all(4 <= d <= 5 for d in sleeps)
+
+    @responses.activate
+    def test_no_slots(self, sleeps):
+        """A Tool Data Sink not handing out slots lets the upload proceed."""
+        responses.add(responses.POST, f"{self.url}/slot", status=HTTPStatus.NOT_FOUND)
+
+        reserve_upload_slot(self.url, logging.getLogger())
+        assert sleeps == []
+
+    @responses.activate
+    def test_timeout(self, sleeps, monkeypatch):
+        monkeypatch.setattr("pbench.agent.tool_meister._SLOT_TIMEOUT", 10)
+        responses.add(
+            responses.POST,
+            f"{self.url}/slot",
+            status=HTTPStatus.SERVICE_UNAVAILABLE,
+            headers={"Retry-After": "30"},
+        )
+
+        with pytest.raises(ToolMeisterError):
+            reserve_upload_slot(self.url, logging.getLogger())
+        assert sleeps == []
+
+    def test_backoff(self, sleeps, monkeypatch):
+        """The delays double, up to a limit, until the time is up."""
+        now = [0.0]
+        monkeypatch.setattr("pbench.agent.tool_meister.time.monotonic", lambda: now[0])
+        backoff = Backoff(timeout=10)
+        delays = []
+        while backoff.wait():
+            delays.append(backoff.delay)
+            now[0] += sleeps[-1]
+        assert delays[:3] == [0.2, 0.4, 0.8]
+        assert max(delays) == 5
+        assert 10 <= sum(sleeps) and sleeps[-1] <= 5
+
+
+class MockPubSub:
+    """A Redis pub/sub object delivering a given list of messages."""
+
+    def __init__(self, messages: List[Any]):
+        self.messages = list(messages)
+        self.channel = None
+        self.closed = False
+
+    def subscribe(self, channel: str):
+        self.channel = channel
+
+    def get_message(self, timeout: float = 0.0):
+        if not self.messages:
+            return None
+        message = self.messages.pop(0)
+        if isinstance(message, Exception):
+            raise message
+        return {"type": "message", "data": json.dumps(message).encode("utf-8")}
+
+    def close(self):
+        self.closed = True
+
+
+class MockPoolRedis:
+    """A Redis client holding the keys of a new run, for pooled Tool
+    Meisters to be re-bound to.
+    """
+
+    def __init__(self, messages: List[Any], keys: dict):
+        self._pubsub = MockPubSub(messages)
+        self.keys = dict(keys)
+        self.connection_pool = NullObject()
+        self.connection_pool.connection_kwargs = {"host": "redis.host", "port": 17001}
+
+    def pubsub(self, ignore_subscribe_messages: bool = False):
+        return self._pubsub
+
+    def set(self, key: str, value: Any, nx: bool = False, ex: int = None):
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = value
+        return True
+
+    def get(self, key: str):
+        return self.keys.get(key)
+
+
+class TestPark:
+    """Verify how a pooled Tool Meister waits to be re-bound to a new run."""
+
+    new_uuid = str(uuid.uuid4())
+    rebind = {
+        "action": "rebind",
+        "redis_host": "redis.host",
+        "redis_port": 17001,
+        "key": "tm-default-test.hostname.com",
+        "instance_uuid": new_uuid,
+    }
+
+    def params(self, **kwargs):
+        return ToolMeister.fetch_params(
+            {**tm_params, "tool_group": "default", "pool": True, **kwargs}
+        )
+
+    def new_run_keys(self, **kwargs) -> dict:
+        new_params = {
+            **tm_params,
+            "benchmark_run_dir": "/run/2",
+            "tool_group": "default",
+            "pool": True,
+            "instance_uuid": self.new_uuid,
+            **kwargs,
+        }
+        return {self.rebind["key"]: json.dumps(new_params)}
+
+    def test_fetch_params_pool(self):
+        assert not ToolMeister.fetch_params(tm_params).pool
+        assert self.params().pool
+
+    def test_rebind(self):
+        rs = MockPoolRedis([{"action": "bogus"}, self.rebind], self.new_run_keys())
+        new_rs, new_params = park(rs, self.params(), logging.getLogger())
+        assert new_rs is rs
+        assert new_params.benchmark_run_dir == "/run/2"
+        assert new_params.instance_uuid == self.new_uuid
+        assert rs._pubsub.channel == "pbench-tm-pool-default-test.hostname.com"
+        assert rs._pubsub.closed
+
+    def test_rebind_claimed(self):
+        """A run claimed by another parked Tool Meister is ignored."""
+        keys = self.new_run_keys()
+        keys[f"{self.rebind['key']}-claim-{self.new_uuid}"] = 42
+        rs = MockPoolRedis([self.rebind, {"action": "retire"}], keys)
+        assert park(rs, self.params(), logging.getLogger()) is None
+
+    def test_rebind_bad_uuid(self):
+        rs = MockPoolRedis(
+            [self.rebind], self.new_run_keys(instance_uuid=str(uuid.uuid4()))
+        )
+        assert park(rs, self.params(), logging.getLogger(), idle_timeout=0.1) is None
+
+    def test_retire(self):
+        rs = MockPoolRedis([{"action": "retire"}, self.rebind], self.new_run_keys())
+        assert park(rs, self.params(), logging.getLogger()) is None
+
+    def test_lost_connection(self):
+        rs = MockPoolRedis([redis.ConnectionError("gone")], {})
+        assert park(rs, self.params(), logging.getLogger()) is None
+
+
+class TestInstallCache:
+    """Verify that a pooled Tool Meister only checks the installation of its
+    tools once, whatever their kind.
+    """
+
+    @pytest.fixture
+    def installs(self, monkeypatch):
+        """Count the installation checks of the tools, while stubbing out
+        the communication with the Tool Data Sink.
+        """
+        installs = []
+
+        def install(self):
+            installs.append(self.name)
+            self.args = [f"/usr/bin/{self.name}"]
+            return InstallationResult(returncode=0, output="installed")
+
+        def transient_install(self):
+            installs.append(self.name)
+            return InstallationResult(returncode=0, output="installed")
+
+        monkeypatch.setattr(NodeExporterTool, "install", install)
+        monkeypatch.setattr(TransientTool, "install", transient_install)
+        monkeypatch.setattr(
+            "pbench.agent.tool_meister.open_subscriber", lambda *a, **k: NullObject()
+        )
+        monkeypatch.setattr(
+            "pbench.agent.tool_meister.collect_local_info",
+            lambda _: ("0.71.0", "1", "abcdef", {}),
+        )
+        monkeypatch.setattr(
+            "pbench.agent.tool_meister.redis_publish", lambda *a, **k: 1
+        )
+        return installs
+
+    @staticmethod
+    def enter(install_cache: dict) -> ToolMeister:
+        params = {
+            **tm_params,
+            "tool_metadata": {"persistent": {"node-exporter": {}}, "transient": {}},
+            "tools": {"node-exporter": "", "iostat": "--interval=3"},
+        }
+        tm = ToolMeister(
+            pbench_install_dir=MockedPath(),
+            tmp_dir=MockedPath(),
+            tar_path="tar_path",
+            sysinfo_dump=None,
+            tm_params=ToolMeister.fetch_params(params),
+            redis_server=None,
+            logger=logging.getLogger(),
+            install_cache=install_cache,
+        )
+        return tm.__enter__()
+
+    def test_rebind(self, installs):
+        install_cache = {}
+        first = self.enter(install_cache)
+        assert sorted(installs) == ["iostat", "node-exporter"]
+        first._persistent_tools["node-exporter"].process = "running"
+
+        second = self.enter(install_cache)
+        assert sorted(installs) == ["iostat", "node-exporter"]
+        tool = second._persistent_tools["node-exporter"]
+        assert tool is not first._persistent_tools["node-exporter"]
+        assert tool.args == ["/usr/bin/node-exporter"]
+        assert tool.process is None
+        assert second._usable_tools == first._usable_tools
+        assert "iostat" in second._transient_tools
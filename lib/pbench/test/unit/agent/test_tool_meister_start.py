@@ -0,0 +1,32 @@
+"""Tests for the Tool Meister start module.
+"""
+import logging
+
+import pytest
+
+from pbench.agent.tool_meister_start import env_int
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    (
+        (None, 16),
+        ("4", 4),
+        ("1", 1),
+        ("0", 16),
+        ("-2", 16),
+        ("many", 16),
+    ),
+)
+def test_env_int(monkeypatch, value, expected):
+    """Values which are not integers, or are out of range, are replaced by
+    the default.
+    """
+    if value is None:
+        monkeypatch.delenv("PBENCH_TDS_MAX_UPLOADS", raising=False)
+    else:
+        monkeypatch.setenv("PBENCH_TDS_MAX_UPLOADS", value)
+    assert (
+        env_int("PBENCH_TDS_MAX_UPLOADS", 16, logging.getLogger(), minimum=1)
+        == expected
+    )
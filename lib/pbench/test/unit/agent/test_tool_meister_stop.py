@@ -38,3 +38,20 @@ class TestRedisServer:
         assert (
             rs.host == "redis.example.com"
         ), f"Expected 'RedisServer.host' to be '{rs_host}', got '{rs.host}'"
+
+    def test_pooled(self, tmp_path):
+        # A pooled run directory records where the pooled Redis server lives.
+        rundir = tmp_path / "run-dir"
+        (rundir / "tm").mkdir(parents=True)
+        pooldir = tmp_path / "tm-pool"
+        pooldir.mkdir()
+        (pooldir / "redis.pid").write_text("12345")
+        (rundir / "tm" / "pool").write_text(str(pooldir))
+
+        rs = RedisServer("", rundir, "notme.example.com")
+        assert rs.pooled and rs.locally_managed()
+        assert rs.pid_file == pooldir / "redis.pid"
+        assert rs.host == "localhost"
+
+        rs = RedisServer("", tmp_path, "notme.example.com")
+        assert not rs.pooled
@@ -0,0 +1,105 @@
+import hashlib
+from http import HTTPStatus
+import json
+
+import pytest
+import requests
+import responses
+
+
+class TestUploadParts:
+    PART_SIZE = 10
+
+    @pytest.fixture()
+    def tarball(self, connect, tmp_path):
+        """
+        Create a small "tarball" and add the upload session URI templates to
+        the client's cached endpoints.
+        """
+        base = f"{connect.url}/api/v1"
+        connect.endpoints["uri"].update(
+            {
+                "upload_part": {
+                    "template": f"{base}/upload/part/{{filename}}/{{part}}",
+                    "params": {"filename": {"type": "string"}, "part": {"type": "int"}},
+                },
+                "upload_session": {
+                    "template": f"{base}/upload/session/{{filename}}",
+                    "params": {"filename": {"type": "string"}},
+                },
+            }
+        )
+        tarball = tmp_path / "test.tar.xz"
+        tarball.write_bytes(b"0123456789" * 3 + b"xyz")
+        tarball.with_suffix(".xz.md5").write_text("md5 test.tar.xz\n")
+        return tarball
+
+    def test_upload_parts(self, connect, tarball):
+        """
+        Confirm that only the parts the server is missing are sent, that each
+        carries its own length and MD5, and that the session is completed.
+        """
+        session = f"{connect.url}/api/v1/upload/session/{tarball.name}"
+        part = f"{connect.url}/api/v1/upload/part/{tarball.name}"
+        with responses.RequestsMock() as rsp:
+            rsp.add(
+                responses.POST,
+                session,
+                json={"parts": 4, "received": [2]},
+                status=HTTPStatus.CREATED,
+            )
+            for p in (1, 3, 4):
+                rsp.add(responses.PUT, f"{part}/{p}", status=HTTPStatus.CREATED)
+            rsp.add(responses.PUT, session, status=HTTPStatus.CREATED)
+            response = connect.upload_parts(
+                tarball, self.PART_SIZE, md5="md5", controller="ctl"
+            )
+            assert response.status_code == HTTPStatus.CREATED
+            assert json.loads(rsp.calls[0].request.body) == {
+                "controller": "ctl",
+                "md5": "md5",
+                "size": 33,
+                "part_size": self.PART_SIZE,
+            }
+            parts = {
+                c.request.url: c.request.headers["Content-Length"]
+                for c in rsp.calls[1:-1]
+            }
+            assert parts == {f"{part}/1": "10", f"{part}/3": "10", f"{part}/4": "3"}
+            md5s = {
+                c.request.url: c.request.headers["Content-MD5"] for c in rsp.calls[1:-1]
+            }
+            assert md5s[f"{part}/1"] == hashlib.md5(b"0123456789").hexdigest()
+            assert md5s[f"{part}/4"] == hashlib.md5(b"xyz").hexdigest()
+            assert rsp.calls[-1].request.url == session
+
+    def test_upload_duplicate(self, connect, tarball):
+        """
+        Confirm that no parts are sent when the server already has the dataset.
+        """
+        session = f"{connect.url}/api/v1/upload/session/{tarball.name}"
+        with responses.RequestsMock() as rsp:
+            rsp.add(responses.POST, session, json={"message": "Dataset already exists"})
+            response = connect.upload_parts(
+                tarball, self.PART_SIZE, md5="md5", controller="ctl"
+            )
+            assert response.status_code == HTTPStatus.OK
+            assert len(rsp.calls) == 1
+
+    def test_upload_part_failure(self, connect, tarball):
+        """
+        Confirm that a failed part is reported and the session isn't completed.
+        """
+        session = f"{connect.url}/api/v1/upload/session/{tarball.name}"
+        part = f"{connect.url}/api/v1/upload/part/{tarball.name}"
+        with responses.RequestsMock(assert_all_requests_are_fired=False) as rsp:
+            rsp.add(
+                responses.POST,
+                session,
+                json={"parts": 4, "received": [1, 2, 3]},
+                status=HTTPStatus.CREATED,
+            )
+            rsp.add(responses.PUT, f"{part}/4", status=HTTPStatus.BAD_REQUEST)
+            with pytest.raises(requests.HTTPError):
+                connect.upload_parts(tarball, self.PART_SIZE, md5="md5", controller="c")
+            assert len(rsp.calls) == 2
@@ -0,0 +1,90 @@
+import io
+from pathlib import Path
+import shutil
+import subprocess
+import tarfile
+
+import pytest
+
+from pbench.common.compression import (
+    available_codecs,
+    codec_for,
+    CODECS,
+    DEFAULT_CODEC,
+    negotiate,
+    open_tar_stream,
+)
+
+
+class TestNegotiate:
+    @staticmethod
+    def test_first_accepted_offered():
+        assert negotiate(["xz", "lz4"], ["zstd", "lz4", "xz"]).name == "lz4"
+
+    @staticmethod
+    def test_nothing_offered():
+        """A Tool Meister which predates codec negotiation offers nothing."""
+        assert negotiate(None, ["zstd", "lz4", "xz"]) == DEFAULT_CODEC
+
+    @staticmethod
+    def test_nothing_in_common():
+        assert negotiate(["lz4"], ["zstd"]) == DEFAULT_CODEC
+
+
+class TestCodec:
+    @staticmethod
+    @pytest.mark.parametrize(
+        "path,expected",
+        [
+            ("a/b/run.tar.xz", "xz"),
+            (Path("run.tar.zst"), "zstd"),
+            ("run.tar.lz4", "lz4"),
+            ("run.tar", None),
+            ("run.zst", None),
+        ],
+    )
+    def test_codec_for(path, expected):
+        codec = codec_for(path)
+        assert (codec.name if codec else None) == expected
+
+    @staticmethod
+    def test_compress_args():
+        assert CODECS["zstd"].compress_args() == ["zstd", "-c", "-3", "-T0"]
+        assert CODECS["xz"].compress_args(9, 1) == ["xz", "-c", "-9", "-T1"]
+        assert CODECS["lz4"].compress_args(threads=4) == ["lz4", "-c", "-1"]
+        assert CODECS["zstd"].tar_option() == "--use-compress-program=zstd -c -3 -T0"
+
+    @staticmethod
+    def test_available_codecs(monkeypatch):
+        monkeypatch.setattr(
+            shutil, "which", lambda cmd: None if cmd == "lz4" else f"/usr/bin/{cmd}"
+        )
+        assert available_codecs() == ["zstd", "xz"]
+        assert available_codecs(["xz", "bogus"]) == ["xz"]
+
+
+class TestOpenTarStream:
+    @staticmethod
+    @pytest.mark.parametrize("name", list(CODECS))
+    def test_round_trip(name, tmp_path):
+        codec = CODECS[name]
+        if not shutil.which(codec.command):
+            pytest.skip(f"{codec.command} is not installed")
+        data = b"some tool data\n" * 1000
+        tar_buf = io.BytesIO()
+        with tarfile.open(fileobj=tar_buf, mode="w") as tar:
+            info = tarfile.TarInfo("run/tool.txt")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        tarball = tmp_path / f"run{codec.tar_suffix()}"
+        with tarball.open("wb") as f:
+            subprocess.run(
+                codec.compress_args(), input=tar_buf.getvalue(), stdout=f, check=True
+            )
+
+        with tarball.open("rb") as f, open_tar_stream(f, codec) as tar:
+            members = []
+            for member in tar:
+                members.append(member.name)
+                assert tar.extractfile(member).read() == data
+        assert members == ["run/tool.txt"]
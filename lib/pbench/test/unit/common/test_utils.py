@@ -1,9 +1,16 @@
+import hashlib
 import logging
 from pathlib import Path
 
 import pytest
 
-from pbench.common.utils import Cleanup, CleanupNotCallable, Md5Result, md5sum
+from pbench.common.utils import (
+    Cleanup,
+    CleanupNotCallable,
+    FileRange,
+    Md5Result,
+    md5sum,
+)
 
 
 class TestMd5sum:
@@ -31,6 +38,23 @@ class TestMd5sum:
         ), f"Expected MD5 '{expected_hash_md5}', got '{hash_md5}'"
 
 
+class TestFileRange:
+    @staticmethod
+    def test_file_range(tmp_path):
+        test_file = tmp_path / "data"
+        test_file.write_bytes(b"0123456789abcdef")
+        with FileRange(test_file, 4, 8) as r:
+            assert len(r) == 8
+            assert r.md5() == hashlib.md5(b"456789ab").hexdigest()
+            assert r.read(3) == b"456"
+            assert len(r) == 5
+            assert r.read() == b"789ab"
+            assert r.read() == b""
+            r.rewind()
+            assert r.read(100) == b"456789ab"
+        assert r.file.closed
+
+
 class TestCleanup:
     def test_bad_add(self, caplog):
         logger = logging.getLogger("test_bad_add")
@@ -0,0 +1,249 @@
+import datetime
+from http import HTTPStatus
+
+import pytest
+import responses
+from responses import matchers
+
+from pbench.server.database.models.datasets import Dataset, States
+
+
+@pytest.fixture()
+def compare_datasets(attach_dataset, create_drb_user, create_user):
+    """
+    Create datasets to compare: two private ones owned by "drb", one of them
+    spanning two months, and a public one owned by "test".
+    """
+    for name, owner, access, created, uploaded in (
+        ("cmp1", create_drb_user, "private", (2020, 8, 10), (2020, 8, 11)),
+        ("cmp2", create_drb_user, "private", (2020, 8, 20), (2020, 9, 2)),
+        ("cmp3", create_user, "public", (2020, 8, 5), (2020, 8, 6)),
+    ):
+        Dataset(
+            owner_id=str(owner.id),
+            created=datetime.datetime(*created),
+            uploaded=datetime.datetime(*uploaded),
+            state=States.INDEXED,
+            name=name,
+            access=access,
+            resource_id=f"md5_{name}",
+        ).add()
+
+
+class TestDatasetsCompare:
+    """
+    Unit testing for DatasetsCompare class.
+    In a web service context, we access class functions mostly via the
+    Flask test client rather than trying to directly invoke the class
+    constructor and `post` service.
+    """
+
+    AUGUST = "/unit-test.v5.result-data.2020-08,"
+    AUGUST_SEPTEMBER = (
+        "/unit-test.v5.result-data.2020-08,unit-test.v5.result-data.2020-09,"
+    )
+
+    @pytest.fixture()
+    def es_url(self, server_config):
+        host = server_config.get("elasticsearch", "host")
+        port = server_config.get("elasticsearch", "port")
+        return f"http://{host}:{port}"
+
+    @staticmethod
+    def es_query(dataset: str, aggs: dict) -> dict:
+        return {
+            "size": 0,
+            "query": {
+                "bool": {
+                    "filter": [
+                        {"term": {"run.id": dataset}},
+                        {"match_phrase": {"sample.measurement_title": "Gb_sec"}},
+                    ]
+                }
+            },
+            "aggs": aggs,
+        }
+
+    @staticmethod
+    def stats(value: float) -> dict:
+        return {
+            "count": 2,
+            "min": value - 1.0,
+            "max": value + 1.0,
+            "avg": value,
+            "sum": value * 2,
+            "sum_of_squares": 2 * value * value + 2.0,
+            "variance": 1.0,
+            "std_deviation": 1.0,
+            "std_deviation_bounds": {"upper": value + 2.0, "lower": value - 2.0},
+        }
+
+    def test_compare(
+        self,
+        caplog,
+        client,
+        server_config,
+        es_url,
+        pbench_token,
+        find_template,
+        compare_datasets,
+    ):
+        """
+        Each dataset is queried separately over the result data indices of
+        the months it ran in, and the statistics are returned in the order of
+        the datasets. The concurrent queries are traced with the request.
+        """
+        server_config.conf.set("pbench-server", "slow_request_threshold", "0")
+        aggs = {"stats": {"extended_stats": {"field": "result.value"}}}
+        datasets = ("md5_cmp2", "md5_cmp1", "md5_cmp3")
+        indices = (self.AUGUST_SEPTEMBER, self.AUGUST, self.AUGUST)
+        with responses.RequestsMock() as rsp:
+            for i, (dataset, index) in enumerate(zip(datasets, indices)):
+                rsp.add(
+                    responses.POST,
+                    f"{es_url}{index}/_search?ignore_unavailable=true",
+                    json={
+                        "took": 1,
+                        "hits": {"total": {"value": 2}, "hits": []},
+                        "aggregations": {"stats": self.stats(10.0 * (i + 1))},
+                    },
+                    match=[matchers.json_params_matcher(self.es_query(dataset, aggs))],
+                )
+            response = client.post(
+                f"{server_config.rest_uri}/datasets/compare",
+                headers={"Authorization": "Bearer " + pbench_token},
+                json={"datasets": list(datasets), "metric": "Gb_sec"},
+            )
+        assert response.status_code == HTTPStatus.OK
+        assert response.json == [
+            {
+                "dataset": dataset,
+                "name": dataset[4:],
+                "count": 2,
+                "min": 10.0 * (i + 1) - 1.0,
+                "max": 10.0 * (i + 1) + 1.0,
+                "avg": 10.0 * (i + 1),
+                "std_deviation": 1.0,
+            }
+            for i, dataset in enumerate(datasets)
+        ]
+        slow = [m for m in caplog.messages if m.startswith("Slow request")]
+        assert len(slow) == 1
+        assert "[elasticsearch 3 calls " in slow[0]
+        assert "elasticsearch 2x " in slow[0]
+        assert f"{self.AUGUST}/_search (indices: 1)" in slow[0]
+        assert f"{self.AUGUST_SEPTEMBER}/_search (indices: 2)" in slow[0]
+
+    def test_group_by(
+        self,
+        client,
+        server_config,
+        es_url,
+        pbench_token,
+        find_template,
+        compare_datasets,
+    ):
+        aggs = {
+            "groups": {
+                "terms": {"field": "iteration.name", "size": 100},
+                "aggs": {"stats": {"extended_stats": {"field": "result.value"}}},
+            }
+        }
+        with responses.RequestsMock() as rsp:
+            rsp.add(
+                responses.POST,
+                f"{es_url}{self.AUGUST}/_search?ignore_unavailable=true",
+                json={
+                    "took": 1,
+                    "hits": {"total": {"value": 4}, "hits": []},
+                    "aggregations": {
+                        "groups": {
+                            "buckets": [
+                                {"key": "1-tcp_stream", "stats": self.stats(1.0)},
+                                {"key": "2-tcp_rr", "stats": self.stats(2.0)},
+                            ]
+                        }
+                    },
+                },
+                match=[matchers.json_params_matcher(self.es_query("md5_cmp1", aggs))],
+            )
+            response = client.post(
+                f"{server_config.rest_uri}/datasets/compare",
+                headers={"Authorization": "Bearer " + pbench_token},
+                json={
+                    "datasets": ["md5_cmp1"],
+                    "metric": "Gb_sec",
+                    "group_by": "iteration.name",
+                },
+            )
+        assert response.status_code == HTTPStatus.OK
+        groups = response.json[0]["groups"]
+        assert [(g["key"], g["avg"]) for g in groups] == [
+            ("1-tcp_stream", 1.0),
+            ("2-tcp_rr", 2.0),
+        ]
+
+    @pytest.mark.parametrize(
+        "datasets,token,expected_status",
+        (
+            ([], True, HTTPStatus.BAD_REQUEST),
+            (["md5_cmp1", "random_md5_string2"], True, HTTPStatus.FORBIDDEN),
+            (["md5_cmp3", "md5_cmp1"], False, HTTPStatus.UNAUTHORIZED),
+        ),
+    )
+    def test_unauthorized(
+        self,
+        client,
+        server_config,
+        pbench_token,
+        find_template,
+        compare_datasets,
+        datasets,
+        token,
+        expected_status,
+    ):
+        """
+        Every dataset must be readable: no Elasticsearch query is made
+        otherwise.
+        """
+        with responses.RequestsMock():
+            response = client.post(
+                f"{server_config.rest_uri}/datasets/compare",
+                headers={"Authorization": "Bearer " + pbench_token} if token else {},
+                json={"datasets": datasets, "metric": "Gb_sec"},
+            )
+        assert response.status_code == expected_status
+
+    def test_es_failure(
+        self,
+        client,
+        server_config,
+        es_url,
+        pbench_token,
+        find_template,
+        compare_datasets,
+    ):
+        """
+        The failure of any of the queries fails the API.
+        """
+        with responses.RequestsMock(assert_all_requests_are_fired=False) as rsp:
+            rsp.add(
+                responses.POST,
+                f"{es_url}{self.AUGUST}/_search?ignore_unavailable=true",
+                json={
+                    "took": 1,
+                    "hits": {"total": {"value": 2}, "hits": []},
+                    "aggregations": {"stats": self.stats(1.0)},
+                },
+            )
+            rsp.add(
+                responses.POST,
+                f"{es_url}{self.AUGUST_SEPTEMBER}/_search?ignore_unavailable=true",
+                status=HTTPStatus.INTERNAL_SERVER_ERROR,
+            )
+            response = client.post(
+                f"{server_config.rest_uri}/datasets/compare",
+                headers={"Authorization": "Bearer " + pbench_token},
+                json={"datasets": ["md5_cmp1", "md5_cmp2"], "metric": "Gb_sec"},
+            )
+        assert response.status_code == HTTPStatus.BAD_GATEWAY
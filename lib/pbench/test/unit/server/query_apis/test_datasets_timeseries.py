@@ -0,0 +1,341 @@
+from datetime import datetime, timezone
+from http import HTTPStatus
+
+import pytest
+
+from pbench.server.api.resources import ApiParams
+from pbench.server.api.resources.query_apis.datasets.datasets_timeseries import (
+    DatasetsTimeseries,
+)
+from pbench.server.database.models.datasets import Dataset, Metadata
+from pbench.test.unit.server.query_apis.commons import Commons
+
+
+class TestDatasetsTimeseries(Commons):
+    """
+    Unit testing for DatasetsTimeseries class.
+    In a web service context, we access class functions mostly via the
+    Flask test client rather than trying to directly invoke the class
+    constructor and `post` service.
+    """
+
+    RESULT_INDEX = "unit-test.v5.result-data.2020-08"
+    TOOL_INDEX = "unit-test.v4.tool-data-iostat.2020-08-01"
+    ROLLUP_INDEX = "unit-test.v4.tool-data-rollup-iostat.2020-08-01"
+
+    @pytest.fixture(autouse=True)
+    def _setup(self, client):
+        super()._setup(
+            cls_obj=DatasetsTimeseries(client.config, client.logger),
+            pbench_endpoint="/datasets/timeseries/random_md5_string1",
+            elastic_endpoint="/_search",
+            payload={"metric": "Gb_sec", "interval": 60},
+            index_from_metadata=".result-data.",
+        )
+
+    @pytest.fixture()
+    def provide_metadata(self, provide_metadata):
+        """
+        Add result data and raw and rolled up tool data indices to the index
+        map of the "drb" dataset, and record the times of its day long run.
+        """
+        drb = Dataset.query(name="drb")
+        metalog = Metadata.get(drb, Metadata.METALOG)
+        metalog.value = {
+            **metalog.value,
+            "run": {
+                **metalog.value["run"],
+                "start_run": "2020-08-01T00:00:00.000000",
+                "end_run": "2020-08-02T00:00:00.000000",
+            },
+        }
+        metalog.update()
+        index_map = Metadata.getvalue(dataset=drb, key="server.index-map")
+        index_map.update(
+            {
+                self.RESULT_INDEX: ["random_document_uuid"],
+                self.TOOL_INDEX: ["random_document_uuid"],
+                self.ROLLUP_INDEX: ["random_document_uuid"],
+            }
+        )
+        Metadata.setvalue(dataset=drb, key="server.index-map", value=index_map)
+
+    @staticmethod
+    def histogram(stats):
+        return {
+            "buckets": [
+                {
+                    "key_as_string": "2020-08-01T00:00:00.000Z",
+                    "key": 1596240000000 + i * 60000,
+                    "doc_count": count,
+                    "min": {"value": low},
+                    "max": {"value": high},
+                    "avg": {"value": avg},
+                    "count": {"value": count},
+                }
+                for i, (low, high, avg, count) in enumerate(stats)
+            ]
+        }
+
+    @pytest.mark.parametrize(
+        "tool,rollup_interval,end,expect_index,expect_rollup",
+        (
+            (None, 0, None, RESULT_INDEX, False),
+            ("iostat", 0, None, TOOL_INDEX, False),
+            ("iostat", 30, None, ROLLUP_INDEX, True),
+            ("iostat", 45, None, TOOL_INDEX, False),
+            ("iostat", 30, "2020-08-01T01:00:00", TOOL_INDEX, False),
+        ),
+    )
+    def test_query(
+        self,
+        server_config,
+        query_api,
+        build_auth_header,
+        find_template,
+        provide_metadata,
+        tool,
+        rollup_interval,
+        end,
+        expect_index,
+        expect_rollup,
+    ):
+        """
+        Check the choice of the indices, and the conversion of the date
+        histogram into compact series: the rolled up tool data is used for
+        the day long run, but not for an hour of it.
+        """
+        server_config.conf.set(
+            "Indexing", "tool_data_rollup_interval", str(rollup_interval)
+        )
+        if tool:
+            self.payload.update({"tool": tool, "metric": "util"})
+        if end:
+            self.payload["end"] = end
+        response_payload = {
+            "took": 3,
+            "timed_out": False,
+            "hits": {"total": {"value": 3, "relation": "eq"}, "hits": []},
+            "aggregations": {
+                "histogram": self.histogram(
+                    [(1.0, 3.0, 2.0, 2.0), (None, None, None, 0.0), (5.0, 5.0, 5.0, 1)]
+                )
+            },
+        }
+        expected_status = self.get_expected_status(
+            {"user": "drb", "access": "private"}, build_auth_header["header_param"]
+        )
+        response = query_api(
+            self.pbench_endpoint,
+            self.elastic_endpoint,
+            self.payload,
+            f"/{expect_index}",
+            expected_status,
+            json=response_payload,
+            status=HTTPStatus.OK,
+            headers=build_auth_header["header"],
+        )
+        if expected_status == HTTPStatus.OK:
+            assert response.json == {
+                "interval": 60,
+                "rollup": expect_rollup,
+                "series": [
+                    {
+                        "key": None,
+                        "timestamps": [1596240000000, 1596240060000, 1596240120000],
+                        "min": [1.0, None, 5.0],
+                        "max": [3.0, None, 5.0],
+                        "avg": [2.0, None, 5.0],
+                        "count": [2, 0, 1],
+                    }
+                ],
+            }
+
+    def test_group_by(self, server_config, query_api, pbench_token, provide_metadata):
+        self.payload.update(
+            {"tool": "iostat", "group_by": "iostat.id", "interval": 3600}
+        )
+        response_payload = {
+            "took": 3,
+            "timed_out": False,
+            "hits": {"total": {"value": 2, "relation": "eq"}, "hits": []},
+            "aggregations": {
+                "series": {
+                    "buckets": [
+                        {
+                            "key": "sda",
+                            "doc_count": 1,
+                            "histogram": self.histogram([(1.0, 1.0, 1.0, 1)]),
+                        },
+                        {
+                            "key": "sdb",
+                            "doc_count": 1,
+                            "histogram": self.histogram([(2.0, 2.0, 2.0, 1)]),
+                        },
+                    ]
+                }
+            },
+        }
+        response = query_api(
+            self.pbench_endpoint,
+            self.elastic_endpoint,
+            self.payload,
+            f"/{self.TOOL_INDEX}",
+            HTTPStatus.OK,
+            json=response_payload,
+            status=HTTPStatus.OK,
+            headers={"Authorization": "Bearer " + pbench_token},
+        )
+        assert [(s["key"], s["avg"]) for s in response.json["series"]] == [
+            ("sda", [1.0]),
+            ("sdb", [2.0]),
+        ]
+
+    @pytest.mark.parametrize(
+        "payload,message",
+        (
+            ({"interval": 0}, "The interval must be a positive number"),
+            (
+                {"start": "2020-08-02", "end": "2020-08-01"},
+                "The start time is after the end time",
+            ),
+            (
+                {"interval": 1, "start": "2020-08-01", "end": "2020-08-31"},
+                "The interval is too small: more than 10000 buckets",
+            ),
+            (
+                {"interval": 1, "start": "2020-08-01T12:00:00"},
+                "The interval is too small: more than 10000 buckets",
+            ),
+            (
+                {"interval": 1},
+                "The interval is too small: more than 10000 buckets",
+            ),
+            (
+                {"start": "2020-08-03"},
+                "The start time is after the end time",
+            ),
+            (
+                {
+                    "interval": 60,
+                    "start": "2020-08-01T00:00:00",
+                    "end": "2020-08-01T02:00:00",
+                    "group_by": "iostat.id",
+                },
+                "The interval is too small: more than 10000 buckets",
+            ),
+        ),
+    )
+    def test_bad_buckets(
+        self, client, server_config, pbench_token, provide_metadata, payload, message
+    ):
+        self.payload.update(payload)
+        response = client.post(
+            f"{server_config.rest_uri}{self.pbench_endpoint}",
+            headers={"Authorization": "Bearer " + pbench_token},
+            json=self.payload,
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.json["message"] == message
+
+    def test_no_run_times(self, client, server_config, pbench_token, provide_metadata):
+        """
+        Without recorded run times, the time range must be given.
+        """
+        drb = Dataset.query(name="drb")
+        metalog = Metadata.get(drb, Metadata.METALOG)
+        metalog.value = {**metalog.value, "run": {"controller": "node1.example.com"}}
+        metalog.update()
+        self.payload["start"] = "2020-08-01"
+        response = client.post(
+            f"{server_config.rest_uri}{self.pbench_endpoint}",
+            headers={"Authorization": "Bearer " + pbench_token},
+            json=self.payload,
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.json["message"] == (
+            "Dataset drb has no recorded run times: the start and end times are required"
+        )
+
+    def test_no_tool_data(self, client, server_config, pbench_token, provide_metadata):
+        self.payload["tool"] = "vmstat"
+        response = client.post(
+            f"{server_config.rest_uri}{self.pbench_endpoint}",
+            headers={"Authorization": "Bearer " + pbench_token},
+            json=self.payload,
+        )
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        assert response.json["message"] == "Dataset drb has no vmstat data"
+
+    @pytest.mark.parametrize("rollup", (False, True))
+    def test_assemble(self, attach_dataset, rollup):
+        """
+        Check the Elasticsearch query aggregating tool data, restricted to a
+        time range and filtered.
+        """
+        drb = Dataset.query(name="drb")
+        start = datetime(2020, 8, 1, tzinfo=timezone.utc)
+        end = datetime(2020, 8, 2, tzinfo=timezone.utc)
+        params = ApiParams(
+            body={
+                "tool": "iostat",
+                "metric": "iops.read",
+                "interval": 300,
+                "filters": {"iostat.id": "sda"},
+                "group_by": "sample.hostname",
+            }
+        )
+        context = {
+            "dataset": drb,
+            "indices": self.ROLLUP_INDEX if rollup else self.TOOL_INDEX,
+            "interval": 300,
+            "rollup": rollup,
+            "start": start,
+            "end": end,
+        }
+        query = self.cls_obj.assemble(params, context)
+        assert query["path"] == f"/{context['indices']}/_search"
+        body = query["kwargs"]["json"]
+        assert body["size"] == 0
+        assert body["query"] == {
+            "bool": {
+                "filter": [
+                    {"term": {"run.id": drb.resource_id}},
+                    {
+                        "range": {
+                            "@timestamp": {
+                                "gte": "2020-08-01T00:00:00+00:00",
+                                "lte": "2020-08-02T00:00:00+00:00",
+                            }
+                        }
+                    },
+                    {"match": {"iostat.id": "sda"}},
+                ]
+            }
+        }
+        series = body["aggs"]["series"]
+        assert series["terms"] == {"field": "sample.hostname", "size": 100}
+        histogram = series["aggs"]["histogram"]
+        assert histogram["date_histogram"] == {
+            "field": "@timestamp",
+            "fixed_interval": "300s",
+            "extended_bounds": {
+                "min": "2020-08-01T00:00:00+00:00",
+                "max": "2020-08-02T00:00:00+00:00",
+            },
+        }
+        if rollup:
+            assert histogram["aggs"]["avg"] == {
+                "weighted_avg": {
+                    "value": {"field": "iostat.iops.read.avg"},
+                    "weight": {"field": "iostat.iops.read.count"},
+                }
+            }
+            assert histogram["aggs"]["count"] == {
+                "sum": {"field": "iostat.iops.read.count"}
+            }
+        else:
+            assert histogram["aggs"]["avg"] == {"avg": {"field": "iostat.iops.read"}}
+            assert histogram["aggs"]["count"] == {
+                "value_count": {"field": "iostat.iops.read"}
+            }
@@ -1,11 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http import HTTPStatus
+import json
+import threading
 from typing import Optional
 
 import pytest
+import responses
 
 from pbench.server import JSON
 from pbench.server.api.resources import API_METHOD, API_OPERATION, ApiSchema
-from pbench.server.api.resources.query_apis import ElasticBase
+from pbench.server.api.resources.query_apis import ElasticBase, IndexCatalog
 from pbench.server.auth.auth import Auth
+from pbench.server.database.models.template import Template
 from pbench.server.database.models.users import User
 
 ADMIN_ID = "6"  # This needs to match the current_user_admin fixture
@@ -178,3 +185,147 @@ class TestQueryBuilder:
                 ]
             }
         }
+
+    @pytest.mark.parametrize(
+        "rollup_interval,hours,interval,expect",
+        [
+            (60, 1, None, False),
+            (60, 168, None, True),
+            (0, 168, None, False),
+            (60, 168, 300, True),
+            (60, 168, 90, False),
+        ],
+    )
+    def test_use_tool_data_rollup(
+        self, client, server_config, rollup_interval, hours, interval, expect
+    ):
+        """
+        The rolled up tool data is only used when rollups are enabled, the
+        raw tool data would return too many points for the time range, and
+        the buckets, if any, are made of whole rollup intervals.
+        """
+        server_config.conf.set(
+            "Indexing", "tool_data_rollup_interval", str(rollup_interval)
+        )
+        elasticbase = ElasticBase(
+            server_config,
+            client.logger,
+            ApiSchema(API_METHOD.POST, API_OPERATION.READ),
+        )
+        start = datetime(2022, 3, 1)
+        assert (
+            elasticbase._use_tool_data_rollup(
+                start, start + timedelta(hours=hours), interval
+            )
+            == expect
+        )
+
+    @pytest.mark.parametrize(
+        "existing,expect",
+        (
+            (
+                ["unit-test.v6.run-data.2020-08", "unit-test.v6.run-data.2020-10"],
+                ["2020-08", "2020-10"],
+            ),
+            (["unit-test.v6.run-data.2019-01"], ["2020-08", "2020-09", "2020-10"]),
+            (None, ["2020-08", "2020-09", "2020-10"]),
+        ),
+    )
+    def test_month_range_catalog(
+        self, client, server_config, find_template, monkeypatch, existing, expect
+    ):
+        """
+        With an index catalog, the months without an index are left out of a
+        month range, unless no index exists or the indices can't be listed.
+        The indices are listed again only after the refresh interval.
+        """
+        monkeypatch.setattr(IndexCatalog, "catalogs", {})
+        server_config.conf.set("Indexing", "index_catalog_refresh", "3600")
+        elasticbase = ElasticBase(
+            server_config,
+            client.logger,
+            ApiSchema(API_METHOD.POST, API_OPERATION.READ),
+        )
+        with responses.RequestsMock() as rsp:
+            url = "http://elasticsearch.example.com:7080/_cat/indices/unit-test.*"
+            if existing is None:
+                rsp.add(responses.GET, url, status=HTTPStatus.INTERNAL_SERVER_ERROR)
+            else:
+                rsp.add(responses.GET, url, json=[{"index": i} for i in existing])
+            for _ in range(2):
+                indices = elasticbase._gen_month_range(
+                    "run", datetime(2020, 8, 15), datetime(2020, 10, 1)
+                )
+                assert indices == "".join(f"unit-test.v6.run-data.{m}," for m in expect)
+            assert len(rsp.calls) == 1
+
+    def test_daily_range_catalog(self, client, server_config, monkeypatch, fake_mtime):
+        """
+        A month of daily indices is kept when any of its days exists.
+        """
+
+        def fake_find(name: str) -> Template:
+            return Template(
+                name=name,
+                idxname=f"tool-data-{name}",
+                template_name=f"unit-test.v4.tool-data-{name}",
+                file="tool-data-frag-iostat.json",
+                template_pattern=f"unit-test.v4.tool-data-{name}.*",
+                index_template="{prefix}.v{version}.{idxname}.{year}-{month}-{day}",
+                settings={},
+                mappings={},
+                version="4",
+            )
+
+        monkeypatch.setattr(Template, "find", fake_find)
+        monkeypatch.setattr(IndexCatalog, "catalogs", {})
+        server_config.conf.set("Indexing", "index_catalog_refresh", "60")
+        elasticbase = ElasticBase(
+            server_config,
+            client.logger,
+            ApiSchema(API_METHOD.POST, API_OPERATION.READ),
+        )
+        with responses.RequestsMock() as rsp:
+            rsp.add(
+                responses.GET,
+                "http://elasticsearch.example.com:7080/_cat/indices/unit-test.*",
+                json=[{"index": "unit-test.v4.tool-data-iostat.2022-03-02"}],
+            )
+            indices = elasticbase._gen_month_range(
+                "iostat", datetime(2022, 1, 1), datetime(2022, 4, 1)
+            )
+        assert indices == "unit-test.v4.tool-data-iostat.2022-03-*,"
+
+    def test_catalog_refresh_in_progress(self, client, monkeypatch):
+        """
+        While one caller lists the indices again, the others keep using the
+        previous view instead of waiting for Elasticsearch.
+        """
+        now = [1000.0]
+        monkeypatch.setattr(
+            "pbench.server.api.resources.query_apis.monotonic", lambda: now[0]
+        )
+        catalog = IndexCatalog("http://elasticsearch.example.com:7080", "unit-test")
+        listing = threading.Event()
+        listed = threading.Event()
+
+        def slow_listing(request):
+            listing.set()
+            assert listed.wait(timeout=5)
+            return HTTPStatus.OK, {}, json.dumps([{"index": "unit-test.new"}])
+
+        with responses.RequestsMock() as rsp:
+            url = "http://elasticsearch.example.com:7080/_cat/indices/unit-test.*"
+            rsp.add(responses.GET, url, json=[{"index": "unit-test.old"}])
+            assert catalog.existing(60, client.logger) == {"unit-test.old"}
+            rsp.remove(responses.GET, url)
+            rsp.add_callback(responses.GET, url, callback=slow_listing)
+            now[0] += 60
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                refresh = executor.submit(catalog.existing, 60, client.logger)
+                assert listing.wait(timeout=5)
+                assert catalog.existing(60, client.logger) == {"unit-test.old"}
+                listed.set()
+                assert refresh.result() == {"unit-test.new"}
+            assert catalog.existing(60, client.logger) == {"unit-test.new"}
+            assert len(rsp.calls) == 2
@@ -3,6 +3,7 @@ from pathlib import Path
 import re
 import shutil
 import subprocess
+import tarfile
 
 import pytest
 
@@ -13,6 +14,7 @@ from pbench.server.cache_manager import (
     Tarball,
     TarballModeChangeError,
     TarballNotFound,
+    TarballScanner,
     TarballUnpackError,
 )
 from pbench.server.database.models.datasets import Dataset, DatasetBadName
@@ -177,6 +179,105 @@ class TestCacheManager:
             cm.create("ABC", source_tarball)
         assert exc.value.tarball == Dataset.stem(source_tarball)
 
+    @pytest.mark.parametrize("chunk_size", (1, 100, 65536))
+    def test_scanner(self, make_logger, tarball, chunk_size):
+        """
+        Feed a tarball to the scanner in chunks of varying size, and check
+        that it captures the metadata.log and the member manifest.
+        """
+        source_tarball, _, _ = tarball
+        name = Dataset.stem(source_tarball)
+        scanner = TarballScanner(name, make_logger)
+        data = source_tarball.read_bytes()
+        for offset in range(0, len(data), chunk_size):
+            scanner.feed(data[offset : offset + chunk_size])
+        manifest = scanner.finish()
+        assert manifest["metadata"] == {"pbench": {"date": "2002-05-16"}}
+        assert [m["name"] for m in manifest["members"]] == [f"{name}/metadata.log"]
+        assert manifest["raw_size"] == manifest["members"][0]["size"]
+        assert manifest["raw_size"] > 0
+
+        # A second call returns the same result without waiting.
+        assert scanner.finish() == manifest
+
+    def test_scanner_bad_stream(self, make_logger):
+        """
+        A stream which isn't a tarball results in no manifest, and the scanner
+        doesn't block the writer while consuming the remainder of the stream.
+        """
+        scanner = TarballScanner("bad", make_logger)
+        for _ in range(TarballScanner.QUEUE_DEPTH * 2):
+            scanner.feed(b"This is not a tarball")
+        assert scanner.finish() is None
+        assert scanner.error is not None
+
+    def test_manifest(
+        self, selinux_disabled, server_config, make_logger, tarball, monkeypatch
+    ):
+        """
+        Create a dataset with a manifest, and check that the metadata and list
+        of members are taken from the manifest rather than the tarball.
+        """
+        source_tarball, _, md5 = tarball
+        name = Dataset.stem(source_tarball)
+        scanner = TarballScanner(name, make_logger)
+        scanner.feed(source_tarball.read_bytes())
+        manifest = scanner.finish()
+        manifest_file = source_tarball.with_suffix(".xz.manifest")
+        Tarball.write_manifest(manifest_file, manifest)
+
+        cm = CacheManager(server_config, make_logger)
+        tarball = cm.create("ABC", source_tarball)
+        assert not manifest_file.exists()
+        assert tarball.manifest_path == cm.archive_root / "ABC" / manifest_file.name
+        assert tarball.manifest_path.exists()
+
+        def extract(path: str) -> str:
+            raise AssertionError("Tarball should not be decompressed")
+
+        monkeypatch.setattr(tarball, "extract", extract)
+        assert tarball.get_metadata() == {"pbench": {"date": "2002-05-16"}}
+
+        members = Tarball.manifest_members(tarball.get_manifest())
+        with tarfile.open(tarball.tarball_path) as tar:
+            expected = tar.getmembers()
+        assert [(m.name, m.type, m.size, m.mode, m.mtime) for m in members] == [
+            (m.name, m.type, m.size, m.mode, m.mtime) for m in expected
+        ]
+        assert members[0].isfile()
+
+        manifest_path = tarball.manifest_path
+        cm.delete(md5)
+        assert not manifest_path.exists()
+
+    def test_manifest_copy_failure(
+        self, selinux_disabled, server_config, make_logger, tarball, monkeypatch
+    ):
+        """
+        When the tarball can't be copied, neither the MD5 nor the manifest
+        is left behind in the controller directory.
+        """
+        source_tarball, _, _ = tarball
+        name = Dataset.stem(source_tarball)
+        scanner = TarballScanner(name, make_logger)
+        scanner.feed(source_tarball.read_bytes())
+        manifest_file = source_tarball.with_suffix(".xz.manifest")
+        Tarball.write_manifest(manifest_file, scanner.finish())
+
+        real_copy2 = shutil.copy2
+
+        def copy2(src, dst, **kwargs):
+            if Path(src) == source_tarball:
+                raise OSError("No space left on device")
+            return real_copy2(src, dst, **kwargs)
+
+        monkeypatch.setattr(shutil, "copy2", copy2)
+        cm = CacheManager(server_config, make_logger)
+        with pytest.raises(OSError):
+            cm.create("ABC", source_tarball)
+        assert list((cm.archive_root / "ABC").iterdir()) == []
+        assert manifest_file.exists()
+
     def test_tarball_subprocess_run_with_exception(self, monkeypatch):
         """Test to check the subprocess_run functionality of the Tarball when
         an Exception occured"""
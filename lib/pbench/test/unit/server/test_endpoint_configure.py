@@ -51,6 +51,7 @@ class TestEndpointConfig:
             },
             "identification": f"Pbench server {server_config.COMMIT_ID}",
             "api": {
+                "datasets_compare": f"{uri}/datasets/compare",
                 "datasets_contents": f"{uri}/datasets/contents",
                 "datasets_daterange": f"{uri}/datasets/daterange",
                 "datasets_delete": f"{uri}/datasets/delete",
@@ -62,16 +63,24 @@ class TestEndpointConfig:
                 "datasets_namespace": f"{uri}/datasets/namespace",
                 "datasets_publish": f"{uri}/datasets/publish",
                 "datasets_search": f"{uri}/datasets/search",
+                "datasets_timeseries": f"{uri}/datasets/timeseries",
                 "datasets_values": f"{uri}/datasets/values",
                 "endpoints": f"{uri}/endpoints",
                 "login": f"{uri}/login",
                 "logout": f"{uri}/logout",
                 "register": f"{uri}/register",
                 "server_configuration": f"{uri}/server/configuration",
+                "server_metrics": f"{uri}/metrics",
                 "upload": f"{uri}/upload",
+                "upload_part": f"{uri}/upload/part",
+                "upload_session": f"{uri}/upload/session",
                 "user": f"{uri}/user",
             },
             "uri": {
+                "datasets_compare": {
+                    "template": f"{uri}/datasets/compare",
+                    "params": {},
+                },
                 "datasets_contents": {
                     "template": f"{uri}/datasets/contents/{{dataset}}/{{target}}",
                     "params": {
@@ -119,6 +128,10 @@ class TestEndpointConfig:
                     "params": {"dataset": {"type": "string"}},
                 },
                 "datasets_search": {"template": f"{uri}/datasets/search", "params": {}},
+                "datasets_timeseries": {
+                    "template": f"{uri}/datasets/timeseries/{{dataset}}",
+                    "params": {"dataset": {"type": "string"}},
+                },
                 "datasets_values": {
                     "template": f"{uri}/datasets/values/{{dataset}}/{{dataset_view}}",
                     "params": {
@@ -134,10 +147,22 @@ class TestEndpointConfig:
                     "template": f"{uri}/server/configuration/{{key}}",
                     "params": {"key": {"type": "string"}},
                 },
+                "server_metrics": {"template": f"{uri}/metrics", "params": {}},
                 "upload": {
                     "template": f"{uri}/upload/{{filename}}",
                     "params": {"filename": {"type": "string"}},
                 },
+                "upload_part": {
+                    "template": f"{uri}/upload/part/{{filename}}/{{part}}",
+                    "params": {
+                        "filename": {"type": "string"},
+                        "part": {"type": "int"},
+                    },
+                },
+                "upload_session": {
+                    "template": f"{uri}/upload/session/{{filename}}",
+                    "params": {"filename": {"type": "string"}},
+                },
                 "user": {
                     "template": f"{uri}/user/{{target_username}}",
                     "params": {"target_username": {"type": "string"}},
@@ -1,4 +1,16 @@
-from pbench.server.indexer import ResultData
+import gzip
+import json
+
+import pytest
+
+from pbench.server.indexer import (
+    BulkFileSink,
+    es_index,
+    read_bulk_file,
+    ResultData,
+    StageStats,
+    ToolDataRollup,
+)
 
 
 class TestResultData_expand_uid_template:
@@ -52,3 +64,250 @@ class TestResultData_expand_uid_template:
             templ, {"str": "abc", "int": 123, "float": 45.6789012, "other": []}
         )
         assert res == "abc_123_45.678901_%other%_UID"
+
+
+class TestBulkFileSink:
+    actions = [
+        {
+            "_op_type": "create",
+            "_index": f"idx-{i % 2}",
+            "_id": f"id{i}",
+            "_source": {"n": i, "name": "\u00e9t\u00e9\nhiver"},
+        }
+        for i in range(5)
+    ]
+
+    def test_round_trip(self, tmp_path, make_logger):
+        sink = BulkFileSink(tmp_path / "bulk", "pbench-index.run-1", make_logger)
+        beg, end, successes, duplicates, failures, retries = es_index(
+            sink, iter(self.actions), None, make_logger
+        )
+        assert (successes, duplicates, failures, retries) == (5, 0, 0, 0)
+        assert beg <= end
+        assert sink.path == tmp_path / "bulk" / "pbench-index.run-1.0001.ndjson.gz"
+
+        # The Elasticsearch bulk API format, one line per action and source.
+        with gzip.open(sink.path, "rt") as fp:
+            lines = fp.read().splitlines()
+        assert len(lines) == 10
+        assert json.loads(lines[0]) == {"create": {"_index": "idx-0", "_id": "id0"}}
+        assert list(read_bulk_file(sink.path)) == self.actions
+
+        sink.write_manifest({"resource_id": "ABC"})
+        assert json.loads(
+            (tmp_path / "bulk" / "pbench-index.run-1.0001.json").read_text()
+        ) == {"resource_id": "ABC"}
+
+        sink.write(iter(self.actions[:1]))
+        assert sink.path.name == "pbench-index.run-1.0002.ndjson.gz"
+
+    def test_failure(self, tmp_path, make_logger):
+        """A file is only given its final name once complete."""
+
+        def actions():
+            yield self.actions[0]
+            raise ValueError("bad date")
+
+        sink = BulkFileSink(tmp_path, "pbench-index.run-1", make_logger)
+        with pytest.raises(ValueError):
+            sink.write(actions())
+        assert list(tmp_path.iterdir()) == []
+        assert sink.path is None
+
+
+class TestStageStats:
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        """A clock which only advances when told to, with half as much CPU
+        time as wall clock time.
+        """
+        now = [0.0]
+        monkeypatch.setattr("pbench.server.indexer.time.perf_counter", lambda: now[0])
+        monkeypatch.setattr(
+            "pbench.server.indexer.time.process_time", lambda: now[0] / 2
+        )
+        return now
+
+    def test_nested(self, clock):
+        """Time is only charged to the innermost stage, including the time
+        spent generating the actions consumed by an outer stage.
+        """
+        stats = StageStats()
+
+        def actions():
+            for i in range(3):
+                clock[0] += 1
+                with stats.stage("sosreports"):
+                    clock[0] += 10
+                stats.add("toc", nbytes=100)
+                yield i
+
+        with stats.stage("bulk"):
+            for _ in stats.wrap("toc", actions()):
+                clock[0] += 0.5
+
+        record = stats.record()
+        assert list(record) == ["bulk", "toc", "sosreports"]
+        assert record["bulk"]["wall"] == 1.5
+        assert record["bulk"]["cpu"] == 0.75
+        assert record["bulk"]["docs"] == 0
+        assert record["toc"]["wall"] == 3
+        assert record["toc"]["docs"] == 3
+        assert record["toc"]["bytes"] == 300
+        assert record["sosreports"]["wall"] == 30
+        assert all(s["maxrss"] > 0 for s in record.values())
+
+    def test_failure(self, clock):
+        """A failing generator is charged for the time it took."""
+        stats = StageStats()
+
+        def actions():
+            clock[0] += 2
+            raise ValueError("bad date")
+            yield
+
+        with pytest.raises(ValueError):
+            with stats.stage("bulk"):
+                list(stats.wrap("result-data", actions()))
+        assert stats.record()["result-data"]["wall"] == 2
+        assert stats._active == []
+
+    def test_rss(self, clock, monkeypatch):
+        """The RSS sampled while a stage is active is only charged to that
+        stage, and the documents of a stage wrapped with `count=False` are
+        not counted twice.
+        """
+        rss = [1000]
+        monkeypatch.setattr("pbench.server.indexer._current_rss", lambda: rss[0])
+        stats = StageStats()
+
+        def tool(n):
+            for i in range(n):
+                clock[0] += 1
+                rss[0] += 1000
+                yield i
+
+        def actions():
+            for name, n in (("iostat", 2), ("mpstat", 1)):
+                clock[0] += 1
+                yield from stats.wrap(f"tool-data:{name}", tool(n))
+            rss[0] = 500
+
+        with stats.stage("bulk"):
+            for _ in stats.wrap("tool-data", actions(), count=False):
+                clock[0] += 1
+
+        record = stats.record()
+        assert record["tool-data"]["docs"] == 0
+        assert record["tool-data:iostat"]["docs"] == 2
+        assert record["tool-data:mpstat"]["docs"] == 1
+        assert record["tool-data:iostat"]["maxrss"] == 3000
+        assert record["tool-data:mpstat"]["maxrss"] == 4000
+        assert record["tool-data"]["maxrss"] == 3000
+        assert record["bulk"]["maxrss"] == 4000
+
+    def test_merge(self, clock):
+        total = StageStats()
+        for docs in (1, 2):
+            stats = StageStats()
+            with stats.stage("open"):
+                clock[0] += docs
+            stats.add("run", docs=docs, nbytes=10)
+            total.merge(stats)
+        record = total.record()
+        assert record["open"]["wall"] == 3
+        assert record["run"] == {
+            "wall": 0.0,
+            "cpu": 0.0,
+            "docs": 3,
+            "bytes": 20,
+            "maxrss": 0,
+        }
+        lines = total.table()
+        assert lines[0].split()[:3] == ["stage", "wall", "(s)"]
+        assert lines[1].split()[:4] == ["open", "3.00", "1.50", "0"]
+
+
+class TestToolDataRollup:
+    class FakeToolData:
+        toolname = "iostat"
+
+    @staticmethod
+    def source(ts, dev, util, iops, host="host"):
+        source = {
+            "@timestamp": ts,
+            "@timestamp_original": "0",
+            "run": {"id": "run-id"},
+            "iteration": {"name": "1-default", "number": 1},
+            "sample": {"name": "sample1", "hostname": host},
+            "iostat": {
+                "@idx": 0,
+                "id": dev,
+                "disk": {"util": util, "iops": {"read": iops, "write": 0.0}},
+            },
+        }
+        if dev is None:
+            del source["iostat"]["id"]
+        return source
+
+    def test_intervals(self):
+        """Each identifier is rolled up in its own intervals, which are
+        emitted once a later interval starts or when flushed.
+        """
+        rollup = ToolDataRollup(self.FakeToolData, 60)
+        assert rollup.add(self.source("2022-03-01T12:00:00.000000", "sda", 10, 1)) == []
+        assert rollup.add(self.source("2022-03-01T12:00:00.000000", "sdb", 7, 7)) == []
+        assert rollup.add(self.source("2022-03-01T12:00:30.000000", "sda", 30, 5)) == []
+        done = rollup.add(self.source("2022-03-01T12:01:00.000000", "sda", 50, 2))
+        assert done == [
+            {
+                "@timestamp": "2022-03-01T12:00:00.000000",
+                "run": {"id": "run-id"},
+                "iteration": {"name": "1-default", "number": 1},
+                "sample": {"name": "sample1", "hostname": "host"},
+                "rollup": {
+                    "interval": 60,
+                    "samples": 2,
+                    "end": "2022-03-01T12:00:30.000000",
+                },
+                "iostat": {
+                    "id": "sda",
+                    "disk": {
+                        "util": {"min": 10, "max": 30, "avg": 20.0, "count": 2},
+                        "iops": {
+                            "read": {"min": 1, "max": 5, "avg": 3.0, "count": 2},
+                            "write": {"min": 0.0, "max": 0.0, "avg": 0.0, "count": 2},
+                        },
+                    },
+                },
+            }
+        ]
+        flushed = rollup.flush()
+        assert [(d["@timestamp"], d["iostat"]["id"]) for d in flushed] == [
+            ("2022-03-01T12:01:00.000000", "sda"),
+            ("2022-03-01T12:00:00.000000", "sdb"),
+        ]
+        assert flushed[1]["iostat"]["disk"]["util"] == {
+            "min": 7,
+            "max": 7,
+            "avg": 7.0,
+            "count": 1,
+        }
+        assert rollup.flush() == []
+
+    def test_series_without_id(self):
+        """Documents without an identifier are rolled up per host rather than
+        all together.
+        """
+        rollup = ToolDataRollup(self.FakeToolData, 60)
+        ts = "2022-03-01T12:00:00.000000"
+        assert rollup.add(self.source(ts, None, 10, 1, host="host1")) == []
+        assert rollup.add(self.source(ts, None, 30, 3, host="host2")) == []
+        assert rollup.add(self.source(ts, None, 20, 2, host="host1")) == []
+        flushed = rollup.flush()
+        assert [
+            (d["sample"]["hostname"], d["iostat"]["disk"]["util"]) for d in flushed
+        ] == [
+            ("host1", {"min": 10, "max": 20, "avg": 15.0, "count": 2}),
+            ("host2", {"min": 30, "max": 30, "avg": 30.0, "count": 1}),
+        ]
@@ -1,4 +1,5 @@
 from argparse import Namespace
+import json
 from logging import Logger
 import os
 from os import stat_result
@@ -16,6 +17,7 @@ from pbench.server.database.models.datasets import (
     MetadataBadKey,
     States,
 )
+from pbench.server.indexer import BulkFileSink, read_bulk_file
 from pbench.server.indexing_tarballs import (
     Index,
     SigIntException,
@@ -107,6 +109,7 @@ class FakePbenchTemplates:
 class FakeReport:
     reported = False
     failure: Optional[Exception] = None
+    status: Optional[str] = None
 
     def __init__(
         self,
@@ -129,12 +132,15 @@ class FakeReport:
         __class__.reported = True
         if self.failure:
             raise self.failure
+        if doctype == "status":
+            __class__.status = file_to_index.read_text()
         return "tracking_id"
 
     @classmethod
     def reset(cls):
         cls.reported = False
         cls.failure = None
+        cls.status = None
 
 
 class FakeIdxContext:
@@ -207,6 +213,7 @@ class FakeSync:
     called: List[str] = []
     did: Optional[Operation] = None
     updated: Optional[List[Operation]] = None
+    status: Optional[str] = None
     errors: JSONOBJECT = {}
 
     @classmethod
@@ -215,6 +222,7 @@ class FakeSync:
         cls.called = []
         cls.did = None
         cls.updated = None
+        cls.status = None
         cls.errors = {}
 
     def __init__(self, logger: Logger, component: str):
@@ -231,9 +239,11 @@ class FakeSync:
         dataset: Dataset,
         did: Optional[Operation],
         enabled: Optional[List[Operation]],
+        status: Optional[str] = None,
     ):
         __class__.did = did
         __class__.updated = enabled
+        __class__.status = status
 
     def error(self, dataset: Dataset, message: str):
         __class__.errors[dataset.name] = message
@@ -493,6 +503,22 @@ class TestIndexingTarballs:
             }
         }
 
+    def test_process_tb_stats(self, mocks, index):
+        """The resources used by each stage of indexing are summarized in
+        the status report.
+        """
+
+        def fake_es_index(es, actions, errorsfp, logger, _dbg=0):
+            return (1000, 2000, len(list(actions)), 0, 0, 0)
+
+        mocks.setattr("pbench.server.indexing_tarballs.es_index", fake_es_index)
+        stat = index.process_tb(tarballs=[tarball_2, tarball_1])
+        assert stat == 0
+        report = FakeReport.status.split("\nIndexing Stages\n===============\n")[1]
+        header, *stages = report.splitlines()
+        assert header.split()[0] == "stage"
+        assert [line.split()[0] for line in stages] == ["open", "bulk"]
+
     def test_process_tb(self, mocks, index):
         index_actions = []
 
@@ -511,3 +537,105 @@ class TestIndexingTarballs:
             [{"action": "make_all_actions", "name": f"{ds2.name}.tar.xz"}],
             [{"action": "make_all_actions", "name": f"{ds1.name}.tar.xz"}],
         ]
+
+
+class TestOfflineIndexing:
+    """Verify writing the documents to bulk action files, and replaying them
+    into Elasticsearch later.
+    """
+
+    @staticmethod
+    def actions(self) -> JSONARRAY:
+        return [
+            {
+                "_op_type": "create",
+                "_index": "idx1",
+                "_id": f"{self.name}-{i}",
+                "_source": {"name": self.name},
+            }
+            for i in range(2)
+        ]
+
+    @pytest.fixture()
+    def bulk_dir(self, tmp_path) -> Path:
+        return tmp_path / "bulk"
+
+    @pytest.fixture()
+    def offline_index(self, mocks, server_config, make_logger, bulk_dir):
+        mocks.setattr(FakePbenchTarBall, "make_all_actions", self.actions)
+        idxctx = FakeIdxContext(server_config, make_logger)
+        idxctx.es = BulkFileSink(bulk_dir, "test.FAKE_TS", make_logger)
+        return Index("test", Namespace(index_tool_data=False, re_index=False), idxctx)
+
+    def test_process_tb(self, offline_index, bulk_dir):
+        """The documents are written instead of indexed, and the datasets are
+        left to be completed by the replay.
+        """
+        stat = offline_index.process_tb(tarballs=[tarball_2, tarball_1])
+        assert stat == 0
+        assert not FakePbenchTemplates.templates_updated
+        assert sorted(p.name for p in bulk_dir.iterdir()) == [
+            "test.FAKE_TS.0001.json",
+            "test.FAKE_TS.0001.ndjson.gz",
+            "test.FAKE_TS.0002.json",
+            "test.FAKE_TS.0002.ndjson.gz",
+        ]
+        assert [
+            a["_id"] for a in read_bulk_file(bulk_dir / "test.FAKE_TS.0001.ndjson.gz")
+        ] == ["ds2.tar.xz-0", "ds2.tar.xz-1"]
+        assert json.loads((bulk_dir / "test.FAKE_TS.0002.json").read_text()) == {
+            "resource_id": "ABC",
+            "name": "ds1",
+            "enabled": ["INDEX_TOOL"],
+            "index_map": {"idx1": ["id1", "id2"]},
+        }
+        assert FakeDataset.new_state == States.INDEXING
+        assert FakeMetadata.set_values == {}
+        assert FakeSync.did == Operation.INDEX and FakeSync.updated is None
+        assert FakeSync.status == "written to test.FAKE_TS.0002.ndjson.gz"
+
+    def test_replay(self, offline_index, bulk_dir, mocks, index):
+        offline_index.process_tb(tarballs=[tarball_1])
+        offline_index.idxctx.es.write(iter(self.actions(ds3)))
+        mocks.setattr(FakeDataset, "attach", lambda resource_id: ds1, raising=False)
+        replayed = []
+
+        def fake_es_index(es, actions, errorsfp, logger, _dbg=0):
+            actions = list(actions)
+            replayed.append([a["_id"] for a in actions])
+            return (1000, 2000, len(actions), 0, 0, 0)
+
+        mocks.setattr("pbench.server.indexing_tarballs.es_index", fake_es_index)
+        stat = index.replay(bulk_dir)
+        assert stat == 0
+        assert FakePbenchTemplates.templates_updated
+        assert replayed == [["ds1.tar.xz-0", "ds1.tar.xz-1"], ["ds3-0", "ds3-1"]]
+        assert list(bulk_dir.iterdir()) == []
+        assert FakeDataset.new_state == States.INDEXED
+        assert FakeMetadata.set_values == {
+            "ds1": {
+                Metadata.REINDEX: False,
+                Metadata.INDEX_MAP: {"idx1": ["id1", "id2"]},
+            }
+        }
+        assert FakeSync.updated == [Operation.INDEX_TOOL]
+
+    def test_replay_failures(self, offline_index, bulk_dir, mocks, index):
+        """Files with indexing failures are kept to be replayed again."""
+        offline_index.process_tb(tarballs=[tarball_1])
+        mocks.setattr(FakeDataset, "attach", lambda resource_id: ds1, raising=False)
+
+        def fake_es_index(es, actions, errorsfp, logger, _dbg=0):
+            print("failed", file=errorsfp)
+            return (1000, 2000, 1, 0, 1, 0)
+
+        mocks.setattr("pbench.server.indexing_tarballs.es_index", fake_es_index)
+        stat = index.replay(bulk_dir)
+        assert stat == index.error_code["OP_ERROR"].value
+        assert sorted(p.name for p in bulk_dir.iterdir()) == [
+            "test.FAKE_TS.0001.errors.json",
+            "test.FAKE_TS.0001.json",
+            "test.FAKE_TS.0001.ndjson.gz",
+        ]
+        assert FakeDataset.new_state == States.INDEXING
+        assert FakeSync.errors["ds1"] == "1:Operational error while indexing"
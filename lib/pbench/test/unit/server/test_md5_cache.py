@@ -0,0 +1,71 @@
+import os
+import sqlite3
+
+import pytest
+
+from pbench.server.md5_cache import Md5Cache
+
+DAY = 24 * 60 * 60
+
+
+@pytest.fixture
+def tarball(tmp_path):
+    tar = tmp_path / "a.tar.xz"
+    tar.write_bytes(b"tar ball")
+    return tar
+
+
+class TestMd5Cache:
+    def test_created(self, tmp_path):
+        """The database, and its table, are created from scratch."""
+        path = tmp_path / "md5cache.db"
+        Md5Cache(path, DAY).close()
+        db = sqlite3.connect(str(path))
+        assert db.execute("SELECT * FROM md5").fetchall() == []
+        db.close()
+
+    def test_miss(self, tmp_path, tarball):
+        cache = Md5Cache(tmp_path / "md5cache.db", DAY)
+        assert cache.lookup(Md5Cache.key(tarball.stat()), 100.0) is None
+
+    def test_hit(self, tmp_path, tarball):
+        """An entry is found until it is due to be re-verified, including by
+        another run of the script.
+        """
+        path = tmp_path / "md5cache.db"
+        cache = Md5Cache(path, DAY)
+        cache.update(Md5Cache.key(tarball.stat()), "abcdef", 100.0)
+        cache.commit(100.0)
+        cache.close()
+
+        cache = Md5Cache(path, DAY)
+        key = Md5Cache.key(tarball.stat())
+        assert cache.lookup(key, 100.0 + DAY - 1) == "abcdef"
+        assert cache.lookup(key, 100.0 + DAY) is None
+
+    def test_stale_mtime(self, tmp_path, tarball):
+        """A tar ball whose modification time changed is not found."""
+        cache = Md5Cache(tmp_path / "md5cache.db", DAY)
+        st = tarball.stat()
+        cache.update(Md5Cache.key(st), "abcdef", 100.0)
+        os.utime(tarball, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+        assert cache.lookup(Md5Cache.key(tarball.stat()), 100.0) is None
+
+    def test_stale_size(self, tmp_path, tarball):
+        """A tar ball whose size changed is not found, even if its
+        modification time was restored.
+        """
+        cache = Md5Cache(tmp_path / "md5cache.db", DAY)
+        st = tarball.stat()
+        cache.update(Md5Cache.key(st), "abcdef", 100.0)
+        tarball.write_bytes(b"another tar ball")
+        os.utime(tarball, ns=(st.st_atime_ns, st.st_mtime_ns))
+        assert cache.lookup(Md5Cache.key(tarball.stat()), 100.0) is None
+
+    def test_commit_expires(self, tmp_path, tarball):
+        """Entries not used for longer than the re-verify age are dropped."""
+        cache = Md5Cache(tmp_path / "md5cache.db", DAY)
+        key = Md5Cache.key(tarball.stat())
+        cache.update(key, "abcdef", 100.0)
+        cache.commit(100.0 + DAY + 1)
+        assert cache.db.execute("SELECT * FROM md5").fetchall() == []
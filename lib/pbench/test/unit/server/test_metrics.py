@@ -0,0 +1,189 @@
+from http import HTTPStatus
+from logging import WARNING
+import os
+
+import pytest
+
+from pbench.server import metrics
+from pbench.server.metrics import Registry, WorkerTextfile
+
+
+class TestRegistry:
+    def test_exposition(self):
+        """The metric families are rendered in the Prometheus text format,
+        omitting those without samples.
+        """
+        registry = Registry()
+        counter = registry.counter("requests_total", "Requests", ("endpoint",))
+        gauge = registry.gauge("backlog", "Backlog")
+        histogram = registry.histogram("latency", "Latency", ("api",), (0.1, 1))
+        registry.counter("unused_total", "Never incremented")
+        counter.inc(endpoint='say "hi"\\')
+        counter.inc(2, endpoint='say "hi"\\')
+        gauge.set(7)
+        histogram.observe(0.05, api="a")
+        histogram.observe(0.5, api="a")
+        histogram.observe(5, api="a")
+        assert counter.get(endpoint='say "hi"\\') == 3.0
+        assert histogram.get(api="a") == 3
+        assert registry.exposition() == (
+            "# HELP requests_total Requests\n"
+            "# TYPE requests_total counter\n"
+            'requests_total{endpoint="say \\"hi\\"\\\\"} 3.0\n'
+            "# HELP backlog Backlog\n"
+            "# TYPE backlog gauge\n"
+            "backlog 7.0\n"
+            "# HELP latency Latency\n"
+            "# TYPE latency histogram\n"
+            'latency_bucket{api="a",le="0.1"} 1\n'
+            'latency_bucket{api="a",le="1.0"} 2\n'
+            'latency_bucket{api="a",le="+Inf"} 3\n'
+            'latency_sum{api="a"} 5.55\n'
+            'latency_count{api="a"} 3\n'
+        )
+
+    def test_bad_labels(self):
+        registry = Registry()
+        counter = registry.counter("requests_total", "Requests", ("endpoint",))
+        with pytest.raises(ValueError):
+            counter.inc(api="x")
+        with pytest.raises(ValueError):
+            registry.gauge("requests_total", "Requests")
+
+    def test_textfiles(self, tmp_path, make_logger):
+        """The textfiles of other processes are merged into the families of
+        the registry, with a "source" label.
+        """
+        other = Registry()
+        other.counter("requests_total", "Requests", ("endpoint",)).inc(endpoint="x")
+        other.gauge("backlog", "Backlog").set(3)
+        directory = tmp_path / "metrics"
+        registry = metrics.REGISTRY
+        metrics.REGISTRY = other
+        try:
+            metrics.write_textfile(directory, "pbench-index", make_logger)
+        finally:
+            metrics.REGISTRY = registry
+        assert [p.name for p in metrics.textfiles(directory)] == ["pbench-index.prom"]
+
+        mine = Registry()
+        mine.counter("requests_total", "Requests", ("endpoint",)).inc(endpoint="y")
+        assert mine.exposition(metrics.textfiles(directory)) == (
+            "# HELP requests_total Requests\n"
+            "# TYPE requests_total counter\n"
+            'requests_total{endpoint="y"} 1.0\n'
+            'requests_total{source="pbench-index",endpoint="x"} 1.0\n'
+            "# HELP backlog Backlog\n"
+            "# TYPE backlog gauge\n"
+            'backlog{source="pbench-index"} 3.0\n'
+        )
+
+    def test_worker_textfiles(self, tmp_path, make_logger):
+        """A worker flushes its textfile periodically, and ignores its own
+        textfile and the ones of the workers which exited.
+        """
+        worker = WorkerTextfile(tmp_path, make_logger, interval=3600)
+        worker.flush()
+        mine = tmp_path / f"api-{os.getpid()}.prom"
+        assert mine.exists()
+        mine.unlink()
+        worker.flush()
+        assert not mine.exists()
+
+        # There's no process with a PID beyond the kernel's maximum
+        dead = tmp_path / "api-4194305.prom"
+        dead.write_text("")
+        (tmp_path / "api-1.prom").write_text("")
+        (tmp_path / "pbench-unpack-tarballs.prom").write_text("")
+        (tmp_path / f"api-{os.getpid()}.prom").write_text("")
+        assert [p.name for p in worker.others()] == [
+            "api-1.prom",
+            "pbench-unpack-tarballs.prom",
+        ]
+        assert not dead.exists()
+
+
+class TestRequestMetrics:
+    def test_backend_time(self):
+        """Backend time is only charged to the current request."""
+        before = metrics.API_BACKEND_TIME.get(endpoint="Test", backend="sql")
+        metrics.add_backend_time("sql", 1.0)
+        with metrics.RequestMetrics("Test", "GET") as m:
+            metrics.add_backend_time("sql", 0.5)
+            metrics.add_backend_time("sql", 0.25)
+            m.finish(HTTPStatus.OK, 10)
+        metrics.add_backend_time("sql", 1.0)
+        assert metrics.API_BACKEND_TIME.get(endpoint="Test", backend="sql") == (
+            before + 0.75
+        )
+        assert metrics.API_RESPONSE_SIZE.get(endpoint="Test", method="GET") >= 1
+
+    def test_endpoint(self, client, server_config):
+        """The API requests are counted, and the metrics are exposed."""
+        labels = {"endpoint": "ServerConfiguration", "method": "GET", "status": "200"}
+        before = metrics.API_REQUESTS.get(**labels)
+        response = client.get(f"{server_config.rest_uri}/server/configuration")
+        assert response.status_code == HTTPStatus.OK
+        assert metrics.API_REQUESTS.get(**labels) == before + 1
+
+        response = client.get(f"{server_config.rest_uri}/metrics")
+        assert response.status_code == HTTPStatus.OK
+        assert response.content_type == metrics.CONTENT_TYPE
+        text = response.get_data(as_text=True)
+        assert "# TYPE pbench_server_api_request_duration_seconds histogram" in text
+        assert (
+            'pbench_server_api_requests_total{endpoint="ServerConfiguration",'
+            f'method="GET",status="200"}} {before + 1}'
+        ) in text
+
+    def test_aborted(self, client, server_config):
+        """Aborted requests are counted with their HTTP status."""
+        labels = {"endpoint": "DatasetsDetail", "method": "GET", "status": "404"}
+        before = metrics.API_REQUESTS.get(**labels)
+        response = client.get(f"{server_config.rest_uri}/datasets/detail/nosuch")
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        assert metrics.API_REQUESTS.get(**labels) == before + 1
+
+    def test_trace(self):
+        """Traced requests count the distinct backend calls they make."""
+        with metrics.RequestMetrics("Test", "GET", trace=True) as m:
+            metrics.add_backend_time("sql", 0.25)
+            metrics.trace_call("sql", "SELECT 1", 0.125)
+            metrics.trace_call("elasticsearch", "POST /a,b/_search", 1.0)
+            metrics.trace_call("sql", "SELECT\n    1", 0.125)
+        metrics.trace_call("sql", "SELECT 2", 1.0)
+        assert m.calls == {
+            ("sql", "SELECT 1"): [2, 0.25],
+            ("elasticsearch", "POST /a,b/_search"): [1, 1.0],
+        }
+        report = metrics.trace_report(m, HTTPStatus.OK).splitlines()
+        assert report[0].startswith("Slow request GET Test (200): ")
+        assert report[0].endswith(" [sql 2 calls 0.250s]")
+        assert report[1:] == [
+            "  sql 2x 0.250s: SELECT 1",
+            "  elasticsearch 1x 1.000s: POST /a,b/_search",
+        ]
+
+        with metrics.RequestMetrics("Test", "GET") as m:
+            metrics.trace_call("sql", "SELECT 1", 0.125)
+        assert m.calls is None
+
+    @pytest.mark.parametrize("threshold,logged", ((None, False), ("0", True)))
+    def test_slow_request(self, caplog, client, server_config, threshold, logged):
+        """Requests over the threshold are logged with their SQL statements."""
+        if threshold:
+            server_config.conf.set("pbench-server", "slow_request_threshold", threshold)
+        response = client.get(f"{server_config.rest_uri}/datasets/detail/nosuch")
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        slow = [
+            r.getMessage()
+            for r in caplog.records
+            if r.levelno == WARNING and r.getMessage().startswith("Slow request")
+        ]
+        if logged:
+            assert len(slow) == 1
+            assert slow[0].startswith("Slow request GET DatasetsDetail (404): ")
+            assert "\n  sql 1x " in slow[0]
+            assert "FROM datasets" in slow[0]
+        else:
+            assert not slow
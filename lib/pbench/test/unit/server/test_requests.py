@@ -1,5 +1,9 @@
+import datetime
+import hashlib
 from http import HTTPStatus
+import json
 from logging import Logger
+import os
 from pathlib import Path
 import socket
 from typing import Any
@@ -7,6 +11,7 @@ from typing import Any
 import pytest
 
 from pbench.server import PbenchServerConfig
+from pbench.server.api.resources.upload_api import UploadBase, UploadSession
 from pbench.server.cache_manager import CacheManager
 from pbench.server.database.models.datasets import (
     Dataset,
@@ -138,7 +143,7 @@ class TestUpload:
     ):
         """Test with URL uploading a file named "f" which is missing the
         required filename extension"""
-        expected_message = "File extension not supported, must be .tar.xz"
+        expected_message = "File extension not supported, must be .tar.xz or .tar.zst"
         response = client.put(
             f"{server_config.rest_uri}/upload/f",
             headers={
@@ -237,7 +242,7 @@ class TestUpload:
     ):
         datafile = tmp_path / bad_extension
         datafile.write_text("compressed tar ball")
-        expected_message = "File extension not supported, must be .tar.xz"
+        expected_message = "File extension not supported, must be .tar.xz or .tar.zst"
         with datafile.open("rb") as data_fp:
             response = client.put(
                 self.gen_uri(server_config, bad_extension),
@@ -352,6 +357,15 @@ class TestUpload:
         assert self.cachemanager_created
         assert dataset.name in self.cachemanager_created
 
+        # The fake cache manager doesn't move the manifest file, so we can
+        # find it in the temporary upload directory.
+        manifest_path = Path(str(self.cachemanager_create_path) + ".manifest")
+        manifest = json.loads(manifest_path.read_text())
+        assert manifest["metadata"] == {"pbench": {"date": "2002-05-16"}}
+        assert [m["name"] for m in manifest["members"]] == [
+            f"{dataset.name}/metadata.log"
+        ]
+
         for record in caplog.records:
             assert record.levelname in ["DEBUG", "INFO"]
 
@@ -430,3 +444,263 @@ class TestUpload:
         assert not self.cachemanager_create_path.exists()
         assert not Path(str(self.cachemanager_create_path) + ".md5").exists()
         assert self.tarball_deleted == Dataset.stem(datafile)
+
+
+class TestUploadSession:
+    """
+    Test the chunked upload session APIs: these share the dataset creation
+    logic with the single PUT upload tested above, so here we focus on the
+    session and part management.
+    """
+
+    PART_SIZE = 64
+
+    @staticmethod
+    def gen_uri(server_config, filename, part=None):
+        if part is None:
+            return f"{server_config.rest_uri}/upload/session/{filename}"
+        return f"{server_config.rest_uri}/upload/part/{filename}/{part}"
+
+    @staticmethod
+    def parts(datafile: Path) -> list[bytes]:
+        data = datafile.read_bytes()
+        size = TestUploadSession.PART_SIZE
+        return [data[i : i + size] for i in range(0, len(data), size)]
+
+    def begin(self, client, server_config, token, datafile, md5):
+        return client.post(
+            self.gen_uri(server_config, datafile.name),
+            json={
+                "controller": socket.gethostname(),
+                "md5": md5,
+                "size": datafile.stat().st_size,
+                "part_size": self.PART_SIZE,
+            },
+            headers={"Authorization": "Bearer " + token},
+        )
+
+    def put_part(self, client, server_config, token, datafile, part, data):
+        return client.put(
+            self.gen_uri(server_config, datafile.name, part),
+            data=data,
+            headers={
+                "Authorization": "Bearer " + token,
+                "Content-MD5": hashlib.md5(data).hexdigest(),
+            },
+        )
+
+    def test_session_missing(self, client, server_config, pbench_token):
+        response = client.get(
+            self.gen_uri(server_config, "f.tar.xz"),
+            headers={"Authorization": "Bearer " + pbench_token},
+        )
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        assert response.json["message"] == "No upload session found for 'f.tar.xz'"
+
+    def test_session_bad_request(self, client, server_config, pbench_token):
+        response = client.post(
+            self.gen_uri(server_config, "f.tar.xz"),
+            json={"controller": socket.gethostname(), "md5": "x", "size": 0},
+            headers={"Authorization": "Bearer " + pbench_token},
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.json["message"].startswith(
+            "Upload session requires 'controller', 'md5', 'size', and 'part_size'"
+        )
+
+    def test_upload_parts(
+        self, client, server_config, pbench_token, tarball, monkeypatch
+    ):
+        """
+        Upload a tarball in parts, interrupting and resuming the session, and
+        complete it.
+        """
+        datafile, _, md5 = tarball
+        parts = self.parts(datafile)
+        assert len(parts) > 2
+
+        created = {}
+
+        def create(self, controller: str, tarfile: Path):
+            created["controller"] = controller
+            created["data"] = tarfile.read_bytes()
+            raise Exception("Stop here")
+
+        monkeypatch.setattr(CacheManager, "create", create)
+
+        response = self.begin(client, server_config, pbench_token, datafile, md5)
+        assert response.status_code == HTTPStatus.CREATED
+        assert response.json == {
+            "name": datafile.name,
+            "md5": md5,
+            "size": datafile.stat().st_size,
+            "part_size": self.PART_SIZE,
+            "parts": len(parts),
+            "received": [],
+        }
+
+        # Send every part except the second, and one with a bad MD5
+        for number, data in enumerate(parts, start=1):
+            if number != 2:
+                response = self.put_part(
+                    client, server_config, pbench_token, datafile, number, data
+                )
+                assert response.status_code == HTTPStatus.CREATED
+        response = client.put(
+            self.gen_uri(server_config, datafile.name, 2),
+            data=parts[1],
+            headers={"Authorization": "Bearer " + pbench_token, "Content-MD5": "x"},
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+        # Completion fails because a part is missing
+        response = client.put(
+            self.gen_uri(server_config, datafile.name),
+            headers={"Authorization": "Bearer " + pbench_token},
+        )
+        assert response.status_code == HTTPStatus.CONFLICT
+        assert response.json["message"] == (
+            f"Upload session for {datafile.name!r} is missing parts [2]"
+        )
+
+        # "Resume" the session, which reports the missing part
+        response = self.begin(client, server_config, pbench_token, datafile, md5)
+        assert response.status_code == HTTPStatus.OK
+        missing = set(range(1, len(parts) + 1)) - set(response.json["received"])
+        assert missing == {2}
+
+        response = self.put_part(
+            client, server_config, pbench_token, datafile, 2, parts[1]
+        )
+        assert response.status_code == HTTPStatus.CREATED
+
+        # Completion assembles the tarball and hands it to the cache manager,
+        # where we stop the upload to check the assembled data.
+        response = client.put(
+            self.gen_uri(server_config, datafile.name),
+            headers={"Authorization": "Bearer " + pbench_token},
+        )
+        assert response.status_code == HTTPStatus.INTERNAL_SERVER_ERROR
+        assert created["controller"] == socket.gethostname()
+        assert created["data"] == datafile.read_bytes()
+        with pytest.raises(DatasetNotFound):
+            Dataset.query(resource_id=md5)
+
+    def test_session_per_user(
+        self, client, server_config, pbench_token, pbench_admin_token, tarball
+    ):
+        """
+        Sessions for the same tarball name by different users are independent.
+        """
+        datafile, _, md5 = tarball
+        parts = self.parts(datafile)
+        response = self.begin(client, server_config, pbench_token, datafile, md5)
+        assert response.status_code == HTTPStatus.CREATED
+        response = self.put_part(
+            client, server_config, pbench_token, datafile, 1, parts[0]
+        )
+        assert response.status_code == HTTPStatus.CREATED
+
+        response = self.begin(client, server_config, pbench_admin_token, datafile, md5)
+        assert response.status_code == HTTPStatus.CREATED
+        assert response.json["received"] == []
+
+        response = client.get(
+            self.gen_uri(server_config, datafile.name),
+            headers={"Authorization": "Bearer " + pbench_token},
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert response.json["received"] == [1]
+
+    def test_session_expiry(self, client, server_config, pbench_token, tarball):
+        """
+        A session without recent activity is removed when a session begins.
+        """
+        datafile, _, md5 = tarball
+        response = self.begin(client, server_config, pbench_token, datafile, md5)
+        assert response.status_code == HTTPStatus.CREATED
+
+        sessions = server_config.ARCHIVE / CacheManager.TEMPORARY / "sessions"
+        states = list(sessions.glob(f"*/{datafile.name}.parts/session.json"))
+        assert states
+        stale = (
+            datetime.datetime.now() - UploadSession.SESSION_EXPIRY
+        ).timestamp() - 60
+        for state in states:
+            os.utime(state, (stale, stale))
+
+        response = client.post(
+            self.gen_uri(server_config, "other.tar.xz"),
+            json={
+                "controller": socket.gethostname(),
+                "md5": "other",
+                "size": 100,
+                "part_size": self.PART_SIZE,
+            },
+            headers={"Authorization": "Bearer " + pbench_token},
+        )
+        assert response.status_code == HTTPStatus.CREATED
+        assert not any(state.parent.exists() for state in states)
+        response = client.get(
+            self.gen_uri(server_config, datafile.name),
+            headers={"Authorization": "Bearer " + pbench_token},
+        )
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+    def test_part_partial_files(
+        self, client, server_config, pbench_token, tarball, monkeypatch
+    ):
+        """
+        Each part is received into its own temporary file, so that parts
+        sent concurrently don't overwrite each other.
+        """
+        datafile, _, md5 = tarball
+        parts = self.parts(datafile)
+        received = []
+        receive = UploadBase._receive
+
+        def capture(self, path, *args, **kwargs):
+            received.append(path.name)
+            return receive(self, path, *args, **kwargs)
+
+        monkeypatch.setattr(UploadBase, "_receive", capture)
+        response = self.begin(client, server_config, pbench_token, datafile, md5)
+        assert response.status_code == HTTPStatus.CREATED
+        for number in (1, 2):
+            response = self.put_part(
+                client, server_config, pbench_token, datafile, number, parts[number - 1]
+            )
+            assert response.status_code == HTTPStatus.CREATED
+        assert received == ["part.000001.partial", "part.000002.partial"]
+
+    def test_part_errors(self, client, server_config, pbench_token, tarball):
+        datafile, _, md5 = tarball
+        parts = self.parts(datafile)
+        response = self.begin(client, server_config, pbench_token, datafile, md5)
+        assert response.status_code == HTTPStatus.CREATED
+
+        response = self.put_part(
+            client, server_config, pbench_token, datafile, len(parts) + 1, b"x"
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.json["message"] == (
+            f"Part {len(parts) + 1} is not in the range 1 to {len(parts)}"
+        )
+
+        response = self.put_part(
+            client, server_config, pbench_token, datafile, 1, parts[0][:10]
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.json["message"] == (
+            f"'Content-Length' 10 for part 1 must be {self.PART_SIZE}"
+        )
+
+        response = client.delete(
+            self.gen_uri(server_config, datafile.name),
+            headers={"Authorization": "Bearer " + pbench_token},
+        )
+        assert response.status_code == HTTPStatus.OK
+        response = self.put_part(
+            client, server_config, pbench_token, datafile, 1, parts[0]
+        )
+        assert response.status_code == HTTPStatus.NOT_FOUND
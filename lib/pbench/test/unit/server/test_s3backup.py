@@ -0,0 +1,158 @@
+from configparser import ConfigParser
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from pbench.server.s3backup import S3Config, Status
+
+
+@pytest.fixture
+def s3_config(tmp_path, make_logger):
+    """Construct an S3Config using the mock connector, which keeps the
+    objects of its bucket in a local directory.
+    """
+    config = ConfigParser()
+    config.read_dict(
+        {
+            "pbench-server": {
+                "debug_unittest": "True",
+                "pbench-s3-upload-dir": str(tmp_path / "uploads"),
+            },
+            "pbench-server-backup": {
+                "endpoint_url": str(tmp_path / "s3"),
+                "bucket_name": "bucket",
+            },
+        }
+    )
+    (tmp_path / "s3" / "bucket").mkdir(parents=True)
+    return S3Config(config, make_logger)
+
+
+def put_object(bucket: Path, key: str, data: bytes):
+    """Store an object in the mock bucket as `put_object` would."""
+    path = bucket / key
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    Path(f"{path}.ETag").write_text(f'"{hashlib.md5(data).hexdigest()}"\n')
+
+
+class TestListObjects:
+    def test_tarball_suffixes(self, s3_config, tmp_path):
+        """Objects are listed for every supported tar ball suffix."""
+        bucket = tmp_path / "s3" / "bucket"
+        put_object(bucket, "ctrl/a.tar.xz", b"xz")
+        put_object(bucket, "ctrl/b.tar.zst", b"zstd")
+        put_object(bucket, "ctrl/c.tar.gz", b"gzip")
+        resp = s3_config.list_objects(Bucket=s3_config.bucket_name)
+        assert {(o["Key"], s3_config.header_md5(o)) for o in resp["Contents"]} == {
+            ("ctrl/a.tar.xz", hashlib.md5(b"xz").hexdigest()),
+            ("ctrl/b.tar.zst", hashlib.md5(b"zstd").hexdigest()),
+        }
+
+
+class TestMultipartUpload:
+    KEY = "ctrl/big.tar.xz"
+    DATA = b"0123456789"
+
+    @pytest.fixture
+    def tarball(self, s3_config, tmp_path):
+        """A 3-part "large" tar ball."""
+        s3_config.chunk_size = 4
+        tar = tmp_path / "big.tar.xz"
+        tar.write_bytes(self.DATA)
+        return tar
+
+    @staticmethod
+    def failing_parts(monkeypatch, s3_config, *numbers):
+        """Make the upload of the given parts fail, recording the numbers of
+        the parts which were uploaded.
+        """
+        uploaded = []
+        connector = s3_config.connector
+        upload_part = type(connector).upload_part
+
+        def fake_upload_part(**kwargs):
+            if kwargs["PartNumber"] in numbers:
+                raise ConnectionError("connection reset")
+            uploaded.append(kwargs["PartNumber"])
+            return upload_part(connector, **kwargs)
+
+        monkeypatch.setattr(connector, "upload_part", fake_upload_part)
+        return uploaded
+
+    def put(self, s3_config, tarball, data=None):
+        return s3_config.put_tarball_multipart(
+            Name=str(tarball),
+            ContentMD5=hashlib.md5(data or self.DATA).hexdigest(),
+            Bucket=s3_config.bucket_name,
+            Key=self.KEY,
+        )
+
+    def test_resume(self, s3_config, tarball, tmp_path, monkeypatch):
+        """An interrupted upload only uploads its missing parts when it is
+        resumed.
+        """
+        uploaded = self.failing_parts(monkeypatch, s3_config, 3)
+        assert self.put(s3_config, tarball) == Status.FAIL
+        assert sorted(uploaded) == [1, 2]
+        assert (tmp_path / "uploads" / f"{self.KEY}.json").exists()
+
+        uploaded = self.failing_parts(monkeypatch, s3_config)
+        assert self.put(s3_config, tarball) == Status.SUCCESS
+        assert uploaded == [3]
+        assert (tmp_path / "s3" / "bucket" / self.KEY).read_bytes() == self.DATA
+        assert not (tmp_path / "uploads").exists()
+        assert not (tmp_path / "s3" / "bucket" / ".uploads").exists()
+
+    def test_changed_tarball(self, s3_config, tarball, tmp_path, monkeypatch):
+        """The interrupted upload of a tar ball which has changed since is
+        aborted, and the new one uploaded from scratch.
+        """
+        self.failing_parts(monkeypatch, s3_config, 3)
+        assert self.put(s3_config, tarball) == Status.FAIL
+
+        data = b"abcdefghijkl"
+        tarball.write_bytes(data)
+        uploaded = self.failing_parts(monkeypatch, s3_config)
+        assert self.put(s3_config, tarball, data) == Status.SUCCESS
+        assert sorted(uploaded) == [1, 2, 3]
+        assert (tmp_path / "s3" / "bucket" / self.KEY).read_bytes() == data
+
+    def test_abort_corrupt_part(self, s3_config, tarball, tmp_path, monkeypatch):
+        """The upload is aborted, rather than kept for resuming, when S3 did
+        not receive a part intact.
+        """
+        connector = s3_config.connector
+        upload_part = type(connector).upload_part
+
+        def fake_upload_part(**kwargs):
+            etag = upload_part(connector, **kwargs)
+            return "0" * 32 if kwargs["PartNumber"] == 2 else etag
+
+        monkeypatch.setattr(connector, "upload_part", fake_upload_part)
+        assert self.put(s3_config, tarball) == Status.FAIL
+        assert not (tmp_path / "uploads").exists()
+        assert not (tmp_path / "s3" / "bucket" / ".uploads").exists()
+        assert not (tmp_path / "s3" / "bucket" / self.KEY).exists()
+
+    def test_streamed_parts(self, s3_config, tmp_path, monkeypatch):
+        """Parts handed to a resumed upload are only uploaded if they are
+        missing or have changed since the interrupted attempt.
+        """
+        s3_config.chunk_size = 4
+        md5 = hashlib.md5(self.DATA).hexdigest()
+        upload = s3_config.multipart_upload(Key=self.KEY, Size=10, ContentMD5=md5)
+        with upload:
+            upload.add_part(1, b"0123")
+            upload.add_part(2, b"XXXX")
+
+        uploaded = self.failing_parts(monkeypatch, s3_config)
+        with s3_config.multipart_upload(
+            Key=self.KEY, Size=10, ContentMD5=md5
+        ) as upload:
+            for number, data in enumerate((b"0123", b"4567", b"89"), start=1):
+                upload.add_part(number, data)
+            assert upload.complete() == Status.SUCCESS
+        assert sorted(uploaded) == [2, 3]
+        assert (tmp_path / "s3" / "bucket" / self.KEY).read_bytes() == self.DATA
@@ -1,5 +1,6 @@
 import pytest
 
+from pbench.server import metrics
 from pbench.server.database.models.datasets import Dataset, Metadata
 from pbench.server.sync import Operation, Sync, SyncSqlError
 
@@ -136,3 +137,26 @@ class TestSync:
         )
         assert Metadata.getvalue(drb, "server.status.test") == "plugh"
         assert Metadata.getvalue(drb, Metadata.OPERATION) == ["COPY_SOS"]
+
+    def test_metrics(self, make_logger, more_datasets):
+        """Test that sync operations export the backlog of each operation, and
+        count the operations completed and the errors.
+        """
+        drb = Dataset.query(name="drb")
+        fio_1 = Dataset.query(name="fio_1")
+        sync = Sync(make_logger, "metrics")
+        done = metrics.SYNC_COMPLETED.get(component="metrics", operation="UNPACK")
+        errors = metrics.SYNC_ERRORS.get(component="metrics")
+        Metadata.setvalue(drb, Metadata.OPERATION, ["UNPACK"])
+        Metadata.setvalue(fio_1, Metadata.OPERATION, ["UNPACK"])
+        sync.next(Operation.UNPACK)
+        assert metrics.SYNC_BACKLOG.get(component="metrics", operation="UNPACK") == 2
+        sync.update(drb, did=Operation.UNPACK, enabled=[Operation.INDEX])
+        sync.error(fio_1, "failed")
+        sync.next(Operation.UNPACK)
+        assert metrics.SYNC_BACKLOG.get(component="metrics", operation="UNPACK") == 1
+        assert (
+            metrics.SYNC_COMPLETED.get(component="metrics", operation="UNPACK")
+            == done + 1
+        )
+        assert metrics.SYNC_ERRORS.get(component="metrics") == errors + 1
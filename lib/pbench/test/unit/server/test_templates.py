@@ -4,7 +4,7 @@ from pathlib import Path
 
 import pytest
 
-from pbench.server.templates import JsonFile, JsonToolFile
+from pbench.server.templates import JsonFile, JsonRollupToolFile, JsonToolFile
 
 
 @pytest.fixture()
@@ -175,3 +175,54 @@ class TestJsonToolFile:
                 "tool": {"iostat": {"run": "far and fast"}},
             },
         }
+
+
+class TestJsonRollupToolFile:
+    """
+    Test the JsonRollupToolFile subclass.
+    """
+
+    def test_json_merge(self, fake_resolve, fake_mtime, monkeypatch):
+        """
+        Test merging the rollup of a tool properties file with a skeleton
+        file: numeric fields are rolled up, keywords are kept and internal
+        "@" fields are dropped.
+        """
+        json = JsonRollupToolFile(Path("mapping.json"))
+        base = JsonFile(Path("tool.json"))
+        with monkeypatch.context() as m:
+
+            def fake_open(self: Path, mode: str = "r"):
+                return io.StringIO(
+                    '{"_meta": {"version": 6}, "properties": {'
+                    '"@idx": {"type": "long"}, "id": {"type": "keyword"},'
+                    '"iops": {"properties": {"read": {"type": "float"}}}}}\n'
+                )
+
+            m.setattr(Path, "open", fake_open)
+            json.load()
+        with monkeypatch.context() as m:
+
+            def fake_open(self: Path, mode: str = "r"):
+                return io.StringIO('{"properties": {"@meta": "at meta friend"}}')
+
+            m.setattr(Path, "open", fake_open)
+            base.load()
+        json.merge("iostat", base)
+        assert json.get_version() == 6
+        assert json.json == {
+            "_meta": {"version": 6},
+            "properties": {
+                "@meta": "at meta friend",
+                "iostat": {
+                    "properties": {
+                        "id": {"type": "keyword"},
+                        "iops": {
+                            "properties": {
+                                "read": JsonRollupToolFile.ROLLUP_MAPPING,
+                            }
+                        },
+                    }
+                },
+            },
+        }
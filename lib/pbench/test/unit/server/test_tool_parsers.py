@@ -0,0 +1,179 @@
+import csv
+from datetime import timedelta
+from pathlib import Path
+import shutil
+
+import pytest
+
+from pbench.server.indexer import _known_tool_handlers, ToolData
+from pbench.server.tool_parsers import parsers, PidstatParser
+
+# The samples of raw tool output, and the .csv files the postprocessing
+# scripts of the agent generate from them (with TZ=UTC), found in the source
+# tree only.
+postprocess = Path(__file__).parents[5] / "agent" / "tool-scripts" / "postprocess"
+needs_samples = pytest.mark.skipif(
+    not postprocess.is_dir(), reason="no tool postprocessing samples"
+)
+samples = (
+    sorted(
+        d.name
+        for d in (postprocess / "samples").iterdir()
+        if d.name.split("-")[0] in parsers
+    )
+    if postprocess.is_dir()
+    else []
+)
+
+
+def read_online_cpus(sample_dir: Path):
+    online_cpus_txt = sample_dir / "online-cpus.txt"
+    if not online_cpus_txt.exists():
+        return None
+    online_cpus = {}
+    for line in online_cpus_txt.read_text().splitlines():
+        cpu, _, online = line.partition(":")
+        online_cpus[cpu.strip()] = online.strip() == "1"
+    return online_cpus
+
+
+@pytest.mark.parametrize("sample", samples)
+def test_matches_postprocessing(sample):
+    """The rows parsed from the raw output of a tool are those of the .csv
+    files written by its postprocessing script.
+    """
+    tool = sample.split("-")[0]
+    sample_dir = postprocess / "samples" / sample
+    parser = parsers[tool](
+        str(sample_dir / f"{tool}-stdout.txt"),
+        online_cpus=read_online_cpus(sample_dir),
+    )
+    headers = parser.headers()
+    assert headers
+    for name, header in headers.items():
+        with (postprocess / "gold" / sample / "csv" / name).open() as fp:
+            expected = list(csv.reader(fp))
+        assert header == expected[0], name
+        rows = list(parser.reader(name))
+        assert len(rows) == len(expected) - 1, name
+        for row, expected_row in zip(rows, expected[1:]):
+            assert row[0] == expected_row[0], name
+            # Numbers computed by perl may be formatted differently, and
+            # devices missing from a sample have no value.
+            assert [float(v) if v else v for v in row[1:]] == [
+                float(v) if v else v for v in expected_row[1:]
+            ], name
+
+
+def test_utc_offset_and_day_rollover(tmp_path):
+    stdout = tmp_path / "mpstat-stdout.txt"
+    stdout.write_text(
+        "Linux 5.14.0 (host.example.com) \t03/01/2022 \t_x86_64_\t(1 CPU)\n"
+        "\n"
+        "11:59:58 PM  CPU    %usr   %nice    %sys %iowait    %irq   %soft  %steal"
+        "  %guest  %gnice   %idle\n"
+        "11:59:59 PM  all    1.00    0.00    1.00    0.00    0.00    0.00    0.00"
+        "    0.00    0.00   98.00\n"
+        "12:00:00 AM  all    2.00    0.00    1.00    0.00    0.00    0.00    0.00"
+        "    0.00    0.00   97.00\n"
+    )
+    parser = parsers["mpstat"](str(stdout), utc_offset=timedelta(hours=-5))
+    assert parser.headers() == {
+        "cpuall_cpuall.csv": [
+            "timestamp_ms",
+            "guest",
+            "idle",
+            "iowait",
+            "irq",
+            "nice",
+            "softirq",
+            "steal",
+            "sys",
+            "usr",
+        ]
+    }
+    rows = list(parser.reader("cpuall_cpuall.csv"))
+    # 2022-03-02T04:59:59 and 2022-03-02T05:00:00 UTC.
+    assert [row[0] for row in rows] == ["1646197199000", "1646197200000"]
+    assert rows[1][-1] == "2.00"
+
+
+def test_pidstat_label():
+    assert (
+        PidstatParser.label("42", "/usr/bin/foo --a='b, c'")
+        == "42-/usr/bin/foo_--a=b_c"
+    )
+    assert (
+        PidstatParser.label("7", "/usr/libexec/qemu-kvm -name guest1 -S")
+        == "7-KVMguest--guest1"
+    )
+    assert len(PidstatParser.label("1", "x" * 80)) == len("1-") + 40
+
+
+class FakeIdxCtx:
+    class logger:
+        warnings = []
+
+        @classmethod
+        def warning(cls, msg, *args):
+            cls.warnings.append(msg.format(*args))
+
+
+class FakePbenchTarBall:
+    def __init__(self, extracted_root: Path, members: list):
+        self.extracted_root = str(extracted_root)
+        self.members = members
+        self.utc_offset = timedelta(0)
+        self.idxctx = FakeIdxCtx
+        self._tbctx = "controller/result.tar.xz(md5)"
+
+    def gen_files_by_partial_path(self, path):
+        return (m for m in self.members if path in m)
+
+
+@needs_samples
+def test_get_files_falls_back_to_raw_stdout(tmp_path):
+    basepath = "result/1-iter/sample1/tools-default/host/iostat"
+    tool_dir = tmp_path / basepath
+    tool_dir.mkdir(parents=True)
+    shutil.copy(postprocess / "samples" / "iostat-0" / "iostat-stdout.txt", tool_dir)
+    ptb = FakePbenchTarBall(tmp_path, [f"{basepath}/iostat-stdout.txt"])
+
+    files = ToolData.get_files(
+        _known_tool_handlers["iostat"], basepath, "default", "iostat", ptb
+    )
+
+    # There is no handler for the request sizes in kB.
+    assert [f["basename"] for f in files] == [
+        "disk_IOPS.csv",
+        "disk_Queue_Size.csv",
+        "disk_Request_Merges_per_sec.csv",
+        "disk_Request_Size_in_512_byte_sectors.csv",
+        "disk_Throughput_MB_per_sec.csv",
+        "disk_Utilization_percent.csv",
+        "disk_Wait_Time_msec.csv",
+    ]
+    gold = postprocess / "gold" / "iostat-0" / "csv"
+    for f in files:
+        with (gold / f["basename"]).open() as fp:
+            expected = list(csv.reader(fp))
+        assert f["path"] == f"{basepath}/iostat-stdout.txt"
+        assert f["header"] == expected[0]
+        assert len(list(f["reader"])) == len(expected) - 1
+
+
+def test_get_files_bad_raw_stdout(tmp_path):
+    basepath = "result/1-iter/sample1/tools-default/host/mpstat"
+    tool_dir = tmp_path / basepath
+    tool_dir.mkdir(parents=True)
+    (tool_dir / "mpstat-stdout.txt").write_text("not mpstat output\n")
+    ptb = FakePbenchTarBall(tmp_path, [f"{basepath}/mpstat-stdout.txt"])
+
+    files = ToolData.get_files(
+        _known_tool_handlers["mpstat"], basepath, "default", "mpstat", ptb
+    )
+
+    assert files == []
+    assert FakeIdxCtx.logger.warnings[-1].startswith(
+        "tool-data-indexing: unable to parse raw mpstat output"
+    )
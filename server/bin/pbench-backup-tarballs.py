@@ -1,21 +1,25 @@
 #!/usr/bin/env python3
 # -*- mode: python -*-
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+import errno
+import hashlib
 import os
 from pathlib import Path
 import shutil
 import sys
 import tempfile
+from typing import Optional
 
 from pbench.common.exceptions import BadConfig
 from pbench.common.logger import get_pbench_logger
-from pbench.common.utils import md5sum
+import pbench.server
 from pbench.server import PbenchServerConfig
 from pbench.server.database import init_db
 from pbench.server.database.models.datasets import Dataset, DatasetError, Metadata
 from pbench.server.report import Report
-from pbench.server.s3backup import NoSuchKey, S3Config, Status
+from pbench.server.s3backup import MultipartUpload, NoSuchKey, S3Config, Status
 from pbench.server.sync import Operation, Sync
 
 _NAME_ = "pbench-backup-tarballs"
@@ -26,6 +30,120 @@ _linkdestfail = "BACKUP-FAILED"
 _linkdest = "BACKED-UP"
 
 
+class TarballStream:
+    """Read a tar ball exactly once, fanning the bytes out to everything that
+    needs them: the MD5 of the whole tar ball, an optional local copy, and
+    optionally the parts of an S3 multipart upload.
+
+    The local copy is made with os.copy_file_range() for each block just
+    read, which lets the kernel copy from the (hot) page cache, or share
+    the blocks outright on file systems supporting reflinks; if that is
+    not supported between the two files, the block just read is written
+    instead.
+    """
+
+    # Read size: large, and a multiple of any page or file system block size.
+    BLOCKSIZE = 8 * 2**20
+
+    @dataclass
+    class Result:
+        length: int = 0
+        md5: str = ""
+        elapsed: float = 0.0
+
+        @property
+        def throughput(self) -> str:
+            rate = self.length / self.elapsed / 2**20 if self.elapsed > 0 else 0.0
+            return f"{self.length} bytes read in {self.elapsed:.2f}s ({rate:.2f} MiB/s)"
+
+    def __init__(
+        self,
+        tar: Path,
+        copy_to: Optional[Path] = None,
+        upload: Optional[MultipartUpload] = None,
+    ):
+        """
+        Args:
+            tar         The tar ball to read
+            copy_to     Path of a (new) local copy of the tar ball to write
+            upload      The S3 multipart upload to which the parts of the tar
+                        ball are to be handed as they are read
+        """
+        self.tar = tar
+        self.copy_to = copy_to
+        self.upload = upload
+
+    def run(self) -> "TarballStream.Result":
+        start = pbench.server._time()
+        result = self.Result()
+        md5 = hashlib.md5()
+        if self.upload:
+            part_size = self.upload.part_size
+            part = bytearray()
+            number = 1
+        buf = bytearray(self.BLOCKSIZE)
+        view = memoryview(buf)
+        dst = None
+        copy_range = hasattr(os, "copy_file_range")
+        with open(self.tar, "rb", buffering=0) as src:
+            if self.copy_to:
+                dst = open(self.copy_to, "wb", buffering=0)
+            try:
+                for n in iter(lambda: src.readinto(buf), 0):
+                    data = view[:n]
+                    md5.update(data)
+                    if self.upload:
+                        # Split the block at part boundaries.
+                        offset = 0
+                        while offset < n:
+                            take = min(n - offset, part_size - len(part))
+                            part += data[offset : offset + take]
+                            offset += take
+                            if len(part) == part_size:
+                                self.upload.add_part(number, part)
+                                part = bytearray()
+                                number += 1
+                    if dst:
+                        if copy_range:
+                            try:
+                                self._copy_range(src, dst, result.length, n)
+                            except OSError as e:
+                                if e.errno not in (
+                                    errno.EXDEV,
+                                    errno.ENOSYS,
+                                    errno.EINVAL,
+                                    errno.EOPNOTSUPP,
+                                ):
+                                    raise
+                                copy_range = False
+                                dst.seek(result.length)
+                                dst.write(data)
+                        else:
+                            dst.write(data)
+                    result.length += n
+            finally:
+                if dst:
+                    dst.close()
+        if self.upload and (part or number == 1):
+            self.upload.add_part(number, part)
+        if self.copy_to:
+            shutil.copymode(self.tar, self.copy_to)
+        result.md5 = md5.hexdigest()
+        result.elapsed = pbench.server._time() - start
+        return result
+
+    @staticmethod
+    def _copy_range(src, dst, offset: int, count: int):
+        while count > 0:
+            copied = os.copy_file_range(
+                src.fileno(), dst.fileno(), count, offset, offset
+            )
+            if copied == 0:
+                raise OSError(errno.EINVAL, "copy_file_range made no progress")
+            offset += copied
+            count -= copied
+
+
 class LocalBackupObject:
     def __init__(self, config):
         self.backup_dir = config.BACKUP
@@ -83,18 +201,13 @@ def sanity_check(lb_obj, s3_obj, config, logger):
     return (lb_obj, s3_obj)
 
 
-def backup_to_local(
-    lb_obj,
-    logger,
-    controller_path,
-    controller,
-    tb,
-    tar,
-    resultname,
-    archive_md5,
-    archive_md5_hex_value,
-):
-    logger.debug("Start local backup of {}.", tar)
+def check_local(lb_obj, logger, controller, resultname, archive_md5_hex_value):
+    """Check whether the tar ball needs to be backed up locally.
+
+    Returns the (temporary) path to which the local copy of the tar ball is to
+    be written, or the final Status if there is nothing to copy, either
+    because the tar ball is already backed up or because of an error.
+    """
     if lb_obj is None:
         # Short-circuit operation when we don't have an lb object. This can
         # happen when the expected result of sanity check does not exist, or
@@ -103,6 +216,60 @@ def backup_to_local(
 
     backup_controller_path = Path(lb_obj.backup_dir, controller)
 
+    # Check if tarball exists in local backup
+    backup_tar = backup_controller_path / resultname
+    if not (backup_tar.exists() and backup_tar.is_file()):
+        # The copy is written under a hidden name, and only moved into place
+        # once its contents have been verified.
+        return Path(lb_obj.backup_dir, f".{controller}.{resultname}.partial")
+
+    backup_md5 = backup_controller_path / f"{resultname}.md5"
+
+    # check that the md5 file exists and it is a regular file
+    if backup_md5.exists() and backup_md5.is_file():
+        pass
+    else:
+        # backup md5 file does not exist or it is not a regular file
+        logger.error("{} does not exist or it is not a regular file", backup_md5)
+        return Status.FAIL
+
+    # read backup md5 file
+    try:
+        with backup_md5.open() as f:
+            backup_md5_hex_value = f.readline().split(" ")[0]
+    except Exception:
+        # Could not read file
+        logger.exception("Could not read file {}", backup_md5)
+        return Status.FAIL
+    else:
+        if archive_md5_hex_value == backup_md5_hex_value:
+            # declare success
+            logger.info("Already locally backed-up: {}/{}", controller, resultname)
+            return Status.SUCCESS
+        else:
+            # md5 file of archive and backup does not match
+            logger.error(
+                "{}/{} already exists in backup but md5 sums of archive and backup disagree",
+                controller,
+                resultname,
+            )
+            return Status.FAIL
+
+
+def remove_partial(partial, logger):
+    try:
+        partial.unlink(missing_ok=True)
+    except Exception:
+        logger.exception("Unable to remove: {}", partial)
+
+
+def backup_to_local(lb_obj, logger, controller, tar, resultname, archive_md5, partial):
+    """Complete the local backup of a tar ball whose contents have already
+    been copied (and verified) to the `partial` path by the TarballStream.
+    """
+    logger.debug("Start local backup of {}.", tar)
+    backup_controller_path = Path(lb_obj.backup_dir, controller)
+
     # make sure the controller is present in local backup directory
     backup_controller_path.mkdir(exist_ok=True)
 
@@ -111,145 +278,112 @@ def backup_to_local(
             "os.mkdir: Unable to create backup destination directory: {}",
             backup_controller_path,
         )
+        remove_partial(partial, logger)
         return Status.FAIL
 
-    # Check if tarball exists in local backup
-    backup_tar = backup_controller_path / resultname
-    if backup_tar.exists() and backup_tar.is_file():
-        backup_md5 = backup_controller_path / f"{resultname}.md5"
+    tar_done = False
 
-        # check that the md5 file exists and it is a regular file
-        if backup_md5.exists() and backup_md5.is_file():
-            pass
-        else:
-            # backup md5 file does not exist or it is not a regular file
-            logger.error("{} does not exist or it is not a regular file", backup_md5)
-            return Status.FAIL
-
-        # read backup md5 file
-        try:
-            with backup_md5.open() as f:
-                backup_md5_hex_value = f.readline().split(" ")[0]
-        except Exception:
-            # Could not read file
-            logger.exception("Could not read file {}", backup_md5)
-            return Status.FAIL
-        else:
-            if archive_md5_hex_value == backup_md5_hex_value:
-                # declare success
-                logger.info("Already locally backed-up: {}/{}", controller, resultname)
-                return Status.SUCCESS
-            else:
-                # md5 file of archive and backup does not match
-                logger.error(
-                    "{}/{} already exists in backup but md5 sums of archive and backup disagree",
-                    controller,
-                    resultname,
-                )
-                return Status.FAIL
+    # copy the md5 file from archive to backup
+    try:
+        shutil.copy(archive_md5, backup_controller_path)
+    except Exception:
+        # couldn't copy md5 file
+        md5_done = False
+        logger.exception(
+            "shutil.copy: Unable to copy {} from archive to backup: {}",
+            archive_md5,
+            backup_controller_path,
+        )
     else:
-        tar_done = False
+        md5_done = True
 
-        # copy the md5 file from archive to backup
+    # move the verified copy of the tarball into place
+    if md5_done:
         try:
-            shutil.copy(archive_md5, backup_controller_path)
+            partial.rename(backup_controller_path / resultname)
         except Exception:
-            # couldn't copy md5 file
-            md5_done = False
+            # couldn't move the tarball
+            tar_done = False
             logger.exception(
-                "shutil.copy: Unable to copy {} from archive to backup: {}",
-                archive_md5,
+                "Unable to move {} from {} to backup: {}",
+                tar,
+                partial,
                 backup_controller_path,
             )
-        else:
-            md5_done = True
 
-        # copy the tarball from archive to backup
-        if md5_done:
-            try:
-                shutil.copy(tar, backup_controller_path)
-            except Exception:
-                # couldn't copy tarball
-                tar_done = False
-                logger.exception(
-                    "shutil.copy: Unable to copy {} from archive to backup: {}",
-                    tar,
-                    backup_controller_path,
-                )
-
-                # remove the copied md5 file from backup
-                bmd5_file = backup_controller_path / f"{resultname}.md5"
-                if bmd5_file.exists():
-                    try:
-                        bmd5_file.remove(bmd5_file)
-                    except Exception:
-                        logger.exception("Unable to remove: {}", bmd5_file)
-            else:
-                tar_done = True
-
-        logger.debug("End local backup of {}.", tar)
-        if md5_done and tar_done:
-            logger.info("Local backup of {}/{} successful", controller, resultname)
-            return Status.SUCCESS
+            # remove the copied md5 file from backup
+            bmd5_file = backup_controller_path / f"{resultname}.md5"
+            if bmd5_file.exists():
+                try:
+                    bmd5_file.unlink()
+                except Exception:
+                    logger.exception("Unable to remove: {}", bmd5_file)
         else:
-            return Status.FAIL
+            tar_done = True
+    if not tar_done:
+        remove_partial(partial, logger)
+
+    logger.debug("End local backup of {}.", tar)
+    if md5_done and tar_done:
+        logger.info("Local backup of {}/{} successful", controller, resultname)
+        return Status.SUCCESS
+    else:
+        return Status.FAIL
 
 
-def backup_to_s3(
-    s3_obj,
-    logger,
-    controller_path,
-    controller,
-    tb,
-    tar,
-    resultname,
-    archive_md5_hex_value,
-):
+def check_s3(s3_obj, logger, controller, resultname, archive_md5_hex_value):
+    """Check whether the tar ball needs to be uploaded to S3.
+
+    Returns None if it does, or the final Status if there is nothing to
+    upload, either because the tar ball is already in S3 or because of an
+    error.
+    """
     if s3_obj is None:
         # Short-circuit operation when we don't have an S3 object to work with
         # when executing.  This can happen when the expected bucket does not
         # exist, or for other errors where we still want to backup locally.
         return Status.FAIL
 
-    logger.debug("Start S3 backup of {}.", tar)
     s3_resultname = os.path.join(controller, resultname)
 
     # Check if the result already present in s3 or not
     try:
         tbh = s3_obj.get_tarball_header(Bucket=s3_obj.bucket_name, Key=s3_resultname)
     except NoSuchKey:
-        s3_md5 = None
+        return None
     except Exception as e:
         logger.error("Exception raised by get_tarball_header(): {}", e)
         return Status.FAIL
+
+    # compare md5 which we already have so no need to recalculate
+    if archive_md5_hex_value == s3_obj.s3_md5(tbh):
+        # declare success
+        logger.info(
+            "The tarball {} is already present in S3 bucket with same md5",
+            s3_resultname,
+        )
+        return Status.SUCCESS
     else:
-        s3_md5 = s3_obj.s3_md5(tbh)
+        logger.error(
+            "The tarball {} is already present in S3 bucket, but with different MD5",
+            s3_resultname,
+        )
+        return Status.FAIL
 
-    if s3_md5 is not None:
-        # compare md5 which we already have so no need to recalculate
-        if archive_md5_hex_value == s3_md5:
-            # declare success
-            logger.info(
-                "The tarball {} is already present in S3 bucket with same md5",
-                s3_resultname,
-            )
-            _status = Status.SUCCESS
-        else:
-            logger.error(
-                "The tarball {} is already present in S3 bucket, but with different MD5",
-                s3_resultname,
-            )
-            _status = Status.FAIL
-        return _status
 
-    size = s3_obj.getsize(str(tar))
+def backup_to_s3(s3_obj, logger, controller, tar, resultname, size, md5):
+    """Upload a tar ball small enough to be uploaded in one piece, whose MD5
+    has already been verified by the TarballStream.
+    """
+    logger.debug("Start S3 backup of {}.", tar)
+    s3_resultname = os.path.join(controller, resultname)
     logger.debug("tarball: {}, size = {}", tar, size)
     with open(tar, "rb") as f:
         sts = s3_obj.put_tarball(
             Name=tar,
             Body=f,
             Size=size,
-            ContentMD5=archive_md5_hex_value,
+            ContentMD5=md5,
             Bucket=s3_obj.bucket_name,
             Key=s3_resultname,
         )
@@ -262,6 +396,54 @@ def backup_data(lb_obj, s3_obj, config, logger):
     sync = Sync(logger, "backup")
     datasets = sync.next(Operation.BACKUP)
     ntotal = nbackup_success = nbackup_fail = ns3_success = ns3_fail = process_fail = 0
+    tarball_workers = s3_obj.tarball_workers if s3_obj else 1
+    executor = (
+        ThreadPoolExecutor(max_workers=tarball_workers, thread_name_prefix="s3-tar")
+        if tarball_workers > 1
+        else None
+    )
+    pending = []
+
+    def finish(dataset, tar, local_backup_result, s3_backup_result):
+        """Count the successes and failures of the local and S3 backups of
+        a tar ball, and, if both succeeded, advance its dataset's state.
+        """
+        nonlocal nbackup_success, nbackup_fail, ns3_success, ns3_fail
+
+        if local_backup_result == Status.SUCCESS:
+            nbackup_success += 1
+        elif local_backup_result == Status.FAIL:
+            nbackup_fail += 1
+        else:
+            assert (
+                False
+            ), f"Impossible situation, local_backup_result = {local_backup_result!r}"
+
+        if s3_backup_result == Status.SUCCESS:
+            ns3_success += 1
+        elif s3_backup_result == Status.FAIL:
+            ns3_fail += 1
+        else:
+            assert (
+                False
+            ), f"Impossible situation, s3_backup_result = {s3_backup_result!r}"
+
+        if local_backup_result == Status.SUCCESS and (
+            s3_obj is None or s3_backup_result == Status.SUCCESS
+        ):
+            # Mark the dataset as archived, and request that it be unpacked
+            Metadata.setvalue(dataset=dataset, key=Metadata.ARCHIVED, value=True)
+            sync.update(
+                dataset=dataset,
+                did=Operation.BACKUP,
+                enabled=[Operation.COPY_SOS, Operation.UNPACK],
+            )
+        else:
+            # Do nothing when the backup fails, allowing us to retry on a
+            # future pass.
+            pass
+
+        logger.debug("End backup of {}.", tar)
 
     for dataset in datasets:
         tb = Metadata.getvalue(dataset, Metadata.TARBALL_PATH)
@@ -301,98 +483,126 @@ def backup_data(lb_obj, s3_obj, config, logger):
             logger.exception(error)
             continue
 
-        # match md5sum of the tarball to its md5 file
-        try:
-            (_, archive_tar_hex_value) = md5sum(tar)
-        except Exception:
-            # Could not read file.
-            error = f"can't compute tarfile {tar} MD5"
-            sync.error(dataset, error)
-            process_fail += 1
-            logger.exception(error)
-            continue
-
-        if archive_tar_hex_value != archive_md5_hex_value:
-            error = f"Recorded MD5 {archive_md5_hex_value!r} does not match tarball MD5 {archive_tar_hex_value!r}"
-            sync.error(dataset, error)
-            process_fail += 1
-            logger.error(error)
-            continue
-
         resultname = tar.name
         controller_path = tar.parent
         controller = controller_path.name
-        try:
-            dataset = Dataset.attach(resource_id=archive_md5_hex_value)
-        except DatasetError as e:
-            logger.error(
-                "Unable to find dataset with resource ID {!r}: {}",
-                archive_md5_hex_value,
-                str(e),
-            )
-            continue
 
-        # This will handle all the local backup related
-        # operations and count the number of successes and failures.
-        local_backup_result = backup_to_local(
-            lb_obj,
-            logger,
-            controller_path,
-            controller,
-            tb,
-            tar,
-            resultname,
-            archive_md5,
-            archive_md5_hex_value,
+        # Work out what has to be written before reading the tarball, so that
+        # it is read only once: for its MD5, for the local backup copy, and
+        # for the parts of a large S3 object, which are uploaded as they are
+        # read.
+        local_backup_result = check_local(
+            lb_obj, logger, controller, resultname, archive_md5_hex_value
         )
-
-        if local_backup_result == Status.SUCCESS:
-            nbackup_success += 1
-        elif local_backup_result == Status.FAIL:
-            nbackup_fail += 1
-        else:
-            assert (
-                False
-            ), f"Impossible situation, local_backup_result = {local_backup_result!r}"
-
-        # This will handle all the S3 bucket related operations
-        # and count the number of successes and failures.
-        s3_backup_result = backup_to_s3(
-            s3_obj,
-            logger,
-            controller_path,
-            controller,
-            tb,
-            tar,
-            resultname,
-            archive_md5_hex_value,
+        partial = local_backup_result if isinstance(local_backup_result, Path) else None
+        s3_backup_result = check_s3(
+            s3_obj, logger, controller, resultname, archive_md5_hex_value
         )
+        size = 0
+        upload = None
+        if s3_backup_result is None:
+            size = s3_obj.getsize(str(tar))
+            if size >= s3_obj.multipart_threshold:
+                logger.debug("Start S3 backup of {}, size = {}.", tar, size)
+                upload = s3_obj.multipart_upload(
+                    Key=os.path.join(controller, resultname),
+                    Size=size,
+                    ContentMD5=archive_md5_hex_value,
+                )
+                if upload is None:
+                    s3_backup_result = Status.FAIL
 
-        if s3_backup_result == Status.SUCCESS:
-            ns3_success += 1
-        elif s3_backup_result == Status.FAIL:
-            ns3_fail += 1
-        else:
-            assert (
-                False
-            ), f"Impossible situation, s3_backup_result = {s3_backup_result!r}"
+        # An upload which is neither completed nor aborted below is kept, to
+        # be resumed by the next pass.
+        try:
+            # match md5sum of the tarball to its md5 file
+            try:
+                stream = TarballStream(tar, copy_to=partial, upload=upload).run()
+            except Exception:
+                # Could not read file.
+                error = f"can't compute tarfile {tar} MD5"
+                sync.error(dataset, error)
+                process_fail += 1
+                logger.exception(error)
+                if partial:
+                    remove_partial(partial, logger)
+                continue
+            logger.debug("Read {}: {}", tar, stream.throughput)
+
+            if stream.md5 != archive_md5_hex_value:
+                error = f"Recorded MD5 {archive_md5_hex_value!r} does not match tarball MD5 {stream.md5!r}"
+                sync.error(dataset, error)
+                process_fail += 1
+                logger.error(error)
+                if partial:
+                    remove_partial(partial, logger)
+                if upload:
+                    upload.abort()
+                continue
 
-        if local_backup_result == Status.SUCCESS and (
-            s3_obj is None or s3_backup_result == Status.SUCCESS
-        ):
-            # Mark the dataset as archived, and request that it be unpacked
-            Metadata.setvalue(dataset=dataset, key=Metadata.ARCHIVED, value=True)
-            sync.update(
-                dataset=dataset,
-                did=Operation.BACKUP,
-                enabled=[Operation.COPY_SOS, Operation.UNPACK],
-            )
-        else:
-            # Do nothing when the backup fails, allowing us to retry on a
-            # future pass.
-            pass
+            try:
+                dataset = Dataset.attach(resource_id=archive_md5_hex_value)
+            except DatasetError as e:
+                logger.error(
+                    "Unable to find dataset with resource ID {!r}: {}",
+                    archive_md5_hex_value,
+                    str(e),
+                )
+                if partial:
+                    remove_partial(partial, logger)
+                continue
+
+            # This will handle all the local backup related
+            # operations and count the number of successes and failures.
+            if partial:
+                local_backup_result = backup_to_local(
+                    lb_obj, logger, controller, tar, resultname, archive_md5, partial
+                )
 
-        logger.debug("End backup of {}.", tar)
+            # This will handle all the S3 bucket related operations.  The
+            # parts of a large tar ball have been uploaded while it was read,
+            # so all that is left is to complete the upload.  Other tar balls
+            # are uploaded concurrently when configured to do so: the results
+            # of those uploads are then recorded, in order, once they have all
+            # finished.
+            if upload:
+                s3_backup_result = upload.complete()
+                logger.debug("End S3 backup of {}.", tar)
+            elif s3_backup_result is None:
+                if executor is None:
+                    s3_backup_result = backup_to_s3(
+                        s3_obj, logger, controller, tar, resultname, size, stream.md5
+                    )
+                else:
+                    s3_backup_result = executor.submit(
+                        backup_to_s3,
+                        s3_obj,
+                        logger,
+                        controller,
+                        tar,
+                        resultname,
+                        size,
+                        stream.md5,
+                    )
+                    pending.append(
+                        (dataset, tar, local_backup_result, s3_backup_result)
+                    )
+                    continue
+        finally:
+            if upload:
+                upload.close()
+
+        finish(dataset, tar, local_backup_result, s3_backup_result)
+
+    if executor is not None:
+        for dataset, tar, local_backup_result, future in pending:
+            try:
+                s3_backup_result = future.result()
+            except Exception:
+                logger.exception("S3 backup of {} failed", tar)
+                s3_backup_result = Status.FAIL
+            finish(dataset, tar, local_backup_result, s3_backup_result)
+        executor.shutdown()
 
     return Results(
         ntotal=ntotal,
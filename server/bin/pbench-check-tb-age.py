@@ -19,11 +19,13 @@ import sys
 
 from pbench import BadConfig
 from pbench.server import PbenchServerConfig
+from pbench.server.database.models.datasets import Dataset
 
 _NAME_ = "pbench-check-tb_age"
 
 tb_pat_r = (
-    r"\S+_(\d\d\d\d)[._-](\d\d)[._-](\d\d)[T_](\d\d)[._:](\d\d)[._:](\d\d)\.tar\.xz"
+    r"\S+_(\d\d\d\d)[._-](\d\d)[._-](\d\d)[T_](\d\d)[._:](\d\d)[._:](\d\d)"
+    f"(?:{'|'.join(re.escape(s) for s in Dataset.TARBALL_SUFFIXES)})"
 )
 tb_pat = re.compile(tb_pat_r)
 
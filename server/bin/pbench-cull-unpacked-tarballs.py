@@ -33,6 +33,7 @@ from pbench.common.exceptions import BadConfig
 from pbench.common.logger import get_pbench_logger
 import pbench.server
 from pbench.server.database import init_db
+from pbench.server.database.models.datasets import Dataset
 from pbench.server.indexer import _STD_DATETIME_FMT
 from pbench.server.report import Report
 
@@ -290,8 +291,10 @@ def gen_list_unpacked_aged(incoming, archive, curr_dt, max_unpacked_age):
                         # flag this unwanted condition.
                         continue
                     # We have a tar ball directory name, validate it.
-                    tb_path = Path(archive, c_entry.name, f"{entry.name}.tar.xz")
-                    if not tb_path.exists():
+                    if not any(
+                        Path(archive, c_entry.name, f"{entry.name}{suffix}").exists()
+                        for suffix in Dataset.TARBALL_SUFFIXES
+                    ):
                         # NOTE: the pbench-audit-server should pick up and
                         # flag this unwanted condition.
                         continue
@@ -15,7 +15,7 @@ import sys
 
 from pbench.common.exceptions import BadConfig, ConfigFileError, JsonFileError
 from pbench.common.logger import get_pbench_logger
-from pbench.server import PbenchServerConfig
+from pbench.server import metrics, PbenchServerConfig
 from pbench.server.database import init_db
 from pbench.server.indexer import IdxContext
 from pbench.server.indexing_tarballs import Index, SigTermException
@@ -40,6 +40,10 @@ def main(options, name):
         dump_templates        - Dump the templates that would be used
         index_tool_data       - Index tool data only
         re_index              - Consider tar balls marked for re-indexing
+        bulk_dir              - Write the documents to bulk action files in
+                                this directory instead of indexing them
+        replay                - Index the bulk action files written to this
+                                directory by an earlier run
     All exceptions are caught and logged to syslog with the stacktrace of
     the exception in a sub-object of the logged JSON document.
 
@@ -131,9 +135,19 @@ def main(options, name):
     idxctx.logger.debug("{}.{}: starting", name, idxctx.TS)
 
     index_obj = Index(name, options, idxctx)
+    if options.replay:
+        return index_obj.replay(Path(options.replay))
+
     status, tarballs = index_obj.collect_tb()
     if status == 0 and tarballs:
         status = index_obj.process_tb(tarballs)
+    elif status == 0:
+        metrics.record_run(name, 0, 0.0)
+
+    # Export the backlog and throughput of the run, except from the legacy
+    # unit tests, whose output must be reproducible.
+    if not config._unittests:
+        metrics.write_textfile(config.metrics_dir, name, logger)
 
     return status
 
@@ -189,7 +203,24 @@ if __name__ == "__main__":
         default=False,
         help="Perform re-indexing of previously indexed data",
     )
+    parser.add_argument(
+        "-B",
+        "--bulk-dir",
+        dest="bulk_dir",
+        default=None,
+        help="Write the documents to compressed NDJSON bulk action files in"
+        " the given directory instead of indexing them",
+    )
+    parser.add_argument(
+        "--replay",
+        dest="replay",
+        default=None,
+        help="Index the bulk action files written to the given directory by"
+        " an earlier --bulk-dir run",
+    )
     parsed = parser.parse_args()
+    if parsed.bulk_dir and parsed.replay:
+        parser.error("--bulk-dir and --replay are mutually exclusive")
     try:
         # The SIGTERM handler is established around main() to make it easier
         # to handle it cleanly once established. We also make sure both
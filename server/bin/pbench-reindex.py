@@ -32,7 +32,8 @@ from pbench.server.utils import get_tarball_md5
 _NAME_ = "pbench-reindex"
 
 tb_pat_r = (
-    r"\S+_(\d\d\d\d)[._-](\d\d)[._-](\d\d)[T_](\d\d)[._:](\d\d)[._:](\d\d)\.tar\.xz"
+    r"\S+_(\d\d\d\d)[._-](\d\d)[._-](\d\d)[T_](\d\d)[._:](\d\d)[._:](\d\d)"
+    f"(?:{'|'.join(re.escape(s) for s in Dataset.TARBALL_SUFFIXES)})"
 )
 tb_pat = re.compile(tb_pat_r)
 
@@ -44,9 +45,9 @@ def reindex(controller_name, tb_name, archive_p, incoming_p, dry_run=False):
     and moving it to the TO-RE-INDEX directory, creating that directory if
     it does not exist.
     """
-    assert tb_name.endswith(".tar.xz"), f"invalid tar ball name, '{tb_name}'"
+    assert Dataset.is_tarball(tb_name), f"invalid tar ball name, '{tb_name}'"
 
-    if not (incoming_p / controller_name / tb_name[:-7]).exists():
+    if not (incoming_p / controller_name / Dataset.stem(tb_name)).exists():
         # Can't re-index tar balls that are not unpacked
         return (controller_name, tb_name, "not-unpacked", "")
 
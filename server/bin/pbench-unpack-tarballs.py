@@ -7,7 +7,7 @@ import sys
 
 from pbench.common.exceptions import BadConfig
 from pbench.common.logger import get_pbench_logger
-from pbench.server import PbenchServerConfig
+from pbench.server import metrics, PbenchServerConfig
 from pbench.server.database import init_db
 from pbench.server.unpack_tarballs import UnpackTarballs
 
@@ -70,6 +70,11 @@ def main(cfg_name):
     # prepare and send report
     unpack_obj.report(prog, result_string)
 
+    # Export the backlog and throughput of the run, except from the legacy
+    # unit tests, whose output must be reproducible.
+    if not config._unittests:
+        metrics.write_textfile(config.metrics_dir, prog, logger)
+
     logger.info("end-{}", config.TS)
 
     return 0
@@ -39,24 +39,34 @@ or S3, then those files will have been moved backed up first before we can
 re-verify.
 """
 
+from concurrent.futures import as_completed, ProcessPoolExecutor
 from enum import Enum
 import errno
 import glob
+import itertools
 import os
 from pathlib import Path
+import sqlite3
 import sys
 import tempfile
 
 from pbench.common.exceptions import BadConfig
 from pbench.common.logger import get_pbench_logger
 from pbench.common.utils import md5sum
+import pbench.server
 from pbench.server import PbenchServerConfig
 from pbench.server.database import init_db
+from pbench.server.database.models.datasets import Dataset
+from pbench.server.md5_cache import Md5Cache
 from pbench.server.report import Report
 from pbench.server.s3backup import Entry, S3Config
 
 _NAME_ = "pbench-verify-backup-tarballs"
 
+# Tar balls are read in large blocks (a multiple of any page or device block
+# size) to keep the number of system calls per byte low.
+_MD5_BLOCKSIZE = 16 * 2**20
+
 
 class Status(Enum):
     SUCCESS = 10
@@ -87,7 +97,10 @@ class BackupObject:
     def fs_entry_list_creation(self):
         # Function to create entry list for results in a file-system
         # (archive or backup) directory.
-        tarlist = glob.iglob(os.path.join(self.dirname, "*", "*.tar.xz"))
+        tarlist = itertools.chain.from_iterable(
+            glob.iglob(os.path.join(self.dirname, "*", f"*{suffix}"))
+            for suffix in Dataset.TARBALL_SUFFIXES
+        )
         self.content_list = []
         self.missing_list = []
         self.error_list = []
@@ -154,10 +167,16 @@ class BackupObject:
         else:
             return Status.FAIL
 
-    def checkmd5(self):
+    def checkmd5(self, cache, workers=1, progress_interval=300):
         # Function to check integrity of results in a local (archive or local
         # backup) directory.
         #
+        # MD5 values are taken from the given cache for tar balls which have
+        # not changed since they were last verified; the remaining tar balls
+        # are read in parallel by a pool of `workers` processes, which also
+        # bounds the number of concurrent readers of the file system.  Progress
+        # is logged every `progress_interval` seconds.
+        #
         # This function returns the count of results that failed the MD5 sum
         # check, and raises exceptions on failure.
 
@@ -165,16 +184,63 @@ class BackupObject:
         self.indicator_file_ok = f"{self.indicator_file}.ok"
         self.indicator_file_fail = f"{self.indicator_file}.fail"
         self.nfailed_md5 = 0
+
+        start = pbench.server._time()
+        md5s = {}
+        pending = []
+        for tar in self.content_list:
+            path = Path(self.dirname, tar.name)
+            key = Md5Cache.key(path.stat())
+            md5 = cache.lookup(key, start)
+            if md5 is None:
+                pending.append((tar.name, path, key))
+            else:
+                md5s[tar.name] = md5
+        cached = len(md5s)
+
+        nbytes = 0
+        if pending:
+            last_progress = start
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(md5sum, path, _MD5_BLOCKSIZE): (name, key)
+                    for name, path, key in pending
+                }
+                for future in as_completed(futures):
+                    name, key = futures[future]
+                    length, md5 = future.result()
+                    nbytes += length
+                    md5s[name] = md5
+                    now = pbench.server._time()
+                    cache.update(key, md5, now)
+                    if now - last_progress >= progress_interval:
+                        last_progress = now
+                        self.logger.info(
+                            "{}: {} of {} tar balls checked, {}",
+                            self.name,
+                            len(md5s),
+                            len(self.content_list),
+                            _throughput(nbytes, now - start),
+                        )
+        cache.commit(start)
+
         with open(self.indicator_file_ok, "w") as f_ok, open(
             self.indicator_file_fail, "w"
         ) as f_fail:
             for tar in self.content_list:
-                (_, md5_returned) = md5sum(Path(self.dirname, tar.name))
-                if tar.md5 == md5_returned:
+                if tar.md5 == md5s[tar.name]:
                     f_ok.write(f"{tar.name}: {'OK'}\n")
                 else:
                     self.nfailed_md5 += 1
                     f_fail.write(f"{tar.name}: {'FAILED'}\n")
+        if self.content_list:
+            self.logger.debug(
+                "{}: {} tar balls checked ({} cached), {}",
+                self.name,
+                len(self.content_list),
+                cached,
+                _throughput(nbytes, pbench.server._time() - start),
+            )
         return self.nfailed_md5
 
     def report_failed_md5(self, report):
@@ -195,6 +261,11 @@ class BackupObject:
                 report.write(f"ERROR - {msg}\n")
 
 
+def _throughput(nbytes, elapsed):
+    rate = nbytes / elapsed / 2**20 if elapsed > 0 else 0.0
+    return f"{nbytes} bytes read in {elapsed:.2f}s ({rate:.2f} MiB/s)"
+
+
 def compare_entry_lists(list_one_obj, list_two_obj, report, logger):
     # Compare the two lists and report the differences.
     sorted_list_one_content = sorted(list_one_obj.content_list, key=lambda k: k.name)
@@ -308,6 +379,24 @@ def main():
     if not backuppath:
         return 1
 
+    # Open the persistent MD5 cache, and fetch the tuning parameters for the
+    # MD5 checks.
+    cache_file = config.conf.get("pbench-server", "pbench-md5-cache", fallback=None)
+    try:
+        workers = config.conf.getint(_NAME_, "md5-workers", fallback=4)
+        reverify_age = config.conf.getint(_NAME_, "md5-reverify-age-days", fallback=30)
+        progress_interval = config.conf.getint(
+            _NAME_, "progress-interval", fallback=300
+        )
+    except ValueError as e:
+        logger.error("Bad {} configuration: {}", _NAME_, e)
+        return 1
+    try:
+        cache = Md5Cache(cache_file, reverify_age * 24 * 60 * 60)
+    except sqlite3.Error as e:
+        logger.error("Unable to open MD5 cache {}: {}", cache_file, e)
+        return 1
+
     # instantiate the s3config class
     s3_config_obj = S3Config(config, logger)
     s3_config_obj = sanity_check(s3_config_obj, logger)
@@ -366,7 +455,9 @@ def main():
             ar_md5_start = config.timestamp()
             try:
                 # Check the data integrity in ARCHIVE (Question 1).
-                md5_result_archive = archive_obj.checkmd5()
+                md5_result_archive = archive_obj.checkmd5(
+                    cache, workers, progress_interval
+                )
             except Exception as ex:
                 msg = f"Failed to check data integrity of ARCHIVE ({config.ARCHIVE})"
                 logger.exception(msg)
@@ -387,7 +478,9 @@ def main():
             lb_md5_start = config.timestamp()
             try:
                 # Check the data integrity in BACKUP (Question 2).
-                md5_result_backup = local_backup_obj.checkmd5()
+                md5_result_backup = local_backup_obj.checkmd5(
+                    cache, workers, progress_interval
+                )
             except Exception as ex:
                 msg = f"Failed to check data integrity of BACKUP ({config.BACKUP})"
                 logger.exception(msg)
@@ -446,6 +539,7 @@ def main():
                 pass
             logger.debug("Sending report: end")
 
+    cache.close()
     logger.info("end-{}", config.TS)
 
     return sts